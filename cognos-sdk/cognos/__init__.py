@@ -6,6 +6,8 @@ import httpx
 from dataclasses import dataclass
 from typing import Any, Optional
 
+from cognos import _json
+
 
 __version__ = "0.1.0"
 __author__ = "Base76 Research Lab"
@@ -150,14 +152,14 @@ class CognosClient:
         try:
             response = self._client.post(
                 f"{self.base_url}/v1/chat/completions",
-                json=payload,
+                content=_json.dumps(payload),
                 headers=headers,
             )
             response.raise_for_status()
         except httpx.HTTPError as e:
             raise httpx.HTTPError(f"CognOS request failed: {e}")
 
-        data = response.json()
+        data = _json.loads(response.content)
         return self._parse_response(data)
 
     def get_trace(self, trace_id: str) -> dict[str, Any]:
@@ -188,7 +190,7 @@ class CognosClient:
         except httpx.HTTPError as e:
             raise httpx.HTTPError(f"Failed to retrieve trace {trace_id}: {e}")
 
-        return response.json()
+        return _json.loads(response.content)
 
     def create_trust_report(
         self,
@@ -227,14 +229,14 @@ class CognosClient:
         try:
             response = self._client.post(
                 f"{self.base_url}/v1/reports/trust",
-                json=payload,
+                content=_json.dumps(payload),
                 headers=headers,
             )
             response.raise_for_status()
         except httpx.HTTPError as e:
             raise httpx.HTTPError(f"Failed to create trust report: {e}")
 
-        return response.json()
+        return _json.loads(response.content)
 
     def healthz(self) -> dict[str, str]:
         """
@@ -255,7 +257,7 @@ class CognosClient:
         except httpx.HTTPError:
             return {"status": "error", "service": "operational-cognos-gateway"}
 
-        return response.json()
+        return _json.loads(response.content)
 
     def close(self) -> None:
         """Close HTTP client and cleanup resources."""
@@ -271,7 +273,7 @@ class CognosClient:
 
     def _build_headers(self) -> dict[str, str]:
         """Build request headers with optional API key."""
-        headers: dict[str, str] = {}
+        headers: dict[str, str] = {"content-type": "application/json"}
         if self.api_key:
             headers["x-api-key"] = self.api_key
         return headers
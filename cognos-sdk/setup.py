@@ -25,6 +25,9 @@ setup(
         "httpx>=0.27.0",
     ],
     extras_require={
+        "fast": [
+            "orjson>=3.9.0",
+        ],
         "dev": [
             "pytest>=8.0.0",
             "pytest-asyncio>=0.23.0",
@@ -95,6 +95,48 @@ def cmd_report(args: argparse.Namespace) -> int:
     return 0
 
 
+def cmd_replay(args: argparse.Namespace) -> int:
+    url = f"{_base_url()}/internal/policies/replay"
+    body: dict[str, Any] = {
+        "policy_ids": args.policy_ids,
+        "created_from": args.created_from,
+        "created_to": args.created_to,
+        "model": args.model,
+        "policy": args.policy,
+        "mode": args.mode,
+    }
+    if args.policies_file:
+        with open(args.policies_file, encoding="utf-8") as handle:
+            body["policies"] = json.load(handle)
+
+    with httpx.Client(timeout=args.timeout) as client:
+        response = client.post(url, headers=_headers(), json=body)
+
+    if response.status_code >= 400:
+        print(response.text, file=sys.stderr)
+        return 1
+
+    _print_json(response.json())
+    return 0
+
+
+def cmd_suggest(args: argparse.Namespace) -> int:
+    url = f"{_base_url()}/internal/policies/suggestions"
+    params: dict[str, Any] = {"refresh": str(args.refresh).lower(), "limit": args.limit}
+    if args.target_mix:
+        params["target_mix"] = args.target_mix
+
+    with httpx.Client(timeout=args.timeout) as client:
+        response = client.get(url, headers=_headers(), params=params)
+
+    if response.status_code >= 400:
+        print(response.text, file=sys.stderr)
+        return 1
+
+    _print_json(response.json())
+    return 0
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="CognOS Trust Gateway CLI")
     subparsers = parser.add_subparsers(dest="command", required=True)
@@ -122,6 +164,24 @@ def build_parser() -> argparse.ArgumentParser:
     report_parser.add_argument("--timeout", type=float, default=30.0)
     report_parser.set_defaults(func=cmd_report)
 
+    replay_parser = subparsers.add_parser("replay", help="Replay stored traces against candidate policies")
+    replay_parser.add_argument("--policy-ids", nargs="+", required=True)
+    replay_parser.add_argument("--policies-file", default=None, help="Candidate policy config (default: the gateway's loaded policies)")
+    replay_parser.add_argument("--from", dest="created_from", default=None, help="ISO timestamp, inclusive")
+    replay_parser.add_argument("--to", dest="created_to", default=None, help="ISO timestamp, exclusive")
+    replay_parser.add_argument("--model", default=None, help="Only traces for this model")
+    replay_parser.add_argument("--policy", default=None, help="Only traces recorded under this policy")
+    replay_parser.add_argument("--mode", choices=["monitor", "enforce"], default="enforce")
+    replay_parser.add_argument("--timeout", type=float, default=600.0)
+    replay_parser.set_defaults(func=cmd_replay)
+
+    suggest_parser = subparsers.add_parser("suggest", help="Ranked target_risk and band patches from recent traces")
+    suggest_parser.add_argument("--refresh", action="store_true", help="Slide the tuner window to now first")
+    suggest_parser.add_argument("--target-mix", default=None, help="e.g. PASS=0.9,REFINE=0.07,ESCALATE=0.02,BLOCK=0.01")
+    suggest_parser.add_argument("--limit", type=int, default=20)
+    suggest_parser.add_argument("--timeout", type=float, default=120.0)
+    suggest_parser.set_defaults(func=cmd_suggest)
+
     return parser
 
 
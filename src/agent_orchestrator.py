@@ -6,7 +6,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
-from trace_store import aggregate_tvv
+from trace_store import aggregate_tvv, backfill_columns
 
 ROOT = Path(__file__).resolve().parents[1]
 AGENTS_FILE = ROOT / "ops" / "agents" / "agents.json"
@@ -123,9 +123,15 @@ def cmd_update_metrics(tvv_requests: int | None, tvv_tokens: int | None, externa
     print("North star metrics updated.")
 
 
+def cmd_backfill(chunk_size: int) -> None:
+    processed = backfill_columns(chunk_size=chunk_size)
+    print(f"Trace column backfill complete: {processed} row updates")
+
+
 def cmd_sync_tvv() -> None:
     state = load_json(STATE_FILE)
     snapshot = state["north_star_snapshot"]
+    backfill_columns()
     aggregate = aggregate_tvv()
 
     snapshot["tvv_requests"] = int(aggregate.get("tvv_requests", 0))
@@ -164,6 +170,9 @@ def build_parser() -> argparse.ArgumentParser:
 
     subparsers.add_parser("sync-tvv", help="Sync TVV metrics from trace database")
 
+    backfill_parser = subparsers.add_parser("backfill", help="Backfill usage and timestamp columns for older traces")
+    backfill_parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=10000)
+
     return parser
 
 
@@ -188,6 +197,8 @@ def main() -> None:
         )
     elif args.command == "sync-tvv":
         cmd_sync_tvv()
+    elif args.command == "backfill":
+        cmd_backfill(chunk_size=args.chunk_size)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import time
+from typing import Any, Callable
+
+from canonical import JsonBody
+from models import ChatCompletionRequest
+
+SIZES = {"1KB": 1024, "100KB": 100 * 1024, "2MB": 2 * 1024 * 1024}
+
+
+def _body(target_bytes: int) -> bytes:
+    turn = "The quick brown fox jumps over the lazy dog. " * 4
+    messages: list[dict[str, str]] = [{"role": "system", "content": "You are a careful assistant."}]
+    payload: dict[str, Any] = {"model": "openai:gpt-4o-mini", "messages": messages, "cognos": {"mode": "monitor"}}
+    while len(json.dumps(payload)) < target_bytes:
+        messages.append({"role": "user" if len(messages) % 2 else "assistant", "content": turn})
+    return json.dumps(payload).encode("utf-8")
+
+
+def _legacy(raw: bytes) -> bytes:
+    """The pre-fast-path request handling: parse, validate, dump, copy, hash twice, re-encode."""
+    payload = json.loads(raw)
+    request_model = ChatCompletionRequest.model_validate(payload)
+    payload = request_model.model_dump(exclude_none=True)
+    hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+    upstream_payload = {k: v for k, v in payload.items() if k != "cognos"}
+    upstream_payload["model"] = "gpt-4o-mini"
+    hashlib.sha256(json.dumps(upstream_payload, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+    return json.dumps(upstream_payload).encode("utf-8")
+
+
+def _fast(raw: bytes) -> bytes:
+    body = JsonBody.parse(raw)
+    ChatCompletionRequest.model_validate(body.payload)
+    edits: dict[str, Any] = {"exclude": ("cognos",), "overrides": {"model": "gpt-4o-mini"}}
+    body.canonical_fingerprint()
+    body.canonical_fingerprint(**edits)
+    return body.forward_bytes(**edits)
+
+
+def _ms_per_op(action: Callable[[bytes], Any], raw: bytes, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        action(raw)
+    return (time.perf_counter() - started) * 1000 / iterations
+
+
+def run_benchmark(budget_bytes: int) -> dict[str, dict[str, float]]:
+    results: dict[str, dict[str, float]] = {}
+    for label, size in SIZES.items():
+        raw = _body(size)
+        iterations = max(3, budget_bytes // len(raw))
+        results[label] = {
+            "before_ms": _ms_per_op(_legacy, raw, iterations),
+            "after_ms": _ms_per_op(_fast, raw, iterations),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark chat request canonicalization and forwarding")
+    parser.add_argument("--budget-mb", type=int, default=64, help="Approximate bytes processed per payload size")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.budget_mb * 1024 * 1024)
+    print("request canonicalization benchmark (parse + validate + fingerprints + upstream body)")
+    for label, row in results.items():
+        speedup = row["before_ms"] / row["after_ms"] if row["after_ms"] else float("inf")
+        print(f"  {label:<6} before={row['before_ms']:>9.3f} ms  after={row['after_ms']:>9.3f} ms  speedup={speedup:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
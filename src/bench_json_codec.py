@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Any, Callable
+
+from json_codec import StdlibCodec, load_codec
+from main import _build_cognos_envelope, _mock_non_stream_response
+
+
+def _attestation_payload(envelope: dict[str, Any]) -> dict[str, Any]:
+    return {key: envelope[key] for key in ("trace_id", "policy", "decision", "risk", "signals")}
+
+
+def _workloads() -> dict[str, Any]:
+    envelope = _build_cognos_envelope(
+        trace_id="tr_01jabcdefghjkmnpqrstvwxyz0",
+        policy="default_v1",
+        decision="PASS",
+        risk=0.12,
+        shadow_pct=0.1,
+        shadow_models=["openai:gpt-4o", "claude:claude-3-5-sonnet"],
+    )
+    response = _mock_non_stream_response({"model": "gpt-4o-mini"})
+    response["choices"][0]["message"]["content"] = "Grounded answer with sources. " * 200
+    response["cognos"] = envelope
+    metadata = {
+        "mode": "live",
+        "upstream": "json",
+        "usage": {"prompt_tokens": 812, "completion_tokens": 1204, "total_tokens": 2016},
+        "retention": "fingerprints",
+        "cache": {"status": "miss", "stored": True},
+    }
+    return {"envelope": envelope, "response": response, "metadata": metadata}
+
+
+def _ops_per_sec(action: Callable[[], Any], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        action()
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed if elapsed > 0 else float("inf")
+
+
+def run_benchmark(iterations: int) -> dict[str, dict[str, float]]:
+    workloads = _workloads()
+    envelope = workloads["envelope"]
+    attestation = _attestation_payload(envelope)
+    response = workloads["response"]
+    metadata = workloads["metadata"]
+
+    results: dict[str, dict[str, float]] = {}
+    for name in ("stdlib", "orjson", "msgspec"):
+        codec: StdlibCodec = load_codec(name)
+        if codec.name != name:
+            continue
+        assert codec.dumps_canonical(attestation) == StdlibCodec().dumps_canonical(attestation)
+        envelope_text = codec.dumps_text(envelope)
+        response_bytes = codec.dumps(response)
+        results[name] = {
+            "attestation_canonical": _ops_per_sec(lambda: codec.dumps_canonical(attestation), iterations),
+            "trace_columns_encode": _ops_per_sec(lambda: (codec.dumps_text(envelope), codec.dumps_text(metadata)), iterations),
+            "trace_columns_decode": _ops_per_sec(lambda: codec.loads(envelope_text), iterations),
+            "http_response_encode": _ops_per_sec(lambda: codec.dumps(response), iterations),
+            "http_response_decode": _ops_per_sec(lambda: codec.loads(response_bytes), iterations),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare JSON codecs on gateway envelopes, trace columns and responses")
+    parser.add_argument("--iterations", type=int, default=20000, help="Operations per workload and codec")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.iterations)
+    baseline = results["stdlib"]
+    print(f"json codec benchmark ({args.iterations} ops per workload, ops/sec, speedup vs stdlib)")
+    for name, row in results.items():
+        print(f"  {name}")
+        for workload, rate in row.items():
+            print(f"    {workload:<22} {rate:>12.0f}  {rate / baseline[workload]:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
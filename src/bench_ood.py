@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from ood_detector import OODDetector
+
+SIZES = {"200B": 200, "2KB": 2 * 1024, "8KB": 8 * 1024}
+
+_TOPICS = ("database", "checkout", "login", "payment", "search", "invoice", "shipping", "refund")
+_SYMPTOMS = ("is slow", "returns errors", "times out", "fails for some users", "shows stale data")
+
+
+def _prompt(rng: random.Random, target_chars: int) -> str:
+    parts: list[str] = []
+    while sum(len(part) + 1 for part in parts) < target_chars:
+        parts.append(
+            f"Ticket {rng.randint(1, 99999)}: the {rng.choice(_TOPICS)} service {rng.choice(_SYMPTOMS)} "
+            "since the last deploy. Include likely causes and next steps."
+        )
+    return " ".join(parts)[:target_chars]
+
+
+def _us_per_op(action: Callable[[], Any], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        action()
+    return (time.perf_counter() - started) * 1_000_000 / iterations
+
+
+def run_benchmark(iterations: int, references: int) -> dict[str, dict[str, float]]:
+    rng = random.Random(7)
+    detector = OODDetector(min_samples=1)
+    for index in range(references * 200):
+        detector.assess(_prompt(rng, 400), f"model-{index % references}")
+
+    results: dict[str, dict[str, float]] = {}
+    for label, size in SIZES.items():
+        text = _prompt(rng, size)
+        vector = detector.vectorize(text)
+        results[label] = {
+            "vectorize_us": _us_per_op(lambda: detector.vectorize(text), iterations),
+            "score_us": _us_per_op(lambda: detector.score(vector, "model-0"), iterations),
+            "assess_us": _us_per_op(lambda: detector.assess(text, "model-0"), iterations),
+        }
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "ood_reference.npz"
+        started = time.perf_counter()
+        detector.snapshot(path)
+        saved = time.perf_counter()
+        OODDetector().load(path)
+        loaded = time.perf_counter()
+        results["snapshot"] = {"save_ms": (saved - started) * 1000, "load_ms": (loaded - saved) * 1000}
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark OOD scoring cost per request")
+    parser.add_argument("--iterations", type=int, default=2000, help="Scoring calls per prompt size")
+    parser.add_argument("--references", type=int, default=8, help="Per-model references to warm up")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.iterations, args.references)
+    print(f"OOD detector benchmark ({args.references} warm references, {args.iterations} calls per size)")
+    for label in SIZES:
+        row = results[label]
+        print(
+            f"  {label:<5} vectorize={row['vectorize_us']:>8.1f} us  score={row['score_us']:>7.1f} us  "
+            f"assess (vectorize + score + update)={row['assess_us']:>8.1f} us"
+        )
+    snapshot = results["snapshot"]
+    print(f"  snapshot save={snapshot['save_ms']:.2f} ms  load={snapshot['load_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Any, Callable
+
+import policy
+from signals import DEFAULT_WEIGHTS, SIGNAL_NAMES, aggregate_risk
+
+CONFIG = {
+    "policies": {
+        "strict_v1": {
+            "target_risk": 0.3,
+            "weights": {"ue": 0.7, "out_of_distribution": 0.8},
+            "bands": {"refine": 0.1, "escalate": 0.25},
+            "models": {"gpt-4o-mini": {"target_risk": 0.25}},
+        },
+        "lenient_v1": {"target_risk": 0.7, "base_risk": 0.05},
+    }
+}
+
+
+def _signals(rng: random.Random, count: int) -> list[dict[str, float]]:
+    return [{name: rng.random() * 0.5 for name in SIGNAL_NAMES} for _ in range(count)]
+
+
+def _legacy(signals: dict[str, float]) -> tuple[str, float]:
+    """Dict-weighted noisy-OR followed by the hard-coded default_v1 ladder."""
+    risk = aggregate_risk(signals, DEFAULT_WEIGHTS, 0.12)
+    return policy.resolve_decision("enforce", None, base_risk=risk)
+
+
+def _rate(action: Callable[[dict[str, float]], Any], samples: list[dict[str, float]], rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for signals in samples:
+            action(signals)
+    elapsed = time.perf_counter() - started
+    return rounds * len(samples) / elapsed if elapsed > 0 else float("inf")
+
+
+def run_benchmark(evaluations: int) -> dict[str, float]:
+    samples = _signals(random.Random(7), 1000)
+    rounds = max(1, evaluations // len(samples))
+    table = policy.compile_policies(CONFIG)
+
+    def default_policy(signals: dict[str, float]) -> tuple[str, float]:
+        return table.get("default_v1").evaluate("enforce", signals)
+
+    def model_override(signals: dict[str, float]) -> tuple[str, float]:
+        return table.get("strict_v1", "gpt-4o-mini").evaluate("enforce", signals)
+
+    started = time.perf_counter()
+    for _ in range(100):
+        policy.compile_policies(CONFIG)
+    compile_ms = (time.perf_counter() - started) * 10
+
+    return {
+        "legacy_per_sec": _rate(_legacy, samples, rounds),
+        "compiled_per_sec": _rate(default_policy, samples, rounds),
+        "override_per_sec": _rate(model_override, samples, rounds),
+        "compile_ms": compile_ms,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmark policy evaluations per second")
+    parser.add_argument("--evaluations", type=int, default=500_000, help="Evaluations per variant")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.evaluations)
+    print(f"policy benchmark ({args.evaluations} evaluations per variant)")
+    print(f"  legacy (aggregate_risk + resolve_decision) {results['legacy_per_sec']:>12.0f} evals/sec")
+    print(f"  compiled default_v1 (lookup + evaluate)    {results['compiled_per_sec']:>12.0f} evals/sec")
+    print(f"  compiled model override                    {results['override_per_sec']:>12.0f} evals/sec")
+    print(f"  compile config: {results['compile_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
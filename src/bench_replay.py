@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import policy
+import trace_store
+from bench_policy import CONFIG
+from policy_replay import replay
+from signals import SIGNAL_NAMES
+
+MODELS = ("gpt-4o-mini", "gpt-4o", "ollama:llama3.2")
+BATCH_ROWS = 10_000
+
+
+def _record(rng: random.Random, index: int, default: policy.CompiledPolicy) -> dict[str, Any]:
+    signals = {name: rng.random() * 0.5 for name in SIGNAL_NAMES}
+    decision, risk = default.evaluate("enforce", signals)
+    trace_id = f"tr_bench_{index:09d}"
+    return {
+        "trace_id": trace_id,
+        "created_at": "2026-02-27T12:00:00+00:00",
+        "created_ms": 1_772_193_600_000 + index,
+        "decision": decision,
+        "policy": "default_v1",
+        "trust_score": round(1.0 - risk, 6),
+        "risk": risk,
+        "is_stream": False,
+        "status_code": 200,
+        "model": MODELS[index % len(MODELS)],
+        "request_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 512},
+        "response_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 768},
+        "envelope": {"decision": decision, "risk": risk, "signals": signals, "trace_id": trace_id},
+        "metadata": {},
+    }
+
+
+def _per_trace(table: policy.PolicyTable, policy_ids: list[str], trace_ids: list[str]) -> int:
+    """The replay loop without column reads: get_trace, decode the envelope, evaluate each candidate."""
+    changed = 0
+    for trace_id in trace_ids:
+        trace = trace_store.get_trace(trace_id)
+        envelope = trace["envelope"]
+        for policy_id in policy_ids:
+            decision, _ = table.get(policy_id, trace["model"]).evaluate("enforce", envelope["signals"])
+            changed += decision != trace["decision"]
+    return changed
+
+
+def run_benchmark(traces: int, sample: int, chunk_rows: int) -> dict[str, float]:
+    rng = random.Random(7)
+    default = policy.builtin_policy()
+    table = policy.compile_policies(CONFIG)
+    policy_ids = ["default_v1", "strict_v1", "lenient_v1"]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        trace_store.DEFAULT_DB_PATH = str(Path(tmpdir) / "replay.sqlite3")
+        trace_store.init_db()
+        for start in range(0, traces, BATCH_ROWS):
+            trace_store.save_traces([_record(rng, index, default) for index in range(start, min(traces, start + BATCH_ROWS))])
+
+        sample_ids = [f"tr_bench_{index:09d}" for index in range(min(sample, traces))]
+        started = time.perf_counter()
+        _per_trace(table, policy_ids, sample_ids)
+        per_trace_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = replay(table, policy_ids, chunk_rows=chunk_rows)
+        replay_elapsed = time.perf_counter() - started
+        trace_store.close_connections()
+
+    return {
+        "per_trace_per_sec": len(sample_ids) / per_trace_elapsed if per_trace_elapsed > 0 else float("inf"),
+        "replay_per_sec": result["traces"] / replay_elapsed if replay_elapsed > 0 else float("inf"),
+        "replay_seconds": replay_elapsed,
+        "chunks": result["chunks"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark offline policy replay throughput")
+    parser.add_argument("--traces", type=int, default=200_000, help="Traces to generate and replay")
+    parser.add_argument("--sample", type=int, default=20_000, help="Traces replayed one get_trace at a time")
+    parser.add_argument("--chunk-rows", type=int, default=50_000, help="Rows per column chunk")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.traces, args.sample, args.chunk_rows)
+    print(f"policy replay benchmark ({args.traces} traces, 3 candidate policies)")
+    print(f"  per-trace (get_trace + evaluate)  {results['per_trace_per_sec']:>12.0f} traces/sec")
+    print(f"  column chunks (NumPy)             {results['replay_per_sec']:>12.0f} traces/sec")
+    print(f"  full replay: {results['replay_seconds']:.2f} s over {results['chunks']} chunks")
+
+
+if __name__ == "__main__":
+    main()
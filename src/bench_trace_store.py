@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import trace_store
+
+
+def _record(index: int) -> dict[str, Any]:
+    trace_id = f"tr_bench_{index:08d}"
+    return {
+        "trace_id": trace_id,
+        "created_at": "2026-02-27T12:00:00+00:00",
+        "decision": "PASS",
+        "policy": "default_v1",
+        "trust_score": 0.88,
+        "risk": 0.12,
+        "is_stream": False,
+        "status_code": 200,
+        "model": "openai:gpt-4o-mini",
+        "request_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 512},
+        "response_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 768},
+        "envelope": {"decision": "PASS", "risk": 0.12, "trace_id": trace_id, "policy": "default_v1"},
+        "metadata": {"mode": "live", "upstream": "json", "usage": {"total_tokens": 42}},
+    }
+
+
+# The trace table and insert exactly as they were before pooling: no indexes, no rollup
+# triggers, no materialized columns, one connection and one commit per trace.
+_BASELINE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS traces (
+        trace_id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        decision TEXT NOT NULL,
+        policy TEXT NOT NULL,
+        trust_score REAL NOT NULL,
+        risk REAL NOT NULL,
+        is_stream INTEGER NOT NULL,
+        status_code INTEGER NOT NULL,
+        model TEXT,
+        request_fingerprint TEXT,
+        response_fingerprint TEXT,
+        envelope_json TEXT,
+        metadata_json TEXT
+    )
+"""
+
+_BASELINE_INSERT_SQL = """
+    INSERT OR REPLACE INTO traces (
+        trace_id, created_at, decision, policy, trust_score, risk, is_stream, status_code,
+        model, request_fingerprint, response_fingerprint, envelope_json, metadata_json
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _baseline_save(db_path: Path, record: dict[str, Any]) -> None:
+    """Connect-per-call plain INSERT with default pragmas, as trace_store.save_trace did before pooling."""
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.execute(
+            _BASELINE_INSERT_SQL,
+            (
+                record["trace_id"],
+                record["created_at"],
+                record["decision"],
+                record["policy"],
+                float(record.get("trust_score", 0.0)),
+                float(record.get("risk", 0.0)),
+                int(bool(record.get("is_stream", False))),
+                int(record.get("status_code", 200)),
+                record.get("model"),
+                json.dumps(record.get("request_fingerprint", {}), ensure_ascii=False),
+                json.dumps(record.get("response_fingerprint", {}), ensure_ascii=False),
+                json.dumps(record.get("envelope", {}), ensure_ascii=False),
+                json.dumps(record.get("metadata", {}), ensure_ascii=False),
+            ),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _unpooled_save(db_path: Path, record: dict[str, Any]) -> None:
+    """Today's insert (upsert, indexes, rollup triggers) over a fresh connection per call."""
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.execute(trace_store._INSERT_TRACE_SQL, trace_store._trace_row(record))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _legacy_get(db_path: Path, trace_id: str) -> Any:
+    connection = sqlite3.connect(db_path)
+    connection.row_factory = sqlite3.Row
+    try:
+        row = connection.execute("SELECT * FROM traces WHERE trace_id = ?", (trace_id,)).fetchone()
+    finally:
+        connection.close()
+    return json.loads(row["envelope_json"]) if row else None
+
+
+def _rate(count: int, action: Callable[[int], Any]) -> float:
+    started = time.perf_counter()
+    for index in range(count):
+        action(index)
+    elapsed = time.perf_counter() - started
+    return count / elapsed if elapsed > 0 else float("inf")
+
+
+def run_benchmark(count: int) -> dict[str, dict[str, float]]:
+    results: dict[str, dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        baseline_path = Path(tmpdir) / "baseline.sqlite3"
+        connection = sqlite3.connect(baseline_path)
+        connection.execute(_BASELINE_SCHEMA)
+        connection.commit()
+        connection.close()
+        results["before"] = {
+            "inserts_per_sec": _rate(count, lambda i: _baseline_save(baseline_path, _record(i))),
+            "lookups_per_sec": _rate(count, lambda i: _legacy_get(baseline_path, f"tr_bench_{i:08d}")),
+        }
+
+        # Same schema and SQL as "after", only without pooling or pragmas, to isolate the connection change.
+        unpooled_path = Path(tmpdir) / "unpooled.sqlite3"
+        trace_store.DEFAULT_DB_PATH = str(unpooled_path)
+        trace_store.init_db()
+        trace_store.close_connections()
+        # Databases opened without the pooled pragmas ran in rollback-journal mode with synchronous=FULL.
+        connection = sqlite3.connect(unpooled_path)
+        connection.execute("PRAGMA journal_mode=DELETE")
+        connection.close()
+        results["unpooled"] = {
+            "inserts_per_sec": _rate(count, lambda i: _unpooled_save(unpooled_path, _record(i))),
+            "lookups_per_sec": _rate(count, lambda i: _legacy_get(unpooled_path, f"tr_bench_{i:08d}")),
+        }
+
+        pooled_path = Path(tmpdir) / "pooled.sqlite3"
+        trace_store.DEFAULT_DB_PATH = str(pooled_path)
+        trace_store.init_db()
+        results["after"] = {
+            "inserts_per_sec": _rate(count, lambda i: trace_store.save_trace(_record(i))),
+            "lookups_per_sec": _rate(count, lambda i: trace_store.get_trace(f"tr_bench_{i:08d}")),
+        }
+        trace_store.close_connections()
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmark trace_store inserts and lookups")
+    parser.add_argument("--count", type=int, default=2000, help="Number of traces to insert and look up")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.count)
+    print(f"trace_store benchmark ({args.count} traces)")
+    for label in ("before", "unpooled", "after"):
+        row = results[label]
+        print(f"  {label:<8} inserts/sec={row['inserts_per_sec']:>10.0f}  lookups/sec={row['lookups_per_sec']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import policy
+import trace_store
+from policy_tuner import ThresholdTuner, _candidate_grid
+
+MODELS = ("gpt-4o-mini", "gpt-4o", "ollama:llama3.2")
+START_MS = 1_772_193_600_000
+BATCH_ROWS = 10_000
+
+
+def _records(rng: random.Random, start: int, count: int) -> list[dict[str, Any]]:
+    records = []
+    for index in range(start, start + count):
+        risk = round(rng.betavariate(2, 5), 6)
+        trace_id = f"tr_bench_{index:09d}"
+        records.append(
+            {
+                "trace_id": trace_id,
+                "created_at": "2026-02-27T12:00:00+00:00",
+                "created_ms": START_MS + index * 1000,
+                "decision": "PASS",
+                "policy": "default_v1",
+                "trust_score": round(1.0 - risk, 6),
+                "risk": risk,
+                "is_stream": False,
+                "status_code": 200,
+                "model": MODELS[index % len(MODELS)],
+                "request_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 512},
+                "response_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 768},
+                "envelope": {"decision": "PASS", "risk": risk, "trace_id": trace_id},
+                "metadata": {},
+            }
+        )
+    return records
+
+
+def run_benchmark(traces: int, arrivals: int, step: float) -> dict[str, float]:
+    rng = random.Random(7)
+    window_hours = traces / 3600
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        trace_store.DEFAULT_DB_PATH = str(Path(tmpdir) / "tuner.sqlite3")
+        trace_store.init_db()
+        for start in range(0, traces, BATCH_ROWS):
+            trace_store.save_traces(_records(rng, start, min(BATCH_ROWS, traces - start)))
+
+        tuner = ThresholdTuner(window_hours=window_hours, step=step, min_traces=1)
+        started = time.perf_counter()
+        tuner.refresh(now_ms=START_MS + traces * 1000)
+        full_ms = (time.perf_counter() - started) * 1000
+
+        trace_store.save_traces(_records(rng, traces, arrivals))
+        started = time.perf_counter()
+        tuner.refresh(now_ms=START_MS + (traces + arrivals) * 1000)
+        incremental_ms = (time.perf_counter() - started) * 1000
+
+        _candidate_grid(step)
+        started = time.perf_counter()
+        suggestions = tuner.suggest(policy.compile_policies())
+        suggest_ms = (time.perf_counter() - started) * 1000
+        trace_store.close_connections()
+
+    groups = len(MODELS) + 1
+    candidates = len(_candidate_grid(step)[1])
+    return {
+        "full_ms": full_ms,
+        "incremental_ms": incremental_ms,
+        "suggest_ms": suggest_ms,
+        "candidates": candidates * groups,
+        "ns_per_candidate": suggest_ms * 1_000_000 / (candidates * groups),
+        "suggestions": len(suggestions),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark incremental threshold sweeps")
+    parser.add_argument("--traces", type=int, default=200_000, help="Traces in the sliding window")
+    parser.add_argument("--arrivals", type=int, default=2_000, help="New traces per incremental refresh")
+    parser.add_argument("--step", type=float, default=0.01, help="Threshold grid step")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.traces, args.arrivals, args.step)
+    print(f"threshold tuner benchmark ({args.traces} traces in window, {args.arrivals} arrivals)")
+    print(f"  full window load        {results['full_ms']:>10.1f} ms")
+    print(f"  incremental refresh     {results['incremental_ms']:>10.1f} ms")
+    print(
+        f"  sweep + rank            {results['suggest_ms']:>10.1f} ms for {results['candidates']} candidates "
+        f"({results['ns_per_candidate']:.0f} ns each, {results['suggestions']} suggestions)"
+    )
+
+
+if __name__ == "__main__":
+    main()
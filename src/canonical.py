@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from json.encoder import encode_basestring_ascii
+from typing import Any, Iterable, Mapping
+
+import json_codec
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_WHITESPACE_BYTES = b" \t\n\r"
+_DECODER = json.JSONDecoder()
+
+
+def encode_canonical(value: Any) -> bytes:
+    """Canonical JSON: sorted keys, compact separators, ASCII-escaped."""
+    return json_codec.dumps_canonical(value)
+
+
+def canonical_digest(payload: Any) -> tuple[str, int]:
+    """(sha256 hex digest, length) of the canonical JSON encoding of payload."""
+    canonical = encode_canonical(payload)
+    return hashlib.sha256(canonical).hexdigest(), len(canonical)
+
+
+def _encode_member(key: str, value: Any) -> str:
+    return f"{json_codec.dumps_text(key)}:{json_codec.dumps_text(value)}"
+
+
+class JsonBody:
+    """A JSON object body parsed once, keeping each top-level member's raw span.
+
+    The spans let the gateway forward request and response bytes untouched apart from
+    the members it drops, rewrites or adds, and canonical fingerprints are hashed one
+    member at a time instead of re-serialising the whole payload for every digest.
+    """
+
+    def __init__(self, raw: bytes, text: str, members: list[tuple[str, int, int, Any]]) -> None:
+        self.raw = raw
+        self._text = text
+        self._members = members
+        self.payload: dict[str, Any] = {key: value for key, _, _, value in members}
+        # Duplicate keys resolve last-wins like json.loads, but can't be spliced safely.
+        self._spliceable = len(self.payload) == len(members)
+        self._canonical: dict[str, bytes] = {}
+
+    @classmethod
+    def parse(cls, raw: bytes) -> JsonBody:
+        """Parse a JSON object, raising ValueError for anything else."""
+        text = raw.decode("utf-8")
+        members: list[tuple[str, int, int, Any]] = []
+        try:
+            index = _WHITESPACE.match(text, 0).end()
+            if text[index] != "{":
+                raise ValueError("Expected a JSON object")
+            index = _WHITESPACE.match(text, index + 1).end()
+            if text[index] == "}":
+                index += 1
+            else:
+                while True:
+                    if text[index] != '"':
+                        raise ValueError(f"Expected property name at char {index}")
+                    member_start = index
+                    key, index = json.decoder.scanstring(text, index + 1)
+                    index = _WHITESPACE.match(text, index).end()
+                    if text[index] != ":":
+                        raise ValueError(f"Expected ':' at char {index}")
+                    index = _WHITESPACE.match(text, index + 1).end()
+                    value, index = _DECODER.raw_decode(text, index)
+                    members.append((key, member_start, index, value))
+                    index = _WHITESPACE.match(text, index).end()
+                    if text[index] == ",":
+                        index = _WHITESPACE.match(text, index + 1).end()
+                        continue
+                    if text[index] != "}":
+                        raise ValueError(f"Expected ',' or '}}' at char {index}")
+                    index += 1
+                    break
+        except IndexError:
+            raise ValueError("Unexpected end of JSON input") from None
+        if _WHITESPACE.match(text, index).end() != len(text):
+            raise ValueError(f"Extra data at char {index}")
+        return cls(raw, text, members)
+
+    def canonical_fingerprint(
+        self,
+        exclude: Iterable[str] = (),
+        overrides: Mapping[str, Any] | None = None,
+    ) -> tuple[str, int]:
+        """(sha256 hex digest, length) of encode_canonical() over the edited payload.
+
+        Equal to canonical_digest() of the same dict, but each member is encoded once
+        and reused across calls, and the full canonical text is never materialised.
+        """
+        overrides = overrides or {}
+        skipped = set(exclude)
+        keys = sorted((set(self.payload) | set(overrides)) - skipped)
+        hasher = hashlib.sha256(b"{")
+        length = 2
+        for position, key in enumerate(keys):
+            if key in overrides:
+                encoded = encode_canonical(overrides[key])
+            else:
+                encoded = self._canonical.get(key)
+                if encoded is None:
+                    encoded = self._canonical[key] = encode_canonical(self.payload[key])
+            member = b"".join((b"," if position else b"", encode_basestring_ascii(key).encode("ascii"), b":", encoded))
+            hasher.update(member)
+            length += len(member)
+        hasher.update(b"}")
+        return hasher.hexdigest(), length
+
+    def forward_bytes(
+        self,
+        exclude: Iterable[str] = (),
+        overrides: Mapping[str, Any] | None = None,
+    ) -> bytes:
+        """The original body with excluded members removed and overridden values replaced or added."""
+        skipped = set(exclude)
+        overrides = {key: value for key, value in (overrides or {}).items() if key not in skipped}
+        if not self._spliceable:
+            payload = {key: value for key, value in self.payload.items() if key not in skipped}
+            payload.update(overrides)
+            return json_codec.dumps(payload)
+
+        changed = any(key in skipped for key in self.payload) or any(
+            key not in self.payload or self.payload[key] != value for key, value in overrides.items()
+        )
+        if not changed:
+            return self.raw
+        if not skipped.intersection(self.payload) and not set(overrides).intersection(self.payload):
+            # Pure additions: append before the closing brace without touching the rest.
+            added = ",".join(
+                _encode_member(key, value)
+                for key, value in overrides.items()
+            ).encode("utf-8")
+            head = self.raw.rstrip(_WHITESPACE_BYTES)[:-1].rstrip(_WHITESPACE_BYTES)
+            return b"".join((head, b"," if self._members else b"", added, b"}"))
+
+        parts: list[str] = []
+        for key, start, end, _ in self._members:
+            if key in skipped:
+                continue
+            if key in overrides:
+                parts.append(_encode_member(key, overrides[key]))
+            else:
+                parts.append(self._text[start:end])
+        for key, value in overrides.items():
+            if key not in self.payload:
+                parts.append(_encode_member(key, value))
+        return ("{" + ",".join(parts) + "}").encode("utf-8")
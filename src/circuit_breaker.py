@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import collections
+import os
+from typing import Any
+
+BREAKER_WINDOW_SECONDS = float(os.getenv("COGNOS_BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_REQUESTS = int(os.getenv("COGNOS_BREAKER_MIN_REQUESTS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("COGNOS_BREAKER_FAILURE_RATE", "0.5"))
+# 0 disables latency-based trips and backoff: time to headers includes whole non-streamed
+# completions, so any fixed cut-off has to be chosen per deployment.
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("COGNOS_BREAKER_SLOW_CALL_SECONDS", "0"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("COGNOS_BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("COGNOS_BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("COGNOS_BREAKER_HALF_OPEN_PROBES", "1"))
+# Off by default: the limit is still learned and reported, but nothing is shed against it.
+CONCURRENCY_LIMIT_ENABLED = os.getenv("COGNOS_CONCURRENCY_LIMIT", "false").lower() in {"1", "true", "yes"}
+CONCURRENCY_LIMIT_INITIAL = float(os.getenv("COGNOS_CONCURRENCY_LIMIT_INITIAL", "32"))
+CONCURRENCY_LIMIT_MIN = float(os.getenv("COGNOS_CONCURRENCY_LIMIT_MIN", "1"))
+CONCURRENCY_LIMIT_MAX = float(os.getenv("COGNOS_CONCURRENCY_LIMIT_MAX", "256"))
+CONCURRENCY_LIMIT_BACKOFF = float(os.getenv("COGNOS_CONCURRENCY_LIMIT_BACKOFF", "0.9"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a sliding time window of call outcomes.
+
+    Trips when the window holds at least min_requests calls and either the failure
+    rate or the slow-call rate reaches its threshold (slow calls only count when
+    slow_call_seconds is positive). After open_seconds it lets
+    half_open_probes calls through; one success closes it, one failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = BREAKER_WINDOW_SECONDS,
+        min_requests: int = BREAKER_MIN_REQUESTS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+        slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.min_requests = max(1, min_requests)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self.last_trip_reason: str | None = None
+        self._probes_in_flight = 0
+        # (timestamp, failed, slow) per call, oldest first, with running totals.
+        self._window: collections.deque[tuple[float, bool, bool]] = collections.deque()
+        self._failures = 0
+        self._slow = 0
+
+    def allows(self, now: float) -> bool:
+        """Whether a call may be sent now; does not reserve a half-open probe slot."""
+        if self.state == OPEN:
+            return now - self.opened_at >= self.open_seconds
+        if self.state == HALF_OPEN:
+            return self._probes_in_flight < self.half_open_probes
+        return True
+
+    def on_cancel(self) -> None:
+        """Give back a half-open probe slot for a call that never completed."""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def on_send(self, now: float) -> None:
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+        if self.state == HALF_OPEN:
+            self._probes_in_flight += 1
+
+    def record(self, now: float, failed: bool, latency_seconds: float) -> str | None:
+        """Record a finished call; returns the trip reason if this call opened the breaker."""
+        slow = 0 < self.slow_call_seconds <= latency_seconds
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if failed or slow:
+                return self._trip(now, "half-open probe " + ("failed" if failed else f"took {latency_seconds:.1f}s"))
+            self.state = CLOSED
+            self._reset_window()
+            return None
+        if self.state == OPEN:
+            # A call sent before the breaker opened; it no longer changes anything.
+            return None
+
+        self._window.append((now, failed, slow))
+        self._failures += failed
+        self._slow += slow
+        self._expire(now)
+        calls = len(self._window)
+        if calls < self.min_requests:
+            return None
+        if self._failures / calls >= self.failure_rate:
+            return self._trip(now, f"failure rate {self._failures}/{calls} in {self.window_seconds:.0f}s")
+        if self._slow / calls >= self.slow_call_rate:
+            return self._trip(now, f"slow calls {self._slow}/{calls} over {self.slow_call_seconds:.0f}s")
+        return None
+
+    def _trip(self, now: float, reason: str) -> str:
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self.last_trip_reason = reason
+        self._probes_in_flight = 0
+        self._reset_window()
+        return reason
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._window and self._window[0][0] < cutoff:
+            _, failed, slow = self._window.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _reset_window(self) -> None:
+        self._window.clear()
+        self._failures = 0
+        self._slow = 0
+
+    def stats(self, now: float) -> dict[str, Any]:
+        self._expire(now)
+        calls = len(self._window)
+        return {
+            "state": self.state,
+            "calls_in_window": calls,
+            "failure_rate": round(self._failures / calls, 4) if calls else 0.0,
+            "slow_call_rate": round(self._slow / calls, 4) if calls else 0.0,
+            "trips": self.trips,
+            "open_for_seconds": round(max(0.0, self.opened_at + self.open_seconds - now), 3) if self.state == OPEN else 0.0,
+            "last_trip_reason": self.last_trip_reason,
+        }
+
+
+class AimdLimiter:
+    """Additive-increase / multiplicative-decrease concurrency limit for one upstream.
+
+    Each fast success grows the limit by 1/limit (about +1 per limit's worth of calls);
+    each failure or slow call multiplies it by backoff. Unless enabled, the limit is
+    only tracked for stats and every call has capacity.
+    """
+
+    def __init__(
+        self,
+        initial: float = CONCURRENCY_LIMIT_INITIAL,
+        minimum: float = CONCURRENCY_LIMIT_MIN,
+        maximum: float = CONCURRENCY_LIMIT_MAX,
+        backoff: float = CONCURRENCY_LIMIT_BACKOFF,
+        slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+        enabled: bool = CONCURRENCY_LIMIT_ENABLED,
+    ) -> None:
+        self.enabled = enabled
+        self.minimum = max(1.0, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.backoff = backoff
+        self.slow_call_seconds = slow_call_seconds
+        self.rejections = 0
+
+    def has_capacity(self, outstanding: int) -> bool:
+        return not self.enabled or outstanding < int(self.limit)
+
+    def record(self, failed: bool, latency_seconds: float) -> None:
+        if failed or 0 < self.slow_call_seconds <= latency_seconds:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def stats(self) -> dict[str, Any]:
+        return {"enabled": self.enabled, "limit": int(self.limit), "limit_exact": round(self.limit, 3), "rejections": self.rejections}
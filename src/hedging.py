@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import collections
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+HEDGE_PERCENTILE = float(os.getenv("COGNOS_HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET_PCT = float(os.getenv("COGNOS_HEDGE_BUDGET_PCT", "5"))
+HEDGE_MIN_SAMPLES = int(os.getenv("COGNOS_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("COGNOS_HEDGE_WINDOW", "1000"))
+HEDGE_MAX_ROUTES = 1024
+
+
+class LatencyTracker:
+    """Percentiles over the last `window` latencies, kept sorted for O(log n) lookups."""
+
+    def __init__(self, window: int = HEDGE_WINDOW) -> None:
+        self.window = max(1, window)
+        self._order: collections.deque[float] = collections.deque()
+        self._sorted: list[float] = []
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def observe(self, seconds: float) -> None:
+        self._order.append(seconds)
+        bisect.insort(self._sorted, seconds)
+        if len(self._order) > self.window:
+            oldest = self._order.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+
+    def percentile(self, quantile: float) -> float | None:
+        if not self._sorted:
+            return None
+        index = min(len(self._sorted) - 1, max(0, int(quantile * len(self._sorted))))
+        return self._sorted[index]
+
+
+class HedgeBudget:
+    """Token bucket: each eligible request earns pct/100 of a hedge, each hedge spends one."""
+
+    def __init__(self, pct: float = HEDGE_BUDGET_PCT, burst: float = 10.0) -> None:
+        self.ratio = max(0.0, pct) / 100.0
+        self.burst = burst
+        self.tokens = 0.0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+def _succeeded(task: asyncio.Task[httpx.Response]) -> bool:
+    return not task.cancelled() and task.exception() is None and task.result().status_code < 500
+
+
+async def _discard(task: asyncio.Task[httpx.Response]) -> None:
+    """Cancel a losing attempt, or close its response if it already finished."""
+    if not task.done():
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            return
+        return
+    if not task.cancelled() and task.exception() is None:
+        await task.result().aclose()
+
+
+class Hedger:
+    """Sends a second identical attempt when the first is slower than the route's percentile.
+
+    The hedge delay is the route's observed latency at the configured percentile, so
+    roughly (1 - percentile) of requests are hedge candidates; the budget caps actual
+    hedges at HEDGE_BUDGET_PCT of hedge-enabled traffic. The first successful attempt
+    wins and the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        budget_pct: float = HEDGE_BUDGET_PCT,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        window: int = HEDGE_WINDOW,
+    ) -> None:
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = HedgeBudget(budget_pct)
+        self._routes: dict[str, LatencyTracker] = {}
+        self._counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0, "warming_up": 0}
+
+    def tracker(self, route: str) -> LatencyTracker:
+        tracker = self._routes.get(route)
+        if tracker is None:
+            if len(self._routes) >= HEDGE_MAX_ROUTES:
+                self._routes.pop(next(iter(self._routes)))
+            tracker = self._routes[route] = LatencyTracker(self.window)
+        return tracker
+
+    def observe(self, route: str, seconds: float) -> None:
+        self.tracker(route).observe(seconds)
+
+    async def run(
+        self,
+        route: str,
+        percentile: float | None,
+        attempt: Callable[[], Awaitable[httpx.Response]],
+    ) -> httpx.Response:
+        """Run attempt(), hedging it once if it outlives the route's latency percentile.
+
+        With percentile None the attempt only feeds the route's latency tracker. Otherwise
+        the winning response gets response.extensions["cognos_hedge"].
+        """
+        if percentile is None:
+            started_at = time.monotonic()
+            response = await attempt()
+            if response.status_code < 500:
+                self.observe(route, time.monotonic() - started_at)
+            return response
+
+        self._counters["requests"] += 1
+        self.budget.deposit()
+        tracker = self.tracker(route)
+        delay = tracker.percentile(percentile) if len(tracker) >= self.min_samples else None
+        info: dict[str, Any] = {
+            "percentile": percentile,
+            "delay_ms": round(delay * 1000, 3) if delay is not None else None,
+            "hedged": False,
+            "winner": 1,
+        }
+        started_at = time.monotonic()
+        first = asyncio.ensure_future(attempt())
+        try:
+            if delay is None:
+                self._counters["warming_up"] += 1
+                info["skipped"] = "warming_up"
+                response = await first
+            else:
+                done, _ = await asyncio.wait({first}, timeout=delay)
+                if done:
+                    response = first.result()
+                elif not self.budget.try_spend():
+                    self._counters["budget_exhausted"] += 1
+                    info["skipped"] = "budget_exhausted"
+                    response = await first
+                else:
+                    self._counters["hedged"] += 1
+                    info["hedged"] = True
+                    hedged_at = time.monotonic()
+                    second = asyncio.ensure_future(attempt())
+                    winner = await self._race(first, second)
+                    info["winner"] = 1 if winner is first else 2
+                    response = winner.result()
+        except BaseException:
+            await _discard(first)
+            raise
+
+        finished_at = time.monotonic()
+        if response.status_code < 500:
+            if info["winner"] == 2:
+                self._counters["hedge_wins"] += 1
+                # The first attempt was still running: its latency is at least this long.
+                tracker.observe(finished_at - started_at)
+                tracker.observe(finished_at - hedged_at)
+            else:
+                tracker.observe(finished_at - started_at)
+        response.extensions["cognos_hedge"] = info
+        return response
+
+    async def _race(self, first: asyncio.Task[httpx.Response], second: asyncio.Task[httpx.Response]) -> asyncio.Task[httpx.Response]:
+        """Wait for the first successful attempt and discard the other one."""
+        pending = {first, second}
+        winner = first
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in (first, second) if task in done and _succeeded(task)]
+                if succeeded:
+                    winner = succeeded[0]
+                    break
+            # If both failed, the first attempt's outcome is reported.
+        except BaseException:
+            await asyncio.gather(_discard(first), _discard(second))
+            raise
+        await _discard(second if winner is first else first)
+        return winner
+
+    def stats(self) -> dict[str, Any]:
+        requests = self._counters["requests"]
+        return {
+            **self._counters,
+            "hedge_rate": round(self._counters["hedged"] / requests, 4) if requests else 0.0,
+            "budget_tokens": round(self.budget.tokens, 3),
+            "routes": {
+                route: {"samples": len(tracker), "p50_ms": _ms(tracker.percentile(0.5)), "p95_ms": _ms(tracker.percentile(0.95))}
+                for route, tracker in self._routes.items()
+            },
+        }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+hedger = Hedger()
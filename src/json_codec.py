@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Any
+
+JSON_CODEC = os.getenv("COGNOS_JSON_CODEC", "auto").strip().lower()
+
+logger = logging.getLogger("cognos.json_codec")
+
+# json.dumps builds a new encoder per call when given options; reuse one (it holds no state).
+_CANONICAL_ENCODER = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+
+
+def _stdlib_canonical(value: Any) -> bytes:
+    return _CANONICAL_ENCODER.encode(value).encode("utf-8")
+
+
+class StdlibCodec:
+    """Reference codec; every other codec inherits its canonical output.
+
+    Fast encoders disagree with json.dumps(sort_keys=True, separators=(",", ":")) on
+    floats, NaN/Infinity and anything json.dumps escapes to \\uXXXX. Attestation
+    payloads always carry floats, so canonical bytes (and the sha256 hashes over
+    them) always come from the stdlib's C encoder.
+    """
+
+    name = "stdlib"
+
+    def dumps(self, value: Any) -> bytes:
+        """Compact UTF-8 JSON (non-ASCII kept as-is)."""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps_text(self, value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps_canonical(self, value: Any) -> bytes:
+        """Sorted keys, compact separators, ASCII-escaped: the form attestation hashes are taken over."""
+        return _stdlib_canonical(value)
+
+    def loads(self, data: bytes | str) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(StdlibCodec):
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._orjson = orjson
+        # Types the stdlib would reject are passed through so they still raise the same way.
+        passthrough = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+        self._options = passthrough
+
+    def dumps(self, value: Any) -> bytes:
+        try:
+            return self._orjson.dumps(value, option=self._options)
+        except TypeError:
+            # Non-str keys, >64-bit ints and str/int subclasses: let the stdlib handle them.
+            return super().dumps(value)
+
+    def dumps_text(self, value: Any) -> str:
+        return self.dumps(value).decode("utf-8")
+
+    def loads(self, data: bytes | str) -> Any:
+        # Note: orjson may read integers beyond 64 bits as floats; gateway payloads never carry them.
+        try:
+            return self._orjson.loads(data)
+        except ValueError:
+            # NaN/Infinity literals; genuinely invalid input re-raises from json.loads.
+            return json.loads(data)
+
+
+class MsgspecCodec(StdlibCodec):
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        self._msgspec = msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, value: Any) -> bytes:
+        try:
+            return self._encoder.encode(value)
+        except (TypeError, OverflowError, self._msgspec.EncodeError):
+            return super().dumps(value)
+
+    def dumps_text(self, value: Any) -> str:
+        return self.dumps(value).decode("utf-8")
+
+    def loads(self, data: bytes | str) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except (ValueError, self._msgspec.DecodeError):
+            return json.loads(data)
+
+
+_CODECS: dict[str, type[StdlibCodec]] = {"orjson": OrjsonCodec, "msgspec": MsgspecCodec, "stdlib": StdlibCodec}
+
+
+def load_codec(name: str = "auto") -> StdlibCodec:
+    """Build the named codec; "auto" prefers orjson, then msgspec, then the stdlib."""
+    if name != "auto" and name not in _CODECS:
+        raise ValueError(f"Unknown JSON codec {name!r}; expected auto, {', '.join(_CODECS)}")
+    candidates = ["orjson", "msgspec", "stdlib"] if name == "auto" else [name, "stdlib"]
+    for candidate in candidates:
+        try:
+            return _CODECS[candidate]()
+        except ImportError:
+            if name != "auto":
+                logger.warning("JSON codec %s is not installed; falling back to stdlib json", candidate)
+    return StdlibCodec()
+
+
+codec = load_codec(JSON_CODEC)
+
+
+def dumps(value: Any) -> bytes:
+    return codec.dumps(value)
+
+
+def dumps_text(value: Any) -> str:
+    return codec.dumps_text(value)
+
+
+def dumps_canonical(value: Any) -> bytes:
+    return codec.dumps_canonical(value)
+
+
+def loads(data: bytes | str) -> Any:
+    return codec.loads(data)
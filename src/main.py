@@ -1,45 +1,141 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+import functools
 import hashlib
 import json
+import logging
+import math
 import os
+import random
+import signal
+import threading
+import time
 import uuid
 from datetime import datetime, timezone
-from typing import Any, AsyncIterator
+from typing import Any, AsyncIterator, Iterable, Iterator, Literal
 
+import anyio
 import httpx
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import ValidationError
-from models import ChatCompletionRequest, ChatCompletionResponse, TraceRecord, TrustReportRequest, TrustReportResponse
-from policy import resolve_decision
+from starlette.background import BackgroundTask
+import json_codec
+import policy
+import provider_routes
+from canonical import JsonBody, canonical_digest
+from hedging import HEDGE_PERCENTILE, hedger
+from models import (
+    ChatCompletionRequest,
+    ChatCompletionResponse,
+    PolicyReplayRequest,
+    TraceRecord,
+    TrustReportRequest,
+    TrustReportResponse,
+)
+from ood_detector import ood_detector
+from policy_replay import replay as replay_policies
+from policy_tuner import parse_mix, policy_tuner
 from reports import build_trust_report
-from trace_store import get_trace, init_db, save_trace
-
-app = FastAPI(title="Operational Cognos Gateway", version="0.1.0")
-
-UPSTREAM_BASE_URL = os.getenv("COGNOS_UPSTREAM_BASE_URL", "https://api.openai.com/v1")
-UPSTREAM_API_KEY = os.getenv("COGNOS_UPSTREAM_API_KEY", "")
-INSTANCE_OPENAI_BASE_URL = os.getenv("COGNOS_INSTANCE_OPENAI_BASE_URL", "https://api.openai.com/v1")
-INSTANCE_OPENAI_API_KEY = os.getenv("COGNOS_INSTANCE_OPENAI_API_KEY", "")
-INSTANCE_GOOGLE_BASE_URL = os.getenv("COGNOS_INSTANCE_GOOGLE_BASE_URL", "")
-INSTANCE_GOOGLE_API_KEY = os.getenv("COGNOS_INSTANCE_GOOGLE_API_KEY", "")
-INSTANCE_CLAUDE_BASE_URL = os.getenv("COGNOS_INSTANCE_CLAUDE_BASE_URL", "")
-INSTANCE_CLAUDE_API_KEY = os.getenv("COGNOS_INSTANCE_CLAUDE_API_KEY", "")
-INSTANCE_MISTRAL_BASE_URL = os.getenv("COGNOS_INSTANCE_MISTRAL_BASE_URL", "")
-INSTANCE_MISTRAL_API_KEY = os.getenv("COGNOS_INSTANCE_MISTRAL_API_KEY", "")
-INSTANCE_OLLAMA_BASE_URL = os.getenv("COGNOS_INSTANCE_OLLAMA_BASE_URL", "")
-INSTANCE_OLLAMA_API_KEY = os.getenv("COGNOS_INSTANCE_OLLAMA_API_KEY", "")
+from response_cache import response_cache
+from shadow_runner import ShadowJob, completion_text, shadow_runner
+from signals import SignalInput, SignalReport, signal_engine
+from simhash_index import format_simhash, representative_of, simhash_index, text_simhash
+from single_flight import Flight, single_flight
+from trace_ids import new_trace_id
+from trace_store import close_connections as close_trace_connections
+from trace_store import (
+    backfill_columns,
+    cluster_stats,
+    get_trace,
+    init_db,
+    load_cluster_ids,
+    query_traces,
+    stream_traces,
+)
+from trace_writer import TracePatch, trace_writer
+from upstream_balancer import HEALTH_CHECK_INTERVAL_SECONDS, UpstreamUnavailable, upstream_balancer
+from upstream_pool import close_all as close_upstream_clients
+from upstream_pool import get_client as get_upstream_client
+from upstream_pool import pool_stats as upstream_pool_stats
+from upstream_retry import REQUEST_DEADLINE_SECONDS, RETRY_MAX_RETRIES, DeadlineExceeded, retry_engine
+
+logger = logging.getLogger("cognos.gateway")
+
+
+class CodecJSONResponse(JSONResponse):
+    """JSONResponse rendered with the configured json_codec (orjson/msgspec when installed)."""
+
+    def render(self, content: Any) -> bytes:
+        return json_codec.dumps(content)
+
+
+app = FastAPI(title="Operational Cognos Gateway", version="0.1.0", default_response_class=CodecJSONResponse)
+
+TRACE_PAGE_MAX = int(os.getenv("COGNOS_TRACE_PAGE_MAX", "5000"))
 DEFAULT_POLICY = os.getenv("COGNOS_DEFAULT_POLICY", "default_v1")
-REQUEST_TIMEOUT_SECONDS = float(os.getenv("COGNOS_REQUEST_TIMEOUT_SECONDS", "120"))
 MOCK_UPSTREAM = os.getenv("COGNOS_MOCK_UPSTREAM", "false").lower() in {"1", "true", "yes"}
 GATEWAY_API_KEY = os.getenv("COGNOS_GATEWAY_API_KEY", "")
 ALLOW_NO_UPSTREAM_AUTH = os.getenv("COGNOS_ALLOW_NO_UPSTREAM_AUTH", "false").lower() in {"1", "true", "yes"}
+TRACE_WRITE_BEHIND = os.getenv("COGNOS_TRACE_WRITE_BEHIND", "true").lower() in {"1", "true", "yes"}
+RESPONSE_VALIDATION_SAMPLE_RATE = float(os.getenv("COGNOS_RESPONSE_VALIDATION_SAMPLE_RATE", "1.0"))
 
 
 @app.on_event("startup")
 async def on_startup() -> None:
     init_db()
+    simhash_index.load(representative_of(cluster_id) for cluster_id in load_cluster_ids())
+    ood_detector.load()
+    # Chunked and resumable; runs beside live traffic instead of delaying startup.
+    app.state.backfill_stop = threading.Event()
+    app.state.backfill = asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(backfill_columns, stop=app.state.backfill_stop)
+    )
+    app.state.backfill.add_done_callback(_log_backfill_result)
+    if TRACE_WRITE_BEHIND:
+        trace_writer.start()
+    upstream_balancer.watch(provider_routes.current().endpoint_groups())
+    upstream_balancer.start(HEALTH_CHECK_INTERVAL_SECONDS)
+    shadow_runner.start()
+    signal_engine.start()
+    ood_detector.start()
+    policy_tuner.start()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _reload_on_sighup)
+    except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+        # No SIGHUP on Windows, and signal handlers can only be set from the main thread.
+        logger.debug("SIGHUP route and policy reload unavailable in this process")
+    if DEFAULT_POLICY not in policy.current():
+        logger.error("COGNOS_DEFAULT_POLICY %r is not a loaded policy; requests without a policy_id will be rejected", DEFAULT_POLICY)
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await shadow_runner.stop()
+    await signal_engine.stop()
+    await ood_detector.stop()
+    await policy_tuner.stop()
+    await upstream_balancer.stop()
+    await close_upstream_clients()
+    backfill = getattr(app.state, "backfill", None)
+    if backfill is not None:
+        # Stops after the current chunk; progress is checkpointed, so the next startup resumes it.
+        app.state.backfill_stop.set()
+        await asyncio.gather(backfill, return_exceptions=True)
+    await asyncio.to_thread(trace_writer.stop)
+    close_trace_connections()
+
+
+def _log_backfill_result(future: asyncio.Future[int]) -> None:
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error("Trace column backfill failed; it resumes from its checkpoint on the next startup", exc_info=error)
+    elif future.result():
+        logger.info("Backfilled materialized trace columns on %d rows", future.result())
 
 
 @app.get("/healthz")
@@ -47,14 +143,240 @@ async def healthz() -> dict[str, str]:
     return {"status": "ok", "service": "operational-cognos-gateway"}
 
 
+@app.get("/internal/upstream/pool")
+async def upstream_pool(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return upstream_pool_stats()
+
+
+@app.get("/internal/traces/writer")
+async def trace_writer_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return trace_writer.stats()
+
+
+@app.get("/internal/cache/stats")
+async def response_cache_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return response_cache.stats()
+
+
+@app.get("/internal/upstream/single-flight")
+async def single_flight_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return single_flight.stats()
+
+
+@app.get("/internal/upstream/endpoints")
+async def upstream_endpoints(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return upstream_balancer.stats()
+
+
+@app.get("/internal/upstream/hedging")
+async def hedging_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return hedger.stats()
+
+
+@app.get("/internal/upstream/retries")
+async def retry_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return retry_engine.stats()
+
+
+@app.get("/internal/shadow")
+async def shadow_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return shadow_runner.stats()
+
+
+@app.get("/internal/signals")
+async def signal_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return signal_engine.stats()
+
+
+@app.get("/internal/ood")
+async def ood_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return ood_detector.stats()
+
+
+@app.get("/internal/simhash")
+async def simhash_stats(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return simhash_index.stats()
+
+
+@app.get("/internal/routes")
+async def provider_routes_table(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return provider_routes.current().describe()
+
+
+@app.post("/internal/routes/reload")
+async def reload_provider_routes(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    try:
+        table = provider_routes.reload()
+    except provider_routes.RoutingConfigError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    upstream_balancer.watch(table.endpoint_groups())
+    return table.describe()
+
+
+@app.get("/internal/policies")
+async def policy_table(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    return policy.current().describe()
+
+
+@app.post("/internal/policies/reload")
+async def reload_policies(request: Request) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    try:
+        table = policy.reload()
+    except policy.PolicyConfigError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    return table.describe()
+
+
+@app.post("/internal/policies/replay")
+async def replay_policy_candidates(request: Request, payload: PolicyReplayRequest) -> dict[str, Any]:
+    """Re-decide stored traces under candidate policies (the active table, or an unsaved config)."""
+    _require_gateway_auth(request.headers)
+    try:
+        table = policy.current() if payload.policies is None else policy.compile_policies(payload.policies, source="request")
+    except policy.PolicyConfigError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    created_from_ms = _timestamp_param_ms(payload.created_from, "created_from")
+    created_to_ms = _timestamp_param_ms(payload.created_to, "created_to")
+
+    await asyncio.to_thread(trace_writer.flush)
+    try:
+        return await asyncio.to_thread(
+            replay_policies,
+            table,
+            payload.policy_ids,
+            created_from_ms=created_from_ms,
+            created_to_ms=created_to_ms,
+            model=payload.model,
+            policy=payload.policy,
+            mode=payload.mode,
+        )
+    except policy.UnknownPolicyError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+
+
+@app.get("/internal/policies/suggestions")
+async def policy_suggestions(
+    request: Request,
+    refresh: bool = False,
+    target_mix: str | None = None,
+    limit: int = Query(default=20, ge=1),
+) -> dict[str, Any]:
+    """Ranked target_risk / band patches from the tuner's sliding window of traces."""
+    _require_gateway_auth(request.headers)
+    try:
+        target = parse_mix(target_mix) if target_mix is not None else policy_tuner.target_mix
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    if refresh:
+        await asyncio.to_thread(trace_writer.flush)
+        await asyncio.to_thread(policy_tuner.refresh)
+    suggestions = await asyncio.to_thread(policy_tuner.suggest, policy.current(), target_mix, limit)
+    return {
+        "target_mix": dict(zip(policy.DECISIONS, (round(float(share), 4) for share in target))),
+        "window": policy_tuner.stats(),
+        "suggestions": suggestions,
+    }
+
+
+@app.get("/v1/traces")
+async def list_traces(
+    request: Request,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    decision: Literal["PASS", "REFINE", "ESCALATE", "BLOCK"] | None = None,
+    policy: str | None = None,
+    model: str | None = None,
+    status_code: int | None = None,
+    min_risk: float | None = Query(default=None, ge=0.0, le=1.0),
+    max_risk: float | None = Query(default=None, ge=0.0, le=1.0),
+    cursor: str | None = None,
+    limit: int = Query(default=100, ge=1),
+    full: bool = False,
+    format: Literal["json", "ndjson"] = "json",
+) -> Response:
+    _require_gateway_auth(request.headers)
+    filters: dict[str, Any] = {
+        "created_from_ms": _timestamp_param_ms(created_from, "created_from"),
+        "created_to_ms": _timestamp_param_ms(created_to, "created_to"),
+        "decision": decision,
+        "policy": policy,
+        "model": model,
+        "status_code": status_code,
+        "min_risk": min_risk,
+        "max_risk": max_risk,
+        "after": _decode_cursor(cursor) if cursor else None,
+        "limit": min(limit, TRACE_PAGE_MAX),
+        "full": full,
+    }
+
+    if format == "ndjson":
+        rows, next_after = await asyncio.to_thread(stream_traces, **filters)
+        next_cursor = _encode_cursor(next_after) if next_after else None
+        return StreamingResponse(
+            _iter_ndjson(rows, next_cursor),
+            media_type="application/x-ndjson",
+            headers={"X-Cognos-Next-Cursor": next_cursor or ""},
+        )
+    traces, next_after = await asyncio.to_thread(query_traces, **filters)
+    next_cursor = _encode_cursor(next_after) if next_after else None
+    return CodecJSONResponse(content={"traces": traces, "count": len(traces), "next_cursor": next_cursor})
+
+
 @app.get("/v1/traces/{trace_id}")
 async def trace_by_id(trace_id: str) -> dict[str, Any]:
+    if trace_writer.is_pending(trace_id):
+        await asyncio.to_thread(trace_writer.flush)
     trace = get_trace(trace_id)
     if trace is None:
         raise HTTPException(status_code=404, detail="Trace not found")
     return TraceRecord.model_validate(trace).model_dump(mode="json")
 
 
+@app.get("/v1/clusters/{cluster_id}")
+async def cluster_by_id(
+    request: Request,
+    cluster_id: str,
+    cursor: str | None = None,
+    limit: int = Query(default=100, ge=1),
+) -> dict[str, Any]:
+    _require_gateway_auth(request.headers)
+    try:
+        representative = representative_of(cluster_id)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    await asyncio.to_thread(trace_writer.flush)
+    stats = await asyncio.to_thread(cluster_stats, cluster_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    traces, next_after = await asyncio.to_thread(
+        query_traces,
+        cluster_id=cluster_id,
+        after=_decode_cursor(cursor) if cursor else None,
+        limit=min(limit, TRACE_PAGE_MAX),
+    )
+    return {
+        **stats,
+        "simhash": format_simhash(representative),
+        "traces": traces,
+        "next_cursor": _encode_cursor(next_after) if next_after else None,
+    }
+
+
 @app.post("/v1/reports/trust")
 async def create_trust_report(request: Request) -> dict[str, Any]:
     _require_gateway_auth(request.headers)
@@ -66,20 +388,25 @@ async def create_trust_report(request: Request) -> dict[str, Any]:
     except Exception as error:
         raise HTTPException(status_code=400, detail=f"Invalid JSON body: {error}")
 
-    report = build_trust_report(report_request.trace_ids, regime=report_request.regime, fmt=report_request.format)
+    await asyncio.to_thread(trace_writer.flush)
+    report = await asyncio.to_thread(
+        build_trust_report, report_request.trace_ids, regime=report_request.regime, fmt=report_request.format
+    )
     return TrustReportResponse.model_validate(report).model_dump(mode="json")
 
 
 @app.post("/v1/chat/completions")
 async def chat_completions(request: Request) -> Response:
     _require_gateway_auth(request.headers)
-    trace_id = f"tr_{uuid.uuid4().hex[:12]}"
-    created_at = datetime.now(timezone.utc).isoformat()
+    created = datetime.now(timezone.utc)
+    created_at = created.isoformat()
+    trace_id = new_trace_id(int(created.timestamp() * 1000))
+    started_at = time.perf_counter()
 
     try:
-        payload = await request.json()
+        body = JsonBody.parse(await request.body())
+        payload = body.payload
         request_model = ChatCompletionRequest.model_validate(payload)
-        payload = request_model.model_dump(exclude_none=True)
         cognos_cfg = request_model.cognos
     except Exception as error:
         if isinstance(error, ValidationError):
@@ -87,25 +414,20 @@ async def chat_completions(request: Request) -> Response:
         raise HTTPException(status_code=400, detail=f"Invalid JSON body: {error}")
 
     model = request_model.model
-    decision, risk = resolve_decision(cognos_cfg.mode, cognos_cfg.target_risk)
     active_policy = cognos_cfg.policy_id or DEFAULT_POLICY
+    try:
+        compiled_policy = policy.get(active_policy, model)
+    except policy.UnknownPolicyError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
 
-    upstream_target = _resolve_upstream_target(str(payload.get("model", model)))
-    upstream_url = f"{upstream_target['base_url'].rstrip('/')}/chat/completions"
+    upstream_target = provider_routes.resolve(str(payload.get("model", model)))
     is_stream = bool(request_model.stream)
-    response_headers = _epistemic_headers(
-        trace_id=trace_id,
-        decision=decision,
-        trust_score=1.0 - risk,
-        policy=active_policy,
-    )
 
-    request_fingerprint = _payload_fingerprint(payload, model_id=model)
-    upstream_payload = {k: v for k, v in payload.items() if k != "cognos"}
-    upstream_payload["model"] = upstream_target["model"]
+    request_fingerprint = _request_fingerprint(body, request_model)
 
     if MOCK_UPSTREAM:
         if is_stream:
+            decision, risk, _, signal_report = _assess(request_model, "", compiled_policy)
             envelope = _build_cognos_envelope(
                 trace_id=trace_id,
                 policy=active_policy,
@@ -113,8 +435,9 @@ async def chat_completions(request: Request) -> Response:
                 risk=risk,
                 shadow_pct=cognos_cfg.shadow_pct,
                 shadow_models=cognos_cfg.shadow_models,
+                signals=signal_report.signals,
             )
-            _persist_trace(
+            await _persist_trace(
                 trace_id=trace_id,
                 created_at=created_at,
                 is_stream=True,
@@ -123,10 +446,21 @@ async def chat_completions(request: Request) -> Response:
                 request_fingerprint=request_fingerprint,
                 response_fingerprint=_payload_fingerprint({"trace_id": trace_id, "stream": True}, model_id=model),
                 envelope=envelope,
-                metadata={"mode": "mock", "upstream": "none", "usage": {"total_tokens": 0}, "retention": cognos_cfg.retention},
+                metadata={
+                    "mode": "mock",
+                    "upstream": "none",
+                    "usage": {"total_tokens": 0},
+                    "retention": cognos_cfg.retention,
+                    "signals": signal_report.as_metadata(),
+                },
+            )
+            return StreamingResponse(
+                _mock_sse_stream(trace_id),
+                media_type="text/event-stream",
+                headers=_epistemic_headers(trace_id=trace_id, decision=decision, trust_score=1.0 - risk, policy=active_policy),
             )
-            return StreamingResponse(_mock_sse_stream(trace_id), media_type="text/event-stream", headers=response_headers)
-        upstream_json = _mock_non_stream_response(upstream_payload)
+        upstream_json = _mock_non_stream_response({"model": upstream_target["model"]})
+        decision, risk, signal_input, signal_report = _assess(request_model, completion_text(upstream_json), compiled_policy)
         envelope = _build_cognos_envelope(
             trace_id=trace_id,
             policy=active_policy,
@@ -134,10 +468,11 @@ async def chat_completions(request: Request) -> Response:
             risk=risk,
             shadow_pct=cognos_cfg.shadow_pct,
             shadow_models=cognos_cfg.shadow_models,
+            signals=signal_report.signals,
         )
         upstream_json["cognos"] = envelope
         ChatCompletionResponse.model_validate(upstream_json)
-        _persist_trace(
+        await _persist_trace(
             trace_id=trace_id,
             created_at=created_at,
             is_stream=False,
@@ -146,9 +481,20 @@ async def chat_completions(request: Request) -> Response:
             request_fingerprint=request_fingerprint,
             response_fingerprint=_payload_fingerprint(upstream_json, model_id=model),
             envelope=envelope,
-            metadata={"mode": "mock", "upstream": "none", "usage": _extract_usage(upstream_json), "retention": cognos_cfg.retention},
+            metadata={
+                "mode": "mock",
+                "upstream": "none",
+                "usage": _extract_usage(upstream_json),
+                "retention": cognos_cfg.retention,
+                "signals": signal_report.as_metadata(),
+            },
+        )
+        _submit_signals(trace_id, signal_input, signal_report)
+        return CodecJSONResponse(
+            status_code=200,
+            content=upstream_json,
+            headers=_epistemic_headers(trace_id=trace_id, decision=decision, trust_score=1.0 - risk, policy=active_policy),
         )
-        return JSONResponse(status_code=200, content=upstream_json, headers=response_headers)
 
     outbound_headers = _build_upstream_headers(
         request.headers,
@@ -156,15 +502,146 @@ async def chat_completions(request: Request) -> Response:
         upstream_base_url=upstream_target["base_url"],
     )
 
+    upstream_edits: dict[str, Any] = {"exclude": ("cognos",), "overrides": {"model": upstream_target["model"]}}
+    upstream_digest, _ = body.canonical_fingerprint(**upstream_edits)
+    request_key = _upstream_request_key(upstream_target["base_url"], outbound_headers, upstream_digest)
+    cache_key: str | None = None
+    if cognos_cfg.cache != "bypass" and not is_stream and response_cache.enabled:
+        cache_key = request_key
+        cached = response_cache.get(cache_key) if cognos_cfg.cache == "use" else None
+        if cached is not None:
+            cached_body = JsonBody.parse(cached["body"])
+            decision, risk, signal_input, signal_report = _assess(request_model, completion_text(cached_body.payload), compiled_policy)
+            envelope = _build_cognos_envelope(
+                trace_id=trace_id,
+                policy=active_policy,
+                decision=decision,
+                risk=risk,
+                shadow_pct=cognos_cfg.shadow_pct,
+                shadow_models=cognos_cfg.shadow_models,
+                signals=signal_report.signals,
+            )
+            content, upstream_json = _splice_envelope(cached_body, envelope)
+            await _persist_trace(
+                trace_id=trace_id,
+                created_at=created_at,
+                is_stream=False,
+                status_code=200,
+                model=model,
+                request_fingerprint=request_fingerprint,
+                response_fingerprint=_bytes_fingerprint(cached["body"], model_id=model),
+                envelope=envelope,
+                metadata={
+                    "mode": "live",
+                    "upstream": "cache",
+                    "usage": _extract_usage(upstream_json),
+                    "retention": cognos_cfg.retention,
+                    "cache": {"status": "hit", "source_trace_id": cached["meta"].get("trace_id"), "age_ms": cached["age_ms"]},
+                    "signals": signal_report.as_metadata(),
+                },
+            )
+            _submit_signals(trace_id, signal_input, signal_report)
+            return Response(
+                status_code=200,
+                content=content,
+                media_type="application/json",
+                headers={
+                    **_epistemic_headers(trace_id=trace_id, decision=decision, trust_score=1.0 - risk, policy=active_policy),
+                    "X-Cognos-Cache": "HIT",
+                },
+            )
+
+    fetch = functools.partial(
+        upstream_balancer.send,
+        upstream_target["endpoints"],
+        functools.partial(
+            _send_upstream,
+            headers=outbound_headers,
+            content=body.forward_bytes(**upstream_edits),
+            is_stream=is_stream,
+        ),
+    )
+    if not is_stream:
+        fetch = functools.partial(
+            hedger.run,
+            f"{upstream_target['provider']}|{upstream_target['model']}",
+            _hedge_percentile(cognos_cfg.hedge, cognos_cfg.hedge_percentile, upstream_target["hedge_percentile"]),
+            fetch,
+        )
+    fetch = functools.partial(
+        retry_engine.run,
+        fetch,
+        RETRY_MAX_RETRIES if cognos_cfg.max_retries is None else cognos_cfg.max_retries,
+        cognos_cfg.deadline_ms / 1000 if cognos_cfg.deadline_ms is not None else REQUEST_DEADLINE_SECONDS,
+    )
+    flight: Flight | None = None
+    coalesced: dict[str, Any] | None = None
     try:
-        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT_SECONDS) as client:
-            upstream_response = await client.post(upstream_url, headers=outbound_headers, json=upstream_payload)
+        shared = None
+        if single_flight.enabled and _coalesces(cognos_cfg.coalesce, request_model):
+            shared = await single_flight.do(f"{request_key}|stream={is_stream}", trace_id, fetch)
+        if shared is not None:
+            flight, is_leader = shared
+            upstream_response = flight.response
+            if not is_leader:
+                coalesced = {
+                    "leader_trace_id": flight.leader_trace_id,
+                    "wait_ms": round((time.perf_counter() - started_at) * 1000, 3),
+                }
+        else:
+            upstream_response = await fetch()
+    except UpstreamUnavailable as error:
+        # Shed immediately instead of queueing behind a degraded or saturated upstream.
+        envelope = _build_cognos_envelope(trace_id=trace_id, policy=active_policy, decision="ESCALATE", risk=1.0)
+        await _persist_trace(
+            trace_id=trace_id,
+            created_at=created_at,
+            is_stream=is_stream,
+            status_code=503,
+            model=model,
+            request_fingerprint=request_fingerprint,
+            response_fingerprint=_payload_fingerprint({"error": True, "status": 503}, model_id=model),
+            envelope=envelope,
+            metadata={
+                "mode": "live",
+                "upstream": "shed",
+                "usage": {"total_tokens": 0},
+                "retention": cognos_cfg.retention,
+                "shed": {"reason": error.reason, "detail": error.detail},
+            },
+        )
+        return CodecJSONResponse(
+            status_code=503,
+            content={"error": "Upstream unavailable", "reason": error.reason, "detail": error.detail, "trace_id": trace_id},
+            headers={"Retry-After": str(max(1, math.ceil(error.retry_after_seconds)))},
+        )
+    except DeadlineExceeded as error:
+        envelope = _build_cognos_envelope(trace_id=trace_id, policy=active_policy, decision="ESCALATE", risk=1.0)
+        await _persist_trace(
+            trace_id=trace_id,
+            created_at=created_at,
+            is_stream=is_stream,
+            status_code=504,
+            model=model,
+            request_fingerprint=request_fingerprint,
+            response_fingerprint=_payload_fingerprint({"error": True, "status": 504}, model_id=model),
+            envelope=envelope,
+            metadata={
+                "mode": "live",
+                "upstream": "deadline",
+                "usage": {"total_tokens": 0},
+                "retention": cognos_cfg.retention,
+                "retry": {"attempts": error.attempts, "retries": len(error.attempts) - 1},
+            },
+        )
+        return CodecJSONResponse(status_code=504, content={"error": "Upstream deadline exceeded", "trace_id": trace_id})
     except httpx.HTTPError as error:
         raise HTTPException(status_code=502, detail=f"Upstream request failed: {error}")
 
+    # Retries are resolved inside fetch(): only the final attempt's status drives the decision.
     if upstream_response.status_code >= 400:
         envelope = _build_cognos_envelope(trace_id=trace_id, policy=active_policy, decision="ESCALATE", risk=1.0)
-        _persist_trace(
+        await _persist_trace(
             trace_id=trace_id,
             created_at=created_at,
             is_stream=is_stream,
@@ -173,9 +650,13 @@ async def chat_completions(request: Request) -> Response:
             request_fingerprint=request_fingerprint,
             response_fingerprint=_payload_fingerprint({"error": True, "status": upstream_response.status_code}, model_id=model),
             envelope=envelope,
-            metadata={"mode": "live", "upstream": "error", "usage": {"total_tokens": 0}, "retention": cognos_cfg.retention},
+            metadata=_with_upstream_context(
+                {"mode": "live", "upstream": "error", "usage": {"total_tokens": 0}, "retention": cognos_cfg.retention},
+                upstream_response,
+                coalesced,
+            ),
         )
-        return JSONResponse(
+        return CodecJSONResponse(
             status_code=upstream_response.status_code,
             content={
                 "error": "Upstream provider returned an error",
@@ -187,33 +668,66 @@ async def chat_completions(request: Request) -> Response:
     content_type = upstream_response.headers.get("content-type", "")
 
     if is_stream and "text/event-stream" in content_type:
-        envelope = _build_cognos_envelope(
-            trace_id=trace_id,
-            policy=active_policy,
-            decision=decision,
-            risk=risk,
-            shadow_pct=cognos_cfg.shadow_pct,
-            shadow_models=cognos_cfg.shadow_models,
-        )
-        _persist_trace(
-            trace_id=trace_id,
-            created_at=created_at,
-            is_stream=True,
-            status_code=200,
-            model=model,
-            request_fingerprint=request_fingerprint,
-            response_fingerprint=_payload_fingerprint({"trace_id": trace_id, "stream": True}, model_id=model),
-            envelope=envelope,
-            metadata={"mode": "live", "upstream": "stream", "usage": {"total_tokens": 0}, "retention": cognos_cfg.retention},
+        try:
+            # The streamed text is relayed, not buffered, so only request-side signals apply.
+            decision, risk, _, signal_report = _assess(request_model, "", compiled_policy)
+            response_headers = _epistemic_headers(trace_id=trace_id, decision=decision, trust_score=1.0 - risk, policy=active_policy)
+            envelope = _build_cognos_envelope(
+                trace_id=trace_id,
+                policy=active_policy,
+                decision=decision,
+                risk=risk,
+                shadow_pct=cognos_cfg.shadow_pct,
+                shadow_models=cognos_cfg.shadow_models,
+                signals=signal_report.signals,
+            )
+            trace_fields: dict[str, Any] = {
+                "trace_id": trace_id,
+                "created_at": created_at,
+                "is_stream": True,
+                "status_code": 200,
+                "model": model,
+                "request_fingerprint": request_fingerprint,
+                "response_fingerprint": _payload_fingerprint({"trace_id": trace_id, "stream": True}, model_id=model),
+                "envelope": envelope,
+                "metadata": _with_upstream_context(
+                    {
+                        "mode": "live",
+                        "upstream": "stream",
+                        "usage": {"total_tokens": 0},
+                        "retention": cognos_cfg.retention,
+                        "signals": signal_report.as_metadata(),
+                    },
+                    upstream_response,
+                    coalesced,
+                ),
+            }
+            await _persist_trace(**trace_fields)
+        except BaseException:
+            if flight is not None and flight.is_streaming:
+                # This caller never reaches flight.stream(), whose exit would otherwise release it.
+                flight.release()
+            raise
+
+        if flight is not None:
+            # The shared response is owned by the flight, which closes it after the last reader.
+            return StreamingResponse(
+                _relay_upstream_stream(flight.stream(), trace_fields, started_at),
+                media_type="text/event-stream",
+                headers=response_headers,
+            )
+        return StreamingResponse(
+            _relay_upstream_stream(_iter_stream_chunks(upstream_response), trace_fields, started_at),
+            media_type="text/event-stream",
+            headers=response_headers,
+            background=BackgroundTask(upstream_response.aclose),
         )
 
-        async def stream_body() -> AsyncIterator[bytes]:
-            async for chunk in _iter_stream_chunks(upstream_response):
-                yield chunk
-
-        return StreamingResponse(stream_body(), media_type="text/event-stream", headers=response_headers)
-
-    upstream_json = upstream_response.json()
+    upstream_body = JsonBody.parse(upstream_response.content)
+    response_text = completion_text(upstream_body.payload)
+    decision, risk, signal_input, signal_report = _assess(request_model, response_text, compiled_policy)
+    response_headers = _epistemic_headers(trace_id=trace_id, decision=decision, trust_score=1.0 - risk, policy=active_policy)
+    shadow_status = shadow_runner.admit(cognos_cfg.shadow_pct, cognos_cfg.shadow_models)
     envelope = _build_cognos_envelope(
         trace_id=trace_id,
         policy=active_policy,
@@ -221,23 +735,77 @@ async def chat_completions(request: Request) -> Response:
         risk=risk,
         shadow_pct=cognos_cfg.shadow_pct,
         shadow_models=cognos_cfg.shadow_models,
+        shadow_status=shadow_status or "not sampled",
+        signals=signal_report.signals,
     )
-    upstream_json["cognos"] = envelope
-    ChatCompletionResponse.model_validate(upstream_json)
+    content, upstream_json = _splice_envelope(upstream_body, envelope)
 
-    _persist_trace(
-        trace_id=trace_id,
-        created_at=created_at,
-        is_stream=False,
-        status_code=200,
-        model=model,
-        request_fingerprint=request_fingerprint,
-        response_fingerprint=_payload_fingerprint(upstream_json, model_id=model),
-        envelope=envelope,
-        metadata={"mode": "live", "upstream": "json", "usage": _extract_usage(upstream_json), "retention": cognos_cfg.retention},
+    metadata = _with_upstream_context(
+        {
+            "mode": "live",
+            "upstream": "json",
+            "usage": _extract_usage(upstream_json),
+            "retention": cognos_cfg.retention,
+            "signals": signal_report.as_metadata(),
+        },
+        upstream_response,
+        coalesced,
     )
+    if cache_key is not None:
+        stored = response_cache.put(cache_key, upstream_response.content, {"trace_id": trace_id})
+        cache_status = "miss" if cognos_cfg.cache == "use" else "refresh"
+        metadata["cache"] = {"status": cache_status, "stored": stored}
+        response_headers = {**response_headers, "X-Cognos-Cache": cache_status.upper()}
+
+    trace_fields = {
+        "trace_id": trace_id,
+        "created_at": created_at,
+        "is_stream": False,
+        "status_code": 200,
+        "model": model,
+        "request_fingerprint": request_fingerprint,
+        "response_fingerprint": _bytes_fingerprint(upstream_response.content, model_id=model),
+        "envelope": envelope,
+        "metadata": metadata,
+    }
+    await _persist_trace(**trace_fields)
+    _submit_signals(trace_id, signal_input, signal_report)
+    if shadow_status == "queued":
+        _submit_shadow(trace_id, request.headers, body, cognos_cfg.shadow_models, response_text)
+
+    return Response(status_code=200, content=content, media_type="application/json", headers=response_headers)
+
+
+def _timestamp_param_ms(value: str | None, field: str) -> int | None:
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid ISO timestamp for {field}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(round(parsed.timestamp() * 1000))
+
+
+def _encode_cursor(after: tuple[int, str]) -> str:
+    raw = json.dumps(list(after), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[int, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_ms, trace_id = json.loads(raw)
+        return int(created_ms), str(trace_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
-    return JSONResponse(status_code=200, content=upstream_json, headers=response_headers)
+def _iter_ndjson(traces: Iterable[dict[str, Any]], next_cursor: str | None) -> Iterator[bytes]:
+    for trace in traces:
+        yield json_codec.dumps(trace) + b"\n"
+    yield json_codec.dumps({"next_cursor": next_cursor}) + b"\n"
 
 
 def _build_upstream_headers(incoming_headers: Any, upstream_api_key: str, upstream_base_url: str) -> dict[str, str]:
@@ -260,81 +828,21 @@ def _build_upstream_headers(incoming_headers: Any, upstream_api_key: str, upstre
     return headers
 
 
-def _normalize_model_for_upstream(model: str) -> str:
-    normalized = (model or "").strip()
-    if ":" not in normalized:
-        return normalized
-
-    prefix, remainder = normalized.split(":", 1)
-    base = UPSTREAM_BASE_URL.lower()
-
-    if "api.openai.com" in base and prefix.lower() == "openai":
-        return remainder
-
-    return normalized
-
-
-def _resolve_upstream_target(model: str) -> dict[str, str]:
-    normalized_model = (model or "").strip()
-    base_url = UPSTREAM_BASE_URL
-    api_key = UPSTREAM_API_KEY
-
-    if ":" in normalized_model:
-        prefix, remainder = normalized_model.split(":", 1)
-        prefix = prefix.lower().strip()
-        remainder = remainder.strip()
-
-        if prefix == "openai":
-            base_url = INSTANCE_OPENAI_BASE_URL or UPSTREAM_BASE_URL
-            api_key = INSTANCE_OPENAI_API_KEY or UPSTREAM_API_KEY
-            normalized_model = _normalize_prefixed_model(prefix, remainder, base_url)
-        elif prefix == "google":
-            base_url = INSTANCE_GOOGLE_BASE_URL or UPSTREAM_BASE_URL
-            api_key = INSTANCE_GOOGLE_API_KEY or UPSTREAM_API_KEY
-            normalized_model = _normalize_prefixed_model(prefix, remainder, base_url)
-        elif prefix in {"claude", "anthropic"}:
-            base_url = INSTANCE_CLAUDE_BASE_URL or UPSTREAM_BASE_URL
-            api_key = INSTANCE_CLAUDE_API_KEY or UPSTREAM_API_KEY
-            normalized_model = _normalize_prefixed_model(prefix, remainder, base_url)
-        elif prefix == "mistral":
-            base_url = INSTANCE_MISTRAL_BASE_URL or UPSTREAM_BASE_URL
-            api_key = INSTANCE_MISTRAL_API_KEY or UPSTREAM_API_KEY
-            normalized_model = _normalize_prefixed_model(prefix, remainder, base_url)
-        elif prefix == "ollama":
-            base_url = INSTANCE_OLLAMA_BASE_URL or UPSTREAM_BASE_URL
-            api_key = INSTANCE_OLLAMA_API_KEY or UPSTREAM_API_KEY
-            normalized_model = _normalize_prefixed_model(prefix, remainder, base_url)
-        else:
-            normalized_model = _normalize_model_for_upstream(normalized_model)
-    else:
-        normalized_model = _normalize_model_for_upstream(normalized_model)
-
-    return {
-        "base_url": base_url,
-        "api_key": api_key,
-        "model": normalized_model,
-    }
-
-
-def _normalize_prefixed_model(prefix: str, remainder: str, base_url: str) -> str:
-    lowered_base = (base_url or "").lower()
-
-    if "api.openai.com" in lowered_base and prefix == "openai":
-        return remainder
+def _reload_on_sighup() -> None:
+    _reload_provider_routes()
+    try:
+        policy.reload()
+    except policy.PolicyConfigError as error:
+        logger.error("Policy reload failed; keeping the current policies: %s", error)
 
-    if "openrouter.ai" in lowered_base:
-        if prefix == "openai":
-            return f"openai/{remainder}"
-        if prefix == "google":
-            return f"google/{remainder}"
-        if prefix in {"claude", "anthropic"}:
-            return f"anthropic/{remainder}"
-        if prefix == "mistral":
-            return f"mistralai/{remainder}"
-        if prefix == "ollama":
-            return remainder
 
-    return remainder
+def _reload_provider_routes() -> None:
+    try:
+        table = provider_routes.reload()
+    except provider_routes.RoutingConfigError as error:
+        logger.error("Provider routing reload failed; keeping the current table: %s", error)
+        return
+    upstream_balancer.watch(table.endpoint_groups())
 
 
 def _is_local_upstream(base_url: str) -> bool:
@@ -372,6 +880,8 @@ def _build_cognos_envelope(
     risk: float = 0.0,
     shadow_pct: float = 0.0,
     shadow_models: list[str] | None = None,
+    shadow_status: str = "not shadowed",
+    signals: dict[str, float] | None = None,
 ) -> dict[str, Any]:
     signals = {
         "ue": 0.0,
@@ -380,6 +890,7 @@ def _build_cognos_envelope(
         "citation_density": 0.0,
         "contradiction": 0.0,
         "out_of_distribution": 0.0,
+        **(signals or {}),
     }
     attestation_payload = {
         "trace_id": trace_id,
@@ -388,8 +899,7 @@ def _build_cognos_envelope(
         "risk": risk,
         "signals": signals,
     }
-    canonical = json.dumps(attestation_payload, sort_keys=True, separators=(",", ":"))
-    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    digest = hashlib.sha256(json_codec.dumps_canonical(attestation_payload)).hexdigest()
 
     envelope: dict[str, Any] = {
         "decision": decision,
@@ -409,15 +919,142 @@ def _build_cognos_envelope(
             "enabled": True,
             "compared_models": shadow_models or [],
             "divergence": 0.0,
-            "note": "MVP shadow placeholder",
+            "note": shadow_status,
         }
 
     return envelope
 
 
+def _assess(
+    request_model: ChatCompletionRequest,
+    response_text: str,
+    compiled_policy: policy.CompiledPolicy,
+) -> tuple[str, float, SignalInput, SignalReport]:
+    """Run the inline signal extractors and decide with the request's policy weights and bands."""
+    signal_input = SignalInput(
+        "\n".join(message.content for message in request_model.messages if message.role == "user"),
+        response_text,
+        request_model.model,
+    )
+    signal_report = signal_engine.evaluate(signal_input, compiled_policy.weights, compiled_policy.base_risk)
+    risk = signal_report.risk
+    decision = compiled_policy.decide(request_model.cognos.mode, risk, request_model.cognos.target_risk)
+    return decision, risk, signal_input, signal_report
+
+
+def _submit_signals(trace_id: str, signal_input: SignalInput, signal_report: SignalReport) -> None:
+    """Queue deferred and async extractors; their results are patched into metadata.signals.
+
+    The envelope keeps the attested inline signals and the served decision.
+    """
+
+    async def record(result: dict[str, Any]) -> None:
+        await trace_writer.submit_patch(TracePatch(trace_id, metadata={"signals": result}))
+
+    signal_engine.submit(signal_input, signal_report, record)
+
+
+def _submit_shadow(
+    trace_id: str,
+    incoming_headers: Any,
+    body: JsonBody,
+    shadow_models: list[str],
+    primary_text: str,
+) -> None:
+    """Queue a sampled request for shadow models; the result is written back onto its trace."""
+    incoming_headers = dict(incoming_headers)
+
+    async def send(shadow_model: str) -> httpx.Response:
+        target = provider_routes.resolve(shadow_model)
+        headers = _build_upstream_headers(incoming_headers, upstream_api_key=target["api_key"], upstream_base_url=target["base_url"])
+        content = body.forward_bytes(exclude=("cognos",), overrides={"model": target["model"], "stream": False})
+        return await upstream_balancer.send(
+            target["endpoints"],
+            functools.partial(_send_upstream, headers=headers, content=content, is_stream=False),
+        )
+
+    async def record(result: dict[str, Any]) -> None:
+        shadow = {
+            "enabled": True,
+            "compared_models": result["compared_models"],
+            "divergence": result["divergence"] or 0.0,
+            "note": result["status"],
+        }
+        await trace_writer.submit_patch(TracePatch(trace_id, envelope={"shadow": shadow}, metadata={"shadow": result}))
+
+    job = ShadowJob(trace_id, primary_text, list(shadow_models), send, record)
+    if not shadow_runner.submit(job):
+        # Filled up since admit(): record the drop instead of leaving the trace "queued".
+        asyncio.ensure_future(record({"status": "dropped", "compared_models": job.models, "divergence": None}))
+
+
+def _is_event_stream(upstream_response: httpx.Response) -> bool:
+    if upstream_response.status_code >= 400:
+        return False
+    return "text/event-stream" in upstream_response.headers.get("content-type", "")
+
+
+async def _send_upstream(
+    base_url: str,
+    headers: dict[str, str],
+    content: bytes,
+    is_stream: bool,
+) -> httpx.Response:
+    client = get_upstream_client(base_url)
+    url = f"{base_url.rstrip('/')}/chat/completions"
+    upstream_request = client.build_request("POST", url, headers=headers, content=content)
+    upstream_response = await client.send(upstream_request, stream=is_stream)
+    if is_stream and not _is_event_stream(upstream_response):
+        # Errors and non-SSE bodies are handled like regular JSON responses.
+        try:
+            await upstream_response.aread()
+        finally:
+            await upstream_response.aclose()
+    return upstream_response
+
+
 async def _iter_stream_chunks(upstream_response: httpx.Response) -> AsyncIterator[bytes]:
-    async for line in upstream_response.aiter_bytes():
-        yield line
+    try:
+        async for line in upstream_response.aiter_bytes():
+            yield line
+    finally:
+        # On client disconnect Starlette cancels the response scope; shield so the close completes.
+        with anyio.CancelScope(shield=True):
+            await upstream_response.aclose()
+
+
+async def _relay_upstream_stream(
+    chunks: AsyncIterator[bytes],
+    trace_fields: dict[str, Any],
+    started_at: float,
+) -> AsyncIterator[bytes]:
+    """Forward upstream SSE bytes as they arrive and record stream timings on the trace."""
+    first_chunk_at: float | None = None
+    streamed_bytes = 0
+    outcome = "client_disconnect"
+
+    try:
+        async for chunk in chunks:
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            streamed_bytes += len(chunk)
+            yield chunk
+        outcome = "completed"
+    except httpx.HTTPError:
+        outcome = "error"
+        raise
+    finally:
+        finished_at = time.perf_counter()
+        stream_stats = {
+            "outcome": outcome,
+            "ttft_ms": round((first_chunk_at - started_at) * 1000, 3) if first_chunk_at is not None else None,
+            "duration_ms": round((finished_at - started_at) * 1000, 3),
+            "bytes": streamed_bytes,
+        }
+        # A client disconnect cancels the response scope, which would cut off every await here.
+        with anyio.CancelScope(shield=True):
+            await chunks.aclose()
+            await _persist_trace(**{**trace_fields, "metadata": {**trace_fields["metadata"], "stream": stream_stats}})
 
 
 async def _mock_sse_stream(trace_id: str) -> AsyncIterator[bytes]:
@@ -457,17 +1094,90 @@ def _safe_json_or_text(response: httpx.Response) -> Any:
 
 
 def _payload_fingerprint(payload: dict[str, Any], model_id: str | None = None) -> dict[str, Any]:
-    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
-    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return _fingerprint(*canonical_digest(payload), model_id=model_id)
+
+
+def _bytes_fingerprint(raw: bytes, model_id: str | None = None) -> dict[str, Any]:
+    return _fingerprint(hashlib.sha256(raw).hexdigest(), len(raw), model_id=model_id)
+
+
+def _request_fingerprint(body: JsonBody, request_model: ChatCompletionRequest) -> dict[str, Any]:
+    """Exact digest of the canonical body plus a SimHash of the message text, clustered via the LSH index."""
+    value = text_simhash("\n".join(message.content for message in request_model.messages))
+    return _fingerprint(
+        *body.canonical_fingerprint(),
+        model_id=request_model.model,
+        simhash=format_simhash(value),
+        cluster_id=simhash_index.assign(value),
+    )
+
+
+def _fingerprint(
+    digest: str,
+    length: int,
+    model_id: str | None = None,
+    simhash: str | None = None,
+    cluster_id: str | None = None,
+) -> dict[str, Any]:
     return {
-        "simhash": f"sha256:{digest[:16]}",
+        "simhash": simhash or f"sha256:{digest[:16]}",
         "embedding_hash": f"sha256:{digest}",
-        "length": len(canonical),
+        "length": length,
         "model_id": model_id,
-        "cluster_id": None,
+        "cluster_id": cluster_id,
     }
 
 
+def _upstream_request_key(base_url: str, outbound_headers: dict[str, str], upstream_digest: str) -> str:
+    # Scope entries to the upstream credential so callers never share each other's responses.
+    credential = hashlib.sha256(outbound_headers.get("authorization", "").encode("utf-8")).hexdigest()[:16]
+    return f"{base_url.rstrip('/').lower()}|{credential}|sha256:{upstream_digest}"
+
+
+def _splice_envelope(body: JsonBody, envelope: dict[str, Any]) -> tuple[bytes, dict[str, Any]]:
+    """Add the cognos envelope to a parsed upstream JSON body without re-serialising it.
+
+    Returns the response bytes and the parsed upstream payload (without the envelope).
+    """
+    if RESPONSE_VALIDATION_SAMPLE_RATE >= 1.0 or random.random() < RESPONSE_VALIDATION_SAMPLE_RATE:
+        ChatCompletionResponse.model_validate({**body.payload, "cognos": envelope})
+    return body.forward_bytes(overrides={"cognos": envelope}), body.payload
+
+
+def _hedge_percentile(requested: bool | None, requested_percentile: float | None, route_percentile: float | None) -> float | None:
+    """Hedge percentile for a request: the cognos block overrides the route's setting."""
+    if requested is False or (requested is None and route_percentile is None):
+        return None
+    return requested_percentile or route_percentile or HEDGE_PERCENTILE
+
+
+def _coalesces(requested: bool | None, request_model: ChatCompletionRequest) -> bool:
+    """Whether a request may share an upstream call: the cognos block decides, else only deterministic requests do."""
+    if requested is not None:
+        return requested
+    # Duplicates of a sampled request are usually fired on purpose, to get independent completions.
+    return request_model.temperature in (None, 0) and (request_model.model_extra or {}).get("n") in (None, 1)
+
+
+def _with_upstream_context(
+    metadata: dict[str, Any],
+    upstream_response: httpx.Response,
+    coalesced: dict[str, Any] | None,
+) -> dict[str, Any]:
+    endpoint = upstream_response.extensions.get("cognos_endpoint")
+    if endpoint is not None:
+        metadata["endpoint"] = endpoint
+    hedge = upstream_response.extensions.get("cognos_hedge")
+    if hedge is not None:
+        metadata["hedge"] = hedge
+    retry = upstream_response.extensions.get("cognos_retry")
+    if retry is not None:
+        metadata["retry"] = retry
+    if coalesced is not None:
+        metadata["coalesced"] = coalesced
+    return metadata
+
+
 def _extract_usage(payload: dict[str, Any]) -> dict[str, int]:
     usage = payload.get("usage", {}) if isinstance(payload, dict) else {}
     if not isinstance(usage, dict):
@@ -491,7 +1201,7 @@ def _extract_usage(payload: dict[str, Any]) -> dict[str, int]:
     }
 
 
-def _persist_trace(
+async def _persist_trace(
     trace_id: str,
     created_at: str,
     is_stream: bool,
@@ -502,7 +1212,7 @@ def _persist_trace(
     envelope: dict[str, Any],
     metadata: dict[str, Any],
 ) -> None:
-    save_trace(
+    await trace_writer.submit(
         {
             "trace_id": trace_id,
             "created_at": created_at,
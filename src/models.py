@@ -13,6 +13,12 @@ class CognosControl(BaseModel):
     shadow_pct: float = Field(default=0.0, ge=0.0, le=1.0)
     shadow_models: list[str] = Field(default_factory=list)
     retention: Literal["none", "fingerprints", "enhanced"] = "fingerprints"
+    cache: Literal["use", "bypass", "refresh"] = "bypass"
+    coalesce: bool | None = None
+    hedge: bool | None = None
+    hedge_percentile: float | None = Field(default=None, gt=0.0, lt=1.0)
+    max_retries: int | None = Field(default=None, ge=0, le=10)
+    deadline_ms: int | None = Field(default=None, gt=0)
 
 
 class ChatMessage(BaseModel):
@@ -108,6 +114,16 @@ class TrustReportRequest(BaseModel):
     format: Literal["json", "pdf"] = "json"
 
 
+class PolicyReplayRequest(BaseModel):
+    policy_ids: list[str] = Field(min_length=1)
+    policies: dict[str, Any] | None = None
+    created_from: str | None = None
+    created_to: str | None = None
+    model: str | None = None
+    policy: str | None = None
+    mode: Literal["monitor", "enforce"] = "enforce"
+
+
 class TrustReportResponse(BaseModel):
     report_id: str
     created: datetime
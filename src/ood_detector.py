@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+import trace_store
+from signals import SignalInput, register_extractor
+
+OOD_DIM = int(os.getenv("COGNOS_OOD_DIM", "1024"))
+OOD_NGRAM = int(os.getenv("COGNOS_OOD_NGRAM", "3"))
+OOD_MAX_CHARS = int(os.getenv("COGNOS_OOD_MAX_CHARS", "8192"))
+OOD_MIN_SAMPLES = int(os.getenv("COGNOS_OOD_MIN_SAMPLES", "100"))
+OOD_WINDOW = int(os.getenv("COGNOS_OOD_WINDOW", "10000"))
+OOD_MAX_REFERENCES = int(os.getenv("COGNOS_OOD_MAX_REFERENCES", "64"))
+OOD_SNAPSHOT = os.getenv("COGNOS_OOD_SNAPSHOT", "")
+OOD_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("COGNOS_OOD_SNAPSHOT_INTERVAL_SECONDS", "60"))
+
+GLOBAL_KEY = "*"
+
+# Distances up to one standard deviation above the reference mean score 0; four or more score 1.
+_Z_FLOOR = 1.0
+_Z_CEIL = 4.0
+# Fibonacci multiplier for hashing packed n-gram codes into buckets (wraps mod 2**32).
+_HASH_MULTIPLIER = np.uint32(0x9E3779B1)
+
+logger = logging.getLogger("cognos.ood")
+
+
+def vectorize(text: str, dim: int = OOD_DIM, ngram: int = OOD_NGRAM, max_chars: int = OOD_MAX_CHARS) -> np.ndarray:
+    """Unit-length float64 vector of hashed character n-gram counts (log-scaled).
+
+    The text is lowercased, whitespace collapsed and ASCII digits folded to "0"; each
+    n-gram's bytes are packed into one 32-bit code and hashed into `dim` buckets, all in NumPy.
+    """
+    normalized = " ".join(text[:max_chars].lower().split())
+    data = np.frombuffer(f" {normalized} ".encode("utf-8"), dtype=np.uint8).astype(np.uint32)
+    vector = np.zeros(dim, dtype=np.float64)
+    if data.size < ngram:
+        return vector
+    data[(data >= 0x31) & (data <= 0x39)] = 0x30
+    span = data.size - ngram + 1
+    codes = data[:span].copy()
+    for offset in range(1, ngram):
+        codes |= data[offset:offset + span] << np.uint32(8 * offset)
+    codes *= _HASH_MULTIPLIER
+    codes >>= np.uint32(33 - dim.bit_length())
+    vector += np.bincount(codes, minlength=dim)
+    np.log1p(vector, out=vector)
+    vector /= np.linalg.norm(vector)
+    return vector
+
+
+class ReferenceStats:
+    """Running centroid of unit vectors plus the mean and variance of their cosine distance to it.
+
+    Updates weigh each sample 1/count until `window` samples, then 1/window, so the reference
+    follows slow drift in traffic instead of freezing on its first days.
+    """
+
+    __slots__ = ("count", "centroid", "distance_mean", "distance_var")
+
+    def __init__(self, dim: int) -> None:
+        self.count = 0
+        self.centroid = np.zeros(dim, dtype=np.float64)
+        self.distance_mean = 0.0
+        self.distance_var = 0.0
+
+    def distance(self, vector: np.ndarray) -> float:
+        norm = float(np.linalg.norm(self.centroid))
+        if norm == 0.0:
+            return 1.0
+        return 1.0 - float(vector @ self.centroid) / norm
+
+    def zscore(self, vector: np.ndarray) -> float:
+        std = math.sqrt(self.distance_var)
+        return (self.distance(vector) - self.distance_mean) / max(std, 1e-6)
+
+    def observe(self, vector: np.ndarray, window: int) -> None:
+        distance = self.distance(vector) if self.count else 0.0
+        self.count += 1
+        alpha = 1.0 / min(self.count, max(1, window))
+        delta = distance - self.distance_mean
+        self.distance_mean += alpha * delta
+        self.distance_var = (1.0 - alpha) * (self.distance_var + alpha * delta * delta)
+        self.centroid += alpha * (vector - self.centroid)
+
+
+class OODDetector:
+    """Scores prompts against per-model reference statistics and updates them with each one.
+
+    A model's reference answers once it has min_samples prompts; until then the global
+    reference (every model's prompts) does. References are snapshotted to an .npz file so
+    restarted workers start warm.
+    """
+
+    def __init__(
+        self,
+        dim: int = OOD_DIM,
+        ngram: int = OOD_NGRAM,
+        min_samples: int = OOD_MIN_SAMPLES,
+        window: int = OOD_WINDOW,
+        max_references: int = OOD_MAX_REFERENCES,
+    ) -> None:
+        if dim < 2 or dim & (dim - 1):
+            raise ValueError(f"OOD vector width must be a power of two, got {dim}")
+        if not 1 <= ngram <= 4:
+            raise ValueError(f"OOD n-gram size must be between 1 and 4, got {ngram}")
+        self.dim = dim
+        self.ngram = ngram
+        self.min_samples = max(1, min_samples)
+        self.window = max(1, window)
+        self.max_references = max(1, max_references)
+        self._references: dict[str, ReferenceStats] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._task: asyncio.Task[None] | None = None
+        self._counters = {"scored": 0, "cold": 0, "observed": 0, "snapshots": 0, "snapshot_errors": 0}
+
+    def vectorize(self, text: str) -> np.ndarray:
+        return vectorize(text, self.dim, self.ngram)
+
+    def _reference_for(self, key: str | None) -> ReferenceStats | None:
+        for candidate in (key, GLOBAL_KEY):
+            reference = self._references.get(candidate) if candidate is not None else None
+            if reference is not None and reference.count >= self.min_samples:
+                return reference
+        return None
+
+    def score(self, vector: np.ndarray, key: str | None = None) -> float | None:
+        """0..1 distance of vector from the key's reference (or the global one); None while cold."""
+        with self._lock:
+            reference = self._reference_for(key)
+            if reference is None:
+                self._counters["cold"] += 1
+                return None
+            z = reference.zscore(vector)
+            self._counters["scored"] += 1
+        return min(1.0, max(0.0, (z - _Z_FLOOR) / (_Z_CEIL - _Z_FLOOR)))
+
+    def observe(self, vector: np.ndarray, key: str | None = None) -> None:
+        with self._lock:
+            keys = [GLOBAL_KEY] if key is None or key == GLOBAL_KEY else [GLOBAL_KEY, key]
+            for name in keys:
+                reference = self._references.get(name)
+                if reference is None:
+                    if len(self._references) >= self.max_references:
+                        continue
+                    reference = self._references[name] = ReferenceStats(self.dim)
+                reference.observe(vector, self.window)
+            self._counters["observed"] += 1
+            self._dirty = True
+
+    def assess(self, text: str, key: str | None = None) -> float | None:
+        """Score text, then fold it into the references so the next request sees it."""
+        if not text.strip():
+            return None
+        vector = self.vectorize(text)
+        value = self.score(vector, key)
+        self.observe(vector, key)
+        return value
+
+    def snapshot(self, path: Path | None = None) -> Path:
+        """Write every reference to an .npz file atomically (temp file, then rename)."""
+        path = path or snapshot_path()
+        with self._lock:
+            keys = list(self._references)
+            references = [self._references[key] for key in keys]
+            arrays = {
+                "keys": np.array(keys, dtype=np.str_),
+                "counts": np.array([reference.count for reference in references], dtype=np.int64),
+                "centroids": np.stack([reference.centroid for reference in references]) if references else np.zeros((0, self.dim)),
+                "distance_mean": np.array([reference.distance_mean for reference in references], dtype=np.float64),
+                "distance_var": np.array([reference.distance_var for reference in references], dtype=np.float64),
+                "shape": np.array([self.dim, self.ngram], dtype=np.int64),
+            }
+            self._dirty = False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with temporary.open("wb") as handle:
+            np.savez(handle, **arrays)
+        os.replace(temporary, path)
+        self._counters["snapshots"] += 1
+        return path
+
+    def load(self, path: Path | None = None) -> int:
+        """Replace the references with a snapshot's; returns how many were loaded.
+
+        A missing file, or one written with a different width or n-gram size, loads nothing.
+        """
+        path = path or snapshot_path()
+        if not path.exists():
+            return 0
+        with np.load(path, allow_pickle=False) as snapshot:
+            dim, ngram = (int(value) for value in snapshot["shape"])
+            if (dim, ngram) != (self.dim, self.ngram):
+                logger.warning(
+                    "Ignoring OOD snapshot %s built for dim=%d ngram=%d (configured dim=%d ngram=%d)",
+                    path, dim, ngram, self.dim, self.ngram,
+                )
+                return 0
+            references: dict[str, ReferenceStats] = {}
+            for index, key in enumerate(snapshot["keys"].tolist()):
+                reference = ReferenceStats(self.dim)
+                reference.count = int(snapshot["counts"][index])
+                reference.centroid = snapshot["centroids"][index].astype(np.float64)
+                reference.distance_mean = float(snapshot["distance_mean"][index])
+                reference.distance_var = float(snapshot["distance_var"][index])
+                references[key] = reference
+        with self._lock:
+            self._references = references
+            self._dirty = False
+        return len(references)
+
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    def start(self, interval_seconds: float = OOD_SNAPSHOT_INTERVAL_SECONDS) -> None:
+        if self.is_running() or interval_seconds <= 0:
+            return
+        self._task = asyncio.create_task(self._snapshot_loop(interval_seconds), name="cognos-ood-snapshot")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self._snapshot_if_dirty()
+
+    async def _snapshot_loop(self, interval_seconds: float) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self._snapshot_if_dirty()
+
+    async def _snapshot_if_dirty(self) -> None:
+        if not self._dirty:
+            return
+        try:
+            await asyncio.to_thread(self.snapshot)
+        except Exception:
+            self._counters["snapshot_errors"] += 1
+            logger.exception("OOD reference snapshot failed")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            references = {
+                key: {
+                    "count": reference.count,
+                    "warm": reference.count >= self.min_samples,
+                    "distance_mean": round(reference.distance_mean, 6),
+                    "distance_std": round(math.sqrt(reference.distance_var), 6),
+                }
+                for key, reference in self._references.items()
+            }
+        return {
+            **self._counters,
+            "dim": self.dim,
+            "ngram": self.ngram,
+            "min_samples": self.min_samples,
+            "window": self.window,
+            "references": references,
+        }
+
+
+def snapshot_path() -> Path:
+    """COGNOS_OOD_SNAPSHOT, or ood_reference.npz beside the trace database."""
+    if OOD_SNAPSHOT:
+        path = Path(OOD_SNAPSHOT)
+        return path if path.is_absolute() else Path(__file__).resolve().parents[1] / path
+    return trace_store._resolve_db_path().with_name("ood_reference.npz")
+
+
+ood_detector = OODDetector()
+
+
+@register_extractor("hashed_ngram_ood", "out_of_distribution")
+def hashed_ngram_ood(data: SignalInput) -> float | None:
+    """How far the prompt's hashed n-gram profile sits from its model's recent prompts."""
+    return ood_detector.assess(data.request_text, data.model)
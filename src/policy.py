@@ -1,19 +1,287 @@
 from __future__ import annotations
 
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Mapping
 
-def resolve_decision(mode: str, target_risk: float | None, base_risk: float = 0.12) -> tuple[str, float]:
-    risk = min(max(base_risk, 0.0), 1.0)
+from signals import BASE_RISK, SIGNAL_NAMES, SIGNAL_WEIGHTS, parse_weights
+
+POLICIES_FILE = os.getenv("COGNOS_POLICIES_FILE", "")
+DEFAULT_POLICY_ID = "default_v1"
+DEFAULT_TARGET_RISK = 0.5
+# Upper edges of the REFINE and ESCALATE bands, as offsets above the target risk.
+DEFAULT_BANDS = (0.2, 0.4)
+DECISIONS = ("PASS", "REFINE", "ESCALATE", "BLOCK")
+
+logger = logging.getLogger("cognos.policy")
+
+
+class PolicyConfigError(ValueError):
+    """Raised when a policy config cannot be compiled; the active table is kept."""
+
+
+class UnknownPolicyError(LookupError):
+    """Raised for a policy_id that no loaded policy declares."""
+
+    def __init__(self, policy_id: str, known: list[str]) -> None:
+        super().__init__(f"Unknown policy_id {policy_id!r}; known policies: {', '.join(known)}")
+        self.policy_id = policy_id
+
+
+def _clamp(value: float) -> float:
+    return min(max(value, 0.0), 1.0)
+
+
+class CompiledPolicy:
+    """One policy (optionally specialised for a model) flattened for evaluation.
+
+    Weights are kept only for signals that can move risk, and the decision cutoffs for the
+    policy's own target risk are precomputed, so evaluate() is a short loop plus a bisect.
+    """
+
+    __slots__ = ("policy_id", "model", "weights", "base_risk", "target_risk", "bands", "_terms", "_cutoffs")
+
+    def __init__(
+        self,
+        policy_id: str,
+        model: str | None,
+        weights: dict[str, float],
+        base_risk: float,
+        target_risk: float,
+        bands: tuple[float, float],
+    ) -> None:
+        self.policy_id = policy_id
+        self.model = model
+        self.weights = weights
+        self.base_risk = base_risk
+        self.target_risk = target_risk
+        self.bands = bands
+        self._terms = tuple((signal, weight) for signal, weight in weights.items() if weight > 0.0)
+        self._cutoffs = self.cutoffs(target_risk)
+
+    def cutoffs(self, target_risk: float | None) -> tuple[float, float, float]:
+        """Risk upper bounds for PASS, REFINE and ESCALATE; anything above the last is BLOCK."""
+        if target_risk is None:
+            return self._cutoffs
+        threshold = _clamp(target_risk)
+        refine, escalate = self.bands
+        return threshold, min(threshold + refine, 1.0), min(threshold + escalate, 1.0)
+
+    def risk(self, signals: Mapping[str, float]) -> float:
+        """Noisy-OR of the base risk and each weighted signal, as signals.aggregate_risk."""
+        survival = 1.0 - self.base_risk
+        for signal, weight in self._terms:
+            survival *= 1.0 - weight * signals.get(signal, 0.0)
+        return round(_clamp(1.0 - survival), 6)
+
+    def decide(self, mode: str, risk: float, target_risk: float | None = None) -> str:
+        if mode == "monitor":
+            return "PASS"
+        return DECISIONS[bisect_left(self.cutoffs(target_risk), risk)]
+
+    def evaluate(self, mode: str, signals: Mapping[str, float], target_risk: float | None = None) -> tuple[str, float]:
+        risk = self.risk(signals)
+        return self.decide(mode, risk, target_risk), risk
+
+    def describe(self) -> dict[str, Any]:
+        refine, escalate = self.bands
+        return {
+            "weights": dict(self.weights),
+            "base_risk": self.base_risk,
+            "target_risk": self.target_risk,
+            "bands": {"refine": refine, "escalate": escalate},
+        }
+
+
+class PolicyTable:
+    """Immutable policy_id (x model) -> CompiledPolicy mapping compiled from the policy config.
+
+    get() is one dict lookup for a model override and one for the policy itself.
+    """
+
+    def __init__(
+        self,
+        policies: dict[str, CompiledPolicy],
+        overrides: dict[tuple[str, str], CompiledPolicy],
+        source: str | None,
+        version: int,
+    ) -> None:
+        self._policies = policies
+        self._overrides = overrides
+        self.source = source
+        self.version = version
+
+    def __contains__(self, policy_id: object) -> bool:
+        return policy_id in self._policies
+
+    def ids(self) -> list[str]:
+        return sorted(self._policies)
+
+    def get(self, policy_id: str, model: str | None = None) -> CompiledPolicy:
+        if model is not None:
+            compiled = self._overrides.get((policy_id, model))
+            if compiled is not None:
+                return compiled
+        compiled = self._policies.get(policy_id)
+        if compiled is None:
+            raise UnknownPolicyError(policy_id, self.ids())
+        return compiled
+
+    def describe(self) -> dict[str, Any]:
+        policies: dict[str, Any] = {}
+        for policy_id, compiled in sorted(self._policies.items()):
+            models = {
+                model: override.describe()
+                for (override_policy, model), override in sorted(self._overrides.items())
+                if override_policy == policy_id
+            }
+            policies[policy_id] = {**compiled.describe(), "models": models}
+        return {"version": self.version, "source": self.source, "policies": policies}
 
-    if mode == "monitor":
-        return "PASS", risk
 
-    threshold = target_risk if target_risk is not None else 0.5
-    threshold = min(max(threshold, 0.0), 1.0)
+def _probability(spec: Mapping[str, Any], key: str, default: float, where: str) -> float:
+    value = spec.get(key, default)
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0.0 <= value <= 1.0:
+        raise PolicyConfigError(f"{where}: {key} must be a number between 0 and 1")
+    return float(value)
+
+
+def _compile_one(
+    policy_id: str,
+    model: str | None,
+    spec: Mapping[str, Any],
+    parent: CompiledPolicy,
+) -> CompiledPolicy:
+    where = f"Policy {policy_id!r}" + (f" model {model!r}" if model else "")
+    weights = dict(parent.weights)
+    file_weights = spec.get("weights") or {}
+    if not isinstance(file_weights, Mapping):
+        raise PolicyConfigError(f"{where}: weights must be an object keyed by signal")
+    for signal in file_weights:
+        if signal not in SIGNAL_NAMES:
+            raise PolicyConfigError(f"{where}: unknown signal {signal!r}; expected one of {', '.join(SIGNAL_NAMES)}")
+        weights[signal] = _probability(file_weights, signal, 0.0, where)
+
+    refine, escalate = parent.bands
+    file_bands = spec.get("bands") or {}
+    if not isinstance(file_bands, Mapping):
+        raise PolicyConfigError(f"{where}: bands must be an object with refine and escalate offsets")
+    refine = _probability(file_bands, "refine", refine, where)
+    escalate = _probability(file_bands, "escalate", escalate, where)
+    if refine > escalate:
+        raise PolicyConfigError(f"{where}: the refine band must not end above the escalate band")
+
+    return CompiledPolicy(
+        policy_id,
+        model,
+        weights,
+        _probability(spec, "base_risk", parent.base_risk, where),
+        _probability(spec, "target_risk", parent.target_risk, where),
+        (refine, escalate),
+    )
+
+
+def builtin_policy(weights: dict[str, float] | None = None, base_risk: float = BASE_RISK) -> CompiledPolicy:
+    """default_v1 as the gateway shipped it: COGNOS_SIGNAL_WEIGHTS, COGNOS_BASE_RISK, 0.5 / +0.2 / +0.4."""
+    return CompiledPolicy(
+        DEFAULT_POLICY_ID,
+        None,
+        weights if weights is not None else parse_weights(SIGNAL_WEIGHTS),
+        _clamp(base_risk),
+        DEFAULT_TARGET_RISK,
+        DEFAULT_BANDS,
+    )
+
+
+def compile_policies(
+    config: Mapping[str, Any] | None = None,
+    source: str | None = None,
+    version: int = 1,
+    default: CompiledPolicy | None = None,
+) -> PolicyTable:
+    """Compile the built-in default_v1, then every policy in the config file.
+
+    Policies start from default_v1's settings (redeclaring default_v1 changes that base);
+    each "models" entry starts from its policy's settings.
+    """
+    config = {} if config is None else config
+    if not isinstance(config, Mapping):
+        raise PolicyConfigError("Policy config must be a JSON object")
+    file_policies = config.get("policies", {})
+    if not isinstance(file_policies, Mapping):
+        raise PolicyConfigError("'policies' must be an object keyed by policy_id")
+
+    base = default or builtin_policy()
+    base_spec = file_policies.get(DEFAULT_POLICY_ID)
+    if isinstance(base_spec, Mapping):
+        base = _compile_one(DEFAULT_POLICY_ID, None, base_spec, base)
+
+    policies: dict[str, CompiledPolicy] = {DEFAULT_POLICY_ID: base}
+    overrides: dict[tuple[str, str], CompiledPolicy] = {}
+    for raw_id, spec in file_policies.items():
+        policy_id = str(raw_id).strip()
+        if not policy_id:
+            raise PolicyConfigError("Policy ids must be non-empty")
+        if not isinstance(spec, Mapping):
+            raise PolicyConfigError(f"Policy {policy_id!r} must be an object")
+        compiled = base if policy_id == DEFAULT_POLICY_ID else _compile_one(policy_id, None, spec, base)
+        policies[policy_id] = compiled
+
+        models = spec.get("models") or {}
+        if not isinstance(models, Mapping):
+            raise PolicyConfigError(f"Policy {policy_id!r}: models must be an object keyed by model id")
+        for model, model_spec in models.items():
+            if not isinstance(model_spec, Mapping):
+                raise PolicyConfigError(f"Policy {policy_id!r} model {model!r} must be an object")
+            overrides[(policy_id, str(model))] = _compile_one(policy_id, str(model), model_spec, compiled)
+
+    return PolicyTable(policies, overrides, source, version)
+
+
+def load_config(path: str) -> dict[str, Any]:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise PolicyConfigError(f"Policy config file not found: {path}") from None
+    except ValueError as error:
+        raise PolicyConfigError(f"Invalid policy config {path}: {error}") from None
+
+
+_lock = threading.Lock()
+_table = compile_policies(load_config(POLICIES_FILE) if POLICIES_FILE else None, source=POLICIES_FILE or None)
+
+
+def current() -> PolicyTable:
+    return _table
+
+
+def get(policy_id: str, model: str | None = None) -> CompiledPolicy:
+    return _table.get(policy_id, model)
+
+
+def reload(path: str | None = None) -> PolicyTable:
+    """Recompile from the config file and swap the table in atomically.
+
+    Requests already evaluating keep the policy they looked up. Raises PolicyConfigError
+    and keeps the current table if the new config is invalid.
+    """
+    global _table
+    path = POLICIES_FILE if path is None else path
+    with _lock:
+        table = compile_policies(load_config(path) if path else None, source=path or None, version=_table.version + 1)
+        _table = table
+    logger.info("Policy table reloaded (version %d, source %s, %d policies)", table.version, table.source, len(table.ids()))
+    return table
+
+
+def resolve_decision(mode: str, target_risk: float | None, base_risk: float = 0.12) -> tuple[str, float]:
+    """The default_v1 ladder applied to an already aggregated risk."""
+    risk = _clamp(base_risk)
+    return _DEFAULT_LADDER.decide(mode, risk, target_risk), risk
+
 
-    if risk <= threshold:
-        return "PASS", risk
-    if risk <= min(threshold + 0.2, 1.0):
-        return "REFINE", risk
-    if risk <= min(threshold + 0.4, 1.0):
-        return "ESCALATE", risk
-    return "BLOCK", risk
+_DEFAULT_LADDER = CompiledPolicy(DEFAULT_POLICY_ID, None, {}, 0.0, DEFAULT_TARGET_RISK, DEFAULT_BANDS)
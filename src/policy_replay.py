@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Any, Iterable
+
+import numpy as np
+
+import trace_store
+from policy import DECISIONS, CompiledPolicy, PolicyTable
+
+REPLAY_CHUNK_ROWS = int(os.getenv("COGNOS_REPLAY_CHUNK_ROWS", "50000"))
+
+_DECISION_CODES = {decision: code for code, decision in enumerate(DECISIONS)}
+_CELLS = len(DECISIONS) * len(DECISIONS)
+
+logger = logging.getLogger("cognos.replay")
+
+
+def _confusion(counts: np.ndarray) -> dict[str, dict[str, int]]:
+    """Nested recorded -> replayed -> count mapping for one 4x4 matrix."""
+    return {
+        recorded: {replayed: int(counts[row, column]) for column, replayed in enumerate(DECISIONS)}
+        for row, recorded in enumerate(DECISIONS)
+    }
+
+
+def _summary(counts: np.ndarray) -> dict[str, Any]:
+    traces = int(counts.sum())
+    changed = traces - int(np.trace(counts))
+    return {
+        "traces": traces,
+        "changed": changed,
+        "changed_rate": round(changed / traces, 6) if traces else 0.0,
+        "confusion": _confusion(counts),
+    }
+
+
+class CandidateReplay:
+    """Running confusion counts for one candidate policy, overall and per model / recorded policy.
+
+    Each chunk is evaluated in bulk: the per-model weights, base risk and cutoffs are gathered
+    into row-aligned arrays, so risk is one product over the signal matrix and the decision is
+    one comparison against the cutoffs (the bisect_left in CompiledPolicy.decide).
+    """
+
+    __slots__ = ("policy_id", "mode", "counts", "by_model", "by_policy", "recorded_risk", "replayed_risk", "_params")
+
+    def __init__(self, policy_id: str, mode: str = "enforce") -> None:
+        self.policy_id = policy_id
+        self.mode = mode
+        self.counts = np.zeros((len(DECISIONS), len(DECISIONS)), dtype=np.int64)
+        self.by_model: dict[str, np.ndarray] = {}
+        self.by_policy: dict[str, np.ndarray] = {}
+        self.recorded_risk = 0.0
+        self.replayed_risk = 0.0
+        self._params: dict[str, tuple[np.ndarray, float, np.ndarray]] = {}
+
+    def _model_params(self, table: PolicyTable, model: str) -> tuple[np.ndarray, float, np.ndarray]:
+        params = self._params.get(model)
+        if params is None:
+            compiled: CompiledPolicy = table.get(self.policy_id, model or None)
+            weights = np.array([compiled.weights.get(name, 0.0) for name in trace_store.SIGNAL_COLUMNS], dtype=np.float64)
+            params = self._params[model] = (weights, compiled.base_risk, np.array(compiled.cutoffs(None), dtype=np.float64))
+        return params
+
+    def add(
+        self,
+        table: PolicyTable,
+        signals: np.ndarray,
+        recorded: np.ndarray,
+        recorded_risk: np.ndarray,
+        models: np.ndarray,
+        model_index: np.ndarray,
+        policies: np.ndarray,
+        policy_index: np.ndarray,
+    ) -> None:
+        if self.mode == "monitor":
+            replayed = np.zeros(recorded.size, dtype=np.int64)
+            risk = np.zeros(recorded.size, dtype=np.float64)
+        else:
+            params = [self._model_params(table, str(model)) for model in models]
+            weights = np.stack([weight for weight, _, _ in params])[model_index]
+            survival = 1.0 - np.array([base for _, base, _ in params])[model_index]
+            survival *= np.prod(1.0 - signals * weights, axis=1)
+            risk = np.round(np.clip(1.0 - survival, 0.0, 1.0), 6)
+            cutoffs = np.stack([cutoff for _, _, cutoff in params])[model_index]
+            replayed = (cutoffs < risk[:, None]).sum(axis=1)
+
+        cells = recorded * len(DECISIONS) + replayed
+        self.counts += np.bincount(cells, minlength=_CELLS).reshape(self.counts.shape)
+        for groups, index, target in ((models, model_index, self.by_model), (policies, policy_index, self.by_policy)):
+            grouped = np.bincount(index * _CELLS + cells, minlength=groups.size * _CELLS).reshape(groups.size, *self.counts.shape)
+            for position, name in enumerate(groups.tolist()):
+                if name in target:
+                    target[name] += grouped[position]
+                else:
+                    target[name] = grouped[position].copy()
+        self.recorded_risk += float(recorded_risk.sum())
+        self.replayed_risk += float(risk.sum())
+
+    def result(self) -> dict[str, Any]:
+        summary = _summary(self.counts)
+        traces = summary["traces"]
+        return {
+            "policy_id": self.policy_id,
+            "mode": self.mode,
+            **summary,
+            "decision_mix": {
+                "recorded": dict(zip(DECISIONS, (int(value) for value in self.counts.sum(axis=1)))),
+                "replayed": dict(zip(DECISIONS, (int(value) for value in self.counts.sum(axis=0)))),
+            },
+            "mean_risk": {
+                "recorded": round(self.recorded_risk / traces, 6) if traces else 0.0,
+                "replayed": round(self.replayed_risk / traces, 6) if traces else 0.0,
+            },
+            "by_model": {name: _summary(counts) for name, counts in sorted(self.by_model.items())},
+            "by_policy": {name: _summary(counts) for name, counts in sorted(self.by_policy.items())},
+        }
+
+
+def succeeded(chunk: dict[str, tuple[Any, ...]]) -> np.ndarray:
+    """Mask of rows with a 2xx status.
+
+    Shed (503), deadline (504) and upstream-error traces are written as ESCALATE at risk 1.0
+    with zero signals, so re-deciding them would report a PASS that never happened.
+    """
+    status = np.asarray(chunk["status_code"], dtype=np.int64)
+    return (status >= 200) & (status < 300)
+
+
+def chunk_arrays(chunk: dict[str, tuple[Any, ...]]) -> dict[str, np.ndarray] | None:
+    """NumPy views of one trace_store.iter_signal_columns chunk; error and unknown-decision rows are dropped."""
+    decisions, decision_index = np.unique(np.asarray(chunk["decision"], dtype=np.str_), return_inverse=True)
+    codes = np.array([_DECISION_CODES.get(decision, -1) for decision in decisions.tolist()], dtype=np.int64)
+    recorded = codes[decision_index]
+    keep = (recorded >= 0) & succeeded(chunk)
+    if not keep.any():
+        return None
+    models, model_index = np.unique(np.asarray(chunk["model"], dtype=np.str_)[keep], return_inverse=True)
+    policies, policy_index = np.unique(np.asarray(chunk["policy"], dtype=np.str_)[keep], return_inverse=True)
+    signals = np.column_stack(
+        [np.asarray(chunk[f"signal_{name}"], dtype=np.float64) for name in trace_store.SIGNAL_COLUMNS]
+    )[keep]
+    return {
+        "signals": signals,
+        "recorded": recorded[keep],
+        "recorded_risk": np.asarray(chunk["risk"], dtype=np.float64)[keep],
+        "models": models,
+        "model_index": model_index.ravel(),
+        "policies": policies,
+        "policy_index": policy_index.ravel(),
+    }
+
+
+def replay(
+    table: PolicyTable,
+    policy_ids: Iterable[str],
+    created_from_ms: int | None = None,
+    created_to_ms: int | None = None,
+    model: str | None = None,
+    policy: str | None = None,
+    mode: str = "enforce",
+    chunk_rows: int = REPLAY_CHUNK_ROWS,
+) -> dict[str, Any]:
+    """Re-decide every stored trace in the range under each candidate policy.
+
+    Reads the signal and risk columns in chunks of chunk_rows (never per-trace envelopes) and
+    returns, per candidate, recorded x replayed decision confusion matrices overall, by model
+    and by the policy that made the recorded decision. Non-2xx traces are counted in skipped
+    and errors instead. Raises UnknownPolicyError up front.
+    """
+    candidate_ids = list(dict.fromkeys(policy_ids))
+    for policy_id in candidate_ids:
+        table.get(policy_id)
+    candidates = [CandidateReplay(policy_id, mode) for policy_id in candidate_ids]
+
+    started = time.perf_counter()
+    traces = chunks = skipped = errors = 0
+    for chunk in trace_store.iter_signal_columns(created_from_ms, created_to_ms, model, policy, chunk_rows):
+        chunks += 1
+        arrays = chunk_arrays(chunk)
+        rows = len(chunk["decision"])
+        errors += rows - int(succeeded(chunk).sum())
+        kept = 0 if arrays is None else int(arrays["recorded"].size)
+        skipped += rows - kept
+        traces += kept
+        if arrays is None:
+            continue
+        for candidate in candidates:
+            candidate.add(table, **arrays)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info("Replayed %d traces against %d policies in %.1f ms", traces, len(candidates), elapsed_ms)
+
+    return {
+        "range": {"created_from_ms": created_from_ms, "created_to_ms": created_to_ms},
+        "filters": {"model": model, "policy": policy},
+        "mode": mode,
+        "traces": traces,
+        "skipped": skipped,
+        "errors": errors,
+        "chunks": chunks,
+        "elapsed_ms": round(elapsed_ms, 3),
+        "candidates": [candidate.result() for candidate in candidates],
+    }
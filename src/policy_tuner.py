@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Any, Iterable
+
+import numpy as np
+
+import policy
+import trace_store
+from policy import DECISIONS
+from policy_replay import succeeded
+
+TUNER_WINDOW_HOURS = float(os.getenv("COGNOS_TUNER_WINDOW_HOURS", "168"))
+TUNER_INTERVAL_SECONDS = float(os.getenv("COGNOS_TUNER_INTERVAL_SECONDS", "300"))
+TUNER_STEP = float(os.getenv("COGNOS_TUNER_STEP", "0.01"))
+TUNER_MIN_TRACES = int(os.getenv("COGNOS_TUNER_MIN_TRACES", "200"))
+TUNER_TOP_K = int(os.getenv("COGNOS_TUNER_TOP_K", "3"))
+TUNER_MIN_GAIN = float(os.getenv("COGNOS_TUNER_MIN_GAIN", "0.01"))
+TUNER_TARGET_MIX = os.getenv("COGNOS_TUNER_TARGET_MIX", "PASS=0.85,REFINE=0.1,ESCALATE=0.04,BLOCK=0.01")
+
+logger = logging.getLogger("cognos.tuner")
+
+
+def parse_mix(spec: str) -> np.ndarray:
+    """Target PASS/REFINE/ESCALATE/BLOCK shares from a "DECISION=share,..." spec, normalized to sum to 1."""
+    mix = np.zeros(len(DECISIONS), dtype=np.float64)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        decision, _, raw = item.partition("=")
+        decision = decision.strip().upper()
+        if decision not in DECISIONS:
+            raise ValueError(f"Unknown decision {decision!r} in target mix; expected {', '.join(DECISIONS)}")
+        mix[DECISIONS.index(decision)] = max(0.0, float(raw))
+    if mix.sum() <= 0.0:
+        raise ValueError("Target mix must give at least one decision a positive share")
+    return mix / mix.sum()
+
+
+class RiskHistogram:
+    """Sorted distinct risks with their counts and running (cumulative) counts.
+
+    Risks are stored rounded to 6 places, so there are at most a million distinct values
+    however many traces the window holds. Adding or evicting a batch is one sorted merge;
+    counting traces at or below a threshold is one binary search into `values`.
+    """
+
+    __slots__ = ("values", "counts", "cumulative")
+
+    def __init__(self) -> None:
+        self.values = np.zeros(0, dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.cumulative = np.zeros(0, dtype=np.int64)
+
+    @property
+    def total(self) -> int:
+        return int(self.cumulative[-1]) if self.cumulative.size else 0
+
+    def update(self, risks: np.ndarray, sign: int = 1) -> None:
+        """Add (sign=1) or evict (sign=-1) a batch of risks; evicting risks never added raises ValueError."""
+        values, counts = np.unique(risks, return_counts=True)
+        merged = np.union1d(self.values, values)
+        merged_counts = np.zeros(merged.size, dtype=np.int64)
+        merged_counts[np.searchsorted(merged, self.values)] += self.counts
+        merged_counts[np.searchsorted(merged, values)] += sign * counts
+        if (merged_counts < 0).any():
+            raise ValueError("Evicted risks that are not in the histogram")
+        keep = merged_counts > 0
+        self.values = merged[keep]
+        self.counts = merged_counts[keep]
+        self.cumulative = np.cumsum(self.counts)
+
+    def count_at_most(self, thresholds: np.ndarray) -> np.ndarray:
+        """Traces with risk <= each threshold, one O(log n) binary search per threshold."""
+        index = np.searchsorted(self.values, thresholds, side="right")
+        padded = np.concatenate(([0], self.cumulative))
+        return padded[index]
+
+    def decision_counts(self, cutoffs: Iterable[float]) -> np.ndarray:
+        """PASS/REFINE/ESCALATE/BLOCK counts under CompiledPolicy.decide's cutoffs."""
+        at_most = self.count_at_most(np.asarray(tuple(cutoffs), dtype=np.float64))
+        return np.diff(np.concatenate(([0], at_most, [self.total])))
+
+    @classmethod
+    def merged(cls, histograms: Iterable[RiskHistogram]) -> RiskHistogram:
+        parts = list(histograms)
+        result = cls()
+        if parts:
+            values, inverse = np.unique(np.concatenate([part.values for part in parts]), return_inverse=True)
+            result.values = values
+            counts = np.concatenate([part.counts for part in parts])
+            result.counts = np.bincount(inverse.ravel(), weights=counts, minlength=values.size).astype(np.int64)
+            result.cumulative = np.cumsum(result.counts)
+        return result
+
+
+@functools.lru_cache(maxsize=4)
+def _candidate_grid(step: float) -> tuple[np.ndarray, np.ndarray]:
+    """Threshold grid and every (target, refine edge, escalate edge) index triple in ascending order."""
+    grid = np.round(np.arange(0.0, 1.0 + step / 2, step), 6)
+    triples = np.array(list(itertools.combinations_with_replacement(range(grid.size), 3)), dtype=np.int64)
+    return grid, triples
+
+
+def _mix(counts: np.ndarray) -> dict[str, float]:
+    total = counts.sum()
+    return {decision: round(float(count / total), 4) if total else 0.0 for decision, count in zip(DECISIONS, counts)}
+
+
+def _thresholds(cutoffs: Iterable[float]) -> dict[str, Any]:
+    target, refine_edge, escalate_edge = (float(value) for value in cutoffs)
+    return {
+        "target_risk": round(target, 6),
+        "bands": {"refine": round(refine_edge - target, 6), "escalate": round(escalate_edge - target, 6)},
+    }
+
+
+class ThresholdTuner:
+    """Sliding-window risk histograms per (policy, model), swept for better target_risk and bands.
+
+    The window holds the 2xx traces with created_ms in the last window_hours, tracked by
+    insertion order: refresh() adds the rows inserted since the last refresh (rowid past the
+    cursor) and evicts only rows already added (rowid at or before it) whose created_ms fell
+    out of the window, so traces persisted long after created_ms are neither missed nor
+    evicted twice. Any change to a trace already counted (a rewritten risk or status, a
+    deleted row) moves the trace store's rewrite count, and the next refresh reloads the
+    window instead of evicting stale values. suggest() ranks threshold patches whose
+    predicted decision mix comes closest to the target.
+    """
+
+    def __init__(
+        self,
+        window_hours: float = TUNER_WINDOW_HOURS,
+        step: float = TUNER_STEP,
+        min_traces: int = TUNER_MIN_TRACES,
+        top_k: int = TUNER_TOP_K,
+        min_gain: float = TUNER_MIN_GAIN,
+        target_mix: str = TUNER_TARGET_MIX,
+    ) -> None:
+        if not 0.0 < step <= 0.5:
+            raise ValueError(f"Threshold step must be in (0, 0.5], got {step}")
+        self.window_ms = int(window_hours * 3_600_000)
+        self.step = step
+        self.min_traces = max(1, min_traces)
+        self.top_k = max(1, top_k)
+        self.min_gain = min_gain
+        self.target_mix = parse_mix(target_mix)
+        self._groups: dict[tuple[str, str], RiskHistogram] = {}
+        # (created_from_ms, rowid cursor, trace_store.rewrite_count()) of the traces in the histograms.
+        self._window: tuple[int, int, int] | None = None
+        self._lock = threading.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self._counters = {"refreshes": 0, "full_loads": 0, "resyncs": 0, "added": 0, "evicted": 0, "refresh_errors": 0}
+        self._last_refresh_ms = 0.0
+
+    def _apply(self, sign: int, **bounds: int | None) -> int:
+        applied = 0
+        for chunk in trace_store.iter_signal_columns(**bounds):
+            # Shed, deadline and upstream-error traces are not decisions the thresholds made.
+            keep = succeeded(chunk)
+            if not keep.any():
+                continue
+            policies, policy_index = np.unique(np.asarray(chunk["policy"], dtype=np.str_)[keep], return_inverse=True)
+            models, model_index = np.unique(np.asarray(chunk["model"], dtype=np.str_)[keep], return_inverse=True)
+            risks = np.round(np.asarray(chunk["risk"], dtype=np.float64)[keep], 6)
+            codes = policy_index.ravel() * models.size + model_index.ravel()
+            order = np.argsort(codes, kind="stable")
+            group_codes, starts = np.unique(codes[order], return_index=True)
+            for code, group_risks in zip(group_codes.tolist(), np.split(risks[order], starts[1:])):
+                key = (str(policies[code // models.size]), str(models[code % models.size]))
+                histogram = self._groups.get(key)
+                if histogram is None:
+                    histogram = self._groups[key] = RiskHistogram()
+                histogram.update(group_risks, sign)
+                if not histogram.total:
+                    del self._groups[key]
+            applied += risks.size
+        return applied
+
+    def refresh(self, now_ms: int | None = None) -> dict[str, Any]:
+        """Slide the window to end now, touching only the traces inserted or aged out since the last refresh."""
+        started = time.perf_counter()
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        start = now_ms - self.window_ms
+        with self._lock:
+            # Read the rewrite count before any rows, so a rewrite racing this refresh is caught by the next one.
+            rewrites = trace_store.rewrite_count()
+            cursor = trace_store.last_rowid()
+            previous = self._window
+            incremental = previous is not None and start >= previous[0]
+            if incremental and rewrites != previous[2]:
+                # A counted trace changed risk, status, group or created_ms, or was deleted: evicting
+                # it by its current values would remove the wrong risk, so reload instead.
+                self._counters["resyncs"] += 1
+                incremental = False
+            if incremental:
+                try:
+                    self._counters["added"] += self._apply(1, created_from_ms=start, after_rowid=previous[1], upto_rowid=cursor)
+                    self._counters["evicted"] += self._apply(
+                        -1, created_from_ms=previous[0], created_to_ms=start, upto_rowid=previous[1]
+                    )
+                except ValueError:
+                    logger.warning("Policy tuner window drifted from the trace store; reloading it")
+                    self._counters["resyncs"] += 1
+                    incremental = False
+            if not incremental:
+                self._groups = {}
+                self._counters["full_loads"] += 1
+                self._counters["added"] += self._apply(1, created_from_ms=start, upto_rowid=cursor)
+            self._window = (start, cursor, rewrites)
+            self._counters["refreshes"] += 1
+        self._last_refresh_ms = (time.perf_counter() - started) * 1000
+        return self.stats()
+
+    def histogram(self, policy_id: str, model: str) -> RiskHistogram | None:
+        return self._groups.get((policy_id, model))
+
+    def _sweep(self, histogram: RiskHistogram, current: policy.CompiledPolicy, target: np.ndarray) -> list[dict[str, Any]]:
+        grid, triples = _candidate_grid(self.step)
+        total = histogram.total
+        at_most = histogram.count_at_most(grid)
+        edges = at_most[triples]
+        counts = np.diff(edges, axis=1, prepend=0, append=total)
+        distance = np.abs(counts / total - target).sum(axis=1)
+
+        current_cutoffs = np.asarray(current.cutoffs(None), dtype=np.float64)
+        current_counts = histogram.decision_counts(current_cutoffs)
+        current_distance = float(np.abs(current_counts / total - target).sum())
+        # Among equally good candidates prefer the smallest move from the current thresholds.
+        shift = np.abs(grid[triples] - current_cutoffs).sum(axis=1)
+        suggestions: list[dict[str, Any]] = []
+        seen: set[tuple[int, ...]] = set()
+        for index in np.lexsort((shift, distance)):
+            gain = current_distance - float(distance[index])
+            if gain < self.min_gain or len(suggestions) >= self.top_k:
+                break
+            mix_key = tuple(counts[index].tolist())
+            if mix_key in seen:
+                continue
+            seen.add(mix_key)
+            thresholds = _thresholds(grid[triples[index]])
+            # Predict with the cutoffs the patched policy will compute, not the grid's, so rounding never shifts a trace.
+            target_risk, bands = thresholds["target_risk"], thresholds["bands"]
+            patched = (target_risk, min(target_risk + bands["refine"], 1.0), min(target_risk + bands["escalate"], 1.0))
+            patched_counts = histogram.decision_counts(patched)
+            suggestions.append(
+                {
+                    "current": {**_thresholds(current_cutoffs), "mix": _mix(current_counts), "distance": round(current_distance, 6)},
+                    "suggested": {
+                        **thresholds,
+                        "mix": _mix(patched_counts),
+                        "distance": round(float(np.abs(patched_counts / total - target).sum()), 6),
+                    },
+                    "gain": round(gain, 6),
+                }
+            )
+        return suggestions
+
+    def suggest(
+        self,
+        table: policy.PolicyTable | None = None,
+        target_mix: str | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """Ranked policy patches (largest gain first) per policy and per model, for the current window.
+
+        A policy-level patch is predicted over the models that have no override of their own;
+        a model-level patch adds or retunes that model's override.
+        """
+        table = table or policy.current()
+        target = self.target_mix if target_mix is None else parse_mix(target_mix)
+        with self._lock:
+            groups = dict(self._groups)
+
+        by_policy: dict[str, list[tuple[str, RiskHistogram]]] = {}
+        for (policy_id, model), histogram in groups.items():
+            by_policy.setdefault(policy_id, []).append((model, histogram))
+
+        suggestions: list[dict[str, Any]] = []
+        for policy_id, members in sorted(by_policy.items()):
+            if policy_id not in table:
+                continue
+            base = table.get(policy_id)
+            inherited = [histogram for model, histogram in members if table.get(policy_id, model or None) is base]
+            candidates = [(None, RiskHistogram.merged(inherited), base)]
+            candidates += [(model, histogram, table.get(policy_id, model)) for model, histogram in sorted(members) if model]
+            for model, histogram, current in candidates:
+                if histogram.total < self.min_traces:
+                    continue
+                for suggestion in self._sweep(histogram, current, target):
+                    thresholds = {key: suggestion["suggested"][key] for key in ("target_risk", "bands")}
+                    spec = thresholds if model is None else {"models": {model: thresholds}}
+                    suggestions.append(
+                        {
+                            "policy_id": policy_id,
+                            "model": model,
+                            "traces": histogram.total,
+                            **suggestion,
+                            "patch": {"policies": {policy_id: spec}},
+                        }
+                    )
+        suggestions.sort(key=lambda item: (-item["gain"], -item["traces"]))
+        return suggestions[:limit] if limit is not None else suggestions
+
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    def start(self, interval_seconds: float = TUNER_INTERVAL_SECONDS) -> None:
+        if self.is_running() or interval_seconds <= 0:
+            return
+        self._task = asyncio.create_task(self._refresh_loop(interval_seconds), name="cognos-policy-tuner")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _refresh_loop(self, interval_seconds: float) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                self._counters["refresh_errors"] += 1
+                logger.exception("Policy tuner refresh failed")
+            await asyncio.sleep(interval_seconds)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            window = self._window
+            groups = {f"{policy_id}/{model or '-'}": histogram.total for (policy_id, model), histogram in sorted(self._groups.items())}
+        return {
+            **self._counters,
+            "window": {"created_from_ms": window[0], "rowid": window[1], "rewrites": window[2]} if window else None,
+            "window_hours": self.window_ms / 3_600_000,
+            "last_refresh_ms": round(self._last_refresh_ms, 3),
+            "traces": sum(groups.values()),
+            "groups": groups,
+        }
+
+
+policy_tuner = ThresholdTuner()
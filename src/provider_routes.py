@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Mapping
+
+PROVIDERS_FILE = os.getenv("COGNOS_PROVIDERS_FILE", "")
+DEFAULT_HEDGE_PERCENTILE = float(os.getenv("COGNOS_HEDGE_PERCENTILE", "0.95"))
+
+logger = logging.getLogger("cognos.provider_routes")
+
+# Built-in prefix providers. "openrouter_namespace" is the vendor segment OpenRouter-style
+# upstreams expect in front of the model name (openai/gpt-4o-mini, anthropic/claude-...).
+_BUILTIN_PROVIDERS: dict[str, dict[str, Any]] = {
+    "openai": {"prefixes": ["openai"], "base_url": "https://api.openai.com/v1", "openrouter_namespace": "openai"},
+    "google": {"prefixes": ["google"], "openrouter_namespace": "google"},
+    "claude": {"prefixes": ["claude", "anthropic"], "openrouter_namespace": "anthropic"},
+    "mistral": {"prefixes": ["mistral"], "openrouter_namespace": "mistralai"},
+    "ollama": {"prefixes": ["ollama"], "openrouter_namespace": ""},
+}
+
+
+class RoutingConfigError(ValueError):
+    """Raised when a provider config cannot be compiled; the active table is kept."""
+
+
+class _Route:
+    __slots__ = ("provider", "endpoints", "api_key", "model_prefix", "hedge_percentile")
+
+    def __init__(
+        self,
+        provider: str,
+        endpoints: tuple[tuple[str, int], ...],
+        api_key: str,
+        model_prefix: str,
+        hedge_percentile: float | None = None,
+    ) -> None:
+        self.provider = provider
+        self.endpoints = endpoints
+        self.api_key = api_key
+        self.model_prefix = model_prefix
+        self.hedge_percentile = hedge_percentile
+
+    @property
+    def base_url(self) -> str:
+        return self.endpoints[0][0]
+
+    def target(self, model: str) -> dict[str, Any]:
+        # base_url is the primary endpoint; it identifies the provider pool for cache and
+        # coalescing keys, while upstream_balancer picks among "endpoints" per request.
+        return {
+            "provider": self.provider,
+            "base_url": self.base_url,
+            "endpoints": self.endpoints,
+            "api_key": self.api_key,
+            "model": f"{self.model_prefix}{model}",
+            "hedge_percentile": self.hedge_percentile,
+        }
+
+
+class RoutingTable:
+    """Immutable model -> upstream mapping compiled from the provider config and env.
+
+    resolve() is an alias dict lookup plus a prefix dict lookup; base URLs, credentials
+    and model-name rewrites are all worked out once at compile time.
+    """
+
+    def __init__(
+        self,
+        default: _Route,
+        prefixes: dict[str, _Route],
+        aliases: dict[str, dict[str, Any]],
+        source: str | None,
+        version: int,
+    ) -> None:
+        self._default = default
+        self._prefixes = prefixes
+        self._aliases = aliases
+        self.source = source
+        self.version = version
+
+    def resolve(self, model: str) -> dict[str, Any]:
+        """Return {"provider", "base_url", "endpoints", "api_key", "model"} for a requested model id."""
+        normalized = (model or "").strip()
+        aliased = self._aliases.get(normalized)
+        if aliased is not None:
+            return dict(aliased)
+        prefix, separator, remainder = normalized.partition(":")
+        if separator:
+            route = self._prefixes.get(prefix.strip().lower())
+            if route is not None:
+                return route.target(remainder.strip())
+        # Unknown prefixes are passed through untouched to the default upstream.
+        return self._default.target(normalized)
+
+    def endpoint_groups(self) -> list[tuple[tuple[str, int], ...]]:
+        """Distinct endpoint lists across the default and every provider."""
+        routes = [self._default, *self._prefixes.values()]
+        return list(dict.fromkeys(route.endpoints for route in routes))
+
+    def describe(self) -> dict[str, Any]:
+        """Routes without credentials, for the admin endpoint."""
+
+        def _summary(route: _Route) -> dict[str, Any]:
+            return {
+                "provider": route.provider,
+                "base_url": route.base_url,
+                "endpoints": [{"base_url": base_url, "weight": weight} for base_url, weight in route.endpoints],
+                "has_api_key": bool(route.api_key),
+                "model_prefix": route.model_prefix,
+                "hedge_percentile": route.hedge_percentile,
+            }
+
+        return {
+            "version": self.version,
+            "source": self.source,
+            "default": _summary(self._default),
+            "prefixes": {prefix: _summary(route) for prefix, route in sorted(self._prefixes.items())},
+            "aliases": {alias: target["provider"] + ":" + target["model"] for alias, target in sorted(self._aliases.items())},
+        }
+
+
+def _endpoints(spec: Mapping[str, Any], name: str) -> tuple[tuple[str, int], ...]:
+    endpoints: list[tuple[str, int]] = []
+    for item in spec.get("endpoints") or []:
+        if isinstance(item, str):
+            base_url, weight = item, 1
+        elif isinstance(item, Mapping):
+            base_url, weight = str(item.get("base_url") or ""), item.get("weight", 1)
+        else:
+            raise RoutingConfigError(f"Provider {name!r} endpoints must be URLs or objects with base_url")
+        if not isinstance(weight, int) or isinstance(weight, bool) or weight < 1:
+            raise RoutingConfigError(f"Provider {name!r} endpoint weights must be positive integers")
+        if base_url.strip():
+            endpoints.append((base_url.strip(), weight))
+    return tuple(endpoints)
+
+
+def _hedge_percentile(spec: Mapping[str, Any], name: str) -> float | None:
+    """"hedge": true uses COGNOS_HEDGE_PERCENTILE; {"percentile": 0.9} sets it per route."""
+    hedge = spec.get("hedge")
+    if hedge is None or hedge is False:
+        return None
+    if hedge is True:
+        return DEFAULT_HEDGE_PERCENTILE
+    percentile = hedge.get("percentile", DEFAULT_HEDGE_PERCENTILE) if isinstance(hedge, Mapping) else None
+    if not isinstance(percentile, (int, float)) or isinstance(percentile, bool) or not 0.0 < percentile < 1.0:
+        raise RoutingConfigError(f"Provider {name!r} hedge must be true or an object with a percentile between 0 and 1")
+    return float(percentile)
+
+
+def _split_urls(value: str) -> tuple[tuple[str, int], ...]:
+    return tuple((url.strip(), 1) for url in value.split(",") if url.strip())
+
+
+def _env(environ: Mapping[str, str], name: str) -> str:
+    return environ.get(name, "").strip()
+
+
+def _api_key(spec: Mapping[str, Any], environ: Mapping[str, str]) -> str:
+    key_env = spec.get("api_key_env")
+    if key_env:
+        return _env(environ, str(key_env))
+    return str(spec.get("api_key") or "")
+
+
+def compile_table(
+    config: Mapping[str, Any] | None = None,
+    environ: Mapping[str, str] | None = None,
+    source: str | None = None,
+    version: int = 1,
+) -> RoutingTable:
+    """Compile built-in providers, then the config file, then COGNOS_* env overrides."""
+    config = {} if config is None else config
+    environ = os.environ if environ is None else environ
+    if not isinstance(config, Mapping):
+        raise RoutingConfigError("Provider config must be a JSON object")
+
+    default_spec = config.get("default") or {}
+    default_endpoints = (
+        _split_urls(_env(environ, "COGNOS_UPSTREAM_BASE_URL"))
+        or _endpoints(default_spec, "default")
+        or _split_urls(str(default_spec.get("base_url") or "https://api.openai.com/v1"))
+    )
+    default_api_key = _env(environ, "COGNOS_UPSTREAM_API_KEY") or _api_key(default_spec, environ)
+    default = _Route("default", default_endpoints, default_api_key, "", _hedge_percentile(default_spec, "default"))
+
+    providers: dict[str, dict[str, Any]] = {name: dict(spec) for name, spec in _BUILTIN_PROVIDERS.items()}
+    file_providers = config.get("providers") or {}
+    if not isinstance(file_providers, Mapping):
+        raise RoutingConfigError("'providers' must be an object keyed by provider name")
+    for name, spec in file_providers.items():
+        if not isinstance(spec, Mapping):
+            raise RoutingConfigError(f"Provider {name!r} must be an object")
+        providers[str(name).lower()] = {**providers.get(str(name).lower(), {}), **spec}
+
+    prefixes: dict[str, _Route] = {}
+    for name, spec in providers.items():
+        env_name = name.upper().replace("-", "_")
+        base_url_env = f"COGNOS_INSTANCE_{env_name}_BASE_URL"
+        # A set-but-empty instance URL deliberately points the provider at the default upstream.
+        # Env values may list several comma-separated endpoints; the file can also weight them.
+        if base_url_env in environ:
+            endpoints = _split_urls(_env(environ, base_url_env))
+        else:
+            endpoints = _endpoints(spec, name) or _split_urls(str(spec.get("base_url") or ""))
+        endpoints = endpoints or default.endpoints
+        base_url = endpoints[0][0]
+        api_key = _env(environ, f"COGNOS_INSTANCE_{env_name}_API_KEY") or _api_key(spec, environ) or default_api_key
+
+        if "model_prefix" in spec:
+            model_prefix = str(spec["model_prefix"] or "")
+        elif "openrouter.ai" in base_url.lower() and spec.get("openrouter_namespace"):
+            model_prefix = f"{spec['openrouter_namespace']}/"
+        else:
+            model_prefix = ""
+
+        route = _Route(name, endpoints, api_key, model_prefix, _hedge_percentile(spec, name))
+        for prefix in spec.get("prefixes") or [name]:
+            key = str(prefix).strip().lower()
+            if key in prefixes:
+                raise RoutingConfigError(f"Model prefix {key!r} is claimed by both {prefixes[key].provider!r} and {name!r}")
+            prefixes[key] = route
+
+    partial = RoutingTable(default, prefixes, {}, source, version)
+    aliases: dict[str, dict[str, Any]] = {}
+    file_aliases = config.get("aliases") or {}
+    if not isinstance(file_aliases, Mapping):
+        raise RoutingConfigError("'aliases' must be an object mapping alias -> model")
+    for alias, target_model in file_aliases.items():
+        if not isinstance(target_model, str) or not target_model.strip():
+            raise RoutingConfigError(f"Alias {alias!r} must map to a model id")
+        aliases[str(alias).strip()] = partial.resolve(target_model)
+
+    return RoutingTable(default, prefixes, aliases, source, version)
+
+
+def load_config(path: str) -> dict[str, Any]:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise RoutingConfigError(f"Provider config file not found: {path}") from None
+    except ValueError as error:
+        raise RoutingConfigError(f"Invalid provider config {path}: {error}") from None
+
+
+_lock = threading.Lock()
+_table = compile_table(load_config(PROVIDERS_FILE) if PROVIDERS_FILE else None, source=PROVIDERS_FILE or None)
+
+
+def current() -> RoutingTable:
+    return _table
+
+
+def resolve(model: str) -> dict[str, Any]:
+    return _table.resolve(model)
+
+
+def reload(path: str | None = None) -> RoutingTable:
+    """Recompile from the config file and env and swap the table in atomically.
+
+    Requests already routed (including open streams) keep the target they resolved.
+    Raises RoutingConfigError and keeps the current table if the new config is invalid.
+    """
+    global _table
+    path = PROVIDERS_FILE if path is None else path
+    with _lock:
+        table = compile_table(load_config(path) if path else None, source=path or None, version=_table.version + 1)
+        _table = table
+    logger.info("Provider routing table reloaded (version %d, source %s)", table.version, table.source)
+    return table
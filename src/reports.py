@@ -4,21 +4,20 @@ import uuid
 from datetime import datetime, timezone
 from typing import Any
 
-from trace_store import get_trace
+from trace_store import get_trace_decisions
 
 
 def build_trust_report(trace_ids: list[str], regime: str, fmt: str = "json") -> dict[str, Any]:
-    found = 0
-    missing: list[str] = []
+    decision_by_id = get_trace_decisions(trace_ids)
+    missing_set = set(trace_ids) - decision_by_id.keys()
+    missing = [trace_id for trace_id in trace_ids if trace_id in missing_set]
+    found = len(trace_ids) - len(missing)
     decisions: dict[str, int] = {}
 
     for trace_id in trace_ids:
-        trace = get_trace(trace_id)
-        if trace is None:
-            missing.append(trace_id)
+        decision = decision_by_id.get(trace_id)
+        if decision is None:
             continue
-        found += 1
-        decision = str((trace.get("envelope") or {}).get("decision", "UNKNOWN"))
         decisions[decision] = decisions.get(decision, 0) + 1
 
     summary: dict[str, Any] = {
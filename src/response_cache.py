@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+CACHE_MAX_BYTES = int(os.getenv("COGNOS_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_ENTRY_BYTES = int(os.getenv("COGNOS_RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("COGNOS_RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+
+class ResponseCache:
+    """Exact-match LRU cache of upstream response bodies, bounded by TTL and total bytes."""
+
+    def __init__(
+        self,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        max_entry_bytes: int = CACHE_MAX_ENTRY_BYTES,
+    ) -> None:
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_seconds = max(0.0, ttl_seconds)
+        self.max_entry_bytes = max(0, min(max_entry_bytes, self.max_bytes))
+        self._entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl_seconds > 0
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Return {"body", "meta", "age_ms"} for a live entry, refreshing its LRU position."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry["expires_at"] <= now:
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return {"body": entry["body"], "meta": entry["meta"], "age_ms": round((now - entry["stored_at"]) * 1000, 3)}
+
+    def put(self, key: str, body: bytes, meta: dict[str, Any] | None = None) -> bool:
+        size = len(body)
+        if not self.enabled or size > self.max_entry_bytes:
+            self._counters["rejected"] += 1
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "body": body,
+                "meta": dict(meta or {}),
+                "size": size,
+                "stored_at": now,
+                "expires_at": now + self.ttl_seconds,
+            }
+            self._bytes += size
+            self._counters["stores"] += 1
+            while self._bytes > self.max_bytes and self._entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._counters["evictions"] += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                **self._counters,
+            }
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import math
+import os
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+import json_codec
+
+SHADOW_WORKERS = int(os.getenv("COGNOS_SHADOW_WORKERS", "4"))
+SHADOW_QUEUE_MAX = int(os.getenv("COGNOS_SHADOW_QUEUE_MAX", "256"))
+SHADOW_TIMEOUT_SECONDS = float(os.getenv("COGNOS_SHADOW_TIMEOUT_SECONDS", "60"))
+SHADOW_MAX_MODELS = int(os.getenv("COGNOS_SHADOW_MAX_MODELS", "3"))
+SHADOW_MAX_ROLLUPS = 256
+
+logger = logging.getLogger("cognos.shadow")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def completion_text(payload: Any) -> str:
+    """Concatenated assistant message content of an OpenAI-style completion payload."""
+    choices = payload.get("choices") if isinstance(payload, dict) else None
+    if not isinstance(choices, list):
+        return ""
+    parts = []
+    for choice in choices:
+        message = choice.get("message") if isinstance(choice, dict) else None
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            parts.append(content)
+    return "\n".join(parts)
+
+
+def _term_counts(text: str) -> collections.Counter[str]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    counts = collections.Counter(tokens)
+    counts.update(f"{left} {right}" for left, right in zip(tokens, tokens[1:]))
+    return counts
+
+
+def divergence(primary: str, shadow: str) -> float:
+    """1 - cosine similarity of unigram+bigram counts: 0.0 identical wording, 1.0 nothing shared."""
+    left, right = _term_counts(primary), _term_counts(shadow)
+    if not left and not right:
+        return 0.0
+    if not left or not right:
+        return 1.0
+    if len(left) > len(right):
+        left, right = right, left
+    dot = sum(count * right[term] for term, count in left.items())
+    norm = math.sqrt(sum(c * c for c in left.values())) * math.sqrt(sum(c * c for c in right.values()))
+    return round(min(1.0, max(0.0, 1.0 - dot / norm)), 6)
+
+
+class ShadowJob:
+    """One sampled request: the primary output and how to send the same request to each shadow model."""
+
+    __slots__ = ("trace_id", "primary_text", "models", "send", "on_done", "queued_at")
+
+    def __init__(
+        self,
+        trace_id: str,
+        primary_text: str,
+        models: list[str],
+        send: Callable[[str], Awaitable[httpx.Response]],
+        on_done: Callable[[dict[str, Any]], Awaitable[None]],
+    ) -> None:
+        self.trace_id = trace_id
+        self.primary_text = primary_text
+        self.models = models
+        self.send = send
+        self.on_done = on_done
+        self.queued_at = time.monotonic()
+
+
+class _ModelRollup:
+    __slots__ = ("samples", "total", "maximum", "last", "errors")
+
+    def __init__(self) -> None:
+        self.samples = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.last: float | None = None
+        self.errors = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "mean_divergence": round(self.total / self.samples, 6) if self.samples else None,
+            "max_divergence": self.maximum,
+            "last_divergence": self.last,
+            "errors": self.errors,
+        }
+
+
+class ShadowRunner:
+    """Runs sampled requests against shadow models on a bounded pool of background workers.
+
+    admit() is the only call on the request path: it samples and checks queue room. Jobs
+    that do not fit are dropped and counted, never waited on, so shadowing cannot add
+    latency to the primary response.
+    """
+
+    def __init__(
+        self,
+        workers: int = SHADOW_WORKERS,
+        max_queue: int = SHADOW_QUEUE_MAX,
+        timeout_seconds: float = SHADOW_TIMEOUT_SECONDS,
+        max_models: int = SHADOW_MAX_MODELS,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.timeout_seconds = timeout_seconds
+        self.max_models = max(1, max_models)
+        self._queue: asyncio.Queue[ShadowJob] | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+        self._models: dict[str, _ModelRollup] = {}
+        self._counters = {"sampled": 0, "enqueued": 0, "completed": 0, "dropped_queue_full": 0, "dropped_not_running": 0, "dropped_shutdown": 0, "write_errors": 0}
+
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self.is_running():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._work(), name=f"cognos-shadow-{index}") for index in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued jobs are dropped and counted."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._queue is not None:
+            self._counters["dropped_shutdown"] += self._queue.qsize()
+            self._queue = None
+
+    def admit(self, shadow_pct: float, models: list[str]) -> str | None:
+        """Sampling decision for a request: None when not sampled, else "queued" or "dropped"."""
+        if not models or shadow_pct <= 0 or (shadow_pct < 1.0 and random.random() >= shadow_pct):
+            return None
+        self._counters["sampled"] += 1
+        if self._queue is None:
+            self._counters["dropped_not_running"] += 1
+            return "dropped"
+        if self._queue.full():
+            self._counters["dropped_queue_full"] += 1
+            return "dropped"
+        return "queued"
+
+    def submit(self, job: ShadowJob) -> bool:
+        if self._queue is None:
+            self._counters["dropped_not_running"] += 1
+            return False
+        job.models = job.models[: self.max_models]
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._counters["dropped_queue_full"] += 1
+            return False
+        self._counters["enqueued"] += 1
+        return True
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                result = await self.run(job)
+                try:
+                    await job.on_done(result)
+                except Exception:
+                    self._counters["write_errors"] += 1
+                    logger.exception("Shadow result write-back failed for trace %s", job.trace_id)
+            except Exception:
+                logger.exception("Shadow job failed for trace %s", job.trace_id)
+            finally:
+                queue.task_done()
+
+    async def run(self, job: ShadowJob) -> dict[str, Any]:
+        """Send the job to every shadow model concurrently and score each output against the primary."""
+        started_at = time.monotonic()
+        outcomes = await asyncio.gather(*(self._shadow_call(job, model) for model in job.models))
+        scores = {model: outcome for model, outcome in zip(job.models, outcomes) if isinstance(outcome, float)}
+        errors = {model: outcome for model, outcome in zip(job.models, outcomes) if isinstance(outcome, str)}
+        self._counters["completed"] += 1
+        return {
+            "status": "completed" if scores else "failed",
+            "compared_models": list(job.models),
+            "divergence": max(scores.values()) if scores else None,
+            "per_model": scores,
+            "errors": errors,
+            "queued_ms": round((started_at - job.queued_at) * 1000, 3),
+            "duration_ms": round((time.monotonic() - started_at) * 1000, 3),
+        }
+
+    async def _shadow_call(self, job: ShadowJob, model: str) -> float | str:
+        rollup = self._rollup(model)
+        try:
+            response = await asyncio.wait_for(job.send(model), self.timeout_seconds)
+            try:
+                if response.status_code >= 400:
+                    rollup.errors += 1
+                    return f"status {response.status_code}"
+                score = divergence(job.primary_text, completion_text(json_codec.loads(response.content)))
+            finally:
+                await response.aclose()
+        except asyncio.TimeoutError:
+            rollup.errors += 1
+            return "timeout"
+        except Exception as error:
+            rollup.errors += 1
+            return f"{type(error).__name__}: {error}"
+        rollup.samples += 1
+        rollup.total += score
+        rollup.maximum = max(rollup.maximum, score)
+        rollup.last = score
+        return score
+
+    def _rollup(self, model: str) -> _ModelRollup:
+        rollup = self._models.get(model)
+        if rollup is None:
+            if len(self._models) >= SHADOW_MAX_ROLLUPS:
+                self._models.pop(next(iter(self._models)))
+            rollup = self._models[model] = _ModelRollup()
+        return rollup
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self._counters,
+            "running": self.is_running(),
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_max": self.max_queue,
+            "models": {model: rollup.as_dict() for model, rollup in self._models.items()},
+        }
+
+
+shadow_runner = ShadowRunner()
@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+import os
+import re
+import time
+from typing import Any, Awaitable, Callable
+
+SIGNAL_NAMES = ("ue", "ua", "divergence", "citation_density", "contradiction", "out_of_distribution")
+
+BASE_RISK = float(os.getenv("COGNOS_BASE_RISK", "0.12"))
+SIGNAL_BUDGET_MS = float(os.getenv("COGNOS_SIGNAL_BUDGET_MS", "5"))
+SIGNAL_WORKERS = int(os.getenv("COGNOS_SIGNAL_WORKERS", "2"))
+SIGNAL_QUEUE_MAX = int(os.getenv("COGNOS_SIGNAL_QUEUE_MAX", "1024"))
+SIGNAL_WEIGHTS = os.getenv("COGNOS_SIGNAL_WEIGHTS", "")
+SIGNAL_PLUGINS = os.getenv("COGNOS_SIGNAL_PLUGINS", "")
+SIGNAL_DISABLED = os.getenv("COGNOS_SIGNAL_DISABLED", "")
+
+# How strongly each signal (0..1) raises risk; citation density is reported but not scored.
+DEFAULT_WEIGHTS = {
+    "ue": 0.5,
+    "ua": 0.3,
+    "divergence": 0.6,
+    "citation_density": 0.0,
+    "contradiction": 0.7,
+    "out_of_distribution": 0.5,
+}
+
+logger = logging.getLogger("cognos.signals")
+
+INLINE = "inline"
+ASYNC = "async"
+
+
+class SignalInput:
+    """What an extractor sees: the request's user text, the response text and the model."""
+
+    __slots__ = ("request_text", "response_text", "model")
+
+    def __init__(self, request_text: str, response_text: str = "", model: str | None = None) -> None:
+        self.request_text = request_text
+        self.response_text = response_text
+        self.model = model
+
+
+class Extractor:
+    """A named function producing one signal in [0, 1], or None when it has nothing to measure."""
+
+    __slots__ = ("name", "signal", "mode", "fn", "runs", "errors", "deferred", "total_ms", "max_ms")
+
+    def __init__(self, name: str, signal: str, mode: str, fn: Callable[[SignalInput], float | None]) -> None:
+        if signal not in SIGNAL_NAMES:
+            raise ValueError(f"Unknown signal {signal!r}; expected one of {', '.join(SIGNAL_NAMES)}")
+        if mode not in (INLINE, ASYNC):
+            raise ValueError(f"Extractor mode must be {INLINE!r} or {ASYNC!r}, got {mode!r}")
+        self.name = name
+        self.signal = signal
+        self.mode = mode
+        self.fn = fn
+        self.runs = 0
+        self.errors = 0
+        self.deferred = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def __call__(self, data: SignalInput) -> tuple[float | None, float]:
+        """Run once: (clamped value or None, elapsed ms). Errors are logged and yield None."""
+        started = time.perf_counter()
+        try:
+            value = self.fn(data)
+        except Exception:
+            self.errors += 1
+            logger.exception("Signal extractor %s failed", self.name)
+            value = None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.runs += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if value is not None:
+            value = min(1.0, max(0.0, float(value)))
+        return value, round(elapsed_ms, 3)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "signal": self.signal,
+            "mode": self.mode,
+            "runs": self.runs,
+            "errors": self.errors,
+            "deferred": self.deferred,
+            "avg_ms": round(self.total_ms / self.runs, 3) if self.runs else 0.0,
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+_registry: dict[str, Extractor] = {}
+
+
+def register_extractor(name: str, signal: str, mode: str = INLINE) -> Callable[[Callable[[SignalInput], float | None]], Callable[[SignalInput], float | None]]:
+    """Decorator adding fn to the registry under name; re-registering a name replaces it.
+
+    Inline extractors run on the request path in registration order until the latency
+    budget is spent; async ones (and inline ones past the budget) run on the worker pool.
+    """
+
+    def decorator(fn: Callable[[SignalInput], float | None]) -> Callable[[SignalInput], float | None]:
+        _registry[name] = Extractor(name, signal, mode, fn)
+        return fn
+
+    return decorator
+
+
+def unregister_extractor(name: str) -> None:
+    _registry.pop(name, None)
+
+
+def extractors() -> list[Extractor]:
+    return list(_registry.values())
+
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """DEFAULT_WEIGHTS overridden by a "signal=weight,..." spec."""
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        signal, _, raw = item.partition("=")
+        signal = signal.strip()
+        if signal not in SIGNAL_NAMES:
+            raise ValueError(f"Unknown signal {signal!r} in COGNOS_SIGNAL_WEIGHTS")
+        weights[signal] = min(1.0, max(0.0, float(raw)))
+    return weights
+
+
+def aggregate_risk(signals: dict[str, float], weights: dict[str, float], base_risk: float = BASE_RISK) -> float:
+    """Noisy-OR of the base risk and each weighted signal: all-zero signals give base_risk."""
+    survival = 1.0 - min(1.0, max(0.0, base_risk))
+    for signal, value in signals.items():
+        survival *= 1.0 - weights.get(signal, 0.0) * value
+    return round(min(1.0, max(0.0, 1.0 - survival)), 6)
+
+
+class SignalReport:
+    """Signals for one request plus per-extractor timings and what was left for the worker pool."""
+
+    __slots__ = ("signals", "timings", "deferred", "elapsed_ms", "budget_ms", "risk", "weights", "base_risk")
+
+    def __init__(self, budget_ms: float, weights: dict[str, float], base_risk: float) -> None:
+        self.signals = dict.fromkeys(SIGNAL_NAMES, 0.0)
+        self.timings: dict[str, float] = {}
+        self.deferred: list[str] = []
+        self.elapsed_ms = 0.0
+        self.budget_ms = budget_ms
+        self.weights = weights
+        self.base_risk = base_risk
+        self.risk = base_risk
+
+    def as_metadata(self) -> dict[str, Any]:
+        return {
+            "values": dict(self.signals),
+            "risk": self.risk,
+            "timings_ms": dict(self.timings),
+            "inline_ms": round(self.elapsed_ms, 3),
+            "budget_ms": self.budget_ms,
+            "deferred": list(self.deferred),
+        }
+
+
+class _Job:
+    __slots__ = ("data", "report", "names", "on_done")
+
+    def __init__(self, data: SignalInput, report: SignalReport, names: list[str], on_done: Callable[[dict[str, Any]], Awaitable[None]]) -> None:
+        self.data = data
+        self.report = report
+        self.names = names
+        self.on_done = on_done
+
+
+class SignalEngine:
+    """Runs registered extractors: cheap ones inline under a latency budget, the rest on workers.
+
+    evaluate() is synchronous and bounded by budget_ms (an extractor already running is never
+    interrupted, so one slow inline extractor can overshoot once). submit() hands the deferred
+    and async extractors to a bounded pool; their results go to the job's on_done callback.
+    """
+
+    def __init__(
+        self,
+        budget_ms: float = SIGNAL_BUDGET_MS,
+        workers: int = SIGNAL_WORKERS,
+        max_queue: int = SIGNAL_QUEUE_MAX,
+        weights: dict[str, float] | None = None,
+        base_risk: float = BASE_RISK,
+        disabled: set[str] | None = None,
+    ) -> None:
+        self.budget_ms = max(0.0, budget_ms)
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.weights = weights if weights is not None else parse_weights(SIGNAL_WEIGHTS)
+        self.base_risk = base_risk
+        self.disabled = disabled if disabled is not None else {name.strip() for name in SIGNAL_DISABLED.split(",") if name.strip()}
+        self._queue: asyncio.Queue[_Job] | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+        self._counters = {"evaluated": 0, "over_budget": 0, "async_jobs": 0, "async_completed": 0, "dropped": 0}
+
+    def _active(self) -> list[Extractor]:
+        return [extractor for extractor in _registry.values() if extractor.name not in self.disabled]
+
+    def evaluate(self, data: SignalInput, weights: dict[str, float] | None = None, base_risk: float | None = None) -> SignalReport:
+        """Run inline extractors; risk uses the given weights and base risk (a policy's) or the engine's."""
+        self._counters["evaluated"] += 1
+        report = SignalReport(
+            self.budget_ms,
+            self.weights if weights is None else weights,
+            self.base_risk if base_risk is None else base_risk,
+        )
+        started = time.perf_counter()
+        for extractor in self._active():
+            if extractor.mode == ASYNC:
+                report.deferred.append(extractor.name)
+                continue
+            if (time.perf_counter() - started) * 1000 >= self.budget_ms:
+                extractor.deferred += 1
+                report.deferred.append(extractor.name)
+                continue
+            value, elapsed_ms = extractor(data)
+            report.timings[extractor.name] = elapsed_ms
+            if value is not None:
+                report.signals[extractor.signal] = max(report.signals[extractor.signal], value)
+        report.elapsed_ms = (time.perf_counter() - started) * 1000
+        if any(_registry[name].mode == INLINE for name in report.deferred):
+            self._counters["over_budget"] += 1
+        report.risk = aggregate_risk(report.signals, report.weights, report.base_risk)
+        return report
+
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self.is_running():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._work(), name=f"cognos-signals-{index}") for index in range(self.workers)]
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._queue is not None:
+            self._counters["dropped"] += self._queue.qsize()
+            self._queue = None
+
+    def submit(self, data: SignalInput, report: SignalReport, on_done: Callable[[dict[str, Any]], Awaitable[None]]) -> bool:
+        """Queue the report's deferred extractors; False (and counted as dropped) if there is no room."""
+        if not report.deferred:
+            return False
+        if self._queue is None:
+            self._counters["dropped"] += 1
+            return False
+        try:
+            self._queue.put_nowait(_Job(data, report, list(report.deferred), on_done))
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+            return False
+        self._counters["async_jobs"] += 1
+        return True
+
+    async def run_deferred(self, data: SignalInput, report: SignalReport, names: list[str]) -> dict[str, Any]:
+        """Run the named extractors in a thread and return the combined signals metadata."""
+        signals = dict(report.signals)
+        timings = dict(report.timings)
+        for name in names:
+            extractor = _registry.get(name)
+            if extractor is None:
+                continue
+            value, elapsed_ms = await asyncio.to_thread(extractor, data)
+            timings[name] = elapsed_ms
+            if value is not None:
+                signals[extractor.signal] = max(signals[extractor.signal], value)
+        metadata = report.as_metadata()
+        metadata.update(
+            {
+                "values": signals,
+                "timings_ms": timings,
+                "async_risk": aggregate_risk(signals, report.weights, report.base_risk),
+                "async_completed": True,
+            }
+        )
+        return metadata
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                result = await self.run_deferred(job.data, job.report, job.names)
+                self._counters["async_completed"] += 1
+                await job.on_done(result)
+            except Exception:
+                logger.exception("Async signal extraction failed")
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self._counters,
+            "budget_ms": self.budget_ms,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_max": self.max_queue,
+            "weights": dict(self.weights),
+            "extractors": {extractor.name: {**extractor.stats(), "enabled": extractor.name not in self.disabled} for extractor in _registry.values()},
+        }
+
+
+# Built-in extractors: lexical proxies that are cheap enough to run on every response.
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_HEDGES = re.compile(
+    r"\b(?:might|may|maybe|perhaps|possibly|probably|likely|unclear|uncertain|not sure|i think|i believe|"
+    r"it seems|appears to|could be|roughly|approximately|as far as i know)\b"
+)
+_VARIABILITY = re.compile(r"\b(?:it depends|depending on|varies|vary|varying|in some cases|sometimes|either|ranges? from)\b")
+_CITATION = re.compile(r"https?://|\bdoi:|\[\d+\]|\(\s*[A-Z][A-Za-z]+(?: et al\.)?,? \d{4}\s*\)")
+_NEGATION = frozenset({"not", "no", "never", "none", "cannot", "isn't", "aren't", "wasn't", "weren't", "doesn't", "don't", "didn't", "won't"})
+
+
+def _sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in _SENTENCE_SPLIT.split(text) if sentence.strip()]
+
+
+def _phrase_rate(pattern: re.Pattern[str], text: str) -> float | None:
+    sentences = _sentences(text)
+    if not sentences:
+        return None
+    return min(1.0, len(pattern.findall(text.lower())) / len(sentences))
+
+
+@register_extractor("hedging_language", "ue")
+def hedging_language(data: SignalInput) -> float | None:
+    """Hedge words per sentence in the response (epistemic uncertainty the model expresses)."""
+    return _phrase_rate(_HEDGES, data.response_text)
+
+
+@register_extractor("conditional_answer", "ua")
+def conditional_answer(data: SignalInput) -> float | None:
+    """Conditional phrases ("it depends", "varies") per sentence in the response."""
+    return _phrase_rate(_VARIABILITY, data.response_text)
+
+
+@register_extractor("citation_markers", "citation_density")
+def citation_markers(data: SignalInput) -> float | None:
+    """Share of response sentences carrying a URL, DOI, [n] or (Author, year) marker."""
+    sentences = _sentences(data.response_text)
+    if not sentences:
+        return None
+    return sum(1 for sentence in sentences if _CITATION.search(sentence)) / len(sentences)
+
+
+@register_extractor("negation_conflict", "contradiction", mode=ASYNC)
+def negation_conflict(data: SignalInput) -> float | None:
+    """Share of sentences that nearly repeat another sentence with the opposite polarity.
+
+    Pairwise over sentences, so it runs on the worker pool rather than inline.
+    """
+    sentences = [set(_WORD_RE.findall(sentence.lower())) for sentence in _sentences(data.response_text)]
+    if len(sentences) < 2:
+        return None
+    conflicted: set[int] = set()
+    for left in range(len(sentences)):
+        for right in range(left + 1, len(sentences)):
+            a, b = sentences[left], sentences[right]
+            if bool(a & _NEGATION) == bool(b & _NEGATION):
+                continue
+            a, b = a - _NEGATION, b - _NEGATION
+            if a and b and len(a & b) / len(a | b) >= 0.6:
+                conflicted.update((left, right))
+    return len(conflicted) / len(sentences)
+
+
+def load_plugins(spec: str = SIGNAL_PLUGINS) -> None:
+    """Import comma-separated modules that register extra extractors on import."""
+    for module in filter(None, (part.strip() for part in spec.split(","))):
+        importlib.import_module(module)
+
+
+load_plugins()
+signal_engine = SignalEngine()
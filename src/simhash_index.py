@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import collections
+import hashlib
+import os
+import re
+from typing import Any, Iterable
+
+SIMHASH_MAX_DISTANCE = int(os.getenv("COGNOS_SIMHASH_MAX_DISTANCE", "3"))
+LSH_BANDS = int(os.getenv("COGNOS_LSH_BANDS", "4"))
+LSH_BUCKET_MAX = int(os.getenv("COGNOS_LSH_BUCKET_MAX", "32"))
+LSH_MAX_CLUSTERS = int(os.getenv("COGNOS_LSH_MAX_CLUSTERS", "200000"))
+
+_MASK64 = (1 << 64) - 1
+# Han and kana are written without spaces, so each character is its own token (the
+# bigram features then act as character bigrams); every other script splits on \w runs.
+_UNSEGMENTED = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_UNSEGMENTED}]|[^\W{_UNSEGMENTED}]+")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def normalize_tokens(text: str) -> list[str]:
+    """Casefolded word tokens in any script with digit runs folded to "0", so ids and counts don't split clusters."""
+    return _TOKEN_RE.findall(_DIGITS_RE.sub("0", text.casefold()))
+
+
+_LANE_BITS = 32
+_LANE_MASK = (1 << _LANE_BITS) - 1
+# _SPREAD[position][byte] places bit i of that hash byte in its own 32-bit lane, so summing
+# spreads counts all 64 bit positions at once in one big integer instead of 64 Python adds.
+_SPREAD = [
+    [sum(((byte >> i) & 1) << ((position * 8 + i) * _LANE_BITS) for i in range(8)) for byte in range(256)]
+    for position in range(8)
+]
+
+
+def simhash64(tokens: list[str]) -> int:
+    """64-bit SimHash over unigram and bigram features, weighted by count."""
+    features = collections.Counter(tokens)
+    features.update(f"{left} {right}" for left, right in zip(tokens, tokens[1:]))
+    if not features:
+        return 0
+    lanes = 0
+    total_weight = 0
+    for feature, weight in features.items():
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        spread = 0
+        for position, byte in enumerate(digest):
+            spread += _SPREAD[position][byte]
+        lanes += spread * weight
+        total_weight += weight
+    value = 0
+    for bit in range(64):
+        # Bit set when the features with it set outweigh those without.
+        if 2 * ((lanes >> (bit * _LANE_BITS)) & _LANE_MASK) > total_weight:
+            value |= 1 << bit
+    return value
+
+
+def text_simhash(text: str) -> int:
+    return simhash64(normalize_tokens(text))
+
+
+def hamming(left: int, right: int) -> int:
+    return (left ^ right).bit_count()
+
+
+def format_simhash(value: int) -> str:
+    return f"simhash64:{value:016x}"
+
+
+def cluster_id_for(representative: int) -> str:
+    return f"cl_{representative:016x}"
+
+
+def representative_of(cluster_id: str) -> int:
+    if not cluster_id.startswith("cl_") or len(cluster_id) != 19:
+        raise ValueError(f"Invalid cluster id {cluster_id!r}")
+    return int(cluster_id[3:], 16)
+
+
+class SimHashIndex:
+    """Banded LSH over 64-bit SimHashes assigning each fingerprint to a near-duplicate cluster.
+
+    The hash is cut into `bands` equal slices; two hashes within max_distance bits share at
+    least one slice when max_distance < bands, so a lookup only compares the cluster
+    representatives in its own band buckets: at most bands * bucket_max Hamming checks,
+    independent of how many clusters exist.
+    """
+
+    def __init__(
+        self,
+        bands: int = LSH_BANDS,
+        max_distance: int = SIMHASH_MAX_DISTANCE,
+        bucket_max: int = LSH_BUCKET_MAX,
+        max_clusters: int = LSH_MAX_CLUSTERS,
+    ) -> None:
+        if bands < 1 or 64 % bands:
+            raise ValueError(f"LSH bands must divide 64, got {bands}")
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self.max_distance = max_distance
+        self.bucket_max = max(1, bucket_max)
+        self.max_clusters = max_clusters
+        self._band_mask = (1 << self.band_bits) - 1
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in range(bands)]
+        self._representatives: set[int] = set()
+        self._counters = {"lookups": 0, "joined": 0, "created": 0, "comparisons": 0, "full_buckets": 0, "index_full": 0}
+
+    def __len__(self) -> int:
+        return len(self._representatives)
+
+    def _band_keys(self, value: int) -> list[int]:
+        return [(value >> (band * self.band_bits)) & self._band_mask for band in range(self.bands)]
+
+    def nearest(self, value: int) -> int | None:
+        """Closest representative within max_distance, or None."""
+        best: int | None = None
+        best_distance = self.max_distance + 1
+        for band, key in enumerate(self._band_keys(value)):
+            for representative in self._buckets[band].get(key, ()):
+                self._counters["comparisons"] += 1
+                distance = hamming(value, representative)
+                if distance < best_distance:
+                    best, best_distance = representative, distance
+        return best
+
+    def add(self, representative: int) -> bool:
+        if representative in self._representatives:
+            return True
+        if len(self._representatives) >= self.max_clusters:
+            self._counters["index_full"] += 1
+            return False
+        self._representatives.add(representative)
+        for band, key in enumerate(self._band_keys(representative)):
+            bucket = self._buckets[band].setdefault(key, [])
+            if len(bucket) >= self.bucket_max:
+                # The cluster stays reachable through its other bands.
+                self._counters["full_buckets"] += 1
+                continue
+            bucket.append(representative)
+        return True
+
+    def assign(self, value: int) -> str | None:
+        """Cluster id for value: an existing near-duplicate cluster, or a new one led by value."""
+        self._counters["lookups"] += 1
+        representative = self.nearest(value)
+        if representative is not None:
+            self._counters["joined"] += 1
+            return cluster_id_for(representative)
+        if not self.add(value):
+            return None
+        self._counters["created"] += 1
+        return cluster_id_for(value)
+
+    def load(self, representatives: Iterable[int]) -> int:
+        """Re-index persisted cluster representatives; returns how many were added."""
+        before = len(self._representatives)
+        for representative in representatives:
+            self.add(representative)
+        return len(self._representatives) - before
+
+    def clear(self) -> None:
+        self._buckets = [{} for _ in range(self.bands)]
+        self._representatives.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._counters["lookups"]
+        return {
+            **self._counters,
+            "clusters": len(self._representatives),
+            "bands": self.bands,
+            "max_distance": self.max_distance,
+            "avg_comparisons": round(self._counters["comparisons"] / lookups, 3) if lookups else 0.0,
+        }
+
+
+simhash_index = SimHashIndex()
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import httpx
+
+SINGLE_FLIGHT_ENABLED = os.getenv("COGNOS_SINGLE_FLIGHT", "true").lower() in {"1", "true", "yes"}
+SINGLE_FLIGHT_MAX_WAIT_SECONDS = float(os.getenv("COGNOS_SINGLE_FLIGHT_MAX_WAIT_SECONDS", "30"))
+SINGLE_FLIGHT_MAX_STREAM_BUFFER_BYTES = int(os.getenv("COGNOS_SINGLE_FLIGHT_MAX_STREAM_BUFFER_BYTES", str(4 * 1024 * 1024)))
+
+
+class Flight:
+    """One upstream call shared by every identical request that arrives while it is in flight.
+
+    Buffered responses are handed to all callers as-is. Event streams are pumped once
+    into a replay buffer that each caller reads from the first chunk, so callers that
+    join mid-stream still see the whole response. Mid-stream joins are only allowed
+    while the stream fits in max_stream_buffer_bytes; past that the flight closes to
+    new callers, chunks every reader has consumed are dropped, and the pump waits for
+    the slowest reader whenever the unread backlog exceeds the cap. A reader that stalls
+    the pump for max_wait_seconds is cut off so the others can carry on.
+    """
+
+    def __init__(
+        self,
+        group: SingleFlight,
+        key: str,
+        trace_id: str,
+        fetch: Callable[[], Awaitable[httpx.Response]],
+    ) -> None:
+        self.key = key
+        self.leader_trace_id = trace_id
+        self.started_at = time.perf_counter()
+        self.followers = 0
+        self._group = group
+        self._loop = asyncio.get_running_loop()
+        self._attached = 1
+        self._joinable = True
+        self._chunks: deque[bytes] = deque()
+        self._base = 0
+        self._positions: dict[object, int] = {}
+        self._buffered_bytes = 0
+        self._drained = asyncio.Event()
+        self._stalled: set[object] = set()
+        self._replay_expired = False
+        self._finished = False
+        self._error: BaseException | None = None
+        self._wakeup = asyncio.Event()
+        self._pump: asyncio.Task[None] | None = None
+        self._response_task: asyncio.Task[httpx.Response] = asyncio.create_task(fetch())
+        self._response_task.add_done_callback(self._on_response)
+
+    @property
+    def response(self) -> httpx.Response:
+        return self._response_task.result()
+
+    @property
+    def is_streaming(self) -> bool:
+        return self._pump is not None
+
+    def joinable(self) -> bool:
+        return self._joinable and not self._finished and self._loop is asyncio.get_running_loop()
+
+    async def wait(self, timeout: float | None = None) -> httpx.Response:
+        # Shielded so a caller that disconnects or gives up never cancels the shared call.
+        return await asyncio.wait_for(asyncio.shield(self._response_task), timeout)
+
+    def attach(self) -> None:
+        self._attached += 1
+        self.followers += 1
+
+    def release(self) -> None:
+        """Detach one caller; the upstream call is cancelled once nobody is left to receive it."""
+        self._attached -= 1
+        self._trim()
+        if self._attached > 0 or self._finished:
+            return
+        self._close_to_new_callers()
+        if self._pump is not None:
+            self._pump.cancel()
+        elif not self._response_task.done():
+            self._response_task.cancel()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Replay the shared event stream from its first chunk; releases this caller when done."""
+        reader = object()
+        index = self._positions[reader] = 0
+        try:
+            if self._base > 0:
+                raise httpx.ReadError("Shared upstream stream has moved past its replay window")
+            while True:
+                while index < self._base + len(self._chunks):
+                    if reader in self._stalled:
+                        raise httpx.ReadError("Fell too far behind the shared upstream stream")
+                    chunk = self._chunks[index - self._base]
+                    index = self._positions[reader] = index + 1
+                    self._trim()
+                    yield chunk
+                if self._finished:
+                    if self._error is not None:
+                        raise httpx.ReadError(f"Shared upstream stream failed: {self._error}")
+                    return
+                await self._wakeup.wait()
+        finally:
+            self._positions.pop(reader, None)
+            self.release()
+
+    def _on_response(self, task: asyncio.Task[httpx.Response]) -> None:
+        if task.cancelled() or task.exception() is not None:
+            self._finished = True
+            self._close_to_new_callers()
+            return
+        response = task.result()
+        if response.is_closed:
+            # Fully buffered: later identical requests are the response cache's job.
+            self._finished = True
+            self._close_to_new_callers()
+            return
+        self._pump = asyncio.create_task(self._pump_stream(response))
+
+    async def _pump_stream(self, response: httpx.Response) -> None:
+        try:
+            async for chunk in response.aiter_bytes():
+                self._chunks.append(chunk)
+                self._buffered_bytes += len(chunk)
+                self._notify()
+                if self._buffered_bytes > self._group.max_stream_buffer_bytes:
+                    # Too long to replay to late joiners: stop taking them and free what has been read.
+                    self._close_to_new_callers()
+                    self._trim()
+                    while self._buffered_bytes > self._group.max_stream_buffer_bytes:
+                        self._drained.clear()
+                        try:
+                            await asyncio.wait_for(self._drained.wait(), self._group.max_wait_seconds)
+                        except asyncio.TimeoutError:
+                            self._drop_stalled_readers()
+        except (httpx.HTTPError, asyncio.CancelledError) as error:
+            self._error = error
+        finally:
+            self._finished = True
+            self._close_to_new_callers()
+            self._notify()
+            await response.aclose()
+
+    def _trim(self) -> None:
+        """Drop chunks every reader has consumed, once no caller can still need a full replay."""
+        if self._joinable or (self._attached > len(self._positions) and not self._replay_expired):
+            return
+        low = min(self._positions.values(), default=self._base + len(self._chunks))
+        while self._base < low:
+            self._buffered_bytes -= len(self._chunks.popleft())
+            self._base += 1
+        if self._buffered_bytes <= self._group.max_stream_buffer_bytes:
+            self._drained.set()
+
+    def _drop_stalled_readers(self) -> None:
+        """Cut off the readers holding the oldest unread chunk, and callers that never started."""
+        self._replay_expired = True
+        low = min(self._positions.values(), default=None)
+        stalled = [reader for reader, position in self._positions.items() if position == low]
+        for reader in stalled:
+            del self._positions[reader]
+        self._stalled.update(stalled)
+        self._group._counters["stalled_readers"] += len(stalled)
+        self._trim()
+
+    def _notify(self) -> None:
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def _close_to_new_callers(self) -> None:
+        self._joinable = False
+        self._group._discard(self)
+
+
+class SingleFlight:
+    """Coalesces identical concurrent upstream requests behind a single leader call.
+
+    Sharing one sampled completion would collapse the diversity of duplicate sampled requests,
+    so the gateway only sends deterministic requests through here unless the caller opts in.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = SINGLE_FLIGHT_ENABLED,
+        max_wait_seconds: float = SINGLE_FLIGHT_MAX_WAIT_SECONDS,
+        max_stream_buffer_bytes: int = SINGLE_FLIGHT_MAX_STREAM_BUFFER_BYTES,
+    ) -> None:
+        self.enabled = enabled
+        self.max_wait_seconds = max_wait_seconds
+        self.max_stream_buffer_bytes = max_stream_buffer_bytes
+        self._flights: dict[str, Flight] = {}
+        self._counters = {"leaders": 0, "followers": 0, "follower_timeouts": 0, "shared_failures": 0, "stalled_readers": 0}
+
+    async def do(
+        self,
+        key: str,
+        trace_id: str,
+        fetch: Callable[[], Awaitable[httpx.Response]],
+    ) -> tuple[Flight, bool] | None:
+        """Run fetch once per key among concurrent callers.
+
+        Returns (flight, is_leader) once the shared response has arrived, or None when a
+        follower waited longer than max_wait_seconds and should call upstream itself.
+        Callers that get a streaming flight must consume flight.stream(); buffered flights
+        need no cleanup. Leader failures are re-raised to every caller.
+        """
+        flight = self._flights.get(key)
+        is_leader = flight is None or not flight.joinable()
+        if is_leader:
+            flight = Flight(self, key, trace_id, fetch)
+            self._flights[key] = flight
+            self._counters["leaders"] += 1
+        else:
+            flight.attach()
+            self._counters["followers"] += 1
+
+        try:
+            await flight.wait(None if is_leader else self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            flight.release()
+            self._counters["follower_timeouts"] += 1
+            return None
+        except asyncio.CancelledError:
+            flight.release()
+            raise
+        except Exception:
+            flight.release()
+            if not is_leader:
+                self._counters["shared_failures"] += 1
+            raise
+
+        if not flight.is_streaming:
+            flight.release()
+        return flight, is_leader
+
+    def stats(self) -> dict[str, Any]:
+        requests = self._counters["leaders"] + self._counters["followers"]
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "max_wait_seconds": self.max_wait_seconds,
+            "coalesced_ratio": round(self._counters["followers"] / requests, 4) if requests else 0.0,
+            **self._counters,
+        }
+
+    def _discard(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+TRACE_ID_PREFIX = "tr_"
+
+# Lowercase Crockford base32 keeps ASCII order equal to numeric order.
+_ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+_DECODE = {char: index for index, char in enumerate(_ALPHABET)}
+_ENCODED_LENGTH = 26  # 48-bit millisecond timestamp + 80 random bits
+_RANDOM_BITS = 80
+_RANDOM_MASK = (1 << _RANDOM_BITS) - 1
+
+_lock = threading.Lock()
+_last_ms = -1
+_last_random = 0
+
+
+def new_trace_id(timestamp_ms: int | None = None) -> str:
+    """ULID-style trace id: time-ordered, 128 bits, monotonic within one millisecond."""
+    global _last_ms, _last_random
+
+    now_ms = int(time.time() * 1000) if timestamp_ms is None else int(timestamp_ms)
+    with _lock:
+        if now_ms <= _last_ms:
+            # Same (or earlier, if the clock stepped back) millisecond: bump the
+            # random part so ids stay strictly increasing from this process.
+            now_ms = _last_ms
+            _last_random = (_last_random + 1) & _RANDOM_MASK
+        else:
+            _last_ms = now_ms
+            _last_random = int.from_bytes(os.urandom(_RANDOM_BITS // 8), "big")
+        value = (now_ms << _RANDOM_BITS) | _last_random
+
+    chars = []
+    for _ in range(_ENCODED_LENGTH):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return TRACE_ID_PREFIX + "".join(reversed(chars))
+
+
+def trace_id_timestamp_ms(trace_id: str) -> int | None:
+    """Epoch milliseconds embedded in a time-ordered id; None for legacy random ids."""
+    if not trace_id.startswith(TRACE_ID_PREFIX):
+        return None
+    encoded = trace_id[len(TRACE_ID_PREFIX):]
+    if len(encoded) != _ENCODED_LENGTH:
+        return None
+
+    value = 0
+    for char in encoded:
+        digit = _DECODE.get(char)
+        if digit is None:
+            return None
+        value = (value << 5) | digit
+    return value >> _RANDOM_BITS
@@ -1,12 +1,31 @@
 from __future__ import annotations
 
-import json
 import os
 import sqlite3
+import threading
+from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
+
+import json_codec
 
 DEFAULT_DB_PATH = os.getenv("COGNOS_TRACE_DB", "data/traces.sqlite3")
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("COGNOS_TRACE_DB_CACHE_KIB", "16384"))
+SQLITE_MMAP_SIZE_BYTES = int(os.getenv("COGNOS_TRACE_DB_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("COGNOS_TRACE_DB_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_STATEMENT_CACHE_SIZE = 128
+# Stay well below SQLITE_MAX_VARIABLE_NUMBER (999 on older builds).
+LOOKUP_CHUNK_SIZE = 900
+# Rows fetched per step when a trace page is streamed straight from its cursor.
+STREAM_FETCH_ROWS = 256
+
+# Envelope signal keys, materialized as signal_<name> REAL columns for bulk reads.
+SIGNAL_COLUMNS = ("ue", "ua", "divergence", "citation_density", "contradiction", "out_of_distribution")
+
+_thread_local = threading.local()
+_connections_lock = threading.Lock()
+_open_connections: list[sqlite3.Connection] = []
+_connections_generation = 0
 
 
 def _resolve_db_path() -> Path:
@@ -17,12 +36,65 @@ def _resolve_db_path() -> Path:
     return db_path
 
 
+def _open_connection(db_path: Path) -> sqlite3.Connection:
+    """Open and tune a new connection to db_path; the caller owns it."""
+    connection = sqlite3.connect(
+        str(db_path),
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+        check_same_thread=False,
+        cached_statements=SQLITE_STATEMENT_CACHE_SIZE,
+    )
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(f"PRAGMA cache_size=-{max(SQLITE_CACHE_SIZE_KIB, 0)}")
+    connection.execute(f"PRAGMA mmap_size={max(SQLITE_MMAP_SIZE_BYTES, 0)}")
+    connection.execute(f"PRAGMA busy_timeout={max(SQLITE_BUSY_TIMEOUT_MS, 0)}")
+    connection.execute("PRAGMA temp_store=MEMORY")
+    return connection
+
+
+def _get_connection(db_path: Path) -> sqlite3.Connection:
+    """Return this thread's long-lived connection for db_path, opening and tuning it once."""
+    cache: dict[str, tuple[int, sqlite3.Connection]] | None = getattr(_thread_local, "connections", None)
+    if cache is None:
+        cache = {}
+        _thread_local.connections = cache
+
+    key = str(db_path)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == _connections_generation:
+        return cached[1]
+
+    connection = _open_connection(db_path)
+    cache[key] = (_connections_generation, connection)
+    with _connections_lock:
+        _open_connections.append(connection)
+    return connection
+
+
+def close_connections() -> None:
+    """Close every pooled connection; threads reopen lazily on next use."""
+    global _connections_generation
+
+    with _connections_lock:
+        _connections_generation += 1
+        connections = list(_open_connections)
+        _open_connections.clear()
+
+    for connection in connections:
+        try:
+            connection.close()
+        except sqlite3.Error:
+            continue
+
+
 def init_db() -> None:
     db_path = _resolve_db_path()
     db_path.parent.mkdir(parents=True, exist_ok=True)
 
-    connection = sqlite3.connect(db_path)
-    try:
+    connection = _get_connection(db_path)
+    with connection:
         connection.execute(
             """
             CREATE TABLE IF NOT EXISTS traces (
@@ -48,59 +120,380 @@ def init_db() -> None:
         }
         if "response_fingerprint" not in existing_cols:
             connection.execute("ALTER TABLE traces ADD COLUMN response_fingerprint TEXT")
-        connection.commit()
-    finally:
-        connection.close()
+        for column in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            if column not in existing_cols:
+                connection.execute(f"ALTER TABLE traces ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        if "created_ms" not in existing_cols:
+            connection.execute("ALTER TABLE traces ADD COLUMN created_ms INTEGER")
+        if "cluster_id" not in existing_cols:
+            connection.execute("ALTER TABLE traces ADD COLUMN cluster_id TEXT")
+        for name in SIGNAL_COLUMNS:
+            if f"signal_{name}" not in existing_cols:
+                connection.execute(f"ALTER TABLE traces ADD COLUMN signal_{name} REAL NOT NULL DEFAULT 0")
+        for index_name in _LEGACY_INDEXES:
+            connection.execute(f"DROP INDEX IF EXISTS {index_name}")
+        for index_sql in _TRACE_INDEXES:
+            connection.execute(index_sql)
+
+        # One row per SimHash cluster; the representative hash is encoded in the id.
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS simhash_clusters (cluster_id TEXT PRIMARY KEY, created_ms INTEGER)"
+        )
+
+        # Rows written before a materialized column existed are filled by backfill_columns().
+        connection.execute("CREATE TABLE IF NOT EXISTS trace_meta (key TEXT PRIMARY KEY, value TEXT)")
+        if "total_tokens" not in existing_cols:
+            _schedule_backfill(connection, "usage")
+        if "created_ms" not in existing_cols:
+            _schedule_backfill(connection, "created_ms")
+        if f"signal_{SIGNAL_COLUMNS[-1]}" not in existing_cols:
+            _schedule_backfill(connection, "signals")
+
+        has_rollups = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trace_rollups'"
+        ).fetchone()
+        connection.execute(_CREATE_ROLLUPS_SQL)
+        for trigger_sql in (*_ROLLUP_TRIGGERS, *_REWRITE_TRIGGERS):
+            connection.execute(trigger_sql)
+        if not has_rollups:
+            connection.execute(_REBUILD_ROLLUPS_SQL)
+
+
+# Every filter index ends in (created_ms, trace_id) so keyset pages are index-ordered.
+_TRACE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_traces_created_ms ON traces (created_ms, trace_id)",
+    "CREATE INDEX IF NOT EXISTS idx_traces_decision_created_ms ON traces (decision, created_ms, trace_id)",
+    "CREATE INDEX IF NOT EXISTS idx_traces_model_created_ms ON traces (model, created_ms, trace_id)",
+    "CREATE INDEX IF NOT EXISTS idx_traces_policy_created_ms ON traces (policy, created_ms, trace_id)",
+    "CREATE INDEX IF NOT EXISTS idx_traces_status_created_ms ON traces (status_code, created_ms, trace_id)",
+    "CREATE INDEX IF NOT EXISTS idx_traces_cluster_created_ms ON traces (cluster_id, created_ms, trace_id)",
+)
+
+# Superseded text-timestamp indexes.
+_LEGACY_INDEXES = (
+    "idx_traces_created",
+    "idx_traces_decision_created",
+    "idx_traces_model_created",
+    "idx_traces_policy_created",
+    "idx_traces_status_created",
+)
+
+# Hourly rollups per model x policy x decision, kept current by triggers in the
+# same transaction as the trace write so dashboards read O(buckets) rows.
+_CREATE_ROLLUPS_SQL = """
+    CREATE TABLE IF NOT EXISTS trace_rollups (
+        bucket_hour TEXT NOT NULL,
+        model TEXT NOT NULL,
+        policy TEXT NOT NULL,
+        decision TEXT NOT NULL,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        total_tokens INTEGER NOT NULL DEFAULT 0,
+        risk_sum REAL NOT NULL DEFAULT 0.0,
+        PRIMARY KEY (bucket_hour, model, policy, decision)
+    )
+"""
+
+_ROLLUP_ADD_NEW = """
+    INSERT INTO trace_rollups (
+        bucket_hour, model, policy, decision, request_count, prompt_tokens, completion_tokens, total_tokens, risk_sum
+    ) VALUES (
+        substr(NEW.created_at, 1, 13), COALESCE(NEW.model, ''), NEW.policy, NEW.decision,
+        1, NEW.prompt_tokens, NEW.completion_tokens, NEW.total_tokens, NEW.risk
+    )
+    ON CONFLICT (bucket_hour, model, policy, decision) DO UPDATE SET
+        request_count = request_count + 1,
+        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+        completion_tokens = completion_tokens + excluded.completion_tokens,
+        total_tokens = total_tokens + excluded.total_tokens,
+        risk_sum = risk_sum + excluded.risk_sum;
+"""
+
+_ROLLUP_SUBTRACT_OLD = """
+    UPDATE trace_rollups SET
+        request_count = request_count - 1,
+        prompt_tokens = prompt_tokens - OLD.prompt_tokens,
+        completion_tokens = completion_tokens - OLD.completion_tokens,
+        total_tokens = total_tokens - OLD.total_tokens,
+        risk_sum = risk_sum - OLD.risk
+    WHERE bucket_hour = substr(OLD.created_at, 1, 13)
+        AND model = COALESCE(OLD.model, '')
+        AND policy = OLD.policy
+        AND decision = OLD.decision;
+"""
+
+_ROLLUP_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS trg_traces_rollup_insert AFTER INSERT ON traces BEGIN {_ROLLUP_ADD_NEW} END",
+    (
+        "CREATE TRIGGER IF NOT EXISTS trg_traces_rollup_update AFTER UPDATE OF "
+        "created_at, model, policy, decision, risk, prompt_tokens, completion_tokens, total_tokens ON traces "
+        f"BEGIN {_ROLLUP_SUBTRACT_OLD} {_ROLLUP_ADD_NEW} END"
+    ),
+    f"CREATE TRIGGER IF NOT EXISTS trg_traces_rollup_delete AFTER DELETE ON traces BEGIN {_ROLLUP_SUBTRACT_OLD} END",
+)
+
+# Counts writes that change an existing row's window fields (created_ms, model, policy, risk,
+# status_code) or delete a row. Readers that sync incrementally by rowid, like the policy
+# tuner, compare it across syncs to tell when rows they already read have changed.
+_BUMP_REWRITES = """
+    INSERT INTO trace_meta (key, value) VALUES ('rewrites', '1')
+    ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1;
+"""
+
+_REWRITE_TRIGGERS = (
+    (
+        "CREATE TRIGGER IF NOT EXISTS trg_traces_rewrite_update AFTER UPDATE OF "
+        "created_ms, model, policy, risk, status_code ON traces "
+        "WHEN OLD.created_ms IS NOT NEW.created_ms OR OLD.model IS NOT NEW.model OR OLD.policy IS NOT NEW.policy "
+        "OR OLD.risk IS NOT NEW.risk OR OLD.status_code IS NOT NEW.status_code "
+        f"BEGIN {_BUMP_REWRITES} END"
+    ),
+    f"CREATE TRIGGER IF NOT EXISTS trg_traces_rewrite_delete AFTER DELETE ON traces BEGIN {_BUMP_REWRITES} END",
+)
+
+_REBUILD_ROLLUPS_SQL = """
+    INSERT INTO trace_rollups (
+        bucket_hour, model, policy, decision, request_count, prompt_tokens, completion_tokens, total_tokens, risk_sum
+    )
+    SELECT substr(created_at, 1, 13), COALESCE(model, ''), policy, decision,
+        COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(total_tokens), SUM(risk)
+    FROM traces
+    GROUP BY 1, 2, 3, 4
+"""
+
+_SUMMARY_COLUMNS = "trace_id, created_at, created_ms, decision, policy, trust_score, risk, is_stream, status_code, model"
+
+# Upsert rather than INSERT OR REPLACE: REPLACE deletes without firing the
+# rollup delete trigger, an upsert fires the update trigger instead.
+_INSERT_TRACE_SQL = """
+    INSERT INTO traces (
+        trace_id,
+        created_at,
+        decision,
+        policy,
+        trust_score,
+        risk,
+        is_stream,
+        status_code,
+        model,
+        request_fingerprint,
+        response_fingerprint,
+        envelope_json,
+        metadata_json,
+        prompt_tokens,
+        completion_tokens,
+        total_tokens,
+        signal_ue,
+        signal_ua,
+        signal_divergence,
+        signal_citation_density,
+        signal_contradiction,
+        signal_out_of_distribution,
+        created_ms,
+        cluster_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (trace_id) DO UPDATE SET
+        created_at = excluded.created_at,
+        created_ms = excluded.created_ms,
+        decision = excluded.decision,
+        policy = excluded.policy,
+        trust_score = excluded.trust_score,
+        risk = excluded.risk,
+        is_stream = excluded.is_stream,
+        status_code = excluded.status_code,
+        model = excluded.model,
+        request_fingerprint = excluded.request_fingerprint,
+        response_fingerprint = excluded.response_fingerprint,
+        envelope_json = excluded.envelope_json,
+        metadata_json = excluded.metadata_json,
+        prompt_tokens = excluded.prompt_tokens,
+        completion_tokens = excluded.completion_tokens,
+        total_tokens = excluded.total_tokens,
+        signal_ue = excluded.signal_ue,
+        signal_ua = excluded.signal_ua,
+        signal_divergence = excluded.signal_divergence,
+        signal_citation_density = excluded.signal_citation_density,
+        signal_contradiction = excluded.signal_contradiction,
+        signal_out_of_distribution = excluded.signal_out_of_distribution,
+        cluster_id = excluded.cluster_id
+"""
+
+# Mirrors the usage rules aggregate_tvv applied to metadata_json: only integer counts count.
+_BACKFILL_USAGE_SQL = """
+    UPDATE traces SET
+        prompt_tokens = CASE WHEN json_type(metadata_json, '$.usage.prompt_tokens') = 'integer'
+            THEN json_extract(metadata_json, '$.usage.prompt_tokens') ELSE 0 END,
+        completion_tokens = CASE WHEN json_type(metadata_json, '$.usage.completion_tokens') = 'integer'
+            THEN json_extract(metadata_json, '$.usage.completion_tokens') ELSE 0 END,
+        total_tokens = CASE WHEN json_type(metadata_json, '$.usage.total_tokens') = 'integer'
+            THEN json_extract(metadata_json, '$.usage.total_tokens') ELSE 0 END
+    WHERE rowid > ? AND rowid <= ? AND json_valid(metadata_json)
+"""
+
+_BACKFILL_CREATED_MS_SQL = """
+    UPDATE traces SET created_ms = CAST(ROUND((julianday(created_at) - 2440587.5) * 86400000.0) AS INTEGER)
+    WHERE rowid > ? AND rowid <= ? AND created_ms IS NULL
+"""
+
+_BACKFILL_SIGNALS_SQL = f"""
+    UPDATE traces SET {", ".join(
+        f"signal_{name} = CASE WHEN json_type(envelope_json, '$.signals.{name}') IN ('integer', 'real') "
+        f"THEN json_extract(envelope_json, '$.signals.{name}') ELSE 0 END"
+        for name in SIGNAL_COLUMNS
+    )}
+    WHERE rowid > ? AND rowid <= ? AND json_valid(envelope_json) AND json_type(envelope_json, '$.signals') = 'object'
+"""
+
+_BACKFILLS = {
+    "usage": _BACKFILL_USAGE_SQL,
+    "created_ms": _BACKFILL_CREATED_MS_SQL,
+    "signals": _BACKFILL_SIGNALS_SQL,
+}
+
+
+def _schedule_backfill(connection: sqlite3.Connection, name: str) -> None:
+    max_rowid = connection.execute("SELECT COALESCE(MAX(rowid), 0) FROM traces").fetchone()[0]
+    connection.execute(
+        "INSERT OR REPLACE INTO trace_meta (key, value) VALUES (?, ?)",
+        (f"{name}_backfill_until", str(max_rowid)),
+    )
+    connection.execute("INSERT OR REPLACE INTO trace_meta (key, value) VALUES (?, '0')", (f"{name}_backfill_rowid",))
+
+
+def _timestamp_ms(value: Any) -> int | None:
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return None
+    return int(round(parsed.timestamp() * 1000))
+
+
+def _usage_tokens(metadata: Any) -> tuple[int, int, int]:
+    usage = metadata.get("usage", {}) if isinstance(metadata, dict) else {}
+    if not isinstance(usage, dict):
+        return 0, 0, 0
+    counts = [usage.get(key, 0) for key in ("prompt_tokens", "completion_tokens", "total_tokens")]
+    return tuple(count if isinstance(count, int) and not isinstance(count, bool) else 0 for count in counts)  # type: ignore[return-value]
+
+
+def _cluster_id(record: dict[str, Any]) -> str | None:
+    fingerprint = record.get("request_fingerprint")
+    cluster_id = fingerprint.get("cluster_id") if isinstance(fingerprint, dict) else None
+    return cluster_id if isinstance(cluster_id, str) else None
+
+
+def _signal_values(envelope: Any) -> tuple[float, ...]:
+    signals = envelope.get("signals") if isinstance(envelope, dict) else None
+    if not isinstance(signals, dict):
+        return (0.0,) * len(SIGNAL_COLUMNS)
+    values = [signals.get(name, 0.0) for name in SIGNAL_COLUMNS]
+    return tuple(float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0 for value in values)
+
+
+def _trace_row(record: dict[str, Any]) -> tuple[Any, ...]:
+    prompt_tokens, completion_tokens, total_tokens = _usage_tokens(record.get("metadata", {}))
+    return (
+        record["trace_id"],
+        record["created_at"],
+        record["decision"],
+        record["policy"],
+        float(record.get("trust_score", 0.0)),
+        float(record.get("risk", 0.0)),
+        int(bool(record.get("is_stream", False))),
+        int(record.get("status_code", 200)),
+        record.get("model"),
+        json_codec.dumps_text(record.get("request_fingerprint", {})),
+        json_codec.dumps_text(record.get("response_fingerprint", {})),
+        json_codec.dumps_text(record.get("envelope", {})),
+        json_codec.dumps_text(record.get("metadata", {})),
+        prompt_tokens,
+        completion_tokens,
+        total_tokens,
+        *_signal_values(record.get("envelope", {})),
+        record.get("created_ms") if record.get("created_ms") is not None else _timestamp_ms(record["created_at"]),
+        _cluster_id(record),
+    )
 
 
 def save_trace(record: dict[str, Any]) -> None:
+    save_traces([record])
+
+
+def save_traces(records: list[dict[str, Any]]) -> None:
+    """Persist many traces in a single transaction (one commit for the whole batch)."""
+    if not records:
+        return
+
     db_path = _resolve_db_path()
     db_path.parent.mkdir(parents=True, exist_ok=True)
+    rows = [_trace_row(record) for record in records]
+    connection = _get_connection(db_path)
+    with connection:
+        _insert_rows(connection, rows)
 
-    envelope_json = json.dumps(record.get("envelope", {}), ensure_ascii=False)
-    metadata_json = json.dumps(record.get("metadata", {}), ensure_ascii=False)
-    request_fingerprint_json = json.dumps(record.get("request_fingerprint", {}), ensure_ascii=False)
-    response_fingerprint_json = json.dumps(record.get("response_fingerprint", {}), ensure_ascii=False)
 
-    connection = sqlite3.connect(db_path)
-    try:
+def patch_traces(patches: list[tuple[str, dict[str, Any], dict[str, Any]]]) -> int:
+    """Merge (trace_id, envelope_updates, metadata_updates) into stored traces, top-level keys only.
+
+    Runs as one transaction; patches for traces that do not exist are ignored. Returns the
+    number of traces updated.
+    """
+    if not patches:
+        return 0
+
+    db_path = _resolve_db_path()
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = _get_connection(db_path)
+    with connection:
+        return _apply_patches(connection, patches)
+
+
+def write_batch(records: list[dict[str, Any]], patches: list[tuple[str, dict[str, Any], dict[str, Any]]]) -> int:
+    """Insert records, then apply patches, in one transaction: one commit, and all or nothing.
+
+    Returns the number of traces patched.
+    """
+    if not records and not patches:
+        return 0
+
+    db_path = _resolve_db_path()
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    rows = [_trace_row(record) for record in records]
+    connection = _get_connection(db_path)
+    with connection:
+        _insert_rows(connection, rows)
+        return _apply_patches(connection, patches)
+
+
+def _insert_rows(connection: sqlite3.Connection, rows: list[tuple[Any, ...]]) -> None:
+    if not rows:
+        return
+    connection.executemany(_INSERT_TRACE_SQL, rows)
+    # Row layout: created_ms is second to last, cluster_id last.
+    clusters = {row[-1]: row[-2] for row in reversed(rows) if row[-1] is not None}
+    if clusters:
+        connection.executemany("INSERT OR IGNORE INTO simhash_clusters (cluster_id, created_ms) VALUES (?, ?)", clusters.items())
+
+
+def _apply_patches(connection: sqlite3.Connection, patches: list[tuple[str, dict[str, Any], dict[str, Any]]]) -> int:
+    updated = 0
+    for trace_id, envelope_updates, metadata_updates in patches:
+        row = connection.execute("SELECT envelope_json, metadata_json FROM traces WHERE trace_id = ?", (trace_id,)).fetchone()
+        if row is None:
+            continue
+        envelope = {**json_codec.loads(row["envelope_json"] or "{}"), **envelope_updates}
+        metadata = {**json_codec.loads(row["metadata_json"] or "{}"), **metadata_updates}
         connection.execute(
-            """
-            INSERT OR REPLACE INTO traces (
-                trace_id,
-                created_at,
-                decision,
-                policy,
-                trust_score,
-                risk,
-                is_stream,
-                status_code,
-                model,
-                request_fingerprint,
-                response_fingerprint,
-                envelope_json,
-                metadata_json
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                record["trace_id"],
-                record["created_at"],
-                record["decision"],
-                record["policy"],
-                float(record.get("trust_score", 0.0)),
-                float(record.get("risk", 0.0)),
-                int(bool(record.get("is_stream", False))),
-                int(record.get("status_code", 200)),
-                record.get("model"),
-                request_fingerprint_json,
-                response_fingerprint_json,
-                envelope_json,
-                metadata_json,
-            ),
+            "UPDATE traces SET envelope_json = ?, metadata_json = ?, "
+            + ", ".join(f"signal_{name} = ?" for name in SIGNAL_COLUMNS)
+            + " WHERE trace_id = ?",
+            (json_codec.dumps_text(envelope), json_codec.dumps_text(metadata), *_signal_values(envelope), trace_id),
         )
-        connection.commit()
-    finally:
-        connection.close()
+        updated += 1
+    return updated
 
 
 def get_trace(trace_id: str) -> dict[str, Any] | None:
@@ -108,19 +501,194 @@ def get_trace(trace_id: str) -> dict[str, Any] | None:
     if not db_path.exists():
         return None
 
-    connection = sqlite3.connect(db_path)
-    connection.row_factory = sqlite3.Row
+    connection = _get_connection(db_path)
+    row = connection.execute("SELECT * FROM traces WHERE trace_id = ?", (trace_id,)).fetchone()
+
+    if row is None:
+        return None
+    return _row_to_trace(row)
+
+
+def get_traces(trace_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Fetch many traces with chunked IN (...) lookups; missing ids are simply absent."""
+    return {row["trace_id"]: _row_to_trace(row) for row in _select_by_ids("*", trace_ids)}
+
+
+def get_trace_decisions(trace_ids: list[str]) -> dict[str, str]:
+    """Map trace_id -> decision from the decision column, without touching envelope JSON.
+
+    The gateway writes the column from the envelope's decision; NULL reads as UNKNOWN, as a
+    missing envelope decision did before.
+    """
+    columns = "trace_id, COALESCE(decision, 'UNKNOWN') AS decision"
+    return {row["trace_id"]: str(row["decision"]) for row in _select_by_ids(columns, trace_ids)}
+
+
+def query_traces(
+    created_from_ms: int | None = None,
+    created_to_ms: int | None = None,
+    decision: str | None = None,
+    policy: str | None = None,
+    model: str | None = None,
+    status_code: int | None = None,
+    min_risk: float | None = None,
+    max_risk: float | None = None,
+    cluster_id: str | None = None,
+    after: tuple[int, str] | None = None,
+    limit: int = 100,
+    full: bool = False,
+) -> tuple[list[dict[str, Any]], tuple[int, str] | None]:
+    """Return one newest-first page of traces plus the (created_ms, trace_id) key to resume after."""
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return [], None
+
+    clauses, params = _trace_filters(
+        created_from_ms, created_to_ms, decision, policy, model, status_code, min_risk, max_risk, cluster_id, after
+    )
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    columns = "*" if full else _SUMMARY_COLUMNS
+    sql = f"SELECT {columns} FROM traces {where} ORDER BY created_ms DESC, trace_id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    connection = _get_connection(db_path)
+    rows = connection.execute(sql, params).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    traces = [_row_to_trace(row) if full else _row_to_summary(row) for row in rows]
+    next_after = (rows[-1]["created_ms"], rows[-1]["trace_id"]) if has_more and rows else None
+    return traces, next_after
+
+
+def _trace_filters(
+    created_from_ms: int | None,
+    created_to_ms: int | None,
+    decision: str | None,
+    policy: str | None,
+    model: str | None,
+    status_code: int | None,
+    min_risk: float | None,
+    max_risk: float | None,
+    cluster_id: str | None,
+    after: tuple[int, str] | None,
+) -> tuple[list[str], list[Any]]:
+    clauses: list[str] = []
+    params: list[Any] = []
+    for column, value in (
+        ("decision", decision),
+        ("policy", policy),
+        ("model", model),
+        ("status_code", status_code),
+        ("cluster_id", cluster_id),
+    ):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if created_from_ms is not None:
+        clauses.append("created_ms >= ?")
+        params.append(created_from_ms)
+    if created_to_ms is not None:
+        clauses.append("created_ms < ?")
+        params.append(created_to_ms)
+    if min_risk is not None:
+        clauses.append("risk >= ?")
+        params.append(min_risk)
+    if max_risk is not None:
+        clauses.append("risk <= ?")
+        params.append(max_risk)
+    if after is not None:
+        clauses.append("(created_ms, trace_id) < (?, ?)")
+        params.extend(after)
+    return clauses, params
+
+
+def stream_traces(
+    created_from_ms: int | None = None,
+    created_to_ms: int | None = None,
+    decision: str | None = None,
+    policy: str | None = None,
+    model: str | None = None,
+    status_code: int | None = None,
+    min_risk: float | None = None,
+    max_risk: float | None = None,
+    cluster_id: str | None = None,
+    after: tuple[int, str] | None = None,
+    limit: int = 100,
+    full: bool = False,
+) -> tuple[Iterator[dict[str, Any]], tuple[int, str] | None]:
+    """Like query_traces, but the page is read lazily from the cursor as the iterator is consumed.
+
+    The resume key is found first with a keys-only index scan, and the page is then bounded by
+    that key rather than LIMIT, so rows committed meanwhile can lengthen it but never be skipped.
+    The iterator owns its connection, so it may be advanced from any thread.
+    """
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return iter(()), None
+
+    clauses, params = _trace_filters(
+        created_from_ms, created_to_ms, decision, policy, model, status_code, min_risk, max_risk, cluster_id, after
+    )
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    bounds = _get_connection(db_path).execute(
+        f"SELECT created_ms, trace_id FROM traces {where} ORDER BY created_ms DESC, trace_id DESC LIMIT 2 OFFSET ?",
+        [*params, max(limit, 1) - 1],
+    ).fetchall()
+    next_after = (bounds[0]["created_ms"], bounds[0]["trace_id"]) if len(bounds) > 1 else None
+    if next_after is not None:
+        clauses.append("(created_ms, trace_id) >= (?, ?)")
+        params.extend(next_after)
+        where = f"WHERE {' AND '.join(clauses)}"
+
+    columns = "*" if full else _SUMMARY_COLUMNS
+    sql = f"SELECT {columns} FROM traces {where} ORDER BY created_ms DESC, trace_id DESC"
+    return _iter_trace_rows(db_path, sql, params, full), next_after
+
+
+def _iter_trace_rows(db_path: Path, sql: str, params: list[Any], full: bool) -> Iterator[dict[str, Any]]:
+    connection = _open_connection(db_path)
     try:
-        cursor = connection.execute("SELECT * FROM traces WHERE trace_id = ?", (trace_id,))
-        row = cursor.fetchone()
+        cursor = connection.execute(sql, params)
+        while rows := cursor.fetchmany(STREAM_FETCH_ROWS):
+            for row in rows:
+                yield _row_to_trace(row) if full else _row_to_summary(row)
     finally:
         connection.close()
 
-    if row is None:
-        return None
 
-    envelope = json.loads(row["envelope_json"]) if row["envelope_json"] else {}
-    metadata = json.loads(row["metadata_json"]) if row["metadata_json"] else {}
+def _row_to_summary(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "trace_id": row["trace_id"],
+        "created": row["created_at"],
+        "decision": row["decision"],
+        "policy": row["policy"],
+        "trust_score": row["trust_score"],
+        "risk": row["risk"],
+        "is_stream": bool(row["is_stream"]),
+        "status_code": row["status_code"],
+        "model": row["model"],
+    }
+
+
+def _select_by_ids(columns: str, trace_ids: list[str]) -> list[sqlite3.Row]:
+    db_path = _resolve_db_path()
+    if not trace_ids or not db_path.exists():
+        return []
+
+    unique_ids = list(dict.fromkeys(trace_ids))
+    connection = _get_connection(db_path)
+    rows: list[sqlite3.Row] = []
+    for start in range(0, len(unique_ids), LOOKUP_CHUNK_SIZE):
+        chunk = unique_ids[start:start + LOOKUP_CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        rows.extend(connection.execute(f"SELECT {columns} FROM traces WHERE trace_id IN ({placeholders})", chunk))
+    return rows
+
+
+def _row_to_trace(row: sqlite3.Row) -> dict[str, Any]:
+    envelope = json_codec.loads(row["envelope_json"]) if row["envelope_json"] else {}
+    metadata = json_codec.loads(row["metadata_json"]) if row["metadata_json"] else {}
 
     request_fingerprint = _decode_fingerprint(row["request_fingerprint"])
     response_fingerprint = _decode_fingerprint(row["response_fingerprint"])
@@ -153,7 +721,7 @@ def _decode_fingerprint(raw: str | None) -> dict[str, Any]:
     if not raw:
         return default
     try:
-        payload = json.loads(raw)
+        payload = json_codec.loads(raw)
         if isinstance(payload, dict):
             return {
                 "simhash": str(payload.get("simhash", default["simhash"])),
@@ -167,34 +735,222 @@ def _decode_fingerprint(raw: str | None) -> dict[str, Any]:
     return default
 
 
-def aggregate_tvv() -> dict[str, int]:
+def backfill_columns(chunk_size: int = 10000, stop: threading.Event | None = None) -> int:
+    """Fill materialized columns (usage, created_ms, signals) for rows written before they existed.
+
+    Runs one short transaction per rowid chunk and stores progress in trace_meta, so it is
+    resumable and safe beside live writes; setting stop ends it after the current chunk.
+    Returns the number of rows updated.
+    """
     db_path = _resolve_db_path()
     if not db_path.exists():
-        return {"tvv_requests": 0, "tvv_tokens": 0}
+        return 0
 
-    connection = sqlite3.connect(db_path)
-    connection.row_factory = sqlite3.Row
-    try:
-        rows = connection.execute("SELECT metadata_json FROM traces").fetchall()
-    finally:
-        connection.close()
+    connection = _get_connection(db_path)
+    meta = dict(connection.execute("SELECT key, value FROM trace_meta").fetchall())
+    processed = 0
 
-    tvv_requests = len(rows)
-    tvv_tokens = 0
+    for name, sql in _BACKFILLS.items():
+        until = int(meta.get(f"{name}_backfill_until", 0))
+        cursor = int(meta.get(f"{name}_backfill_rowid", until))
+        while cursor < until:
+            if stop is not None and stop.is_set():
+                return processed
+            upper = min(cursor + max(chunk_size, 1), until)
+            with connection:
+                updated = connection.execute(sql, (cursor, upper)).rowcount
+                connection.execute(
+                    "INSERT OR REPLACE INTO trace_meta (key, value) VALUES (?, ?)",
+                    (f"{name}_backfill_rowid", str(upper)),
+                )
+            processed += max(updated, 0)
+            cursor = upper
+
+    return processed
 
-    for row in rows:
-        metadata_raw = row["metadata_json"]
-        if not metadata_raw:
-            continue
-        try:
-            metadata = json.loads(metadata_raw)
-        except Exception:
-            continue
 
-        usage = metadata.get("usage", {}) if isinstance(metadata, dict) else {}
-        if isinstance(usage, dict):
-            total_tokens = usage.get("total_tokens", 0)
-            if isinstance(total_tokens, int):
-                tvv_tokens += total_tokens
+def iter_signal_columns(
+    created_from_ms: int | None = None,
+    created_to_ms: int | None = None,
+    model: str | None = None,
+    policy: str | None = None,
+    chunk_rows: int = 50000,
+    after_rowid: int | None = None,
+    upto_rowid: int | None = None,
+) -> Iterator[dict[str, tuple[Any, ...]]]:
+    """Yield oldest-first, column-oriented chunks of model, policy, decision, risk, status_code and signal_* values.
 
-    return {"tvv_requests": tvv_requests, "tvv_tokens": tvv_tokens}
+    Each chunk is one keyset page over (created_ms, trace_id) on the matching index, so memory
+    stays bounded by chunk_rows however many traces the range holds. With after_rowid, only
+    rows inserted after it are read, paged in insertion (rowid) order instead; upto_rowid
+    caps either scan at a rowid taken from last_rowid().
+    """
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return
+
+    clauses: list[str] = []
+    params: list[Any] = []
+    for column, value in (("model", model), ("policy", policy)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if created_from_ms is not None:
+        clauses.append("created_ms >= ?")
+        params.append(created_from_ms)
+    if created_to_ms is not None:
+        clauses.append("created_ms < ?")
+        params.append(created_to_ms)
+    if upto_rowid is not None:
+        clauses.append("rowid <= ?")
+        params.append(upto_rowid)
+
+    names = (
+        "created_ms",
+        "trace_id",
+        "model",
+        "policy",
+        "decision",
+        "risk",
+        "status_code",
+        *(f"signal_{name}" for name in SIGNAL_COLUMNS),
+        "rowid",
+    )
+    columns = ", ".join("COALESCE(model, '') AS model" if name == "model" else name for name in names)
+    by_rowid = after_rowid is not None
+    order, keyset = ("rowid", "rowid > ?") if by_rowid else ("created_ms, trace_id", "(created_ms, trace_id) > (?, ?)")
+    # Plain tuples: building sqlite3.Row objects is a fifth of the read cost at this volume.
+    cursor = _get_connection(db_path).cursor()
+    cursor.row_factory = None
+    after: tuple[Any, ...] | None = (after_rowid,) if by_rowid else None
+    while True:
+        page_clauses = clauses + ([keyset] if after is not None else [])
+        where = f"WHERE {' AND '.join(page_clauses)}" if page_clauses else ""
+        rows = cursor.execute(
+            f"SELECT {columns} FROM traces {where} ORDER BY {order} LIMIT ?",
+            [*params, *(after or ()), max(1, chunk_rows)],
+        ).fetchall()
+        if not rows:
+            return
+        yield dict(zip(names, zip(*rows)))
+        if len(rows) < chunk_rows:
+            return
+        after = (rows[-1][-1],) if by_rowid else (rows[-1][0], rows[-1][1])
+
+
+def last_rowid() -> int:
+    """Highest rowid in the traces table, or 0 when empty; rowids grow in commit order."""
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return 0
+    row = _get_connection(db_path).execute("SELECT COALESCE(MAX(rowid), 0) FROM traces").fetchone()
+    return int(row[0])
+
+
+def rewrite_count() -> int:
+    """How many times a stored trace's created_ms, model, policy, risk or status_code changed, or a trace was deleted."""
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return 0
+    row = _get_connection(db_path).execute("SELECT value FROM trace_meta WHERE key = 'rewrites'").fetchone()
+    return int(row[0]) if row is not None else 0
+
+
+def load_cluster_ids() -> list[str]:
+    """Every persisted SimHash cluster id, oldest first, for rebuilding the in-memory LSH index."""
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return []
+
+    connection = _get_connection(db_path)
+    rows = connection.execute("SELECT cluster_id FROM simhash_clusters ORDER BY created_ms, cluster_id").fetchall()
+    return [row["cluster_id"] for row in rows]
+
+
+def cluster_stats(cluster_id: str) -> dict[str, Any] | None:
+    """Aggregate one cluster's traces through the cluster index; None when it has no traces."""
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return None
+
+    connection = _get_connection(db_path)
+    totals = connection.execute(
+        """
+        SELECT COUNT(*) AS trace_count, MIN(created_at) AS first_seen, MAX(created_at) AS last_seen,
+            AVG(risk) AS avg_risk, MAX(risk) AS max_risk, SUM(total_tokens) AS total_tokens
+        FROM traces WHERE cluster_id = ?
+        """,
+        (cluster_id,),
+    ).fetchone()
+    if not totals["trace_count"]:
+        return None
+
+    breakdowns: dict[str, dict[str, int]] = {}
+    for column in ("decision", "model"):
+        rows = connection.execute(
+            f"SELECT COALESCE({column}, '') AS value, COUNT(*) AS count FROM traces WHERE cluster_id = ? GROUP BY 1 ORDER BY 2 DESC",
+            (cluster_id,),
+        ).fetchall()
+        breakdowns[column] = {row["value"]: int(row["count"]) for row in rows}
+
+    return {
+        "cluster_id": cluster_id,
+        "trace_count": int(totals["trace_count"]),
+        "first_seen": totals["first_seen"],
+        "last_seen": totals["last_seen"],
+        "avg_risk": round(float(totals["avg_risk"]), 6),
+        "max_risk": float(totals["max_risk"]),
+        "total_tokens": int(totals["total_tokens"] or 0),
+        "decision_breakdown": breakdowns["decision"],
+        "model_breakdown": breakdowns["model"],
+    }
+
+
+def get_rollups(bucket_from: str | None = None, bucket_to: str | None = None) -> list[dict[str, Any]]:
+    """Hourly rollup rows (bucket_hour like '2026-02-27T12'), optionally bounded [from, to)."""
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return []
+
+    clauses: list[str] = ["request_count > 0"]
+    params: list[Any] = []
+    if bucket_from is not None:
+        clauses.append("bucket_hour >= ?")
+        params.append(bucket_from)
+    if bucket_to is not None:
+        clauses.append("bucket_hour < ?")
+        params.append(bucket_to)
+
+    connection = _get_connection(db_path)
+    rows = connection.execute(
+        f"SELECT * FROM trace_rollups WHERE {' AND '.join(clauses)} ORDER BY bucket_hour, model, policy, decision",
+        params,
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def aggregate_tvv() -> dict[str, Any]:
+    db_path = _resolve_db_path()
+    if not db_path.exists():
+        return {"tvv_requests": 0, "tvv_tokens": 0, "total_requests": 0, "total_tokens": 0, "decision_breakdown": {}}
+
+    connection = _get_connection(db_path)
+    rows = connection.execute(
+        """
+        SELECT decision, SUM(request_count) AS requests, SUM(total_tokens) AS tokens
+        FROM trace_rollups
+        GROUP BY decision
+        """
+    ).fetchall()
+
+    decision_breakdown = {row["decision"]: int(row["requests"]) for row in rows if row["requests"]}
+    tvv_requests = sum(decision_breakdown.values())
+    tvv_tokens = sum(int(row["tokens"] or 0) for row in rows)
+
+    return {
+        "tvv_requests": tvv_requests,
+        "tvv_tokens": tvv_tokens,
+        "total_requests": tvv_requests,
+        "total_tokens": tvv_tokens,
+        "decision_breakdown": decision_breakdown,
+    }
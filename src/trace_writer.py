@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any
+
+from trace_store import patch_traces, save_trace, save_traces, write_batch
+
+QUEUE_MAX_SIZE = int(os.getenv("COGNOS_TRACE_QUEUE_MAX", "10000"))
+BATCH_MAX_SIZE = int(os.getenv("COGNOS_TRACE_BATCH_MAX", "256"))
+BATCH_MAX_LATENCY_MS = float(os.getenv("COGNOS_TRACE_BATCH_MAX_LATENCY_MS", "50"))
+ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("COGNOS_TRACE_ENQUEUE_TIMEOUT_SECONDS", "5"))
+
+logger = logging.getLogger("cognos.trace_writer")
+
+_STOP = object()
+
+
+class TracePatch:
+    """Top-level envelope/metadata updates for a trace that was already submitted."""
+
+    __slots__ = ("trace_id", "envelope", "metadata")
+
+    def __init__(self, trace_id: str, envelope: dict[str, Any] | None = None, metadata: dict[str, Any] | None = None) -> None:
+        self.trace_id = trace_id
+        self.envelope = envelope or {}
+        self.metadata = metadata or {}
+
+    def as_tuple(self) -> tuple[str, dict[str, Any], dict[str, Any]]:
+        return self.trace_id, self.envelope, self.metadata
+
+
+class TraceWriter:
+    """Write-behind trace persistence: a bounded queue drained by one thread with group commit.
+
+    Every queued item gets the next sequence number as it enters the queue, and the writer
+    publishes the highest one it has committed, so flush() waits only for what was queued
+    before the call, however busy the queue stays. Counters are bumped from both the event
+    loop and the writer thread, so they are only touched under _lock.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = QUEUE_MAX_SIZE,
+        max_batch: int = BATCH_MAX_SIZE,
+        max_latency_ms: float = BATCH_MAX_LATENCY_MS,
+    ) -> None:
+        self.max_queue = max(1, max_queue)
+        self.max_batch = max(1, max_batch)
+        self.max_latency_seconds = max(0.0, max_latency_ms) / 1000.0
+        self._queue: queue.Queue[Any] = queue.Queue(maxsize=self.max_queue)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._pending: dict[str, int] = {}
+        self._progress = threading.Condition()
+        self._sequence = 0
+        self._committed = 0
+        self._counters: dict[str, float] = {
+            "enqueued": 0,
+            "patches": 0,
+            "written": 0,
+            "batches": 0,
+            "max_batch_size": 0,
+            "backpressure_waits": 0,
+            "sync_fallbacks": 0,
+            "commit_errors": 0,
+            "dropped": 0,
+            "commit_seconds_total": 0.0,
+            "commit_ms_last": 0.0,
+            "commit_ms_max": 0.0,
+        }
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_running():
+            return
+        self._thread = threading.Thread(target=self._run, name="cognos-trace-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Drain everything that is queued, then stop the writer thread."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put((None, _STOP))
+        thread.join(timeout)
+        self._thread = None
+
+    def is_pending(self, trace_id: str) -> bool:
+        with self._lock:
+            return trace_id in self._pending
+
+    def flush(self) -> None:
+        """Block until every trace and patch queued before the call has been committed."""
+        with self._progress:
+            target = self._sequence
+            while self._committed < target and self.is_running():
+                self._progress.wait(0.1)
+
+    def _put(self, item: Any, timeout: float = 0.0) -> None:
+        """Queue item under the next sequence number; raises queue.Full if it stays full for timeout."""
+        deadline = time.monotonic() + timeout
+        with self._progress:
+            while True:
+                try:
+                    self._queue.put_nowait((self._sequence + 1, item))
+                except queue.Full:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise
+                    # The writer notifies after each commit; poll too, since it frees slots earlier.
+                    self._progress.wait(min(remaining, 0.01))
+                    continue
+                self._sequence += 1
+                return
+
+    async def submit(self, record: dict[str, Any]) -> None:
+        if not self.is_running():
+            await asyncio.to_thread(save_trace, record)
+            return
+
+        self._mark_pending(record["trace_id"])
+        try:
+            self._put(record)
+        except queue.Full:
+            self._count("backpressure_waits")
+            try:
+                await asyncio.to_thread(self._put, record, ENQUEUE_TIMEOUT_SECONDS)
+            except queue.Full:
+                # Never drop a trace: write it inline once the queue stays saturated.
+                self._count("sync_fallbacks")
+                await asyncio.to_thread(save_trace, record)
+                self._clear_pending([record])
+                return
+        self._count("enqueued")
+
+    async def submit_patch(self, patch: TracePatch) -> None:
+        """Queue a patch behind everything submitted before it, so it lands after the trace's insert."""
+        self._count("patches")
+        if not self.is_running():
+            await asyncio.to_thread(patch_traces, [patch.as_tuple()])
+            return
+
+        self._mark_pending(patch.trace_id)
+        try:
+            self._put(patch)
+        except queue.Full:
+            self._count("backpressure_waits")
+            try:
+                await asyncio.to_thread(self._put, patch, ENQUEUE_TIMEOUT_SECONDS)
+            except queue.Full:
+                # Flush first so the patch cannot overtake the insert it amends.
+                self._count("sync_fallbacks")
+                await asyncio.to_thread(self.flush)
+                await asyncio.to_thread(patch_traces, [patch.as_tuple()])
+                self._clear_pending([patch])
+                return
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        batches = int(counters["batches"])
+        written = int(counters["written"])
+        return {
+            "running": self.is_running(),
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self.max_queue,
+            "batch_max": self.max_batch,
+            "batch_max_latency_ms": self.max_latency_seconds * 1000.0,
+            "enqueued": int(counters["enqueued"]),
+            "patches": int(counters["patches"]),
+            "written": written,
+            "batches": batches,
+            "avg_batch_size": round(written / batches, 3) if batches else 0.0,
+            "max_batch_size": int(counters["max_batch_size"]),
+            "backpressure_waits": int(counters["backpressure_waits"]),
+            "sync_fallbacks": int(counters["sync_fallbacks"]),
+            "commit_errors": int(counters["commit_errors"]),
+            "dropped": int(counters["dropped"]),
+            "commit_ms_last": round(counters["commit_ms_last"], 3),
+            "commit_ms_max": round(counters["commit_ms_max"], 3),
+            "commit_ms_avg": round(counters["commit_seconds_total"] * 1000.0 / batches, 3) if batches else 0.0,
+        }
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _mark_pending(self, trace_id: str) -> None:
+        with self._lock:
+            self._pending[trace_id] = self._pending.get(trace_id, 0) + 1
+
+    def _clear_pending(self, items: list[Any]) -> None:
+        with self._lock:
+            for item in items:
+                trace_id = item.trace_id if isinstance(item, TracePatch) else item["trace_id"]
+                remaining = self._pending.get(trace_id, 0) - 1
+                if remaining > 0:
+                    self._pending[trace_id] = remaining
+                else:
+                    self._pending.pop(trace_id, None)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            sequence, item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            last = sequence
+            deadline = time.monotonic() + self.max_latency_seconds
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    sequence, item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                last = sequence
+
+            self._commit(batch)
+            self._advance(last)
+
+        # Anything enqueued after the stop sentinel still gets written.
+        leftovers: list[Any] = []
+        last = 0
+        while True:
+            try:
+                sequence, item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+                last = sequence
+        if leftovers:
+            self._commit(leftovers)
+            self._advance(last)
+
+    def _advance(self, sequence: int) -> None:
+        with self._progress:
+            self._committed = max(self._committed, sequence)
+            self._progress.notify_all()
+
+    def _commit(self, batch: list[Any]) -> None:
+        started = time.perf_counter()
+        records = [item for item in batch if not isinstance(item, TracePatch)]
+        # A patch is always queued after its trace, so applying patches after the
+        # batch's inserts preserves submission order.
+        patches = [item.as_tuple() for item in batch if isinstance(item, TracePatch)]
+        try:
+            write_batch(records, patches)
+            written = len(records)
+        except Exception:
+            self._count("commit_errors")
+            logger.exception("Trace batch commit failed (%d items); retrying one at a time", len(batch))
+            # The batch transaction rolled back as a whole, so the retry replays all of it.
+            written = self._commit_each(records, patches)
+        finally:
+            self._clear_pending(batch)
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._counters["batches"] += 1
+            self._counters["written"] += written
+            self._counters["max_batch_size"] = max(self._counters["max_batch_size"], len(batch))
+            self._counters["commit_seconds_total"] += elapsed
+            self._counters["commit_ms_last"] = elapsed * 1000.0
+            self._counters["commit_ms_max"] = max(self._counters["commit_ms_max"], elapsed * 1000.0)
+
+    def _commit_each(self, records: list[dict[str, Any]], patches: list[tuple[str, dict[str, Any], dict[str, Any]]]) -> int:
+        """Per-item retry after a failed batch, so one bad record cannot take its batch down with it."""
+        written = 0
+        for record in records:
+            try:
+                save_traces([record])
+                written += 1
+            except Exception:
+                self._count("dropped")
+                logger.exception("Dropping trace %s: write failed on retry", record.get("trace_id"))
+        for patch in patches:
+            try:
+                patch_traces([patch])
+            except Exception:
+                self._count("dropped")
+                logger.exception("Dropping patch for trace %s: write failed on retry", patch[0])
+        return written
+
+
+trace_writer = TraceWriter()
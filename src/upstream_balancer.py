@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable
+
+import httpx
+
+from circuit_breaker import AimdLimiter, CircuitBreaker
+from upstream_pool import get_client
+
+BALANCER_STRATEGY = os.getenv("COGNOS_BALANCER_STRATEGY", "p2c").strip().lower()
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("COGNOS_HEALTH_CHECK_INTERVAL_SECONDS", "10"))
+HEALTH_CHECK_PATH = os.getenv("COGNOS_HEALTH_CHECK_PATH", "/models")
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("COGNOS_HEALTH_CHECK_TIMEOUT_SECONDS", "2"))
+
+logger = logging.getLogger("cognos.upstream_balancer")
+
+# Errors raised before the upstream has seen the request; safe to send it elsewhere.
+_FAILOVER_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+Endpoints = Iterable[tuple[str, int]]
+
+
+def _endpoint_key(base_url: str) -> str:
+    return (base_url or "").strip().rstrip("/").lower()
+
+
+class UpstreamUnavailable(Exception):
+    """No endpoint may take the request: every breaker is open or every limit is reached."""
+
+    def __init__(self, reason: str, detail: str, retry_after_seconds: float) -> None:
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+        self.detail = detail
+        self.retry_after_seconds = retry_after_seconds
+
+
+class EndpointState:
+    __slots__ = ("base_url", "outstanding", "requests", "failures", "healthy", "last_error", "breaker", "limiter")
+
+    def __init__(self, base_url: str, breaker: CircuitBreaker, limiter: AimdLimiter) -> None:
+        self.base_url = base_url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.healthy = True
+        self.last_error: str | None = None
+        self.breaker = breaker
+        self.limiter = limiter
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Wraps a streamed response body so the endpoint stays outstanding until it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]) -> None:
+        self._stream = stream
+        self._release: Callable[[], None] | None = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class UpstreamBalancer:
+    """Per-endpoint load balancing, failover, circuit breaking and load shedding.
+
+    Endpoint state is keyed by base URL, so it survives routing table reloads. Endpoints
+    whose breaker is open or whose adaptive concurrency limit is reached are not
+    candidates; if that leaves none, the request is shed with UpstreamUnavailable.
+    Among the rest, selection is power-of-two-choices (default) or least-outstanding
+    over weight, preferring endpoints that pass health checks.
+    """
+
+    def __init__(
+        self,
+        strategy: str = "p2c",
+        breaker_options: dict[str, Any] | None = None,
+        limiter_options: dict[str, Any] | None = None,
+    ) -> None:
+        if strategy not in {"p2c", "least_outstanding"}:
+            raise ValueError(f"Unknown balancer strategy {strategy!r}; expected p2c or least_outstanding")
+        self.strategy = strategy
+        self._breaker_options = breaker_options or {}
+        self._limiter_options = limiter_options or {}
+        self._states: dict[str, EndpointState] = {}
+        self._watched: set[str] = set()
+        self._health_task: asyncio.Task[None] | None = None
+        self._failovers = 0
+        self._shed = {"circuit_open": 0, "concurrency_limit": 0}
+
+    def state(self, base_url: str) -> EndpointState:
+        key = _endpoint_key(base_url)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = EndpointState(
+                base_url.strip().rstrip("/"),
+                CircuitBreaker(**self._breaker_options),
+                AimdLimiter(**self._limiter_options),
+            )
+        return state
+
+    def _admitted(
+        self,
+        endpoints: Endpoints,
+        exclude: frozenset[str] | set[str],
+        now: float,
+    ) -> tuple[list[tuple[EndpointState, int]], UpstreamUnavailable | None]:
+        candidates = [(self.state(base_url), weight) for base_url, weight in endpoints if _endpoint_key(base_url) not in exclude]
+        if not candidates:
+            return [], None
+        closed = [candidate for candidate in candidates if candidate[0].breaker.allows(now)]
+        if not closed:
+            retry_after = min(state.breaker.opened_at + state.breaker.open_seconds - now for state, _ in candidates)
+            detail = "; ".join(f"{state.base_url}: {state.breaker.last_trip_reason}" for state, _ in candidates)
+            return [], UpstreamUnavailable("circuit_open", detail, max(0.0, retry_after))
+        admitted = [candidate for candidate in closed if candidate[0].limiter.has_capacity(candidate[0].outstanding)]
+        if not admitted:
+            detail = "; ".join(f"{state.base_url}: {state.outstanding}/{int(state.limiter.limit)}" for state, _ in closed)
+            return [], UpstreamUnavailable("concurrency_limit", detail, 1.0)
+        return admitted, None
+
+    def pick(self, endpoints: Endpoints, exclude: frozenset[str] | set[str] = frozenset()) -> EndpointState:
+        now = time.monotonic()
+        admitted, unavailable = self._admitted(endpoints, exclude, now)
+        if unavailable is not None:
+            self._shed[unavailable.reason] += 1
+            if unavailable.reason == "concurrency_limit":
+                for base_url, _ in endpoints:
+                    if _endpoint_key(base_url) not in exclude:
+                        self.state(base_url).limiter.rejections += 1
+            raise unavailable
+        if not admitted:
+            raise ValueError("No upstream endpoints left to try")
+
+        available = [candidate for candidate in admitted if candidate[0].healthy] or admitted
+        if len(available) == 1:
+            return available[0][0]
+
+        def load(candidate: tuple[EndpointState, int]) -> float:
+            return (candidate[0].outstanding + 1) / candidate[1]
+
+        if self.strategy == "least_outstanding":
+            lowest = min(load(candidate) for candidate in available)
+            return random.choice([candidate for candidate in available if load(candidate) == lowest])[0]
+
+        first = random.choices(available, weights=[weight for _, weight in available])[0]
+        rest = [candidate for candidate in available if candidate is not first]
+        second = random.choices(rest, weights=[weight for _, weight in rest])[0]
+        return (first if load(first) <= load(second) else second)[0]
+
+    async def send(
+        self,
+        endpoints: Endpoints,
+        send: Callable[[str], Awaitable[httpx.Response]],
+    ) -> httpx.Response:
+        """Send to a picked endpoint, failing over on connect errors and 5xx responses.
+
+        A 5xx response is only retried elsewhere while its body is still unread by the
+        caller, i.e. before anything has been streamed. The chosen endpoint and every
+        attempt are recorded on response.extensions["cognos_endpoint"].
+        """
+        endpoints = tuple(endpoints)
+        tried: set[str] = set()
+        attempts: list[dict[str, Any]] = []
+
+        while True:
+            state = self.pick(endpoints, tried)
+            tried.add(_endpoint_key(state.base_url))
+            started_at = time.monotonic()
+            state.breaker.on_send(started_at)
+            state.outstanding += 1
+            state.requests += 1
+            try:
+                response = await send(state.base_url)
+            except httpx.HTTPError as error:
+                state.outstanding -= 1
+                attempt = {"base_url": state.base_url, "error": type(error).__name__}
+                attempts.append(self._record(state, attempt, True, started_at))
+                if isinstance(error, _FAILOVER_ERRORS) and self._can_fail_over(endpoints, tried):
+                    self._failovers += 1
+                    continue
+                raise
+            except BaseException:
+                state.outstanding -= 1
+                state.breaker.on_cancel()
+                raise
+
+            attempt = {"base_url": state.base_url, "status": response.status_code}
+            attempts.append(self._record(state, attempt, response.status_code >= 500, started_at, response.status_code == 429))
+            if response.status_code >= 500 and self._can_fail_over(endpoints, tried):
+                state.outstanding -= 1
+                await response.aclose()
+                self._failovers += 1
+                continue
+
+            self._hold_until_closed(state, response)
+            response.extensions["cognos_endpoint"] = {"base_url": state.base_url, "attempts": attempts}
+            return response
+
+    def _can_fail_over(self, endpoints: Endpoints, tried: set[str]) -> bool:
+        admitted, _ = self._admitted(endpoints, tried, time.monotonic())
+        return bool(admitted)
+
+    def _hold_until_closed(self, state: EndpointState, response: httpx.Response) -> None:
+        if response.is_closed:
+            state.outstanding -= 1
+            return
+
+        def release() -> None:
+            state.outstanding -= 1
+
+        response.stream = _ReleasingStream(response.stream, release)
+
+    def _record(
+        self,
+        state: EndpointState,
+        attempt: dict[str, Any],
+        failed: bool,
+        started_at: float,
+        overloaded: bool = False,
+    ) -> dict[str, Any]:
+        """Feed one attempt's outcome to the endpoint's breaker and limiter.
+
+        Latency is time to response headers. 429s shrink the concurrency limit without
+        counting against the breaker.
+        """
+        now = time.monotonic()
+        latency = now - started_at
+        state.limiter.record(failed or overloaded, latency)
+        tripped = state.breaker.record(now, failed, latency)
+        if failed:
+            state.failures += 1
+            state.last_error = attempt.get("error") or f"HTTP {attempt.get('status')}"
+        if tripped is not None:
+            attempt["breaker_tripped"] = tripped
+            logger.warning("Circuit breaker opened for %s: %s", state.base_url, tripped)
+        return attempt
+
+    def watch(self, endpoint_groups: Iterable[Endpoints]) -> None:
+        """Set the endpoints under active health checks (providers with more than one endpoint)."""
+        watched: set[str] = set()
+        for group in endpoint_groups:
+            group = tuple(group)
+            if len(group) > 1:
+                watched.update(self.state(base_url).base_url for base_url, _ in group)
+        self._watched = watched
+
+    async def check_once(self) -> None:
+        async def probe(base_url: str) -> None:
+            state = self.state(base_url)
+            try:
+                response = await get_client(base_url).get(
+                    f"{base_url}{HEALTH_CHECK_PATH}", timeout=HEALTH_CHECK_TIMEOUT_SECONDS
+                )
+                # Any non-5xx answer (401 included) means the endpoint is up and serving.
+                healthy, reason = response.status_code < 500, f"HTTP {response.status_code}"
+            except httpx.HTTPError as error:
+                healthy, reason = False, type(error).__name__
+            if healthy != state.healthy:
+                logger.warning("Upstream endpoint %s is now %s (%s)", base_url, "healthy" if healthy else "unhealthy", reason)
+            state.healthy = healthy
+            if not healthy:
+                state.last_error = reason
+
+        await asyncio.gather(*(probe(base_url) for base_url in sorted(self._watched)))
+
+    async def _health_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_once()
+            except Exception:
+                logger.exception("Upstream health check pass failed")
+
+    def start(self, interval: float) -> None:
+        if interval <= 0 or (self._health_task is not None and not self._health_task.done()):
+            return
+        self._health_task = asyncio.get_running_loop().create_task(self._health_loop(interval))
+
+    async def stop(self) -> None:
+        task, self._health_task = self._health_task, None
+        if task is None or task.done():
+            return
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, RuntimeError):
+            pass
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "strategy": self.strategy,
+            "failovers": self._failovers,
+            "shed": dict(self._shed),
+            "endpoints": {
+                state.base_url: {
+                    "outstanding": state.outstanding,
+                    "requests": state.requests,
+                    "failures": state.failures,
+                    "healthy": state.healthy,
+                    "health_checked": state.base_url in self._watched,
+                    "last_error": state.last_error,
+                    "breaker": state.breaker.stats(now),
+                    "concurrency": state.limiter.stats(),
+                }
+                for state in self._states.values()
+            },
+        }
+
+
+upstream_balancer = UpstreamBalancer(BALANCER_STRATEGY)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, AsyncIterator
+
+import httpx
+
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("COGNOS_REQUEST_TIMEOUT_SECONDS", "120"))
+POOL_MAX_CONNECTIONS = int(os.getenv("COGNOS_UPSTREAM_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("COGNOS_UPSTREAM_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("COGNOS_UPSTREAM_KEEPALIVE_EXPIRY_SECONDS", "30"))
+POOL_HTTP2 = os.getenv("COGNOS_UPSTREAM_HTTP2", "false").lower() in {"1", "true", "yes"}
+
+_clients: dict[str, dict[str, Any]] = {}
+
+
+def _pool_key(base_url: str) -> str:
+    return (base_url or "").strip().rstrip("/").lower()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _InFlightStream(httpx.AsyncByteStream):
+    """Response body that keeps its request counted as in flight until it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, counters: dict[str, int]) -> None:
+        self._stream = stream
+        self._counters = counters
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._counters["in_flight"] -= 1
+        await self._stream.aclose()
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """Transport that counts requests in flight, TCP connects and TLS handshakes.
+
+    Connects and handshakes come from httpcore trace events; in-flight requests are counted
+    here rather than read from the connection pool, whose internals are not public API.
+    """
+
+    def __init__(self, counters: dict[str, int], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._counters = counters
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        upstream_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self._counters["tcp_connects"] += 1
+            elif event_name == "connection.start_tls.complete":
+                self._counters["tls_handshakes"] += 1
+            if upstream_trace is not None:
+                result = upstream_trace(event_name, info)
+                if asyncio.iscoroutine(result):
+                    await result
+
+        request.extensions["trace"] = trace
+        self._counters["requests"] += 1
+        self._counters["in_flight"] += 1
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self._counters["in_flight"] -= 1
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_InFlightStream(response.stream, self._counters),
+            extensions=response.extensions,
+        )
+
+
+def _build_client(counters: dict[str, int]) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    transport = _CountingTransport(counters, limits=limits, http2=POOL_HTTP2 and _http2_available())
+    return httpx.AsyncClient(timeout=REQUEST_TIMEOUT_SECONDS, transport=transport)
+
+
+def get_client(base_url: str) -> httpx.AsyncClient:
+    """Return the long-lived client for an upstream base URL, creating it on first use."""
+    key = _pool_key(base_url)
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(key)
+
+    # A client is bound to the loop its connections were opened on; a new loop
+    # (e.g. a fresh TestClient portal) gets a fresh client.
+    if entry is None or entry["loop"] is not loop or entry["client"].is_closed:
+        counters = {"requests": 0, "in_flight": 0, "tcp_connects": 0, "tls_handshakes": 0}
+        entry = {"client": _build_client(counters), "loop": loop, "counters": counters}
+        _clients[key] = entry
+
+    return entry["client"]
+
+
+async def close_all() -> None:
+    entries = list(_clients.values())
+    _clients.clear()
+    for entry in entries:
+        if entry["client"].is_closed:
+            continue
+        try:
+            await entry["client"].aclose()
+        except RuntimeError:
+            # Client belongs to an event loop that is already gone.
+            continue
+
+
+def pool_stats() -> dict[str, Any]:
+    clients: dict[str, Any] = {}
+    for key, entry in _clients.items():
+        clients[key] = {
+            "requests": entry["counters"]["requests"],
+            "in_flight": entry["counters"]["in_flight"],
+            "tcp_connects": entry["counters"]["tcp_connects"],
+            "tls_handshakes": entry["counters"]["tls_handshakes"],
+        }
+
+    return {
+        "config": {
+            "max_connections": POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": POOL_MAX_KEEPALIVE,
+            "keepalive_expiry_seconds": POOL_KEEPALIVE_EXPIRY_SECONDS,
+            "http2": POOL_HTTP2 and _http2_available(),
+        },
+        "clients": clients,
+    }
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+RETRY_MAX_RETRIES = int(os.getenv("COGNOS_RETRY_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY_MS = float(os.getenv("COGNOS_RETRY_BASE_DELAY_MS", "200"))
+RETRY_MAX_DELAY_MS = float(os.getenv("COGNOS_RETRY_MAX_DELAY_MS", "5000"))
+RETRY_BUDGET_RATIO = float(os.getenv("COGNOS_RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("COGNOS_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+REQUEST_DEADLINE_SECONDS = float(os.getenv("COGNOS_REQUEST_DEADLINE_SECONDS", "0"))
+
+RETRYABLE_STATUS = frozenset({429, 502, 503, 504})
+# Failures where the upstream never received the request; anything later may already
+# have been billed, so it is not retried.
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before an upstream attempt completed."""
+
+    def __init__(self, attempts: list[dict[str, Any]]) -> None:
+        super().__init__("Request deadline exceeded")
+        self.attempts = attempts
+
+
+def parse_retry_after(value: str | None, now: datetime | None = None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+class RetryBudget:
+    """Caps retries at `ratio` of requests, plus a small per-second floor for quiet periods."""
+
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+        burst: float = 10.0,
+    ) -> None:
+        self.ratio = max(0.0, ratio)
+        self.min_per_second = max(0.0, min_per_second)
+        self.burst = burst
+        self.tokens = min(burst, self.min_per_second)
+        self._refilled_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.min_per_second)
+        self._refilled_at = now
+
+    def deposit(self) -> None:
+        self._refill(time.monotonic())
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill(time.monotonic())
+        # Tolerate float drift: ten deposits of 0.1 must buy one retry.
+        if self.tokens < 1.0 - 1e-9:
+            return False
+        self.tokens = max(0.0, self.tokens - 1.0)
+        return True
+
+
+class RetryEngine:
+    """Retries transient upstream failures with capped exponential backoff and full jitter.
+
+    429/502/503/504 responses and connect failures are retried up to max_retries times,
+    waiting at least the upstream's Retry-After, while the shared budget has tokens and
+    the request deadline leaves room. Every attempt is listed on the final response as
+    response.extensions["cognos_retry"].
+    """
+
+    def __init__(
+        self,
+        base_delay_ms: float = RETRY_BASE_DELAY_MS,
+        max_delay_ms: float = RETRY_MAX_DELAY_MS,
+        budget: RetryBudget | None = None,
+    ) -> None:
+        self.base_delay = base_delay_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.budget = budget or RetryBudget()
+        self._counters = {"requests": 0, "retries": 0, "recovered": 0, "gave_up": 0, "budget_exhausted": 0, "deadline_exceeded": 0}
+
+    def backoff(self, retry: int) -> float:
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+    async def run(
+        self,
+        attempt: Callable[[], Awaitable[httpx.Response]],
+        max_retries: int = RETRY_MAX_RETRIES,
+        deadline_seconds: float | None = None,
+    ) -> httpx.Response:
+        self._counters["requests"] += 1
+        self.budget.deposit()
+        deadline_at = time.monotonic() + deadline_seconds if deadline_seconds else None
+        attempts: list[dict[str, Any]] = []
+
+        for number in range(1, max_retries + 2):
+            remaining = deadline_at - time.monotonic() if deadline_at is not None else None
+            started_at = time.monotonic()
+            response: httpx.Response | None = None
+            try:
+                if remaining is None:
+                    response = await attempt()
+                else:
+                    response = await asyncio.wait_for(attempt(), max(0.0, remaining))
+            except asyncio.TimeoutError:
+                attempts.append({"attempt": number, "error": "DeadlineExceeded", "latency_ms": _ms_since(started_at)})
+                self._counters["deadline_exceeded"] += 1
+                raise DeadlineExceeded(attempts) from None
+            except _RETRYABLE_ERRORS as error:
+                record: dict[str, Any] = {"attempt": number, "error": type(error).__name__, "latency_ms": _ms_since(started_at)}
+                failure: httpx.HTTPError | None = error
+            else:
+                endpoint = response.extensions.get("cognos_endpoint") or {}
+                record = {
+                    "attempt": number,
+                    "status": response.status_code,
+                    "latency_ms": _ms_since(started_at),
+                    "endpoint": endpoint.get("base_url"),
+                }
+                failure = None
+                if response.status_code not in RETRYABLE_STATUS:
+                    attempts.append(record)
+                    if number > 1:
+                        self._counters["recovered"] += 1
+                        response.extensions["cognos_retry"] = {"attempts": attempts, "retries": number - 1}
+                    return response
+            attempts.append(record)
+
+            retry_after = parse_retry_after(response.headers.get("retry-after")) if response is not None else None
+            delay = max(retry_after or 0.0, self.backoff(number))
+            remaining = deadline_at - time.monotonic() if deadline_at is not None else None
+            gave_up = None
+            if number > max_retries:
+                gave_up = "max_retries"
+            elif retry_after is not None and retry_after > self.max_delay:
+                gave_up = "retry_after_too_long"
+            elif remaining is not None and delay >= remaining:
+                gave_up = "deadline"
+            elif not self.budget.try_spend():
+                gave_up = "budget_exhausted"
+                self._counters["budget_exhausted"] += 1
+
+            if gave_up is not None:
+                self._counters["gave_up"] += 1
+                record["gave_up"] = gave_up
+                if failure is not None:
+                    raise failure
+                assert response is not None
+                response.extensions["cognos_retry"] = {"attempts": attempts, "retries": number - 1}
+                return response
+
+            record["retry_in_ms"] = round(delay * 1000, 3)
+            self._counters["retries"] += 1
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    def stats(self) -> dict[str, Any]:
+        return {**self._counters, "budget_tokens": round(self.budget.tokens, 3), "budget_ratio": self.budget.ratio}
+
+
+def _ms_since(started_at: float) -> float:
+    return round((time.monotonic() - started_at) * 1000, 3)
+
+
+retry_engine = RetryEngine()
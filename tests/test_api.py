@@ -339,3 +339,87 @@ class TestModelPrefixRouting:
 
             assert response.status_code == 200
             # Model should be normalized in upstream but cognos should track original
+
+
+class TestTraceListEndpoint:
+    """Tests for GET /v1/traces filtering and keyset pagination."""
+
+    def test_filter_by_decision(
+        self,
+        test_client: TestClient,
+        tmp_db_path: str,
+        multiple_trace_records: list[dict[str, Any]],
+    ) -> None:
+        """Only traces matching the decision filter should be returned."""
+        import trace_store
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        for record in multiple_trace_records:
+            save_trace(record)
+
+        response = test_client.get("/v1/traces", params={"decision": "REFINE"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 2
+        assert {trace["decision"] for trace in data["traces"]} == {"REFINE"}
+        assert data["next_cursor"] is None
+
+    def test_keyset_pagination_covers_all(
+        self,
+        test_client: TestClient,
+        tmp_db_path: str,
+        multiple_trace_records: list[dict[str, Any]],
+    ) -> None:
+        """Following next_cursor should visit every trace exactly once."""
+        import trace_store
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        for index, record in enumerate(multiple_trace_records):
+            save_trace({**record, "created_at": f"2026-02-27T12:00:0{index % 3}+00:00"})
+
+        seen: list[str] = []
+        cursor = None
+        while True:
+            params: dict[str, Any] = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            data = test_client.get("/v1/traces", params=params).json()
+            seen.extend(trace["trace_id"] for trace in data["traces"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+
+        assert sorted(seen) == sorted(r["trace_id"] for r in multiple_trace_records)
+        assert len(seen) == len(set(seen))
+
+    def test_ndjson_format(
+        self,
+        test_client: TestClient,
+        tmp_db_path: str,
+        multiple_trace_records: list[dict[str, Any]],
+    ) -> None:
+        """format=ndjson should stream one trace per line plus a cursor line."""
+        import trace_store
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        for record in multiple_trace_records:
+            save_trace(record)
+
+        response = test_client.get("/v1/traces", params={"format": "ndjson", "min_risk": 0.3})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 3
+        assert all(line["risk"] >= 0.3 for line in lines[:-1])
+        assert lines[-1] == {"next_cursor": None}
+
+    def test_invalid_cursor_returns_400(self, test_client: TestClient, tmp_db_path: str) -> None:
+        """A malformed cursor should be rejected."""
+        import trace_store
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+
+        response = test_client.get("/v1/traces", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
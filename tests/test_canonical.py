@@ -0,0 +1,156 @@
+"""Unit tests for canonical module."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from canonical import JsonBody, canonical_digest
+from trace_store import get_trace, init_db
+
+RAW_BODY = (
+    b'{ "model": "openai:gpt-4o-mini",\n'
+    b'  "messages": [{"role": "user", "content": "h\\u00e9llo \xe2\x9c\x93", "name": "alice"}],\n'
+    b'  "temperature": 0.25, "cognos": {"mode": "monitor"}, "metadata": {"b": 1, "a": [1.5, null, true]} }'
+)
+
+
+class TestJsonBody:
+    """Tests for single-pass request parsing."""
+
+    def test_payload_matches_json_loads(self) -> None:
+        """Parsing should produce the same dict as json.loads."""
+        assert JsonBody.parse(RAW_BODY).payload == json.loads(RAW_BODY)
+
+    def test_canonical_fingerprint_matches_full_encoding(self) -> None:
+        """Incremental hashing should equal hashing the whole canonical payload."""
+        body = JsonBody.parse(RAW_BODY)
+        payload = json.loads(RAW_BODY)
+
+        assert body.canonical_fingerprint() == canonical_digest(payload)
+
+        edited = {key: value for key, value in payload.items() if key != "cognos"}
+        edited["model"] = "gpt-4o-mini"
+        assert body.canonical_fingerprint(exclude=("cognos",), overrides={"model": "gpt-4o-mini"}) == canonical_digest(
+            edited
+        )
+
+    def test_forward_bytes_unchanged_is_original(self) -> None:
+        """Without edits the original bytes should be forwarded as-is."""
+        body = JsonBody.parse(RAW_BODY)
+
+        assert body.forward_bytes() is body.raw
+        assert body.forward_bytes(overrides={"model": "openai:gpt-4o-mini"}) is body.raw
+
+    def test_forward_bytes_splices_members(self) -> None:
+        """Excluded members should be removed and overrides rewritten, keeping other bytes."""
+        body = JsonBody.parse(RAW_BODY)
+
+        forwarded = body.forward_bytes(exclude=("cognos",), overrides={"model": "gpt-4o-mini"})
+
+        expected = json.loads(RAW_BODY)
+        del expected["cognos"]
+        expected["model"] = "gpt-4o-mini"
+        assert json.loads(forwarded) == expected
+        assert b'"content": "h\\u00e9llo \xe2\x9c\x93", "name": "alice"' in forwarded
+
+    def test_forward_bytes_appends_new_members(self) -> None:
+        """Added members should be appended before the closing brace, leaving the rest as-is."""
+        assert JsonBody.parse(b'{"a": 1 }\n').forward_bytes(overrides={"cognos": {"x": "\u00e9"}}) == (
+            '{"a": 1,"cognos":{"x":"\u00e9"}}'.encode("utf-8")
+        )
+        assert JsonBody.parse(b"{ }").forward_bytes(overrides={"cognos": 1}) == b'{"cognos":1}'
+
+    def test_duplicate_keys_fall_back_to_reencoding(self) -> None:
+        """Duplicate members should resolve last-wins and still forward valid JSON."""
+        body = JsonBody.parse(b'{"model": "a", "model": "b", "cognos": {}}')
+
+        assert body.payload == {"model": "b", "cognos": {}}
+        assert json.loads(body.forward_bytes(exclude=("cognos",))) == {"model": "b"}
+
+    @pytest.mark.parametrize("raw", [b"", b"[]", b'{"a": 1', b'{"a": 1} x', b'{"a" 1}', b"\xff"])
+    def test_invalid_bodies_raise_value_error(self, raw: bytes) -> None:
+        """Non-object or malformed bodies should raise ValueError."""
+        with pytest.raises(ValueError):
+            JsonBody.parse(raw)
+
+
+class TestGatewayForwarding:
+    """Tests for forwarding bodies between the caller and the upstream."""
+
+    @staticmethod
+    def _post(tmp_db_path: str, upstream_body: bytes, received: list[bytes], sample_rate: float = 1.0) -> httpx.Response:
+        import main
+        import trace_store
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            received.append(request.content)
+            return httpx.Response(200, content=upstream_body, headers={"content-type": "application/json"})
+
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(
+            main, "RESPONSE_VALIDATION_SAMPLE_RATE", sample_rate
+        ), patch.object(
+            upstream_pool,
+            "_build_client",
+            lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        ):
+            with TestClient(main.app, raise_server_exceptions=False) as client:
+                return client.post(
+                    "/v1/chat/completions",
+                    content=RAW_BODY,
+                    headers={"authorization": "Bearer upstream-key", "content-type": "application/json"},
+                )
+
+    def test_upstream_receives_original_members(
+        self,
+        tmp_db_path: str,
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        """Message fields outside the gateway schema should reach the upstream untouched."""
+        received: list[bytes] = []
+
+        response = self._post(tmp_db_path, json.dumps(mock_upstream_response).encode("utf-8"), received)
+
+        assert response.status_code == 200
+        forwarded = json.loads(received[0])
+        assert "cognos" not in forwarded
+        assert forwarded["messages"][0]["name"] == "alice"
+        assert forwarded["metadata"] == {"b": 1, "a": [1.5, None, True]}
+
+    def test_envelope_is_spliced_into_upstream_bytes(
+        self,
+        tmp_db_path: str,
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        """The response should be the upstream bytes plus the envelope, fingerprinted on the upstream bytes."""
+        upstream_body = json.dumps(mock_upstream_response, indent=2).encode("utf-8")
+
+        response = self._post(tmp_db_path, upstream_body, [])
+
+        assert response.status_code == 200
+        assert response.content.startswith(upstream_body.rstrip()[:-1].rstrip())
+        assert response.json()["cognos"]["trace_id"] == response.headers["X-Cognos-Trace-Id"]
+        trace = get_trace(response.headers["X-Cognos-Trace-Id"])
+        expected_hash = hashlib.sha256(upstream_body).hexdigest()
+        assert trace["response_fingerprint"]["embedding_hash"] == f"sha256:{expected_hash}"
+        assert trace["response_fingerprint"]["length"] == len(upstream_body)
+
+    def test_validation_sampling(self, tmp_db_path: str, mock_upstream_response: dict[str, Any]) -> None:
+        """Responses outside the schema should fail when sampled and pass through when not."""
+        invalid = {**mock_upstream_response, "choices": [{"index": 0}]}
+        upstream_body = json.dumps(invalid).encode("utf-8")
+
+        assert self._post(tmp_db_path, upstream_body, [], sample_rate=1.0).status_code == 500
+        unsampled = self._post(tmp_db_path, upstream_body, [], sample_rate=0.0)
+        assert unsampled.status_code == 200
+        assert unsampled.json()["choices"] == [{"index": 0}]
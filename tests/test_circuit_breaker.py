@@ -0,0 +1,158 @@
+"""Unit tests for circuit_breaker module."""
+
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, AimdLimiter, CircuitBreaker
+from trace_store import get_trace, init_db
+
+
+class TestCircuitBreaker:
+    """Tests for breaker state transitions."""
+
+    def test_trips_on_failure_rate(self) -> None:
+        """The breaker should open once enough calls in the window have failed."""
+        breaker = CircuitBreaker(window_seconds=10, min_requests=4, failure_rate=0.5, open_seconds=5)
+
+        assert breaker.record(0.0, False, 0.1) is None
+        assert breaker.record(0.1, True, 0.1) is None
+        assert breaker.record(0.2, False, 0.1) is None
+        reason = breaker.record(0.3, True, 0.1)
+
+        assert breaker.state == OPEN
+        assert reason == "failure rate 2/4 in 10s"
+        assert not breaker.allows(1.0)
+        assert breaker.allows(5.3)
+
+    def test_trips_on_slow_calls(self) -> None:
+        """Mostly slow calls should open the breaker even without errors."""
+        breaker = CircuitBreaker(min_requests=2, slow_call_seconds=1.0, slow_call_rate=1.0)
+
+        breaker.record(0.0, False, 2.0)
+        assert breaker.record(0.1, False, 3.0) == "slow calls 2/2 over 1s"
+
+    def test_old_outcomes_expire(self) -> None:
+        """Failures outside the window should no longer count."""
+        breaker = CircuitBreaker(window_seconds=10, min_requests=2, failure_rate=0.5)
+
+        breaker.record(0.0, True, 0.1)
+        assert breaker.record(20.0, False, 0.1) is None
+        assert breaker.stats(20.0)["calls_in_window"] == 1
+
+    def test_half_open_probe_closes_or_reopens(self) -> None:
+        """After the open period one probe is admitted; its outcome decides the next state."""
+        breaker = CircuitBreaker(min_requests=1, open_seconds=5, half_open_probes=1)
+        breaker.record(0.0, True, 0.1)
+
+        breaker.on_send(6.0)
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allows(6.0)
+        assert breaker.record(6.5, True, 0.1) == "half-open probe failed"
+        assert breaker.state == OPEN
+        assert breaker.trips == 2
+
+        breaker.on_send(12.0)
+        assert breaker.record(12.5, False, 0.1) is None
+        assert breaker.state == CLOSED
+
+    def test_cancelled_probe_frees_slot(self) -> None:
+        """A probe that never completes should not wedge the breaker half-open."""
+        breaker = CircuitBreaker(min_requests=1, open_seconds=5)
+        breaker.record(0.0, True, 0.1)
+
+        breaker.on_send(6.0)
+        breaker.on_cancel()
+
+        assert breaker.allows(6.0)
+
+
+class TestAimdLimiter:
+    """Tests for the additive-increase / multiplicative-decrease limit."""
+
+    def test_grows_slowly_and_backs_off_fast(self) -> None:
+        """Successes add about one per limit's worth of calls; failures cut multiplicatively."""
+        limiter = AimdLimiter(initial=10, minimum=2, maximum=11, backoff=0.5, slow_call_seconds=5)
+
+        for _ in range(10):
+            limiter.record(False, 0.1)
+        assert 10.9 < limiter.limit <= 11
+
+        grown = limiter.limit
+        limiter.record(True, 0.1)
+        assert limiter.limit == grown * 0.5
+        limiter.record(False, 6.0)
+        limiter.record(False, 6.0)
+        assert limiter.limit == 2
+
+    def test_capacity(self) -> None:
+        """Capacity should be the integer part of the limit."""
+        limiter = AimdLimiter(initial=2.9, enabled=True)
+
+        assert limiter.has_capacity(1)
+        assert not limiter.has_capacity(2)
+
+    def test_defaults_shed_nothing(self) -> None:
+        """By default the limit is only tracked, and long calls never count as slow."""
+        limiter = AimdLimiter(initial=2)
+        breaker = CircuitBreaker(min_requests=2)
+
+        for now in (0.0, 0.1, 0.2):
+            limiter.record(False, 300.0)
+            assert breaker.record(now, False, 300.0) is None
+
+        assert limiter.limit > 2
+        assert limiter.has_capacity(1000)
+        assert breaker.state == CLOSED
+
+
+class TestGatewayShedding:
+    """Tests for fast 503s through the chat completions endpoint."""
+
+    def test_open_breaker_sheds_with_escalate_trace(self, tmp_db_path: str) -> None:
+        """Once the breaker trips, requests should fail fast with an ESCALATE trace and a reason."""
+        import main
+        import trace_store
+        import upstream_balancer
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        calls: list[str] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.path)
+            return httpx.Response(500, json={"error": "down"})
+
+        balancer = upstream_balancer.UpstreamBalancer("p2c", breaker_options={"min_requests": 2, "open_seconds": 60})
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(main, "upstream_balancer", balancer), patch.object(
+            upstream_pool, "_build_client", lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        ):
+            with TestClient(main.app) as client:
+                responses = [
+                    client.post(
+                        "/v1/chat/completions",
+                        json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": f"hi {index}"}]},
+                        headers={"authorization": "Bearer upstream-key"},
+                    )
+                    for index in range(3)
+                ]
+
+        assert [response.status_code for response in responses] == [500, 500, 503]
+        assert len(calls) == 2
+        tripping = get_trace(responses[1].json()["trace_id"])
+        assert "failure rate 2/2" in tripping["metadata"]["endpoint"]["attempts"][0]["breaker_tripped"]
+
+        shed = responses[2]
+        assert 1 <= int(shed.headers["Retry-After"]) <= 60
+        assert shed.json()["reason"] == "circuit_open"
+        trace = get_trace(shed.json()["trace_id"])
+        assert trace["decision"] == "ESCALATE"
+        assert trace["status_code"] == 503
+        assert trace["metadata"]["shed"]["reason"] == "circuit_open"
+        assert "failure rate 2/2" in trace["metadata"]["shed"]["detail"]
+        [endpoint] = balancer.stats()["endpoints"].values()
+        assert endpoint["breaker"]["state"] == OPEN
@@ -271,3 +271,167 @@ class TestConcurrentRequests:
             for trace_id in trace_ids:
                 trace = get_trace(trace_id)
                 assert trace is not None
+
+
+class TestLiveStreamPassthrough:
+    """Test live SSE passthrough against a mocked upstream transport."""
+
+    @staticmethod
+    def _patched_upstream(handler: Any) -> Any:
+        import httpx
+        import upstream_pool
+
+        return patch.object(
+            upstream_pool,
+            "_build_client",
+            lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+
+    def test_stream_forwards_chunks_and_records_timings(
+        self,
+        tmp_db_path: str,
+        stream_chat_request: dict[str, Any],
+    ) -> None:
+        """Upstream SSE chunks should be relayed and stream timings stored on the trace."""
+        import httpx
+        import main
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        chunks = [
+            b'data: {"choices":[{"index":0,"delta":{"content":"Hel"}}]}\n\n',
+            b'data: {"choices":[{"index":0,"delta":{"content":"lo"}}]}\n\n',
+            b"data: [DONE]\n\n",
+        ]
+        closed: list[bool] = []
+
+        class UpstreamStream(httpx.AsyncByteStream):
+            async def __aiter__(self) -> Any:
+                for chunk in chunks:
+                    yield chunk
+
+            async def aclose(self) -> None:
+                closed.append(True)
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=UpstreamStream())
+
+        with patch.object(main, "MOCK_UPSTREAM", False), self._patched_upstream(handler):
+            with TestClient(main.app) as client:
+                response = client.post(
+                    "/v1/chat/completions",
+                    json=stream_chat_request,
+                    headers={"authorization": "Bearer upstream-key"},
+                )
+
+        assert response.status_code == 200
+        assert response.content == b"".join(chunks)
+        assert closed
+
+        trace = get_trace(response.headers["X-Cognos-Trace-Id"])
+        stream_stats = trace["metadata"]["stream"]
+        assert stream_stats["outcome"] == "completed"
+        assert stream_stats["bytes"] == len(b"".join(chunks))
+        assert stream_stats["ttft_ms"] is not None
+        assert stream_stats["duration_ms"] >= stream_stats["ttft_ms"]
+
+    async def test_client_disconnect_closes_upstream_and_records_timings(
+        self,
+        tmp_db_path: str,
+        stream_chat_request: dict[str, Any],
+    ) -> None:
+        """A client hanging up mid-stream should still close the upstream and record the stream outcome."""
+        import asyncio
+
+        import httpx
+        import main
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        first_chunk = b'data: {"choices":[{"index":0,"delta":{"content":"Hel"}}]}\n\n'
+        closed: list[bool] = []
+
+        class UpstreamStream(httpx.AsyncByteStream):
+            async def __aiter__(self) -> Any:
+                yield first_chunk
+                await asyncio.sleep(30)
+
+            async def aclose(self) -> None:
+                await asyncio.sleep(0.01)
+                closed.append(True)
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=UpstreamStream())
+
+        body = json.dumps({**stream_chat_request, "cognos": {"mode": "monitor", "coalesce": False}}).encode()
+        relayed = asyncio.Event()
+        received: list[bool] = []
+        headers: dict[str, str] = {}
+
+        async def receive() -> dict[str, Any]:
+            if not received:
+                received.append(True)
+                return {"type": "http.request", "body": body, "more_body": False}
+            await relayed.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                headers.update((key.decode(), value.decode()) for key, value in message["headers"])
+            elif message.get("body"):
+                relayed.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/v1/chat/completions",
+            "raw_path": b"/v1/chat/completions",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"content-type", b"application/json"), (b"authorization", b"Bearer upstream-key")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        with patch.object(main, "MOCK_UPSTREAM", False), self._patched_upstream(handler):
+            await asyncio.wait_for(main.app(scope, receive, send), timeout=5)
+
+        assert closed
+        stream_stats = get_trace(headers["x-cognos-trace-id"])["metadata"]["stream"]
+        assert stream_stats["outcome"] == "client_disconnect"
+        assert stream_stats["bytes"] == len(first_chunk)
+        assert stream_stats["ttft_ms"] is not None
+
+    def test_stream_upstream_error_escalates(
+        self,
+        tmp_db_path: str,
+        stream_chat_request: dict[str, Any],
+    ) -> None:
+        """A failing upstream on a stream request should return the error and an ESCALATE trace."""
+        import httpx
+        import main
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(503, json={"error": "overloaded"})
+
+        with patch.object(main, "MOCK_UPSTREAM", False), self._patched_upstream(handler):
+            with TestClient(main.app) as client:
+                response = client.post(
+                    "/v1/chat/completions",
+                    json=stream_chat_request,
+                    headers={"authorization": "Bearer upstream-key"},
+                )
+
+        assert response.status_code == 503
+        body = response.json()
+        assert body["upstream_body"] == {"error": "overloaded"}
+        trace = get_trace(body["trace_id"])
+        assert trace["decision"] == "ESCALATE"
@@ -0,0 +1,189 @@
+"""Unit tests for hedging module."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+from hedging import HedgeBudget, Hedger, LatencyTracker
+from trace_store import get_trace, init_db
+
+
+def _attempts(delays: list[float], cancelled: list[int]) -> Any:
+    """Attempt factory: the n-th call sleeps delays[n] and answers 200 with its number."""
+    calls = 0
+
+    async def attempt() -> httpx.Response:
+        nonlocal calls
+        number = calls = calls + 1
+        try:
+            await asyncio.sleep(delays[number - 1])
+        except asyncio.CancelledError:
+            cancelled.append(number)
+            raise
+        return httpx.Response(200, json={"attempt": number})
+
+    return attempt
+
+
+def _warm(hedger: Hedger, route: str, seconds: float = 0.01, samples: int = 20) -> None:
+    for _ in range(samples):
+        hedger.observe(route, seconds)
+
+
+class TestLatencyTracker:
+    """Tests for the sliding-window percentile tracker."""
+
+    def test_percentiles(self) -> None:
+        """Percentiles should come from the sorted window."""
+        tracker = LatencyTracker(window=100)
+        for value in range(100):
+            tracker.observe(value / 100)
+
+        assert tracker.percentile(0.5) == 0.5
+        assert tracker.percentile(0.95) == 0.95
+        assert tracker.percentile(1.0) == 0.99
+
+    def test_window_evicts_oldest(self) -> None:
+        """Only the most recent samples should count."""
+        tracker = LatencyTracker(window=3)
+        for value in (9.0, 1.0, 2.0, 3.0):
+            tracker.observe(value)
+
+        assert len(tracker) == 3
+        assert tracker.percentile(0.99) == 3.0
+
+
+class TestHedgeBudget:
+    """Tests for the hedge token bucket."""
+
+    def test_budget_is_a_share_of_traffic(self) -> None:
+        """5% should allow one hedge per twenty requests."""
+        budget = HedgeBudget(pct=5)
+        spent = 0
+        for _ in range(100):
+            budget.deposit()
+            spent += budget.try_spend()
+
+        assert spent == 5
+
+
+class TestHedger:
+    """Tests for hedged attempts."""
+
+    async def test_slow_first_attempt_is_hedged(self) -> None:
+        """A first attempt slower than the percentile should be raced by a second one."""
+        hedger = Hedger(budget_pct=100, min_samples=20)
+        _warm(hedger, "openai|gpt-4o-mini")
+        cancelled: list[int] = []
+
+        started = time.monotonic()
+        response = await hedger.run("openai|gpt-4o-mini", 0.95, _attempts([5.0, 0.0], cancelled))
+
+        assert time.monotonic() - started < 1.0
+        assert response.json() == {"attempt": 2}
+        assert response.extensions["cognos_hedge"]["hedged"] is True
+        assert response.extensions["cognos_hedge"]["winner"] == 2
+        assert cancelled == [1]
+        assert hedger.stats()["hedge_wins"] == 1
+
+    async def test_fast_first_attempt_is_not_hedged(self) -> None:
+        """Attempts finishing before the percentile should not spawn a hedge."""
+        hedger = Hedger(budget_pct=100, min_samples=20)
+        _warm(hedger, "route", seconds=1.0)
+
+        response = await hedger.run("route", 0.95, _attempts([0.0, 0.0], []))
+
+        assert response.extensions["cognos_hedge"] == {"percentile": 0.95, "delay_ms": 1000.0, "hedged": False, "winner": 1}
+
+    async def test_budget_and_warmup_limit_hedging(self) -> None:
+        """No hedges without enough samples or without budget."""
+        hedger = Hedger(budget_pct=0, min_samples=20)
+
+        cold = await hedger.run("route", 0.95, _attempts([0.02], []))
+        assert cold.extensions["cognos_hedge"]["skipped"] == "warming_up"
+
+        _warm(hedger, "route", seconds=0.001)
+        broke = await hedger.run("route", 0.95, _attempts([0.02], []))
+        assert broke.extensions["cognos_hedge"]["skipped"] == "budget_exhausted"
+        assert hedger.stats()["hedged"] == 0
+
+    async def test_failed_hedge_falls_back_to_first(self) -> None:
+        """If the hedge fails, the first attempt should still win."""
+        hedger = Hedger(budget_pct=100, min_samples=1)
+        _warm(hedger, "route", seconds=0.01, samples=1)
+
+        async def attempt_factory() -> httpx.Response:
+            calls.append(1)
+            if len(calls) == 2:
+                return httpx.Response(503)
+            await asyncio.sleep(0.1)
+            return httpx.Response(200)
+
+        calls: list[int] = []
+        response = await hedger.run("route", 0.5, attempt_factory)
+
+        assert response.status_code == 200
+        assert response.extensions["cognos_hedge"]["winner"] == 1
+
+    async def test_untracked_percentile_only_observes(self) -> None:
+        """Without a percentile the attempt just feeds the latency window."""
+        hedger = Hedger()
+
+        response = await hedger.run("route", None, _attempts([0.0], []))
+
+        assert "cognos_hedge" not in response.extensions
+        assert len(hedger.tracker("route")) == 1
+        assert hedger.stats()["requests"] == 0
+
+
+class TestGatewayHedging:
+    """Tests for hedging through the chat completions endpoint."""
+
+    def test_hedge_winner_recorded_in_trace(self, tmp_db_path: str, mock_upstream_response: dict[str, Any]) -> None:
+        """A hedged request should return the fast attempt and record the winner."""
+        import hedging
+        import main
+        import trace_store
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        calls: list[int] = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(5)
+            return httpx.Response(200, content=json.dumps(mock_upstream_response).encode("utf-8"))
+
+        hedger = Hedger(budget_pct=100, min_samples=20)
+        _warm(hedger, "openai|gpt-4o-mini")
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(main, "hedger", hedger), patch.object(
+            upstream_pool, "_build_client", lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        ):
+            with TestClient(main.app) as client:
+                started = time.monotonic()
+                response = client.post(
+                    "/v1/chat/completions",
+                    json={
+                        "model": "openai:gpt-4o-mini",
+                        "messages": [{"role": "user", "content": "hi"}],
+                        "cognos": {"hedge": True},
+                    },
+                    headers={"authorization": "Bearer upstream-key"},
+                )
+                elapsed = time.monotonic() - started
+
+        assert response.status_code == 200
+        assert elapsed < 2.0
+        assert len(calls) == 2
+        hedge = get_trace(response.headers["X-Cognos-Trace-Id"])["metadata"]["hedge"]
+        assert hedge["winner"] == 2
+        assert hedge["percentile"] == hedging.HEDGE_PERCENTILE
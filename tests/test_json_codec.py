@@ -0,0 +1,96 @@
+"""Unit tests for json_codec module."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+import json_codec
+from json_codec import StdlibCodec, load_codec
+
+CANONICAL_CASES: list[Any] = [
+    {"trace_id": "tr_x", "policy": "default_v1", "decision": "PASS", "risk": 0.12, "signals": {"ue": 0.0, "ua": 0.25}},
+    {"small": 1e-05, "tiny": 9.41036901028274e-05, "big": 1e16, "huge": 1.2345678901234568e17},
+    {"text": "héllo ✓", "del": "\x7f", "control": "\x00\n\t\x1f", "quote": '"\\/'},
+    {"b": [1, 2.5, True, False, None], "a": {"z": -0.0, "y": 1.0}},
+    {"nan": float("nan"), "inf": float("inf")},
+    {"bigint": 2**80, "negative": -(2**70)},
+    {"literal": "null 1e5 0.00001"},
+    [],
+    {},
+]
+
+
+def _available_codecs() -> list[StdlibCodec]:
+    codecs: list[StdlibCodec] = []
+    for name in ("stdlib", "orjson", "msgspec"):
+        codec = load_codec(name)
+        if codec.name == name:
+            codecs.append(codec)
+    return codecs
+
+
+@pytest.fixture(params=_available_codecs(), ids=lambda codec: codec.name)
+def codec(request: pytest.FixtureRequest) -> StdlibCodec:
+    return request.param
+
+
+class TestCodecs:
+    """Tests that every installed codec matches the stdlib contract."""
+
+    @pytest.mark.parametrize("value", CANONICAL_CASES)
+    def test_canonical_is_byte_identical(self, codec: StdlibCodec, value: Any) -> None:
+        """Canonical output must match json.dumps(sort_keys=True, compact) exactly."""
+        expected = json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+        assert codec.dumps_canonical(value) == expected
+
+    def test_dumps_round_trips(self, codec: StdlibCodec) -> None:
+        """Compact output should keep non-ASCII text and decode back to the same value."""
+        value = {"text": "héllo", "items": [1, 2.5, None], "nested": {"a": True}}
+
+        encoded = codec.dumps(value)
+
+        assert "héllo".encode("utf-8") in encoded
+        assert codec.loads(encoded) == value
+        assert codec.loads(codec.dumps_text(value)) == value
+
+    def test_falls_back_for_values_fast_codecs_reject(self, codec: StdlibCodec) -> None:
+        """Non-str keys, >64-bit ints and NaN should encode and decode like the stdlib."""
+        assert codec.dumps({1: 2**80}) == b'{"1":1208925819614629174706176}'
+        assert codec.loads(b'{"n": 18446744073709551615}') == {"n": 2**64 - 1}
+        assert codec.loads(b'{"n": NaN}')["n"] != codec.loads(b'{"n": NaN}')["n"]
+
+    def test_invalid_json_raises_value_error(self, codec: StdlibCodec) -> None:
+        """Malformed input should raise ValueError like json.loads."""
+        with pytest.raises(ValueError):
+            codec.loads(b'{"a": ')
+
+
+class TestLoadCodec:
+    """Tests for codec selection."""
+
+    def test_unknown_codec_rejected(self) -> None:
+        """Unknown codec names should fail loudly."""
+        with pytest.raises(ValueError, match="Unknown JSON codec"):
+            load_codec("yaml")
+
+    def test_missing_codec_falls_back_to_stdlib(self) -> None:
+        """Selecting a codec that is not installed should fall back to the stdlib."""
+        with patch.dict("sys.modules", {"msgspec": None}):
+            assert load_codec("msgspec").name == "stdlib"
+
+    def test_attestation_hash_independent_of_codec(self, codec: StdlibCodec) -> None:
+        """Envelope attestation hashes should not change with the active codec."""
+        import main
+
+        with patch.object(json_codec, "codec", codec):
+            envelope = main._build_cognos_envelope(trace_id="tr_x", policy="default_v1", decision="PASS", risk=1e-05)
+
+        attestation_payload = {key: envelope[key] for key in ("trace_id", "policy", "decision", "risk", "signals")}
+        canonical = json.dumps(attestation_payload, sort_keys=True, separators=(",", ":"))
+        assert envelope["attestation"]["hash"] == f"sha256:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
@@ -0,0 +1,158 @@
+"""Unit tests for ood_detector module."""
+
+from __future__ import annotations
+
+import random
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from ood_detector import GLOBAL_KEY, OODDetector, hashed_ngram_ood, vectorize
+from signals import DEFAULT_WEIGHTS, SignalEngine, SignalInput
+
+_TOPICS = ("database", "checkout", "login", "payment", "search", "invoice", "shipping", "refund")
+_SYMPTOMS = ("is slow", "returns errors", "times out", "fails for some users", "shows stale data")
+OUTLIERS = (
+    "def quicksort(arr):\n    return sorted(arr)  # TODO implement the partition step",
+    "Écris un poème sur la mer et le vent du nord, s'il te plaît.",
+    "aGVsbG8gd29ybGQgdGhpcyBpcyBiYXNlNjQgZW5jb2RlZCB0ZXh0",
+)
+
+
+def _ticket(rng: random.Random) -> str:
+    return (
+        f"Summarize ticket {rng.randint(1, 9999)}: the {rng.choice(_TOPICS)} service {rng.choice(_SYMPTOMS)} "
+        "since the last deploy. Include likely causes and next steps."
+    )
+
+
+def _warm(detector: OODDetector, key: str, count: int, seed: int = 0) -> random.Random:
+    rng = random.Random(seed)
+    for _ in range(count):
+        detector.assess(_ticket(rng), key)
+    return rng
+
+
+class TestVectorize:
+    """Tests for hashed character n-gram vectors."""
+
+    def test_unit_length_and_normalization(self) -> None:
+        """Vectors should be unit length and ignore case, spacing and digit values."""
+        vector = vectorize("Ticket 123  is   SLOW", dim=256)
+
+        assert vector.shape == (256,)
+        assert np.linalg.norm(vector) == pytest.approx(1.0)
+        assert np.array_equal(vector, vectorize("ticket 987 is slow", dim=256))
+        assert not np.any(vectorize("", dim=256, ngram=3))
+
+    def test_invalid_shapes_rejected(self) -> None:
+        """Widths must be powers of two and n-grams must pack into 32 bits."""
+        with pytest.raises(ValueError):
+            OODDetector(dim=1000)
+        with pytest.raises(ValueError):
+            OODDetector(ngram=5)
+
+
+class TestOODDetector:
+    """Tests for scoring against incrementally maintained references."""
+
+    def test_cold_reference_returns_none(self) -> None:
+        """Nothing is scored until a reference has min_samples prompts."""
+        detector = OODDetector(min_samples=10)
+        _warm(detector, "gpt-4o-mini", 9)
+
+        assert detector.assess(OUTLIERS[0], "gpt-4o-mini") is None
+        assert detector.stats()["cold"] == 10
+
+    def test_outliers_score_high_and_familiar_prompts_low(self) -> None:
+        """Prompts like the reference should score near 0; unrelated ones near 1."""
+        detector = OODDetector(min_samples=50)
+        rng = _warm(detector, "gpt-4o-mini", 300)
+
+        familiar = [detector.score(detector.vectorize(_ticket(rng)), "gpt-4o-mini") for _ in range(100)]
+        outliers = [detector.score(detector.vectorize(text), "gpt-4o-mini") for text in OUTLIERS]
+
+        assert sum(familiar) / len(familiar) < 0.05
+        assert min(outliers) > 0.9
+
+    def test_cold_model_falls_back_to_global_reference(self) -> None:
+        """A model with too few prompts of its own should be scored against all traffic."""
+        detector = OODDetector(min_samples=50)
+        rng = _warm(detector, "gpt-4o-mini", 100)
+        detector.observe(detector.vectorize(_ticket(rng)), "new-model")
+
+        assert detector.score(detector.vectorize(OUTLIERS[1]), "new-model") > 0.9
+        assert detector.stats()["references"]["new-model"] == {
+            "count": 1,
+            "warm": False,
+            "distance_mean": 0.0,
+            "distance_std": 0.0,
+        }
+
+    def test_reference_limit_keeps_updating_global(self) -> None:
+        """Past max_references new models only feed the global reference."""
+        detector = OODDetector(max_references=2)
+        detector.assess("first prompt", "model-a")
+        detector.assess("second prompt", "model-b")
+
+        assert set(detector.stats()["references"]) == {GLOBAL_KEY, "model-a"}
+        assert detector.stats()["references"][GLOBAL_KEY]["count"] == 2
+
+
+class TestSnapshots:
+    """Tests for persisting reference statistics."""
+
+    def test_snapshot_round_trip(self, tmp_path: Path) -> None:
+        """A fresh detector loading a snapshot should score exactly like the original."""
+        detector = OODDetector(min_samples=20)
+        rng = _warm(detector, "gpt-4o-mini", 50)
+        path = detector.snapshot(tmp_path / "ood_reference.npz")
+        restored = OODDetector(min_samples=20)
+
+        assert restored.load(path) == 2
+        for text in (_ticket(rng), *OUTLIERS):
+            vector = detector.vectorize(text)
+            assert restored.score(vector, "gpt-4o-mini") == pytest.approx(detector.score(vector, "gpt-4o-mini"))
+
+    def test_mismatched_or_missing_snapshot_loads_nothing(self, tmp_path: Path) -> None:
+        """Snapshots built with another vector width are ignored."""
+        detector = OODDetector(dim=256)
+        detector.assess("prompt", "gpt-4o-mini")
+        path = detector.snapshot(tmp_path / "ood_reference.npz")
+
+        assert OODDetector(dim=512).load(path) == 0
+        assert OODDetector(dim=256).load(tmp_path / "missing.npz") == 0
+
+    async def test_stop_writes_dirty_snapshot(self, tmp_path: Path) -> None:
+        """Shutdown should persist references updated since the last snapshot."""
+        import ood_detector
+
+        path = tmp_path / "ood_reference.npz"
+        detector = OODDetector()
+        detector.start(interval_seconds=3600)
+        detector.assess("prompt", "gpt-4o-mini")
+        with patch.object(ood_detector, "OOD_SNAPSHOT", str(path)):
+            await detector.stop()
+
+        assert path.exists()
+        assert detector.stats()["snapshots"] == 1
+
+
+class TestOODExtractor:
+    """Tests for the registered out_of_distribution extractor."""
+
+    def test_extractor_feeds_signal_engine(self) -> None:
+        """The extractor should run inline and report the out_of_distribution signal."""
+        import ood_detector
+
+        detector = OODDetector(min_samples=20)
+        _warm(detector, "gpt-4o-mini", 50)
+        with patch.object(ood_detector, "ood_detector", detector):
+            report = SignalEngine(budget_ms=1000, weights=DEFAULT_WEIGHTS).evaluate(SignalInput(OUTLIERS[0], "", "gpt-4o-mini"))
+            empty = hashed_ngram_ood(SignalInput("  ", "", "gpt-4o-mini"))
+
+        assert "hashed_ngram_ood" in report.timings
+        assert report.signals["out_of_distribution"] > 0.9
+        assert empty is None
@@ -2,9 +2,17 @@
 
 from __future__ import annotations
 
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
 import pytest
+from fastapi.testclient import TestClient
 
-from policy import resolve_decision
+import policy
+from policy import PolicyConfigError, UnknownPolicyError, compile_policies, resolve_decision
+from signals import DEFAULT_WEIGHTS, aggregate_risk
 
 
 class TestResolveDecisionMonitorMode:
@@ -117,3 +125,130 @@ class TestEdgeCases:
         decision, risk = resolve_decision("unknown_mode", target_risk=0.5)
         # Falls through to enforce logic since it's not "monitor"
         assert decision == "PASS"
+
+
+STRICT = {
+    "policies": {
+        "strict_v1": {
+            "base_risk": 0.15,
+            "target_risk": 0.3,
+            "weights": {"ue": 0.8},
+            "bands": {"refine": 0.1, "escalate": 0.25},
+            "models": {"gpt-4o-mini": {"target_risk": 0.1, "weights": {"contradiction": 0.0}}},
+        }
+    }
+}
+
+
+class TestCompilePolicies:
+    """Tests for compiling the policy registry."""
+
+    def test_builtin_default_matches_legacy_ladder(self) -> None:
+        """default_v1 should reproduce resolve_decision and aggregate_risk exactly."""
+        compiled = compile_policies().get("default_v1")
+        signals = {"ue": 0.4, "contradiction": 0.3, "citation_density": 1.0}
+
+        risk = compiled.risk(signals)
+
+        assert risk == aggregate_risk(signals, DEFAULT_WEIGHTS, compiled.base_risk)
+        for target in (None, 0.0, 0.1, 0.3, 0.5, 1.0):
+            assert compiled.evaluate("enforce", signals, target) == resolve_decision("enforce", target, base_risk=risk)
+
+    def test_policy_settings_and_model_overrides(self) -> None:
+        """Declared weights, bands and per-model overrides should layer over their parents."""
+        table = compile_policies(STRICT)
+        strict = table.get("strict_v1")
+        override = table.get("strict_v1", "gpt-4o-mini")
+
+        assert strict.weights["ue"] == 0.8
+        assert strict.weights["contradiction"] == DEFAULT_WEIGHTS["contradiction"]
+        assert strict.cutoffs(None) == pytest.approx((0.3, 0.4, 0.55))
+        assert strict.decide("enforce", 0.35) == "REFINE"
+        assert strict.decide("enforce", 0.5) == "ESCALATE"
+        assert strict.decide("enforce", 0.6) == "BLOCK"
+        assert strict.decide("monitor", 0.9) == "PASS"
+        assert override.target_risk == 0.1
+        assert override.weights["ue"] == 0.8
+        assert override.weights["contradiction"] == 0.0
+        assert table.get("strict_v1", "other-model") is strict
+        assert strict.evaluate("enforce", {}) == ("PASS", 0.15)
+
+    def test_unknown_policy_rejected(self) -> None:
+        """Looking up an undeclared policy_id should fail and list the known ids."""
+        with pytest.raises(UnknownPolicyError, match="default_v1, strict_v1"):
+            compile_policies(STRICT).get("strict_v2")
+
+    @pytest.mark.parametrize(
+        "config",
+        [
+            {"policies": []},
+            {"policies": {"p": {"weights": {"vibes": 1.0}}}},
+            {"policies": {"p": {"target_risk": 1.5}}},
+            {"policies": {"p": {"bands": {"refine": 0.5, "escalate": 0.2}}}},
+            {"policies": {"p": {"models": {"m": "strict"}}}},
+        ],
+    )
+    def test_invalid_configs_rejected(self, config: dict) -> None:
+        """Malformed policies should fail compilation with a config error."""
+        with pytest.raises(PolicyConfigError):
+            compile_policies(config)
+
+
+class TestPolicyReload:
+    """Tests for hot reloading the policy registry."""
+
+    def test_reload_swaps_and_keeps_table_on_error(self, tmp_path: Path) -> None:
+        """A valid file should replace the table; a broken one should keep it."""
+        config_path = tmp_path / "policies.json"
+        config_path.write_text(json.dumps(STRICT))
+        before = policy.current()
+
+        with patch.object(policy, "_table", before):
+            table = policy.reload(str(config_path))
+            assert policy.current() is table
+            assert table.version == before.version + 1
+            assert policy.get("strict_v1").target_risk == 0.3
+
+            config_path.write_text("{not json")
+            with pytest.raises(PolicyConfigError):
+                policy.reload(str(config_path))
+            assert policy.current() is table
+
+    def test_gateway_rejects_unknown_policy_and_applies_declared_one(self, tmp_path: Path, tmp_db_path: str) -> None:
+        """Requests should be decided by their policy, and unknown ids rejected before any work."""
+        import main
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        config_path = tmp_path / "policies.json"
+        config_path.write_text(json.dumps(STRICT))
+        headers = {"authorization": "Bearer upstream-key"}
+
+        def post(client: TestClient, policy_id: str) -> httpx.Response:
+            return client.post(
+                "/v1/chat/completions",
+                json={
+                    "model": "gpt-4o-mini",
+                    "messages": [{"role": "user", "content": "Hello"}],
+                    "cognos": {"mode": "enforce", "policy_id": policy_id},
+                },
+                headers=headers,
+            )
+
+        with patch.object(policy, "_table", policy.current()), patch.object(
+            policy, "POLICIES_FILE", str(config_path)
+        ), patch.object(main, "MOCK_UPSTREAM", True), patch.object(main, "GATEWAY_API_KEY", ""):
+            with TestClient(main.app) as client:
+                rejected = post(client, "strict_v1")
+                reloaded = client.post("/internal/policies/reload")
+                strict = post(client, "strict_v1")
+                default = post(client, "default_v1")
+                described = client.get("/internal/policies").json()
+
+        assert rejected.status_code == 400
+        assert "Unknown policy_id 'strict_v1'" in rejected.json()["detail"]
+        assert reloaded.status_code == 200
+        assert strict.headers["X-Cognos-Policy"] == "strict_v1"
+        assert strict.headers["X-Cognos-Decision"] == "REFINE"
+        assert default.headers["X-Cognos-Decision"] == "PASS"
+        assert described["policies"]["strict_v1"]["models"]["gpt-4o-mini"]["target_risk"] == 0.1
@@ -0,0 +1,167 @@
+"""Unit tests for policy_replay module."""
+
+from __future__ import annotations
+
+import random
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import policy
+import trace_store
+from policy import DECISIONS, UnknownPolicyError, compile_policies
+from policy_replay import replay
+from signals import SIGNAL_NAMES
+
+CANDIDATES = {
+    "policies": {
+        "strict_v1": {
+            "target_risk": 0.2,
+            "bands": {"refine": 0.1, "escalate": 0.2},
+            "models": {"model-b": {"target_risk": 0.1}},
+        },
+        "lenient_v1": {"target_risk": 0.9},
+    }
+}
+
+
+def _records(count: int, seed: int = 3) -> list[dict[str, Any]]:
+    """Traces decided by default_v1 in enforce mode, as the gateway would record them."""
+    rng = random.Random(seed)
+    default = policy.builtin_policy()
+    records = []
+    for index in range(count):
+        model = ("model-a", "model-b")[index % 2]
+        signals = {name: round(rng.random() * 0.6, 4) for name in SIGNAL_NAMES}
+        decision, risk = default.evaluate("enforce", signals)
+        trace_id = f"tr_replay_{index:05d}"
+        records.append(
+            {
+                "trace_id": trace_id,
+                "created_at": f"2026-03-01T12:{index // 60 % 60:02d}:{index % 60:02d}+00:00",
+                "decision": decision,
+                "policy": "default_v1",
+                "trust_score": round(1 - risk, 6),
+                "risk": risk,
+                "is_stream": False,
+                "status_code": 200,
+                "model": model,
+                "request_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 1},
+                "response_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 1},
+                "envelope": {"decision": decision, "risk": risk, "signals": signals, "trace_id": trace_id},
+                "metadata": {},
+            }
+        )
+    return records
+
+
+@pytest.fixture
+def replay_db(tmp_db_path: str) -> list[dict[str, Any]]:
+    trace_store.DEFAULT_DB_PATH = tmp_db_path
+    trace_store.init_db()
+    records = _records(240)
+    trace_store.save_traces(records)
+    return records
+
+
+def _expected(records: list[dict[str, Any]], table: policy.PolicyTable, policy_id: str) -> dict[str, dict[str, int]]:
+    counts = {recorded: dict.fromkeys(DECISIONS, 0) for recorded in DECISIONS}
+    for record in records:
+        replayed, _ = table.get(policy_id, record["model"]).evaluate("enforce", record["envelope"]["signals"])
+        counts[record["decision"]][replayed] += 1
+    return counts
+
+
+class TestReplay:
+    """Tests for bulk re-decisions over the trace store."""
+
+    def test_matches_per_trace_evaluation_across_chunks(self, replay_db: list[dict[str, Any]]) -> None:
+        """Chunked vectorized replay should agree with CompiledPolicy.evaluate on every trace."""
+        table = compile_policies(CANDIDATES)
+
+        result = replay(table, ["default_v1", "strict_v1", "lenient_v1"], chunk_rows=7)
+        default, strict, lenient = result["candidates"]
+
+        assert result["traces"] == 240
+        assert result["chunks"] == 35
+        assert default["changed"] == 0
+        assert default["mean_risk"]["replayed"] == pytest.approx(default["mean_risk"]["recorded"], abs=1e-6)
+        assert strict["confusion"] == _expected(replay_db, table, "strict_v1")
+        assert lenient["confusion"] == _expected(replay_db, table, "lenient_v1")
+        assert strict["decision_mix"]["replayed"]["PASS"] < default["decision_mix"]["replayed"]["PASS"]
+
+    def test_breakdowns_use_model_overrides(self, replay_db: list[dict[str, Any]]) -> None:
+        """Per-model matrices should reflect each model's override and sum to the total."""
+        table = compile_policies(CANDIDATES)
+        model_b = [record for record in replay_db if record["model"] == "model-b"]
+
+        strict = replay(table, ["strict_v1"])["candidates"][0]
+
+        assert strict["by_model"]["model-b"]["confusion"] == _expected(model_b, table, "strict_v1")
+        assert sum(group["traces"] for group in strict["by_model"].values()) == 240
+        assert strict["by_policy"]["default_v1"]["traces"] == 240
+
+    def test_filters_and_monitor_mode(self, replay_db: list[dict[str, Any]]) -> None:
+        """Range and model filters narrow the replay; monitor mode passes everything."""
+        table = compile_policies(CANDIDATES)
+        created_from_ms = trace_store._timestamp_ms("2026-03-01T12:01:00+00:00")
+
+        result = replay(table, ["strict_v1"], created_from_ms=created_from_ms, model="model-a", mode="monitor")
+
+        assert result["traces"] == 90
+        assert result["candidates"][0]["decision_mix"]["replayed"] == {"PASS": 90, "REFINE": 0, "ESCALATE": 0, "BLOCK": 0}
+
+    def test_error_traces_are_skipped(self, replay_db: list[dict[str, Any]]) -> None:
+        """Shed, deadline and upstream-error traces carry no signals and must not be re-decided."""
+        table = compile_policies(CANDIDATES)
+        signals = dict.fromkeys(SIGNAL_NAMES, 0.0)
+        errors = [
+            {
+                **replay_db[0],
+                "trace_id": f"tr_replay_error_{status}",
+                "decision": "ESCALATE",
+                "risk": 1.0,
+                "trust_score": 0.0,
+                "status_code": status,
+                "envelope": {"decision": "ESCALATE", "risk": 1.0, "signals": signals, "trace_id": f"tr_replay_error_{status}"},
+            }
+            for status in (502, 503, 504)
+        ]
+        trace_store.save_traces(errors)
+
+        result = replay(table, ["strict_v1"])
+
+        assert result["traces"] == 240
+        assert result["skipped"] == result["errors"] == 3
+        assert result["candidates"][0]["confusion"] == _expected(replay_db, table, "strict_v1")
+
+    def test_unknown_candidate_raises(self, replay_db: list[dict[str, Any]]) -> None:
+        """Unknown policy ids should fail before any rows are read."""
+        with pytest.raises(UnknownPolicyError):
+            replay(compile_policies(), ["strict_v1"])
+
+
+class TestReplayEndpoint:
+    """Tests for POST /internal/policies/replay."""
+
+    def test_replay_candidate_config(self, replay_db: list[dict[str, Any]]) -> None:
+        """An unsaved candidate config should be replayed; bad configs and ids rejected."""
+        import main
+
+        with patch.object(main, "GATEWAY_API_KEY", ""):
+            client = TestClient(main.app)
+            response = client.post("/internal/policies/replay", json={"policy_ids": ["strict_v1"], "policies": CANDIDATES})
+            unknown = client.post("/internal/policies/replay", json={"policy_ids": ["strict_v1"]})
+            invalid = client.post(
+                "/internal/policies/replay",
+                json={"policy_ids": ["strict_v1"], "policies": {"policies": {"strict_v1": {"target_risk": 2}}}},
+            )
+
+        assert response.status_code == 200
+        candidate = response.json()["candidates"][0]
+        assert candidate["confusion"] == _expected(replay_db, compile_policies(CANDIDATES), "strict_v1")
+        assert unknown.status_code == 400
+        assert "Unknown policy_id 'strict_v1'" in unknown.json()["detail"]
+        assert invalid.status_code == 400
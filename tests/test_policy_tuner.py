@@ -0,0 +1,238 @@
+"""Unit tests for policy_tuner module."""
+
+from __future__ import annotations
+
+import random
+from typing import Any
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import policy
+import trace_store
+from policy import DECISIONS, compile_policies
+from policy_tuner import RiskHistogram, ThresholdTuner, parse_mix
+
+START_MS = 1_772_193_600_000
+
+
+def _record(index: int, risk: float, model: str = "model-a", policy_id: str = "default_v1") -> dict[str, Any]:
+    trace_id = f"tr_tune_{index:06d}"
+    return {
+        "trace_id": trace_id,
+        "created_at": "2026-02-27T12:00:00+00:00",
+        "created_ms": START_MS + index * 60_000,
+        "decision": "PASS",
+        "policy": policy_id,
+        "trust_score": round(1 - risk, 6),
+        "risk": risk,
+        "is_stream": False,
+        "status_code": 200,
+        "model": model,
+        "request_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 1},
+        "response_fingerprint": {"simhash": "sha256:0", "embedding_hash": "sha256:0", "length": 1},
+        "envelope": {"decision": "PASS", "risk": risk, "trace_id": trace_id},
+        "metadata": {},
+    }
+
+
+def _risks(count: int, seed: int = 5) -> list[float]:
+    rng = random.Random(seed)
+    return [round(rng.betavariate(2, 5), 6) for _ in range(count)]
+
+
+@pytest.fixture
+def tuner_db(tmp_db_path: str) -> None:
+    trace_store.DEFAULT_DB_PATH = tmp_db_path
+    trace_store.init_db()
+
+
+def _tuner(**overrides: Any) -> ThresholdTuner:
+    settings = {"window_hours": 2, "min_traces": 50, "min_gain": 0.01}
+    return ThresholdTuner(**{**settings, **overrides})
+
+
+class TestRiskHistogram:
+    """Tests for the sorted risk / cumulative count state."""
+
+    def test_counts_match_brute_force_after_add_and_evict(self) -> None:
+        """count_at_most should agree with a scan over the live multiset."""
+        risks = np.array(_risks(2000))
+        histogram = RiskHistogram()
+        histogram.update(risks[:1500])
+        histogram.update(risks[1500:])
+        histogram.update(risks[:700], sign=-1)
+        live = risks[700:]
+        thresholds = np.array([0.0, 0.1, 0.25, 0.5, float(live[3]), 1.0])
+
+        assert histogram.total == live.size
+        assert histogram.count_at_most(thresholds).tolist() == [int((live <= t).sum()) for t in thresholds]
+        histogram.update(live, sign=-1)
+        assert histogram.total == 0 and histogram.values.size == 0
+        with pytest.raises(ValueError):
+            histogram.update(risks[:1], sign=-1)
+
+    def test_decision_counts_match_compiled_policy(self) -> None:
+        """Counts under a policy's cutoffs should equal deciding each risk with CompiledPolicy."""
+        risks = _risks(1000) + [0.5, 0.7, 0.9]
+        compiled = policy.builtin_policy()
+        histogram = RiskHistogram()
+        histogram.update(np.array(risks))
+        expected = [sum(compiled.decide("enforce", risk) == decision for risk in risks) for decision in DECISIONS]
+
+        assert histogram.decision_counts(compiled.cutoffs(0.3)).tolist() != expected
+        assert histogram.decision_counts(compiled.cutoffs(None)).tolist() == expected
+
+    def test_parse_mix(self) -> None:
+        """Mixes are normalized; unknown decisions and empty mixes are rejected."""
+        assert parse_mix("pass=3,BLOCK=1").tolist() == [0.75, 0.0, 0.0, 0.25]
+        with pytest.raises(ValueError):
+            parse_mix("ALLOW=1")
+        with pytest.raises(ValueError):
+            parse_mix("PASS=0")
+
+
+class TestThresholdTuner:
+    """Tests for the incremental window and ranked suggestions."""
+
+    def test_incremental_refresh_matches_full_load(self, tuner_db: None) -> None:
+        """Sliding the window should add and evict exactly what a fresh load would see."""
+        records = [_record(i, risk, model=("model-a", "model-b")[i % 2]) for i, risk in enumerate(_risks(400))]
+        trace_store.save_traces(records[:300])
+        tuner = _tuner()
+        tuner.refresh(now_ms=START_MS + 300 * 60_000)
+        trace_store.save_traces(records[300:])
+        stats = tuner.refresh(now_ms=START_MS + 400 * 60_000)
+        fresh = _tuner()
+        fresh.refresh(now_ms=START_MS + 400 * 60_000)
+
+        assert stats["full_loads"] == 1
+        assert stats["added"] == 220
+        assert stats["evicted"] == 100
+        assert stats["traces"] == fresh.stats()["traces"] == 120
+        for model in ("model-a", "model-b"):
+            incremental, full = tuner.histogram("default_v1", model), fresh.histogram("default_v1", model)
+            assert incremental.values.tolist() == full.values.tolist()
+            assert incremental.cumulative.tolist() == full.cumulative.tolist()
+
+    def test_late_persisted_traces_are_added_then_evicted(self, tuner_db: None) -> None:
+        """A trace inserted after refresh with an old created_ms should still be counted, and evicted once."""
+        records = [_record(i, risk) for i, risk in enumerate(_risks(300))]
+        trace_store.save_traces(records[:200])
+        tuner = _tuner()
+        tuner.refresh(now_ms=START_MS + 200 * 60_000)
+        trace_store.save_traces([{**records[150], "trace_id": "tr_tune_late"}])
+        stats = tuner.refresh(now_ms=START_MS + 201 * 60_000)
+
+        assert stats["added"] == 121
+        assert stats["traces"] == 120
+
+        trace_store.save_traces(records[200:])
+        stats = tuner.refresh(now_ms=START_MS + 300 * 60_000)
+        fresh = _tuner()
+        fresh.refresh(now_ms=START_MS + 300 * 60_000)
+
+        assert stats["full_loads"] == 1 and stats["resyncs"] == 0
+        assert stats["traces"] == fresh.stats()["traces"] == 120
+        assert tuner.histogram("default_v1", "model-a").cumulative.tolist() == fresh.histogram("default_v1", "model-a").cumulative.tolist()
+
+    def test_rewritten_risk_forces_a_reload(self, tuner_db: None) -> None:
+        """Rewriting a counted trace's risk should reload the window rather than evict the old value."""
+        records = [_record(i, round(0.1 + 0.1 * (i % 3), 6)) for i in range(300)]
+        trace_store.save_traces(records[:200])
+        tuner = _tuner()
+        tuner.refresh(now_ms=START_MS + 200 * 60_000)
+        # Same values again (a stream trace's second upsert) are not a rewrite.
+        trace_store.save_traces(records[150:160])
+        assert tuner.refresh(now_ms=START_MS + 200 * 60_000)["resyncs"] == 0
+
+        # tr_tune_000090 moves from 0.1 to 0.2, both values the histogram already holds.
+        trace_store.save_traces([{**records[90], "risk": 0.2}])
+        trace_store.save_traces(records[200:])
+        stats = tuner.refresh(now_ms=START_MS + 300 * 60_000)
+        fresh = _tuner()
+        fresh.refresh(now_ms=START_MS + 300 * 60_000)
+
+        assert stats["resyncs"] == 1
+        assert stats["full_loads"] == 2
+        assert tuner.histogram("default_v1", "model-a").values.tolist() == fresh.histogram("default_v1", "model-a").values.tolist()
+        assert tuner.histogram("default_v1", "model-a").cumulative.tolist() == fresh.histogram("default_v1", "model-a").cumulative.tolist()
+
+    def test_error_traces_are_not_counted(self, tuner_db: None) -> None:
+        """Shed, deadline and upstream-error traces should stay out of the histograms."""
+        records = [_record(i, risk) for i, risk in enumerate(_risks(100))]
+        errors = [{**_record(100 + i, 1.0), "status_code": status} for i, status in enumerate((429, 502, 503, 504))]
+        trace_store.save_traces(records + errors)
+        tuner = _tuner(window_hours=24)
+
+        stats = tuner.refresh(now_ms=START_MS + 200 * 60_000)
+
+        assert stats["traces"] == stats["added"] == 100
+        assert tuner.histogram("default_v1", "model-a").values.max() < 1.0
+
+    def test_suggested_patch_predicts_compiled_mix(self, tuner_db: None) -> None:
+        """Applying a suggested patch should yield exactly the predicted decision mix."""
+        risks = _risks(400)
+        trace_store.save_traces([_record(i, risk) for i, risk in enumerate(risks)])
+        tuner = _tuner(window_hours=24, target_mix="PASS=0.7,REFINE=0.2,ESCALATE=0.07,BLOCK=0.03")
+        tuner.refresh(now_ms=START_MS + 400 * 60_000)
+
+        suggestions = tuner.suggest(compile_policies())
+        best = suggestions[0]
+        patched = compile_policies(best["patch"]).get("default_v1", "model-a")
+        counts = [sum(patched.decide("enforce", risk) == decision for risk in risks) for decision in DECISIONS]
+
+        assert best["current"]["mix"]["PASS"] > 0.85
+        assert best["suggested"]["mix"] == {decision: round(count / 400, 4) for decision, count in zip(DECISIONS, counts)}
+        assert best["suggested"]["distance"] < 0.05
+        assert best["gain"] >= max(item["gain"] for item in suggestions)
+        assert {item["model"] for item in suggestions} == {None, "model-a"}
+
+    def test_policy_level_excludes_overridden_models(self, tuner_db: None) -> None:
+        """Models with their own override should only get model-level suggestions."""
+        records = [_record(i, risk, model=("model-a", "model-b")[i % 2]) for i, risk in enumerate(_risks(400))]
+        trace_store.save_traces(records)
+        table = compile_policies({"policies": {"default_v1": {"models": {"model-b": {"target_risk": 0.2}}}}})
+        tuner = _tuner(window_hours=24, min_gain=0.0)
+        tuner.refresh(now_ms=START_MS + 400 * 60_000)
+
+        suggestions = tuner.suggest(table)
+        policy_level = [item for item in suggestions if item["model"] is None]
+
+        assert policy_level and all(item["traces"] == 200 for item in policy_level)
+        model_b = [item for item in suggestions if item["model"] == "model-b"]
+        assert model_b and model_b[0]["current"]["target_risk"] == 0.2
+        assert model_b[0]["patch"]["policies"]["default_v1"]["models"]["model-b"]["target_risk"] == model_b[0]["suggested"]["target_risk"]
+
+    def test_small_groups_and_unknown_policies_skipped(self, tuner_db: None) -> None:
+        """Groups below min_traces or for policies no longer loaded produce nothing."""
+        trace_store.save_traces([_record(i, 0.9, policy_id="retired_v1") for i in range(100)])
+        trace_store.save_traces([_record(100 + i, 0.9) for i in range(10)])
+        tuner = _tuner(window_hours=24)
+        tuner.refresh(now_ms=START_MS + 200 * 60_000)
+
+        assert tuner.suggest(compile_policies()) == []
+
+
+class TestSuggestionsEndpoint:
+    """Tests for GET /internal/policies/suggestions."""
+
+    def test_refresh_and_rank(self, tuner_db: None) -> None:
+        """The endpoint should refresh on request and reject malformed target mixes."""
+        import main
+
+        trace_store.save_traces([_record(i, risk) for i, risk in enumerate(_risks(300))])
+        tuner = _tuner(window_hours=24 * 365 * 10)
+        with patch.object(main, "GATEWAY_API_KEY", ""), patch.object(main, "policy_tuner", tuner):
+            client = TestClient(main.app)
+            response = client.get("/internal/policies/suggestions", params={"refresh": "true", "limit": 2})
+            invalid = client.get("/internal/policies/suggestions", params={"target_mix": "ALLOW=1"})
+
+        payload = response.json()
+        assert response.status_code == 200
+        assert payload["window"]["traces"] == 300
+        assert len(payload["suggestions"]) == 2
+        assert payload["target_mix"]["PASS"] == 0.85
+        assert invalid.status_code == 400
@@ -0,0 +1,192 @@
+"""Unit tests for provider_routes module."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import provider_routes
+from provider_routes import RoutingConfigError, compile_table
+
+OPENROUTER = "https://openrouter.ai/api/v1"
+
+
+class TestCompileTable:
+    """Tests for routing table compilation and lookup."""
+
+    def test_openrouter_rewrites_match_vendor_namespaces(self) -> None:
+        """Providers sharing an OpenRouter upstream should get vendor-prefixed model names."""
+        table = compile_table(
+            environ={
+                "COGNOS_UPSTREAM_BASE_URL": OPENROUTER,
+                "COGNOS_UPSTREAM_API_KEY": "sk-or",
+                "COGNOS_INSTANCE_OPENAI_BASE_URL": "",
+            }
+        )
+
+        assert table.resolve("openai:gpt-4o-mini")["model"] == "openai/gpt-4o-mini"
+        assert table.resolve("google:gemini-1.5-pro")["model"] == "google/gemini-1.5-pro"
+        assert table.resolve("claude:claude-3-5-sonnet")["model"] == "anthropic/claude-3-5-sonnet"
+        assert table.resolve("Anthropic: claude-3-5-sonnet")["model"] == "anthropic/claude-3-5-sonnet"
+        assert table.resolve("mistral:mistral-large")["model"] == "mistralai/mistral-large"
+        assert table.resolve("ollama:llama3")["model"] == "llama3"
+        assert table.resolve("google:gemini-1.5-pro")["api_key"] == "sk-or"
+
+    def test_openai_prefix_defaults_to_openai_instance(self) -> None:
+        """openai: models should go to api.openai.com with the prefix stripped."""
+        table = compile_table(environ={"COGNOS_UPSTREAM_BASE_URL": OPENROUTER, "COGNOS_UPSTREAM_API_KEY": "sk-or"})
+
+        target = table.resolve("openai:gpt-4o-mini")
+
+        assert target == {
+            "provider": "openai",
+            "base_url": "https://api.openai.com/v1",
+            "endpoints": (("https://api.openai.com/v1", 1),),
+            "api_key": "sk-or",
+            "model": "gpt-4o-mini",
+            "hedge_percentile": None,
+        }
+
+    def test_unknown_and_unprefixed_models_use_default(self) -> None:
+        """Models without a known prefix should pass through unchanged to the default upstream."""
+        table = compile_table(environ={"COGNOS_UPSTREAM_BASE_URL": "http://127.0.0.1:11434/v1"})
+
+        assert table.resolve("llama3")["base_url"] == "http://127.0.0.1:11434/v1"
+        assert table.resolve("llama3")["model"] == "llama3"
+        assert table.resolve("acme:model-x")["model"] == "acme:model-x"
+        assert table.resolve("acme:model-x")["provider"] == "default"
+
+    def test_instance_env_overrides_file(self) -> None:
+        """COGNOS_INSTANCE_* variables should win over the config file."""
+        config = {"providers": {"google": {"base_url": "https://google.example/v1", "api_key": "file-key"}}}
+
+        table = compile_table(config, environ={"COGNOS_INSTANCE_GOOGLE_API_KEY": "env-key"})
+
+        target = table.resolve("google:gemini-1.5-pro")
+        assert target["base_url"] == "https://google.example/v1"
+        assert target["api_key"] == "env-key"
+        assert target["model"] == "gemini-1.5-pro"
+
+    def test_file_providers_and_aliases(self) -> None:
+        """Config files should add providers and precompiled aliases."""
+        config = {
+            "providers": {
+                "groq": {
+                    "prefixes": ["groq"],
+                    "base_url": "https://api.groq.com/openai/v1",
+                    "api_key_env": "GROQ_KEY",
+                    "model_prefix": "",
+                }
+            },
+            "aliases": {"fast": "groq:llama-3.1-8b-instant", "smart": "openai:gpt-4o"},
+        }
+
+        table = compile_table(config, environ={"GROQ_KEY": "gsk"})
+
+        assert table.resolve("fast") == {
+            "provider": "groq",
+            "base_url": "https://api.groq.com/openai/v1",
+            "endpoints": (("https://api.groq.com/openai/v1", 1),),
+            "api_key": "gsk",
+            "model": "llama-3.1-8b-instant",
+            "hedge_percentile": None,
+        }
+        assert table.resolve("smart")["model"] == "gpt-4o"
+        assert table.describe()["aliases"] == {"fast": "groq:llama-3.1-8b-instant", "smart": "openai:gpt-4o"}
+
+    def test_weighted_endpoints(self) -> None:
+        """Providers should accept weighted endpoint lists and comma-separated env URLs."""
+        config = {
+            "providers": {
+                "vllm": {
+                    "endpoints": [{"base_url": "http://vllm-a:8000/v1", "weight": 3}, "http://vllm-b:8000/v1"],
+                }
+            }
+        }
+
+        table = compile_table(config, environ={"COGNOS_INSTANCE_OLLAMA_BASE_URL": "http://gpu-1:11434/v1, http://gpu-2:11434/v1"})
+
+        assert table.resolve("vllm:llama")["endpoints"] == (("http://vllm-a:8000/v1", 3), ("http://vllm-b:8000/v1", 1))
+        assert table.resolve("vllm:llama")["base_url"] == "http://vllm-a:8000/v1"
+        assert table.resolve("ollama:llama3")["endpoints"] == (("http://gpu-1:11434/v1", 1), ("http://gpu-2:11434/v1", 1))
+        with pytest.raises(RoutingConfigError, match="weights"):
+            compile_table({"providers": {"vllm": {"endpoints": [{"base_url": "http://a", "weight": 0}]}}}, environ={})
+
+    def test_hedge_settings(self) -> None:
+        """Routes should accept hedge: true or a per-route percentile."""
+        config = {"providers": {"openai": {"hedge": True}, "google": {"hedge": {"percentile": 0.9}}}}
+
+        table = compile_table(config, environ={})
+
+        assert table.resolve("openai:gpt-4o-mini")["hedge_percentile"] == provider_routes.DEFAULT_HEDGE_PERCENTILE
+        assert table.resolve("google:gemini-1.5-pro")["hedge_percentile"] == 0.9
+        assert table.resolve("mistral:mistral-large")["hedge_percentile"] is None
+        with pytest.raises(RoutingConfigError, match="hedge"):
+            compile_table({"providers": {"openai": {"hedge": {"percentile": 95}}}}, environ={})
+
+    def test_prefix_collision_rejected(self) -> None:
+        """Two providers claiming the same prefix should fail compilation."""
+        config = {"providers": {"bedrock": {"prefixes": ["claude"], "base_url": "https://bedrock.example"}}}
+
+        with pytest.raises(RoutingConfigError, match="claude"):
+            compile_table(config, environ={})
+
+    def test_describe_hides_api_keys(self) -> None:
+        """The admin view should report whether a key is set, never the key."""
+        table = compile_table(environ={"COGNOS_UPSTREAM_API_KEY": "sk-secret"})
+
+        assert "sk-secret" not in json.dumps(table.describe())
+        assert table.describe()["default"]["has_api_key"] is True
+
+
+class TestReload:
+    """Tests for hot reloading the active table."""
+
+    def test_reload_swaps_table(self, tmp_path: Path) -> None:
+        """A reload should compile the file and replace the active table."""
+        config_path = tmp_path / "providers.json"
+        config_path.write_text(json.dumps({"aliases": {"fast": "openai:gpt-4o-mini"}}))
+        before = provider_routes.current()
+
+        with patch.object(provider_routes, "_table", before):
+            table = provider_routes.reload(str(config_path))
+
+            assert provider_routes.current() is table
+            assert table.version == before.version + 1
+            assert provider_routes.resolve("fast")["model"] == "gpt-4o-mini"
+
+    def test_invalid_reload_keeps_current_table(self, tmp_path: Path) -> None:
+        """A broken config should raise and leave the previous table serving."""
+        config_path = tmp_path / "providers.json"
+        config_path.write_text("{not json")
+        before = provider_routes.current()
+
+        with patch.object(provider_routes, "_table", before):
+            with pytest.raises(RoutingConfigError):
+                provider_routes.reload(str(config_path))
+
+            assert provider_routes.current() is before
+
+    def test_reload_endpoint(self, tmp_path: Path) -> None:
+        """The admin endpoint should reload and report errors as 400s."""
+        import main
+
+        config_path = tmp_path / "providers.json"
+        config_path.write_text(json.dumps({"aliases": {"fast": "openai:gpt-4o-mini"}}))
+
+        with patch.object(provider_routes, "_table", provider_routes.current()), patch.object(
+            provider_routes, "PROVIDERS_FILE", str(config_path)
+        ), patch.object(main, "GATEWAY_API_KEY", ""):
+            client = TestClient(main.app)
+            reloaded = client.post("/internal/routes/reload")
+            assert reloaded.status_code == 200
+            assert reloaded.json()["aliases"] == {"fast": "openai:gpt-4o-mini"}
+            assert client.get("/internal/routes").json()["version"] == reloaded.json()["version"]
+
+            config_path.write_text("[]")
+            assert client.post("/internal/routes/reload").status_code == 400
+            assert client.get("/internal/routes").json()["aliases"] == {"fast": "openai:gpt-4o-mini"}
@@ -158,9 +158,26 @@ class TestBuildTrustReport:
             trace_store.DEFAULT_DB_PATH = tmp_db_path
             init_db()
 
-            trace_record["envelope"]["decision"] = "UNKNOWN"
+            trace_record["decision"] = trace_record["envelope"]["decision"] = "UNKNOWN"
             save_trace(trace_record)
 
             report = build_trust_report([trace_record["trace_id"]], regime="TEST")
 
             assert "UNKNOWN" in report["summary"]["decision_breakdown"]
+
+    def test_build_report_missing_ids_keep_request_order(
+        self,
+        tmp_db_path: str,
+        multiple_trace_records: list[dict[str, Any]],
+    ) -> None:
+        """Missing ids should be reported in request order, duplicates included."""
+        import trace_store
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_trace(multiple_trace_records[0])
+
+        trace_ids = ["tr_missing_b", multiple_trace_records[0]["trace_id"], "tr_missing_a", "tr_missing_b"]
+        report = build_trust_report(trace_ids, regime="EU_AI_ACT")
+
+        assert report["summary"]["found_count"] == 1
+        assert report["summary"]["missing_ids"] == ["tr_missing_b", "tr_missing_a", "tr_missing_b"]
@@ -0,0 +1,153 @@
+"""Unit tests for response_cache module and gateway cache control."""
+
+from __future__ import annotations
+
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+import response_cache as response_cache_module
+from response_cache import ResponseCache
+from trace_store import get_trace, init_db
+
+
+class TestResponseCache:
+    """Tests for the LRU/TTL/byte-bounded cache."""
+
+    def test_put_then_get_hits(self) -> None:
+        """A stored body should be returned with its metadata."""
+        cache = ResponseCache(max_bytes=1024, ttl_seconds=60)
+        cache.put("k", b"body", {"trace_id": "tr_a"})
+
+        entry = cache.get("k")
+
+        assert entry is not None
+        assert entry["body"] == b"body"
+        assert entry["meta"]["trace_id"] == "tr_a"
+        assert cache.stats()["hits"] == 1
+
+    def test_expired_entries_miss(self) -> None:
+        """Entries older than the TTL should be dropped on lookup."""
+        cache = ResponseCache(max_bytes=1024, ttl_seconds=60)
+        cache.put("k", b"body")
+
+        with patch.object(response_cache_module.time, "monotonic", return_value=10**9):
+            assert cache.get("k") is None
+
+        stats = cache.stats()
+        assert stats["expirations"] == 1
+        assert stats["entries"] == 0
+
+    def test_lru_eviction_by_bytes(self) -> None:
+        """Exceeding max_bytes should evict the least recently used entry."""
+        cache = ResponseCache(max_bytes=10, ttl_seconds=60)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        cache.get("a")
+        cache.put("c", b"cccc")
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] == 8
+
+    def test_oversized_entry_rejected(self) -> None:
+        """Bodies above the per-entry bound should not be cached."""
+        cache = ResponseCache(max_bytes=100, ttl_seconds=60, max_entry_bytes=4)
+
+        assert cache.put("k", b"too large") is False
+        assert cache.get("k") is None
+
+
+class TestGatewayCacheControl:
+    """Tests for the cognos.cache request control."""
+
+    def _post_twice(
+        self,
+        tmp_db_path: str,
+        request_body: dict[str, Any],
+        upstream_json: dict[str, Any],
+    ) -> tuple[list[httpx.Response], int]:
+        import main
+        import trace_store
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        calls = {"count": 0}
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls["count"] += 1
+            return httpx.Response(200, json=upstream_json)
+
+        cache = ResponseCache(max_bytes=1024 * 1024, ttl_seconds=60)
+        responses = []
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(main, "response_cache", cache), patch.object(
+            upstream_pool,
+            "_build_client",
+            lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        ):
+            with TestClient(main.app) as client:
+                for _ in range(2):
+                    responses.append(
+                        client.post(
+                            "/v1/chat/completions",
+                            json=request_body,
+                            headers={"authorization": "Bearer upstream-key"},
+                        )
+                    )
+        return responses, calls["count"]
+
+    def test_cache_use_serves_second_request(
+        self,
+        tmp_db_path: str,
+        valid_chat_request: dict[str, Any],
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        """cache=use should answer an identical request from cache with a fresh trace."""
+        valid_chat_request["cognos"]["cache"] = "use"
+
+        (first, second), upstream_calls = self._post_twice(tmp_db_path, valid_chat_request, mock_upstream_response)
+
+        assert upstream_calls == 1
+        assert first.headers["X-Cognos-Cache"] == "MISS"
+        assert second.headers["X-Cognos-Cache"] == "HIT"
+        assert second.json()["choices"] == first.json()["choices"]
+
+        first_trace_id = first.headers["X-Cognos-Trace-Id"]
+        second_trace_id = second.headers["X-Cognos-Trace-Id"]
+        assert first_trace_id != second_trace_id
+        assert second.json()["cognos"]["trace_id"] == second_trace_id
+
+        trace = get_trace(second_trace_id)
+        assert trace["metadata"]["upstream"] == "cache"
+        assert trace["metadata"]["cache"]["source_trace_id"] == first_trace_id
+
+    def test_cache_bypass_by_default(
+        self,
+        tmp_db_path: str,
+        valid_chat_request: dict[str, Any],
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        """Without an explicit opt-in every request should go upstream."""
+        (first, second), upstream_calls = self._post_twice(tmp_db_path, valid_chat_request, mock_upstream_response)
+
+        assert upstream_calls == 2
+        assert "X-Cognos-Cache" not in second.headers
+
+    def test_cache_refresh_always_goes_upstream(
+        self,
+        tmp_db_path: str,
+        valid_chat_request: dict[str, Any],
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        """cache=refresh should skip lookups but still store the fresh response."""
+        valid_chat_request["cognos"]["cache"] = "refresh"
+
+        (first, second), upstream_calls = self._post_twice(tmp_db_path, valid_chat_request, mock_upstream_response)
+
+        assert upstream_calls == 2
+        assert second.headers["X-Cognos-Cache"] == "REFRESH"
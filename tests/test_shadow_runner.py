@@ -0,0 +1,173 @@
+"""Unit tests for shadow_runner module."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+from shadow_runner import ShadowJob, ShadowRunner, completion_text, divergence
+from trace_store import get_trace, init_db
+
+
+def _completion(content: str) -> dict[str, Any]:
+    return {
+        "id": "chatcmpl_shadow",
+        "object": "chat.completion",
+        "created": 1234567890,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+class TestDivergence:
+    """Tests for the output divergence score."""
+
+    def test_bounds_and_ordering(self) -> None:
+        """Identical text scores 0, disjoint text 1, and partial overlap in between."""
+        assert divergence("Paris is the capital", "paris is the capital") == 0.0
+        assert divergence("Paris is the capital", "bananas grow in clusters") == 1.0
+        assert divergence("", "") == 0.0
+        assert divergence("answer", "") == 1.0
+
+        close = divergence("The capital of France is Paris.", "Paris is the capital of France.")
+        far = divergence("The capital of France is Paris.", "France has many large cities.")
+        assert 0.0 < close < far < 1.0
+
+    def test_completion_text(self) -> None:
+        """Assistant message content should be extracted from every choice."""
+        payload = {"choices": [_completion("a")["choices"][0], _completion("b")["choices"][0]]}
+
+        assert completion_text(payload) == "a\nb"
+        assert completion_text({"error": "x"}) == ""
+
+
+class TestShadowRunner:
+    """Tests for the bounded shadow worker pool."""
+
+    async def test_run_scores_each_model_and_rolls_up(self) -> None:
+        """Each shadow model should get its own score; errors are reported, not raised."""
+        runner = ShadowRunner()
+
+        async def send(model: str) -> httpx.Response:
+            if model == "broken":
+                return httpx.Response(500)
+            text = "Paris is the capital" if model == "same" else "Lyon is a city"
+            return httpx.Response(200, json=_completion(text))
+
+        async def on_done(result: dict[str, Any]) -> None:
+            return None
+
+        result = await runner.run(ShadowJob("trace", "Paris is the capital", ["same", "other", "broken"], send, on_done))
+
+        assert result["status"] == "completed"
+        assert result["per_model"]["same"] == 0.0
+        assert result["divergence"] == result["per_model"]["other"] > 0.5
+        assert result["errors"] == {"broken": "status 500"}
+        models = runner.stats()["models"]
+        assert models["same"]["samples"] == 1
+        assert models["broken"]["errors"] == 1
+
+    async def test_queue_limit_drops_and_counts(self) -> None:
+        """A full queue should drop new jobs immediately instead of blocking."""
+        runner = ShadowRunner(workers=1, max_queue=1)
+        release = asyncio.Event()
+        done: list[str] = []
+
+        async def send(model: str) -> httpx.Response:
+            await release.wait()
+            return httpx.Response(200, json=_completion("x"))
+
+        async def on_done(result: dict[str, Any]) -> None:
+            done.append(result["status"])
+
+        assert runner.admit(1.0, ["m"]) == "dropped"
+        runner.start()
+        try:
+            assert runner.submit(ShadowJob("t1", "x", ["m"], send, on_done))
+            await asyncio.sleep(0)  # the worker picks up t1 and waits on release
+            assert runner.admit(1.0, ["m"]) == "queued"
+            assert runner.submit(ShadowJob("t2", "x", ["m"], send, on_done))
+            assert runner.admit(1.0, ["m"]) == "dropped"
+            assert not runner.submit(ShadowJob("t3", "x", ["m"], send, on_done))
+
+            release.set()
+            for _ in range(100):
+                if len(done) == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await runner.stop()
+
+        stats = runner.stats()
+        assert done == ["completed", "completed"]
+        assert stats["dropped_not_running"] == 1
+        assert stats["dropped_queue_full"] == 2
+        assert stats["completed"] == 2
+
+    def test_sampling(self) -> None:
+        """Requests without models or outside the sample are not shadowed."""
+        runner = ShadowRunner()
+
+        assert runner.admit(1.0, []) is None
+        assert runner.admit(0.0, ["m"]) is None
+        with patch("shadow_runner.random.random", return_value=0.7):
+            assert runner.admit(0.5, ["m"]) is None
+        assert runner.stats()["sampled"] == 0
+
+
+class TestGatewayShadow:
+    """Tests for shadow execution through the chat completions endpoint."""
+
+    def test_shadow_divergence_written_back_to_trace(self, tmp_db_path: str) -> None:
+        """The primary response returns immediately; the trace later gets the shadow divergence."""
+        import main
+        import trace_store
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        shadow_release = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            model = json.loads(request.content)["model"]
+            if model == "gpt-4o-mini":
+                return httpx.Response(200, json=_completion("The capital of France is Paris."))
+            await shadow_release.wait()
+            return httpx.Response(200, json=_completion("France has many large cities."))
+
+        runner = ShadowRunner(workers=1)
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(main, "shadow_runner", runner), patch.object(
+            upstream_pool, "_build_client", lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        ):
+            with TestClient(main.app) as client:
+                response = client.post(
+                    "/v1/chat/completions",
+                    json={
+                        "model": "gpt-4o-mini",
+                        "messages": [{"role": "user", "content": "capital of France?"}],
+                        "cognos": {"shadow_pct": 1.0, "shadow_models": ["mistral-large"]},
+                    },
+                    headers={"authorization": "Bearer upstream-key"},
+                )
+                assert response.status_code == 200
+                assert response.json()["cognos"]["shadow"]["note"] == "queued"
+
+                client.portal.call(shadow_release.set)
+                trace_id = response.headers["X-Cognos-Trace-Id"]
+                deadline = time.monotonic() + 5
+                trace = get_trace(trace_id)
+                while (trace is None or trace["envelope"]["shadow"]["note"] != "completed") and time.monotonic() < deadline:
+                    time.sleep(0.02)
+                    trace = get_trace(trace_id)
+
+        shadow = trace["envelope"]["shadow"]
+        assert shadow["note"] == "completed"
+        assert shadow["compared_models"] == ["mistral-large"]
+        assert 0.0 < shadow["divergence"] < 1.0
+        assert trace["metadata"]["shadow"]["per_model"]["mistral-large"] == shadow["divergence"]
+        assert runner.stats()["models"]["mistral-large"]["samples"] == 1
@@ -0,0 +1,206 @@
+"""Unit tests for signals module."""
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import signals
+from signals import (
+    DEFAULT_WEIGHTS,
+    SignalEngine,
+    SignalInput,
+    aggregate_risk,
+    citation_markers,
+    hedging_language,
+    negation_conflict,
+    parse_weights,
+    register_extractor,
+    unregister_extractor,
+)
+from trace_store import get_trace, init_db
+
+
+@pytest.fixture
+def extra_extractor() -> Any:
+    """Register test extractors and remove them afterwards."""
+    names: list[str] = []
+
+    def register(name: str, signal: str, mode: str, fn: Any) -> None:
+        names.append(name)
+        register_extractor(name, signal, mode)(fn)
+
+    yield register
+    for name in names:
+        unregister_extractor(name)
+
+
+class TestExtractors:
+    """Tests for the built-in lexical extractors."""
+
+    def test_hedging_and_citations(self) -> None:
+        """Hedge words and citation markers should be measured per sentence."""
+        hedged = SignalInput("q", "It might rain. Perhaps not. The sky is blue.")
+        cited = SignalInput("q", "See https://example.org for details. Water boils at 100C.")
+
+        assert hedging_language(hedged) == pytest.approx(2 / 3)
+        assert hedging_language(cited) == 0.0
+        assert citation_markers(cited) == 0.5
+        assert hedging_language(SignalInput("q", "")) is None
+
+    def test_negation_conflict(self) -> None:
+        """Near-identical sentences with opposite polarity count as contradictions."""
+        conflicted = SignalInput("q", "The drug is safe for children. The drug is not safe for children. Dosage varies.")
+        consistent = SignalInput("q", "The drug is safe for children. Dosage varies by weight.")
+
+        assert negation_conflict(conflicted) == pytest.approx(2 / 3)
+        assert negation_conflict(consistent) == 0.0
+
+
+class TestRiskAggregation:
+    """Tests for combining signals into a risk score."""
+
+    def test_zero_signals_keep_base_risk(self) -> None:
+        """With nothing measured the risk should be the base risk."""
+        assert aggregate_risk(dict.fromkeys(DEFAULT_WEIGHTS, 0.0), DEFAULT_WEIGHTS, base_risk=0.12) == 0.12
+
+    def test_noisy_or(self) -> None:
+        """Each weighted signal should raise risk without exceeding 1."""
+        weights = {"ue": 0.5, "contradiction": 1.0}
+
+        assert aggregate_risk({"ue": 1.0}, weights, base_risk=0.0) == 0.5
+        assert aggregate_risk({"ue": 1.0, "contradiction": 0.5}, weights, base_risk=0.0) == 0.75
+        assert aggregate_risk({"contradiction": 1.0}, weights, base_risk=0.12) == 1.0
+
+    def test_parse_weights(self) -> None:
+        """Overrides should replace defaults and unknown signals should be rejected."""
+        assert parse_weights("ue=0.9, citation_density=0.2")["ue"] == 0.9
+        assert parse_weights("")["contradiction"] == DEFAULT_WEIGHTS["contradiction"]
+        with pytest.raises(ValueError):
+            parse_weights("vibes=1")
+
+
+class TestSignalEngine:
+    """Tests for inline evaluation, the latency budget and async extraction."""
+
+    def test_inline_signals_and_timings(self) -> None:
+        """Inline extractors should report values, timings and the aggregated risk."""
+        engine = SignalEngine(budget_ms=1000, weights=DEFAULT_WEIGHTS, base_risk=0.12)
+
+        report = engine.evaluate(SignalInput("q", "It might work. It may not."))
+
+        assert report.signals["ue"] == 1.0
+        assert set(report.timings) >= {"hedging_language", "conditional_answer", "citation_markers"}
+        assert report.deferred == ["negation_conflict"]
+        assert report.risk == aggregate_risk(report.signals, DEFAULT_WEIGHTS, 0.12) > 0.12
+
+    def test_budget_defers_remaining_inline_extractors(self, extra_extractor: Any) -> None:
+        """Once the budget is spent, later inline extractors are deferred, not run."""
+
+        def slow(data: SignalInput) -> float:
+            time.sleep(0.02)
+            return 0.0
+
+        extra_extractor("slow_probe", "ua", "inline", slow)
+        extra_extractor("late_probe", "out_of_distribution", "inline", lambda data: 1.0)
+        engine = SignalEngine(budget_ms=10, weights=DEFAULT_WEIGHTS)
+
+        report = engine.evaluate(SignalInput("q", "Fine."))
+
+        assert "slow_probe" in report.timings
+        assert "late_probe" in report.deferred
+        assert report.signals["out_of_distribution"] == 0.0
+        stats = engine.stats()
+        assert stats["over_budget"] == 1
+        assert stats["extractors"]["late_probe"]["deferred"] == 1
+
+    async def test_run_deferred_combines_signals(self, extra_extractor: Any) -> None:
+        """Deferred extractors should add their signals and an async risk to the metadata."""
+        extra_extractor("failing_probe", "ua", "async", lambda data: 1 / 0)
+        engine = SignalEngine(budget_ms=1000, weights=DEFAULT_WEIGHTS)
+        data = SignalInput("q", "The drug is safe for children. The drug is not safe for children.")
+        report = engine.evaluate(data)
+
+        result = await engine.run_deferred(data, report, report.deferred)
+
+        assert result["values"]["contradiction"] == 1.0
+        assert result["async_risk"] > report.risk
+        assert "negation_conflict" in result["timings_ms"]
+        assert engine.stats()["extractors"]["failing_probe"]["errors"] == 1
+
+    def test_disabled_extractors_are_skipped(self) -> None:
+        """Extractors listed as disabled should neither run nor be deferred."""
+        engine = SignalEngine(budget_ms=1000, weights=DEFAULT_WEIGHTS, disabled={"negation_conflict", "hedging_language"})
+
+        report = engine.evaluate(SignalInput("q", "It might work."))
+
+        assert report.signals["ue"] == 0.0
+        assert report.deferred == []
+
+    def test_unknown_signal_rejected(self) -> None:
+        """Extractors must target one of the envelope's signals."""
+        with pytest.raises(ValueError):
+            register_extractor("bogus", "vibes")(lambda data: 0.0)
+
+
+class TestGatewaySignals:
+    """Tests for signals through the chat completions endpoint."""
+
+    def test_signals_drive_decision_and_async_patch(self, tmp_db_path: str) -> None:
+        """A hedged, self-contradicting answer should raise risk inline and get its contradiction patched in."""
+        import main
+        import trace_store
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        answer = "It might be safe. The drug is safe for children. The drug is not safe for children."
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(
+                200,
+                json={
+                    "id": "chatcmpl_signals",
+                    "object": "chat.completion",
+                    "created": 1234567890,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                },
+            )
+
+        engine = SignalEngine(budget_ms=1000, workers=1, weights=DEFAULT_WEIGHTS, base_risk=0.12)
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(main, "signal_engine", engine), patch.object(
+            upstream_pool, "_build_client", lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        ):
+            with TestClient(main.app) as client:
+                response = client.post(
+                    "/v1/chat/completions",
+                    json={
+                        "model": "gpt-4o-mini",
+                        "messages": [{"role": "user", "content": "Is it safe?"}],
+                        "cognos": {"mode": "enforce", "target_risk": 0.2},
+                    },
+                    headers={"authorization": "Bearer upstream-key"},
+                )
+                trace_id = response.headers["X-Cognos-Trace-Id"]
+                deadline = time.monotonic() + 5
+                trace = client.get(f"/v1/traces/{trace_id}").json()
+                while not trace["metadata"]["signals"].get("async_completed") and time.monotonic() < deadline:
+                    time.sleep(0.02)
+                    trace = client.get(f"/v1/traces/{trace_id}").json()
+
+        envelope = response.json()["cognos"]
+        assert envelope["signals"]["ue"] > 0.0
+        assert envelope["risk"] > 0.12
+        assert envelope["decision"] == response.headers["X-Cognos-Decision"] == "REFINE"
+        signals_meta = trace["metadata"]["signals"]
+        assert signals_meta["values"]["contradiction"] > 0.0
+        assert signals_meta["async_risk"] > envelope["risk"]
+        assert trace["envelope"]["signals"] == envelope["signals"]
+        assert get_trace(trace_id)["risk"] == envelope["risk"]
+        assert json.loads(json.dumps(signals_meta["timings_ms"]))["negation_conflict"] >= 0.0
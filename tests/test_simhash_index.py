@@ -0,0 +1,222 @@
+"""Unit tests for simhash_index module."""
+
+from __future__ import annotations
+
+import random
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from simhash_index import (
+    SimHashIndex,
+    cluster_id_for,
+    format_simhash,
+    hamming,
+    normalize_tokens,
+    representative_of,
+    text_simhash,
+)
+from trace_store import cluster_stats, init_db, load_cluster_ids, query_traces, save_traces
+
+PROMPT = (
+    "You are a support assistant. Summarize ticket 123 for the on-call engineer: the orders database is slow "
+    "and customers see timeouts at checkout during peak hours since the deploy on Monday. Include likely causes, "
+    "what to check first in the dashboards, and next steps with owners. Keep it short and use bullet points."
+)
+
+
+def _random_hash(rng: random.Random) -> int:
+    return rng.getrandbits(64)
+
+
+class TestSimHash:
+    """Tests for fingerprinting normalized message text."""
+
+    def test_normalization_folds_case_punctuation_and_digits(self) -> None:
+        """Ids, numbers, case and punctuation should not move the fingerprint."""
+        assert normalize_tokens("Ticket #123, PLEASE!") == ["ticket", "0", "please"]
+        assert text_simhash(PROMPT) == text_simhash(PROMPT.replace("123", "98765").upper().replace(".", "!"))
+
+    def test_near_duplicates_are_closer_than_unrelated_text(self) -> None:
+        """A one-word edit should flip few bits; unrelated text about half of them."""
+        base = text_simhash(PROMPT)
+        edited = text_simhash(PROMPT.replace("Monday", "Tuesday"))
+        unrelated = text_simhash("Write a short poem about autumn leaves falling in an empty park at dusk.")
+
+        assert hamming(base, edited) <= 8
+        assert hamming(base, unrelated) > 16
+        assert text_simhash("") == 0
+
+    def test_non_latin_prompts_get_their_own_clusters(self) -> None:
+        """Non-Latin text should fingerprint by its words; unrelated prompts must not share a cluster."""
+        chinese = "请总结一下订单数据库在高峰期变慢的问题，并给出排查步骤和负责人。"
+        russian = "Пожалуйста, напишите короткое стихотворение об осенних листьях в пустом парке."
+        index = SimHashIndex()
+
+        assert normalize_tokens("ПРИВЕТ Straße 数据") == ["привет", "strasse", "数", "据"]
+        assert 0 not in {text_simhash(chinese), text_simhash(russian)}
+        assert index.assign(text_simhash(chinese)) != index.assign(text_simhash(russian))
+        assert hamming(text_simhash(chinese), text_simhash(chinese.replace("变慢", "变快"))) <= 8
+
+    def test_cluster_id_round_trip(self) -> None:
+        """Cluster ids should encode their representative hash."""
+        value = text_simhash(PROMPT)
+
+        assert representative_of(cluster_id_for(value)) == value
+        assert format_simhash(1) == "simhash64:0000000000000001"
+        with pytest.raises(ValueError):
+            representative_of("cl_nothex")
+
+
+class TestSimHashIndex:
+    """Tests for banded LSH cluster assignment."""
+
+    def test_assign_joins_within_distance(self) -> None:
+        """Hashes within max_distance join the first cluster; farther ones start their own."""
+        index = SimHashIndex(bands=4, max_distance=3)
+        leader = 0x0123456789ABCDEF
+
+        assert index.assign(leader) == cluster_id_for(leader)
+        assert index.assign(leader ^ 0b111) == cluster_id_for(leader)
+        assert index.assign(leader ^ 0xF) == cluster_id_for(leader ^ 0xF)
+        assert len(index) == 2
+
+    def test_pigeonhole_finds_neighbours_across_bands(self) -> None:
+        """Bit flips spread over every band but one must still be found through the untouched band."""
+        index = SimHashIndex(bands=4, max_distance=3)
+        leader = 0xFFFF0000FFFF0000
+        index.add(leader)
+
+        assert index.nearest(leader ^ (1 << 0) ^ (1 << 16) ^ (1 << 32)) == leader
+
+    def test_lookup_cost_is_independent_of_index_size(self) -> None:
+        """Lookups should compare only bucket members, not every cluster."""
+        rng = random.Random(7)
+        index = SimHashIndex(bands=4, max_distance=3, max_clusters=100_000)
+        index.load(_random_hash(rng) for _ in range(20_000))
+        before = index.stats()["comparisons"]
+
+        for _ in range(1_000):
+            index.nearest(_random_hash(rng))
+
+        assert (index.stats()["comparisons"] - before) / 1_000 < 4 * index.bucket_max
+        assert len(index) == 20_000
+
+    def test_full_index_stops_creating_clusters(self) -> None:
+        """Past max_clusters new hashes get no cluster, but existing clusters still match."""
+        index = SimHashIndex(bands=4, max_distance=3, max_clusters=1)
+        index.assign(0)
+
+        assert index.assign(1) == cluster_id_for(0)
+        assert index.assign(_random_hash(random.Random(1)) | 0xFFFF) is None
+        assert index.stats()["index_full"] == 1
+
+    def test_rejects_bands_that_do_not_divide_64(self) -> None:
+        """Band widths must be equal."""
+        with pytest.raises(ValueError):
+            SimHashIndex(bands=5)
+
+
+class TestClusterPersistence:
+    """Tests for cluster columns and lookups in the trace store."""
+
+    def test_clusters_are_persisted_and_aggregated(self, tmp_db_path: str, trace_record: dict) -> None:
+        """Traces should store their cluster, and clusters should reload and aggregate."""
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        cluster_id = cluster_id_for(0xABC)
+        records = []
+        for number, (decision, risk) in enumerate((("PASS", 0.1), ("REFINE", 0.3), ("PASS", 0.2))):
+            record = {
+                **trace_record,
+                "trace_id": f"tr_cluster_{number}",
+                "created_at": f"2026-02-27T12:00:0{number}+00:00",
+                "decision": decision,
+                "risk": risk,
+                "request_fingerprint": {**trace_record["request_fingerprint"], "cluster_id": cluster_id},
+            }
+            records.append(record)
+        save_traces(records)
+        save_traces([{**trace_record, "trace_id": "tr_unclustered"}])
+
+        stats = cluster_stats(cluster_id)
+        page, next_after = query_traces(cluster_id=cluster_id, limit=2)
+
+        assert load_cluster_ids() == [cluster_id]
+        assert stats["trace_count"] == 3
+        assert stats["avg_risk"] == pytest.approx(0.2)
+        assert stats["decision_breakdown"] == {"PASS": 2, "REFINE": 1}
+        assert stats["first_seen"] == "2026-02-27T12:00:00+00:00"
+        assert [trace["trace_id"] for trace in page] == ["tr_cluster_2", "tr_cluster_1"]
+        assert next_after is not None
+        assert cluster_stats(cluster_id_for(0xDEF)) is None
+
+
+class TestGatewayClusters:
+    """Tests for cluster assignment on the chat completions endpoint."""
+
+    def test_near_duplicate_prompts_share_a_cluster(self, tmp_db_path: str) -> None:
+        """Prompts differing only by ids should share a cluster that the cluster endpoint reports."""
+        import main
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        index = SimHashIndex(bands=4, max_distance=3)
+        headers = {"authorization": "Bearer upstream-key"}
+
+        def send(client: TestClient, content: str) -> dict:
+            response = client.post(
+                "/v1/chat/completions",
+                json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": content}]},
+                headers=headers,
+            )
+            return client.get(f"/v1/traces/{response.headers['X-Cognos-Trace-Id']}").json()
+
+        with patch.object(main, "MOCK_UPSTREAM", True), patch.object(main, "simhash_index", index):
+            with TestClient(main.app) as client:
+                first = send(client, PROMPT)
+                second = send(client, PROMPT.replace("123", "4567"))
+                other = send(client, "Translate 'good morning' into French and Spanish.")
+                cluster_id = first["request_fingerprint"]["cluster_id"]
+                cluster = client.get(f"/v1/clusters/{cluster_id}", headers=headers).json()
+                missing = client.get(f"/v1/clusters/{cluster_id_for(1)}", headers=headers)
+                invalid = client.get("/v1/clusters/nope", headers=headers)
+
+        assert first["request_fingerprint"]["simhash"].startswith("simhash64:")
+        assert second["request_fingerprint"]["cluster_id"] == cluster_id
+        assert other["request_fingerprint"]["cluster_id"] != cluster_id
+        assert cluster["trace_count"] == 2
+        assert {trace["trace_id"] for trace in cluster["traces"]} == {first["trace_id"], second["trace_id"]}
+        assert missing.status_code == 404
+        assert invalid.status_code == 400
+
+    def test_index_reloads_from_store_on_startup(self, tmp_db_path: str, trace_record: dict) -> None:
+        """Clusters persisted by earlier processes should be re-indexed at startup."""
+        import main
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        representative = text_simhash(PROMPT)
+        save_traces(
+            [
+                {
+                    **trace_record,
+                    "request_fingerprint": {
+                        **trace_record["request_fingerprint"],
+                        "cluster_id": cluster_id_for(representative),
+                    },
+                }
+            ]
+        )
+        index = SimHashIndex(bands=4, max_distance=3)
+
+        with patch.object(main, "simhash_index", index):
+            with TestClient(main.app):
+                pass
+
+        assert index.nearest(representative) == representative
@@ -0,0 +1,376 @@
+"""Unit tests for single_flight module and gateway request coalescing."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from single_flight import SingleFlight
+from trace_store import get_trace, init_db
+
+
+async def _wait_for_followers(group: SingleFlight, count: int) -> None:
+    for _ in range(500):
+        if group.stats()["followers"] >= count:
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError(f"expected {count} followers, got {group.stats()['followers']}")
+
+
+class TestSingleFlight:
+    """Tests for the coalescing primitive."""
+
+    async def test_concurrent_callers_share_one_fetch(self) -> None:
+        """Identical concurrent calls should run fetch once."""
+        group = SingleFlight(max_wait_seconds=5)
+        gate = asyncio.Event()
+        calls = {"count": 0}
+
+        async def fetch() -> httpx.Response:
+            calls["count"] += 1
+            await gate.wait()
+            return httpx.Response(200, content=b"ok")
+
+        tasks = [asyncio.create_task(group.do("k", f"tr_{index}", fetch)) for index in range(3)]
+        await _wait_for_followers(group, 2)
+        gate.set()
+        results = await asyncio.gather(*tasks)
+
+        assert calls["count"] == 1
+        assert [is_leader for _, is_leader in results] == [True, False, False]
+        assert all(flight.response.content == b"ok" for flight, _ in results)
+        assert group.stats()["in_flight"] == 0
+
+    async def test_leader_failure_propagates(self) -> None:
+        """Followers should see the leader's upstream error."""
+        group = SingleFlight(max_wait_seconds=5)
+        gate = asyncio.Event()
+
+        async def fetch() -> httpx.Response:
+            await gate.wait()
+            raise httpx.ConnectError("boom")
+
+        tasks = [asyncio.create_task(group.do("k", f"tr_{index}", fetch)) for index in range(2)]
+        await _wait_for_followers(group, 1)
+        gate.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert all(isinstance(result, httpx.ConnectError) for result in results)
+        assert group.stats()["shared_failures"] == 1
+
+    async def test_follower_gives_up_after_max_wait(self) -> None:
+        """A follower that waits too long should be told to call upstream itself."""
+        group = SingleFlight(max_wait_seconds=0.01)
+        gate = asyncio.Event()
+
+        async def fetch() -> httpx.Response:
+            await gate.wait()
+            return httpx.Response(200)
+
+        leader = asyncio.create_task(group.do("k", "tr_leader", fetch))
+        await asyncio.sleep(0)
+
+        assert await group.do("k", "tr_follower", fetch) is None
+        gate.set()
+        await leader
+        assert group.stats()["follower_timeouts"] == 1
+
+    async def test_stream_replays_to_late_joiner(self) -> None:
+        """A caller joining mid-stream should still receive every chunk."""
+        group = SingleFlight(max_wait_seconds=5)
+        release = asyncio.Event()
+
+        class UpstreamStream(httpx.AsyncByteStream):
+            async def __aiter__(self) -> Any:
+                yield b"data: one\n\n"
+                await release.wait()
+                yield b"data: two\n\n"
+
+        async def fetch() -> httpx.Response:
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=UpstreamStream())
+
+        leader, _ = await group.do("k", "tr_leader", fetch)
+        leader_chunks = leader.stream()
+        assert await leader_chunks.__anext__() == b"data: one\n\n"
+
+        follower, is_leader = await group.do("k", "tr_follower", fetch)
+        release.set()
+        follower_body = b"".join([chunk async for chunk in follower.stream()])
+        leader_rest = b"".join([chunk async for chunk in leader_chunks])
+
+        assert follower is leader
+        assert not is_leader
+        assert follower_body == b"data: one\n\ndata: two\n\n"
+        assert leader_rest == b"data: two\n\n"
+
+    async def test_stream_past_cap_drops_read_chunks_with_backpressure(self) -> None:
+        """Past the cap the flight should close to joiners, free read chunks and not read ahead."""
+        group = SingleFlight(max_wait_seconds=5, max_stream_buffer_bytes=16)
+        pulled = {"count": 0}
+
+        class UpstreamStream(httpx.AsyncByteStream):
+            async def __aiter__(self) -> Any:
+                for index in range(20):
+                    pulled["count"] += 1
+                    yield b"data: %02d\n\n" % index
+
+        async def fetch() -> httpx.Response:
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=UpstreamStream())
+
+        flight, _ = await group.do("k", "tr_leader", fetch)
+        received = []
+        async for chunk in flight.stream():
+            received.append(chunk)
+            await asyncio.sleep(0)
+            assert flight._buffered_bytes <= 16 + len(chunk)
+            assert pulled["count"] <= len(received) + 3
+
+        assert received == [b"data: %02d\n\n" % index for index in range(20)]
+        assert not flight.joinable()
+
+    async def test_stalled_reader_is_cut_off(self) -> None:
+        """A reader that stops consuming should not hold the shared stream for everyone else."""
+        group = SingleFlight(max_wait_seconds=0.05, max_stream_buffer_bytes=16)
+        gate = asyncio.Event()
+
+        class UpstreamStream(httpx.AsyncByteStream):
+            async def __aiter__(self) -> Any:
+                await gate.wait()
+                for index in range(10):
+                    yield b"data: %02d\n\n" % index
+
+        async def fetch() -> httpx.Response:
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=UpstreamStream())
+
+        leader, _ = await group.do("k", "tr_leader", fetch)
+        follower, _ = await group.do("k", "tr_follower", fetch)
+        stalled = follower.stream()
+        gate.set()
+        assert await stalled.__anext__() == b"data: 00\n\n"
+        body = b"".join([chunk async for chunk in leader.stream()])
+
+        assert body == b"".join(b"data: %02d\n\n" % index for index in range(10))
+        assert group.stats()["stalled_readers"] == 1
+        with pytest.raises(httpx.ReadError):
+            await stalled.__anext__()
+
+
+class TestGatewayCoalescing:
+    """Tests for coalescing concurrent identical chat completions."""
+
+    async def _post_concurrently(
+        self,
+        tmp_db_path: str,
+        request_body: dict[str, Any],
+        handler: Any,
+        group: SingleFlight,
+        count: int,
+        gate: asyncio.Event,
+    ) -> list[httpx.Response]:
+        import main
+        import trace_store
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(main, "single_flight", group), patch.object(
+            upstream_pool,
+            "_build_client",
+            lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        ):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+                tasks = [
+                    asyncio.create_task(
+                        client.post(
+                            "/v1/chat/completions",
+                            json=request_body,
+                            headers={"authorization": "Bearer upstream-key"},
+                        )
+                    )
+                    for _ in range(count)
+                ]
+                await _wait_for_followers(group, count - 1)
+                gate.set()
+                responses = await asyncio.gather(*tasks)
+            await upstream_pool.close_all()
+        return responses
+
+    async def test_json_duplicates_share_upstream_call(
+        self,
+        tmp_db_path: str,
+        valid_chat_request: dict[str, Any],
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        """Concurrent duplicates should get their own traces from one upstream response."""
+        valid_chat_request["temperature"] = 0
+        gate = asyncio.Event()
+        calls = {"count": 0}
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls["count"] += 1
+            await gate.wait()
+            return httpx.Response(200, json=mock_upstream_response)
+
+        group = SingleFlight(max_wait_seconds=5)
+        responses = await self._post_concurrently(tmp_db_path, valid_chat_request, handler, group, 3, gate)
+
+        assert calls["count"] == 1
+        assert all(response.status_code == 200 for response in responses)
+        trace_ids = [response.headers["X-Cognos-Trace-Id"] for response in responses]
+        assert len(set(trace_ids)) == 3
+        assert [response.json()["cognos"]["trace_id"] for response in responses] == trace_ids
+
+        coalesced = [get_trace(trace_id)["metadata"].get("coalesced") for trace_id in trace_ids]
+        followers = [entry for entry in coalesced if entry is not None]
+        assert len(followers) == 2
+        leader_trace_id = followers[0]["leader_trace_id"]
+        assert leader_trace_id in trace_ids
+        assert get_trace(leader_trace_id)["metadata"].get("coalesced") is None
+
+    async def test_leader_error_returns_502_to_everyone(
+        self,
+        tmp_db_path: str,
+        valid_chat_request: dict[str, Any],
+    ) -> None:
+        """A failed shared upstream call should fail every coalesced request."""
+        valid_chat_request["temperature"] = 0
+        gate = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await gate.wait()
+            raise httpx.ConnectError("connection refused", request=request)
+
+        group = SingleFlight(max_wait_seconds=5)
+        responses = await self._post_concurrently(tmp_db_path, valid_chat_request, handler, group, 2, gate)
+
+        assert [response.status_code for response in responses] == [502, 502]
+
+    async def test_stream_duplicates_share_upstream_stream(
+        self,
+        tmp_db_path: str,
+        stream_chat_request: dict[str, Any],
+    ) -> None:
+        """Concurrent streaming duplicates should each receive the full upstream stream."""
+        gate = asyncio.Event()
+        calls = {"count": 0}
+        chunks = [b'data: {"choices":[{"index":0,"delta":{"content":"Hi"}}]}\n\n', b"data: [DONE]\n\n"]
+
+        class UpstreamStream(httpx.AsyncByteStream):
+            async def __aiter__(self) -> Any:
+                for chunk in chunks:
+                    yield chunk
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls["count"] += 1
+            await gate.wait()
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=UpstreamStream())
+
+        group = SingleFlight(max_wait_seconds=5)
+        responses = await self._post_concurrently(tmp_db_path, stream_chat_request, handler, group, 2, gate)
+
+        assert calls["count"] == 1
+        assert [response.content for response in responses] == [b"".join(chunks)] * 2
+        for response in responses:
+            trace = get_trace(response.headers["X-Cognos-Trace-Id"])
+            assert trace["metadata"]["stream"]["outcome"] == "completed"
+
+    async def test_sampled_requests_coalesce_only_on_opt_in(
+        self,
+        tmp_db_path: str,
+        valid_chat_request: dict[str, Any],
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        """Sampled duplicates (temperature > 0 or n > 1) should each get their own completion unless opted in."""
+        calls = {"count": 0}
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls["count"] += 1
+            return httpx.Response(200, json=mock_upstream_response)
+
+        group = SingleFlight(max_wait_seconds=5)
+        gate = asyncio.Event()
+        for body in (valid_chat_request, {**valid_chat_request, "temperature": 0, "n": 2}):
+            await self._post_concurrently(tmp_db_path, body, handler, group, 1, gate)
+        assert calls["count"] == 2
+        assert group.stats()["leaders"] == 0
+
+        opted_in = {**valid_chat_request, "cognos": {**valid_chat_request["cognos"], "coalesce": True}}
+        await self._post_concurrently(tmp_db_path, opted_in, handler, group, 1, gate)
+        assert group.stats()["leaders"] == 1
+
+    async def test_coalesce_opt_out(
+        self,
+        tmp_db_path: str,
+        valid_chat_request: dict[str, Any],
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        """cognos.coalesce=false should send every request upstream."""
+        valid_chat_request["cognos"]["coalesce"] = False
+        calls = {"count": 0}
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls["count"] += 1
+            return httpx.Response(200, json=mock_upstream_response)
+
+        group = SingleFlight(max_wait_seconds=5)
+        gate = asyncio.Event()
+        responses = await self._post_concurrently(tmp_db_path, valid_chat_request, handler, group, 1, gate)
+        responses += await self._post_concurrently(tmp_db_path, valid_chat_request, handler, group, 1, gate)
+
+        assert calls["count"] == 2
+        assert group.stats()["leaders"] == 0
+        assert all(response.status_code == 200 for response in responses)
+
+    async def test_stream_flight_released_when_gateway_fails_before_relay(
+        self,
+        tmp_db_path: str,
+        stream_chat_request: dict[str, Any],
+    ) -> None:
+        """A request that fails before reading its shared stream should still let the flight close."""
+        import main
+        import trace_store
+        import upstream_pool
+
+        closed = asyncio.Event()
+
+        class UpstreamStream(httpx.AsyncByteStream):
+            async def __aiter__(self) -> Any:
+                yield b"data: [DONE]\n\n"
+                await asyncio.Event().wait()
+
+            async def aclose(self) -> None:
+                closed.set()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=UpstreamStream())
+
+        async def failing_persist(**kwargs: Any) -> None:
+            raise RuntimeError("trace store unavailable")
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        group = SingleFlight(max_wait_seconds=5)
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(main, "single_flight", group), patch.object(
+            main, "_persist_trace", failing_persist
+        ), patch.object(
+            upstream_pool,
+            "_build_client",
+            lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        ):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+                with pytest.raises(RuntimeError):
+                    await client.post(
+                        "/v1/chat/completions",
+                        json=stream_chat_request,
+                        headers={"authorization": "Bearer upstream-key"},
+                    )
+            await asyncio.wait_for(closed.wait(), 1)
+            await upstream_pool.close_all()
+
+        assert group.stats()["in_flight"] == 0
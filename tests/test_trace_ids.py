@@ -0,0 +1,37 @@
+"""Unit tests for trace_ids module."""
+
+from __future__ import annotations
+
+from trace_ids import new_trace_id, trace_id_timestamp_ms
+
+
+class TestNewTraceId:
+    """Tests for time-ordered trace id generation."""
+
+    def test_prefix_and_length(self) -> None:
+        """Ids keep the tr_ prefix and carry 128 bits (26 base32 chars)."""
+        trace_id = new_trace_id()
+        assert trace_id.startswith("tr_")
+        assert len(trace_id) == 3 + 26
+
+    def test_ids_sort_by_time(self) -> None:
+        """Ids from later milliseconds should sort after earlier ones."""
+        earlier = new_trace_id(1_772_193_600_000)
+        later = new_trace_id(1_772_193_600_001)
+        assert earlier < later
+
+    def test_monotonic_within_millisecond(self) -> None:
+        """Ids generated in the same millisecond should still be strictly increasing."""
+        ids = [new_trace_id(1_900_000_000_000) for _ in range(1000)]
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+
+    def test_timestamp_roundtrip(self) -> None:
+        """The embedded timestamp should decode back to epoch milliseconds."""
+        trace_id = new_trace_id(2_000_000_000_123)
+        assert trace_id_timestamp_ms(trace_id) == 2_000_000_000_123
+
+    def test_legacy_ids_have_no_timestamp(self) -> None:
+        """Legacy random ids should be recognised as carrying no timestamp."""
+        assert trace_id_timestamp_ms("tr_0123456789ab") is None
+        assert trace_id_timestamp_ms("rpt_0123456789abcdefghjkmnpqrs") is None
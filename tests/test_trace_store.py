@@ -3,12 +3,15 @@
 from __future__ import annotations
 
 import json
+import logging
 import sqlite3
+import threading
 from pathlib import Path
 from typing import Any
 from unittest.mock import patch
 
 import pytest
+from fastapi.testclient import TestClient
 
 from trace_store import aggregate_tvv, get_trace, init_db, save_trace
 
@@ -240,3 +243,420 @@ class TestAggregateTvv:
             assert "decision_breakdown" in tvv
             assert tvv["decision_breakdown"]["PASS"] == 3
             assert tvv["decision_breakdown"]["REFINE"] == 2
+
+
+class TestSaveTraces:
+    """Tests for batched trace persistence."""
+
+    def test_save_traces_inserts_batch(
+        self, tmp_db_path: str, multiple_trace_records: list[dict[str, Any]]
+    ) -> None:
+        """save_traces should persist every record in one call."""
+        import trace_store
+        from trace_store import save_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_traces(multiple_trace_records)
+
+        for record in multiple_trace_records:
+            assert get_trace(record["trace_id"]) is not None
+
+    def test_save_traces_empty_is_noop(self, tmp_db_path: str) -> None:
+        """save_traces with no records should not touch the database."""
+        import trace_store
+        from trace_store import save_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        save_traces([])
+        assert not Path(tmp_db_path).exists()
+
+
+class TestPatchTraces:
+    """Tests for merging late results into stored traces."""
+
+    def test_patch_merges_top_level_keys(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Patched keys should be added or replaced while the rest of the trace is kept."""
+        import trace_store
+        from trace_store import patch_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_trace(trace_record)
+
+        updated = patch_traces(
+            [
+                (trace_record["trace_id"], {"shadow": {"divergence": 0.4}}, {"signals": {"async_completed": True}}),
+                ("tr_missing", {}, {"signals": {}}),
+            ]
+        )
+
+        trace = get_trace(trace_record["trace_id"])
+        assert updated == 1
+        assert trace["envelope"]["shadow"] == {"divergence": 0.4}
+        assert trace["envelope"]["decision"] == trace_record["envelope"]["decision"]
+        assert trace["metadata"]["signals"] == {"async_completed": True}
+        assert trace["metadata"]["mode"] == trace_record["metadata"]["mode"]
+
+
+class TestConnectionManager:
+    """Tests for pooled, tuned SQLite connections."""
+
+    def test_wal_mode_enabled(self, tmp_db_path: str) -> None:
+        """init_db should leave the database in WAL mode."""
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+
+        conn = sqlite3.connect(tmp_db_path)
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+        assert journal_mode == "wal"
+
+    def test_connection_reused_within_thread(self, tmp_db_path: str) -> None:
+        """Repeated calls on one thread should share one connection."""
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        db_path = trace_store._resolve_db_path()
+
+        first = trace_store._get_connection(db_path)
+        second = trace_store._get_connection(db_path)
+        assert first is second
+        assert first.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+    def test_close_connections_reopens_lazily(
+        self, tmp_db_path: str, trace_record: dict[str, Any]
+    ) -> None:
+        """Closing pooled connections should not break later calls."""
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_trace(trace_record)
+
+        trace_store.close_connections()
+
+        assert get_trace(trace_record["trace_id"]) is not None
+
+
+class TestGetTraces:
+    """Tests for bulk trace lookup."""
+
+    def test_get_traces_returns_found_only(
+        self, tmp_db_path: str, multiple_trace_records: list[dict[str, Any]]
+    ) -> None:
+        """get_traces should return a map of found traces and skip missing ids."""
+        import trace_store
+        from trace_store import get_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        for record in multiple_trace_records:
+            save_trace(record)
+
+        ids = [r["trace_id"] for r in multiple_trace_records] + ["tr_missing"]
+        traces = get_traces(ids)
+
+        assert set(traces) == {r["trace_id"] for r in multiple_trace_records}
+        assert traces["tr_pass_0"]["decision"] == "PASS"
+
+    def test_get_trace_decisions_spans_chunks(
+        self, tmp_db_path: str, trace_record: dict[str, Any]
+    ) -> None:
+        """Decision lookup should cover id lists larger than one IN (...) chunk."""
+        import trace_store
+        from trace_store import get_trace_decisions, save_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        count = trace_store.LOOKUP_CHUNK_SIZE + 50
+        save_traces([{**trace_record, "trace_id": f"tr_bulk_{i}"} for i in range(count)])
+
+        decisions = get_trace_decisions([f"tr_bulk_{i}" for i in range(count)])
+
+        assert len(decisions) == count
+        assert set(decisions.values()) == {"PASS"}
+
+    def test_get_trace_decisions_reads_column_only(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Decisions should come from the column, so unparseable envelopes do not matter."""
+        import trace_store
+        from trace_store import get_trace_decisions
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_trace({**trace_record, "decision": "BLOCK"})
+        conn = sqlite3.connect(tmp_db_path)
+        conn.execute("UPDATE traces SET envelope_json = 'not json' WHERE trace_id = ?", (trace_record["trace_id"],))
+        conn.commit()
+        conn.close()
+
+        assert get_trace_decisions([trace_record["trace_id"], "tr_missing"]) == {trace_record["trace_id"]: "BLOCK"}
+
+
+class TestQueryTraces:
+    """Tests for indexed trace queries."""
+
+    def test_init_db_creates_filter_indexes(self, tmp_db_path: str) -> None:
+        """init_db should create the composite filter indexes idempotently."""
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        init_db()
+
+        conn = sqlite3.connect(tmp_db_path)
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(traces)")}
+        plan = " ".join(
+            str(row[3])
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT trace_id FROM traces WHERE model = ? ORDER BY created_ms DESC, trace_id DESC",
+                ("gpt-4o-mini",),
+            )
+        )
+        conn.close()
+
+        assert {"idx_traces_created_ms", "idx_traces_decision_created_ms", "idx_traces_model_created_ms"} <= indexes
+        assert "idx_traces_model_created_ms" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_query_traces_filters_and_pages(
+        self, tmp_db_path: str, multiple_trace_records: list[dict[str, Any]]
+    ) -> None:
+        """query_traces should apply filters and return a resume key when more rows exist."""
+        import trace_store
+        from trace_store import query_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        for record in multiple_trace_records:
+            save_trace(record)
+
+        page, after = query_traces(decision="PASS", limit=2)
+        assert [trace["decision"] for trace in page] == ["PASS", "PASS"]
+        assert after is not None
+
+        rest, after = query_traces(decision="PASS", after=after, limit=2)
+        assert len(rest) == 1
+        assert after is None
+
+    def test_stream_traces_matches_query_and_keeps_late_rows(
+        self, tmp_db_path: str, multiple_trace_records: list[dict[str, Any]]
+    ) -> None:
+        """stream_traces should page like query_traces and not skip rows committed mid-stream."""
+        import trace_store
+        from trace_store import query_traces, stream_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        for index, record in enumerate(multiple_trace_records):
+            save_trace({**record, "created_at": f"2026-02-27T12:00:0{index}+00:00"})
+
+        rows, after = stream_traces(limit=3)
+        expected, expected_after = query_traces(limit=3)
+        save_trace({**multiple_trace_records[0], "trace_id": "tr_late", "created_at": "2026-02-27T12:00:09+00:00"})
+        streamed = [trace["trace_id"] for trace in rows]
+
+        assert after == expected_after
+        assert streamed == ["tr_late"] + [trace["trace_id"] for trace in expected]
+        rest, after = stream_traces(after=after, limit=3)
+        assert len(list(rest)) == len(multiple_trace_records) - 3
+        assert after is None
+
+
+class TestUsageRollups:
+    """Tests for materialized usage columns and hourly rollups."""
+
+    def test_usage_columns_materialized(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """save_trace should store token counts as integer columns."""
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        trace_record["metadata"]["usage"] = {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+        save_trace(trace_record)
+
+        conn = sqlite3.connect(tmp_db_path)
+        row = conn.execute(
+            "SELECT prompt_tokens, completion_tokens, total_tokens FROM traces WHERE trace_id = ?",
+            (trace_record["trace_id"],),
+        ).fetchone()
+        conn.close()
+        assert row == (10, 20, 30)
+
+    def test_rollups_follow_rewrites(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Re-saving a trace should move it between rollup buckets, not double count."""
+        import trace_store
+        from trace_store import get_rollups
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_trace(trace_record)
+        save_trace({**trace_record, "decision": "BLOCK", "metadata": {"usage": {"total_tokens": 7}}})
+
+        rollups = get_rollups()
+        assert len(rollups) == 1
+        assert rollups[0]["decision"] == "BLOCK"
+        assert rollups[0]["request_count"] == 1
+        assert rollups[0]["total_tokens"] == 7
+        assert rollups[0]["bucket_hour"] == "2026-02-27T12"
+
+    def test_backfill_existing_database(self, tmp_db_path: str) -> None:
+        """Databases created before usage columns should be rolled up and backfilled."""
+        import trace_store
+        from trace_store import backfill_columns
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        conn = sqlite3.connect(tmp_db_path)
+        conn.execute(
+            """
+            CREATE TABLE traces (
+                trace_id TEXT PRIMARY KEY, created_at TEXT NOT NULL, decision TEXT NOT NULL,
+                policy TEXT NOT NULL, trust_score REAL NOT NULL, risk REAL NOT NULL,
+                is_stream INTEGER NOT NULL, status_code INTEGER NOT NULL, model TEXT,
+                request_fingerprint TEXT, envelope_json TEXT, metadata_json TEXT
+            )
+            """
+        )
+        for index in range(25):
+            conn.execute(
+                "INSERT INTO traces VALUES (?, '2026-02-27T12:00:00+00:00', 'PASS', 'default_v1', 0.9, 0.1, 0, 200, 'm', '{}', '{}', ?)",
+                (f"tr_old_{index}", json.dumps({"usage": {"total_tokens": 4}})),
+            )
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert aggregate_tvv()["tvv_requests"] == 25
+        assert aggregate_tvv()["tvv_tokens"] == 0
+
+        stop = threading.Event()
+        stop.set()
+        assert backfill_columns(chunk_size=10, stop=stop) == 0
+        assert backfill_columns(chunk_size=10) == 50  # usage + created_ms per row
+        assert aggregate_tvv()["tvv_tokens"] == 100
+        assert backfill_columns(chunk_size=10) == 0
+
+    def test_failed_startup_backfill_is_logged(self, tmp_db_path: str, caplog: pytest.LogCaptureFixture) -> None:
+        """A backfill that raises in the background should be logged, and shutdown should wait for it."""
+        import main
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+
+        def failing_backfill(stop: threading.Event | None = None) -> int:
+            raise sqlite3.OperationalError("disk I/O error")
+
+        with patch.object(main, "backfill_columns", failing_backfill), caplog.at_level(logging.ERROR, "cognos.gateway"):
+            with TestClient(main.app):
+                pass
+
+        assert main.app.state.backfill.done()
+        assert "Trace column backfill failed" in caplog.text
+
+
+class TestCreatedMs:
+    """Tests for the integer epoch-ms timestamp column."""
+
+    def test_created_ms_derived_from_created_at(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """save_trace should store created_at as epoch milliseconds."""
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_trace(trace_record)
+
+        conn = sqlite3.connect(tmp_db_path)
+        created_ms = conn.execute(
+            "SELECT created_ms FROM traces WHERE trace_id = ?", (trace_record["trace_id"],)
+        ).fetchone()[0]
+        conn.close()
+        assert created_ms == 1_772_193_600_000
+
+    def test_legacy_and_new_ids_resolve(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Legacy random ids and time-ordered ids should both be retrievable."""
+        import trace_store
+        from trace_ids import new_trace_id
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        new_id = new_trace_id()
+        save_trace({**trace_record, "trace_id": "tr_0123456789ab"})
+        save_trace({**trace_record, "trace_id": new_id})
+
+        assert get_trace("tr_0123456789ab") is not None
+        assert get_trace(new_id) is not None
+
+
+class TestSignalColumns:
+    """Tests for the materialized signal_* columns read by policy replay."""
+
+    def test_signals_materialized_and_patched(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Envelope signals should land in signal_* columns and follow envelope patches."""
+        import trace_store
+        from trace_store import iter_signal_columns, patch_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_trace(trace_record)
+        signals = {**trace_record["envelope"]["signals"], "ue": 0.5, "contradiction": True}
+        patch_traces([(trace_record["trace_id"], {"signals": signals}, {})])
+
+        chunks = list(iter_signal_columns())
+        assert chunks[0]["signal_ue"] == (0.5,)
+        assert chunks[0]["signal_out_of_distribution"] == (0.04,)
+        assert chunks[0]["signal_contradiction"] == (0.0,)
+        assert chunks[0]["decision"] == ("PASS",)
+
+    def test_iter_signal_columns_pages_in_order(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Chunks should cover the filtered range oldest first without overlap."""
+        import trace_store
+        from trace_store import iter_signal_columns, save_traces
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        save_traces(
+            [
+                {**trace_record, "trace_id": f"tr_sig_{index:02d}", "created_at": f"2026-02-27T12:00:{index:02d}Z"}
+                for index in range(25)
+            ]
+        )
+
+        chunks = list(iter_signal_columns(created_from_ms=1_772_193_605_000, model="gpt-4o-mini", chunk_rows=8))
+        trace_ids = [trace_id for chunk in chunks for trace_id in chunk["trace_id"]]
+        assert [len(chunk["trace_id"]) for chunk in chunks] == [8, 8, 4]
+        assert trace_ids == [f"tr_sig_{index:02d}" for index in range(5, 25)]
+        assert list(iter_signal_columns(model="other")) == []
+
+    def test_signals_backfilled_for_existing_rows(self, tmp_db_path: str) -> None:
+        """Rows written before the signal columns existed should be filled from their envelopes."""
+        import trace_store
+        from trace_store import backfill_columns, iter_signal_columns
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        conn = sqlite3.connect(tmp_db_path)
+        conn.execute(
+            """
+            CREATE TABLE traces (
+                trace_id TEXT PRIMARY KEY, created_at TEXT NOT NULL, decision TEXT NOT NULL,
+                policy TEXT NOT NULL, trust_score REAL NOT NULL, risk REAL NOT NULL,
+                is_stream INTEGER NOT NULL, status_code INTEGER NOT NULL, model TEXT,
+                request_fingerprint TEXT, envelope_json TEXT, metadata_json TEXT
+            )
+            """
+        )
+        envelope = json.dumps({"signals": {"ue": 0.3, "divergence": 1, "ua": "high"}})
+        conn.execute(
+            "INSERT INTO traces VALUES ('tr_old', '2026-02-27T12:00:00+00:00', 'PASS', 'default_v1', 0.9, 0.1, 0, 200, 'm', '{}', ?, '{}')",
+            (envelope,),
+        )
+        conn.commit()
+        conn.close()
+
+        init_db()
+        backfill_columns()
+
+        chunk = next(iter_signal_columns())
+        assert (chunk["signal_ue"], chunk["signal_ua"], chunk["signal_divergence"]) == ((0.3,), (0.0,), (1.0,))
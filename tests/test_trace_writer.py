@@ -0,0 +1,219 @@
+"""Unit tests for trace_writer module."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+import trace_store
+import trace_writer as trace_writer_module
+from trace_store import get_trace, init_db
+from trace_writer import TracePatch, TraceWriter
+
+
+def _record(trace_record: dict[str, Any], index: int) -> dict[str, Any]:
+    return {**trace_record, "trace_id": f"tr_writer_{index}"}
+
+
+class TestTraceWriter:
+    """Tests for write-behind trace persistence."""
+
+    async def test_not_running_writes_synchronously(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Without a writer thread, submit should persist immediately."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        writer = TraceWriter()
+
+        await writer.submit(trace_record)
+
+        assert get_trace(trace_record["trace_id"]) is not None
+        assert writer.stats()["enqueued"] == 0
+
+    async def test_stop_drains_queue(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Every queued trace should be committed when the writer stops."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        writer = TraceWriter(max_batch=8, max_latency_ms=1000)
+        writer.start()
+
+        for index in range(20):
+            await writer.submit(_record(trace_record, index))
+        writer.stop()
+
+        assert not writer.is_running()
+        for index in range(20):
+            assert get_trace(f"tr_writer_{index}") is not None
+        stats = writer.stats()
+        assert stats["written"] == 20
+        assert stats["max_batch_size"] <= 8
+        assert stats["queue_depth"] == 0
+
+    async def test_group_commit_batches(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Traces queued together should share a single transaction."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        batches: list[int] = []
+        release = threading.Event()
+
+        def slow_write(records: list[dict[str, Any]], patches: list[Any]) -> int:
+            release.wait(timeout=5)
+            batches.append(len(records))
+            return 0
+
+        writer = TraceWriter(max_batch=100, max_latency_ms=0)
+        with patch.object(trace_writer_module, "write_batch", slow_write):
+            writer.start()
+            await writer.submit(_record(trace_record, 0))
+            for index in range(1, 11):
+                await writer.submit(_record(trace_record, index))
+            release.set()
+            writer.stop()
+
+        assert sum(batches) == 11
+        assert len(batches) < 11
+
+    async def test_pending_until_flushed(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """Queued traces should report pending until flush commits them."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        writer = TraceWriter(max_latency_ms=50)
+        writer.start()
+        try:
+            await writer.submit(trace_record)
+            writer.flush()
+            assert not writer.is_pending(trace_record["trace_id"])
+            assert get_trace(trace_record["trace_id"]) is not None
+        finally:
+            writer.stop()
+
+    async def test_flush_ignores_items_queued_after_it(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """flush should return once earlier items commit, even while the queue never empties."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        original_write_batch = trace_writer_module.write_batch
+        stop = asyncio.Event()
+
+        def slow_write(records: list[dict[str, Any]], patches: list[Any]) -> int:
+            time.sleep(0.005)
+            return original_write_batch(records, patches)
+
+        async def produce() -> None:
+            index = 1
+            while not stop.is_set():
+                await writer.submit(_record(trace_record, index))
+                index += 1
+                await asyncio.sleep(0.001)
+
+        writer = TraceWriter(max_batch=1, max_latency_ms=0)
+        with patch.object(trace_writer_module, "write_batch", slow_write):
+            writer.start()
+            await writer.submit(_record(trace_record, 0))
+            producer = asyncio.create_task(produce())
+            try:
+                await asyncio.sleep(0.05)
+                await asyncio.wait_for(asyncio.to_thread(writer.flush), timeout=5)
+                assert get_trace("tr_writer_0") is not None
+                assert writer.stats()["queue_depth"] > 0
+            finally:
+                stop.set()
+                await producer
+                writer.stop()
+
+    async def test_failed_batch_retried_per_record(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """A batch that fails to commit should be retried one record at a time."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        original_save_traces = trace_writer_module.save_traces
+        original_write_batch = trace_writer_module.write_batch
+
+        def reject_poison(records: list[dict[str, Any]]) -> None:
+            if any(record["trace_id"] == "tr_writer_2" for record in records):
+                raise ValueError("poison record")
+            original_save_traces(records)
+
+        def reject_poison_batch(records: list[dict[str, Any]], patches: list[Any]) -> int:
+            reject_poison(records)
+            return original_write_batch([], patches)
+
+        writer = TraceWriter(max_batch=100, max_latency_ms=1000)
+        with patch.object(trace_writer_module, "save_traces", reject_poison), patch.object(
+            trace_writer_module, "write_batch", reject_poison_batch
+        ):
+            writer.start()
+            for index in range(5):
+                await writer.submit(_record(trace_record, index))
+            writer.stop()
+
+        stats = writer.stats()
+        assert stats["commit_errors"] == 1
+        assert stats["dropped"] == 1
+        assert stats["written"] == 4
+        assert [get_trace(f"tr_writer_{index}") is not None for index in range(5)] == [True, True, False, True, True]
+
+    async def test_patch_applies_after_queued_insert(self, tmp_db_path: str, trace_record: dict[str, Any]) -> None:
+        """A patch queued right behind its trace should land in the same drain, after the insert."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        writer = TraceWriter(max_latency_ms=1000)
+        writer.start()
+        try:
+            await writer.submit(trace_record)
+            await writer.submit_patch(TracePatch(trace_record["trace_id"], metadata={"signals": {"async_completed": True}}))
+            assert writer.is_pending(trace_record["trace_id"])
+        finally:
+            writer.stop()
+
+        trace = get_trace(trace_record["trace_id"])
+        assert trace["metadata"]["signals"] == {"async_completed": True}
+        assert writer.stats()["patches"] == 1
+        assert writer.stats()["written"] == 1
+
+    async def test_batch_commits_inserts_and_patches_together(
+        self, tmp_db_path: str, trace_record: dict[str, Any]
+    ) -> None:
+        """A batch's inserts and patches should share one transaction and roll back together."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        patch_tuple = TracePatch(trace_record["trace_id"], metadata={"signals": {"async_completed": True}}).as_tuple()
+
+        with patch.object(trace_store, "_apply_patches", side_effect=ValueError("patch failed")):
+            with pytest.raises(ValueError):
+                trace_store.write_batch([trace_record], [patch_tuple])
+        assert get_trace(trace_record["trace_id"]) is None
+
+        assert trace_store.write_batch([trace_record], [patch_tuple]) == 1
+        assert get_trace(trace_record["trace_id"])["metadata"]["signals"] == {"async_completed": True}
+
+    async def test_full_queue_falls_back_to_inline_write(
+        self, tmp_db_path: str, trace_record: dict[str, Any]
+    ) -> None:
+        """A saturated queue should apply backpressure and never drop traces."""
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        release = threading.Event()
+        original_write_batch = trace_writer_module.write_batch
+
+        def blocked_write(records: list[dict[str, Any]], patches: list[Any]) -> int:
+            release.wait(timeout=5)
+            return original_write_batch(records, patches)
+
+        writer = TraceWriter(max_queue=1, max_batch=1, max_latency_ms=0)
+        with patch.object(trace_writer_module, "write_batch", blocked_write), patch.object(
+            trace_writer_module, "ENQUEUE_TIMEOUT_SECONDS", 0.01
+        ):
+            writer.start()
+            for index in range(4):
+                await writer.submit(_record(trace_record, index))
+            release.set()
+            writer.stop()
+
+        stats = writer.stats()
+        assert stats["backpressure_waits"] >= 1
+        assert stats["sync_fallbacks"] >= 1
+        for index in range(4):
+            assert get_trace(f"tr_writer_{index}") is not None
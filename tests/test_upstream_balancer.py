@@ -0,0 +1,203 @@
+"""Unit tests for upstream_balancer module."""
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import provider_routes
+import upstream_pool
+from trace_store import get_trace, init_db
+from upstream_balancer import UpstreamBalancer, UpstreamUnavailable
+
+A = "http://gpu-a:8000/v1"
+B = "http://gpu-b:8000/v1"
+ENDPOINTS = ((A, 1), (B, 1))
+
+
+def _sender(handler: Any, stream: bool = False) -> Any:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def send(base_url: str) -> httpx.Response:
+        request = client.build_request("POST", f"{base_url}/chat/completions", content=b"{}")
+        return await client.send(request, stream=stream)
+
+    return send
+
+
+class TestSelection:
+    """Tests for endpoint selection."""
+
+    @pytest.mark.parametrize("strategy", ["p2c", "least_outstanding"])
+    def test_prefers_fewer_outstanding(self, strategy: str) -> None:
+        """With two endpoints, the less loaded one should always win."""
+        balancer = UpstreamBalancer(strategy)
+        balancer.state(A).outstanding = 5
+
+        assert {balancer.pick(ENDPOINTS).base_url for _ in range(50)} == {B}
+
+    def test_weights_scale_load(self) -> None:
+        """A heavier endpoint should absorb proportionally more outstanding requests."""
+        balancer = UpstreamBalancer("least_outstanding")
+        balancer.state(A).outstanding = 2
+        balancer.state(B).outstanding = 0
+
+        assert balancer.pick(((A, 4), (B, 1))).base_url == A
+
+    def test_open_and_unhealthy_endpoints_skipped(self) -> None:
+        """Endpoints with an open breaker are never picked; unhealthy ones only as a last resort."""
+        balancer = UpstreamBalancer("p2c", breaker_options={"min_requests": 2, "open_seconds": 60})
+        breaker = balancer.state(A).breaker
+        breaker.record(time.monotonic(), True, 0.1)
+        breaker.record(time.monotonic(), True, 0.1)
+
+        assert {balancer.pick(ENDPOINTS).base_url for _ in range(20)} == {B}
+
+        balancer.state(B).healthy = False
+        assert {balancer.pick(ENDPOINTS).base_url for _ in range(20)} == {B}
+
+    def test_sheds_when_no_endpoint_admits(self) -> None:
+        """Open breakers and exhausted limits should raise UpstreamUnavailable immediately."""
+        balancer = UpstreamBalancer("p2c", breaker_options={"min_requests": 1}, limiter_options={"initial": 2, "enabled": True})
+        balancer.state(A).breaker.record(time.monotonic(), True, 0.1)
+        balancer.state(B).outstanding = 2
+
+        with pytest.raises(UpstreamUnavailable) as error:
+            balancer.pick(ENDPOINTS)
+        assert error.value.reason == "concurrency_limit"
+        assert balancer.stats()["endpoints"][B]["concurrency"]["rejections"] == 1
+
+        balancer.state(B).breaker.record(time.monotonic(), True, 0.1)
+        with pytest.raises(UpstreamUnavailable) as error:
+            balancer.pick(ENDPOINTS)
+        assert error.value.reason == "circuit_open"
+        assert "failure rate" in error.value.detail
+        assert balancer.stats()["shed"] == {"circuit_open": 1, "concurrency_limit": 1}
+
+
+class TestSend:
+    """Tests for failover and outstanding-request accounting."""
+
+    async def test_fails_over_on_connect_error_and_5xx(self) -> None:
+        """Connect errors and 5xx answers should move the request to the next endpoint."""
+        balancer = UpstreamBalancer("least_outstanding")
+        # Existing load orders the picks: gpu-a, then gpu-b, then gpu-c.
+        balancer.state(B).outstanding = 1
+        balancer.state("http://gpu-c:8000/v1").outstanding = 2
+        calls: list[str] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.host)
+            if request.url.host == "gpu-a":
+                raise httpx.ConnectError("refused", request=request)
+            if request.url.host == "gpu-b":
+                return httpx.Response(503, json={"error": "overloaded"})
+            return httpx.Response(200, json={"ok": True})
+
+        endpoints = ((A, 1), (B, 1), ("http://gpu-c:8000/v1", 1))
+        response = await balancer.send(endpoints, _sender(handler))
+
+        assert response.status_code == 200
+        assert calls == ["gpu-a", "gpu-b", "gpu-c"]
+        endpoint = response.extensions["cognos_endpoint"]
+        assert endpoint["base_url"] == "http://gpu-c:8000/v1"
+        assert len(endpoint["attempts"]) == 3
+        assert balancer.stats()["failovers"] == 2
+        outstanding = {base_url: state["outstanding"] for base_url, state in balancer.stats()["endpoints"].items()}
+        assert outstanding == {A: 0, B: 1, "http://gpu-c:8000/v1": 2}
+
+    async def test_last_endpoint_errors_are_returned(self) -> None:
+        """When every endpoint fails, the last 5xx is returned and connect errors raise."""
+        balancer = UpstreamBalancer("p2c")
+
+        response = await balancer.send(ENDPOINTS, _sender(lambda request: httpx.Response(502)))
+        assert response.status_code == 502
+        assert len(response.extensions["cognos_endpoint"]["attempts"]) == 2
+
+        def refuse(request: httpx.Request) -> httpx.Response:
+            raise httpx.ConnectError("refused", request=request)
+
+        with pytest.raises(httpx.ConnectError):
+            await balancer.send(ENDPOINTS, _sender(refuse))
+
+    async def test_stream_stays_outstanding_until_closed(self) -> None:
+        """A streamed response should count against its endpoint until the body is closed."""
+        balancer = UpstreamBalancer("p2c")
+
+        class Body(httpx.AsyncByteStream):
+            async def __aiter__(self) -> Any:
+                yield b"data: x\n\n"
+
+        handler = lambda request: httpx.Response(200, stream=Body())  # noqa: E731
+
+        response = await balancer.send(((A, 1),), _sender(handler, stream=True))
+
+        assert balancer.state(A).outstanding == 1
+        assert [chunk async for chunk in response.aiter_bytes()] == [b"data: x\n\n"]
+        await response.aclose()
+        assert balancer.state(A).outstanding == 0
+
+    async def test_health_check_marks_endpoints(self) -> None:
+        """Active checks should mark 5xx/unreachable endpoints unhealthy and 401s healthy."""
+        balancer = UpstreamBalancer("p2c")
+        balancer.watch([ENDPOINTS, ((A, 1),)])
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.host == "gpu-b":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(401)
+
+        with patch.object(upstream_pool, "_build_client", lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+            await balancer.check_once()
+        await upstream_pool.close_all()
+
+        assert balancer.state(A).healthy is True
+        assert balancer.state(B).healthy is False
+        assert balancer.stats()["endpoints"][B]["last_error"] == "ConnectError"
+
+
+class TestGatewayFailover:
+    """Tests for failover through the chat completions endpoint."""
+
+    def test_failover_recorded_in_trace(self, tmp_db_path: str, mock_upstream_response: dict[str, Any]) -> None:
+        """A 5xx from one endpoint should be retried on another and recorded in the trace."""
+        import main
+        import trace_store
+        import upstream_balancer
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        table = provider_routes.compile_table({"providers": {"vllm": {"endpoints": [A, B]}}}, environ={})
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.host == "gpu-a":
+                return httpx.Response(500, json={"error": "boom"})
+            return httpx.Response(200, content=json.dumps(mock_upstream_response).encode("utf-8"))
+
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(provider_routes, "_table", table), patch.object(
+            upstream_balancer.upstream_balancer, "_states", {}
+        ), patch.object(
+            upstream_pool, "_build_client", lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        ):
+            # Standing load on gpu-b makes gpu-a the first pick until it is ejected.
+            upstream_balancer.upstream_balancer.state(B).outstanding = 1
+            with TestClient(main.app) as client:
+                responses = [
+                    client.post(
+                        "/v1/chat/completions",
+                        json={"model": "vllm:llama", "messages": [{"role": "user", "content": f"hi {index}"}]},
+                        headers={"authorization": "Bearer upstream-key"},
+                    )
+                    for index in range(4)
+                ]
+
+        assert [response.status_code for response in responses] == [200] * 4
+        endpoints = [get_trace(response.headers["X-Cognos-Trace-Id"])["metadata"]["endpoint"] for response in responses]
+        assert {endpoint["base_url"] for endpoint in endpoints} == {B}
+        assert endpoints[0]["attempts"] == [{"base_url": A, "status": 500}, {"base_url": B, "status": 200}]
@@ -0,0 +1,128 @@
+"""Unit tests for upstream_pool module."""
+
+from __future__ import annotations
+
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import upstream_pool
+
+
+def _mock_upstream_client(counters: dict[str, int], upstream_json: dict[str, Any]) -> httpx.AsyncClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        counters["requests"] += 1
+        return httpx.Response(200, json=upstream_json)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+class TestGetClient:
+    """Tests for pooled client lookup."""
+
+    async def test_same_base_url_reuses_client(self) -> None:
+        """Clients should be keyed by normalized base_url."""
+        first = upstream_pool.get_client("https://api.openai.com/v1")
+        second = upstream_pool.get_client("https://API.openai.com/v1/")
+        try:
+            assert first is second
+        finally:
+            await upstream_pool.close_all()
+
+    async def test_different_base_urls_get_separate_clients(self) -> None:
+        """Each upstream base_url should get its own client."""
+        openai_client = upstream_pool.get_client("https://api.openai.com/v1")
+        openrouter_client = upstream_pool.get_client("https://openrouter.ai/api/v1")
+        try:
+            assert openai_client is not openrouter_client
+        finally:
+            await upstream_pool.close_all()
+
+    async def test_close_all_closes_clients(self) -> None:
+        """close_all should close and forget every pooled client."""
+        client = upstream_pool.get_client("https://api.openai.com/v1")
+        await upstream_pool.close_all()
+
+        assert client.is_closed
+        assert upstream_pool.pool_stats()["clients"] == {}
+
+
+class TestPoolStats:
+    """Tests for pool statistics."""
+
+    async def test_pool_stats_structure(self) -> None:
+        """pool_stats should report config and per-client counters."""
+        upstream_pool.get_client("http://127.0.0.1:11434/v1")
+        try:
+            stats = upstream_pool.pool_stats()
+        finally:
+            await upstream_pool.close_all()
+
+        assert stats["config"]["max_connections"] == upstream_pool.POOL_MAX_CONNECTIONS
+        client_stats = stats["clients"]["http://127.0.0.1:11434/v1"]
+        assert client_stats["in_flight"] == 0
+        assert client_stats["tls_handshakes"] == 0
+
+    async def test_in_flight_counts_open_responses(self) -> None:
+        """A request should stay in flight until its response body is closed."""
+
+        async def handle(transport: httpx.AsyncHTTPTransport, request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, stream=httpx.ByteStream(b"data: {}\n\n"))
+
+        client = upstream_pool.get_client("http://127.0.0.1:11434/v1")
+        counters = upstream_pool._clients["http://127.0.0.1:11434/v1"]["counters"]
+        try:
+            with patch.object(httpx.AsyncHTTPTransport, "handle_async_request", handle):
+                response = await client.send(client.build_request("GET", "http://127.0.0.1:11434/v1/models"), stream=True)
+                assert counters["in_flight"] == 1
+                assert await response.aread() == b"data: {}\n\n"
+                await response.aclose()
+                await client.get("http://127.0.0.1:11434/v1/models")
+        finally:
+            await upstream_pool.close_all()
+
+        assert counters["in_flight"] == 0
+        assert counters["requests"] == 2
+
+    def test_pool_endpoint(self, test_client: TestClient) -> None:
+        """GET /internal/upstream/pool should expose pool stats."""
+        response = test_client.get("/internal/upstream/pool")
+
+        assert response.status_code == 200
+        assert "clients" in response.json()
+
+
+class TestGatewayUsesPool:
+    """The gateway should reuse one upstream client across requests."""
+
+    def test_live_requests_share_client(
+        self,
+        tmp_db_path: str,
+        valid_chat_request: dict[str, Any],
+        mock_upstream_response: dict[str, Any],
+    ) -> None:
+        import main
+        import trace_store
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        built: list[dict[str, int]] = []
+
+        def build_client(counters: dict[str, int]) -> httpx.AsyncClient:
+            built.append(counters)
+            return _mock_upstream_client(counters, mock_upstream_response)
+
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(upstream_pool, "_build_client", build_client):
+            with TestClient(main.app) as client:
+                for _ in range(3):
+                    response = client.post(
+                        "/v1/chat/completions",
+                        json=valid_chat_request,
+                        headers={"authorization": "Bearer upstream-key"},
+                    )
+                    assert response.status_code == 200
+
+        assert len(built) == 1
+        assert built[0]["requests"] == 3
@@ -0,0 +1,231 @@
+"""Unit tests for upstream_retry module."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from trace_store import get_trace, init_db
+from upstream_retry import DeadlineExceeded, RetryBudget, RetryEngine, parse_retry_after
+
+
+def _attempts(outcomes: list[Any]) -> tuple[Any, list[int]]:
+    """Attempt factory returning (or raising) outcomes in order."""
+    calls: list[int] = []
+
+    async def attempt() -> httpx.Response:
+        calls.append(1)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return attempt, calls
+
+
+def _engine(tokens: float = 10.0, **budget: Any) -> RetryEngine:
+    engine = RetryEngine(base_delay_ms=1, max_delay_ms=50, budget=RetryBudget(**{"ratio": 1.0, "min_per_second": 0, **budget}))
+    engine.budget.tokens = tokens
+    return engine
+
+
+class TestParseRetryAfter:
+    """Tests for Retry-After parsing."""
+
+    def test_delta_seconds_and_http_date(self) -> None:
+        """Both header forms should become seconds from now."""
+        now = datetime(2026, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+        assert parse_retry_after("3") == 3.0
+        assert parse_retry_after("Sun, 01 Mar 2026 12:00:07 GMT", now=now) == 7.0
+        assert parse_retry_after("Sun, 01 Mar 2026 11:00:00 GMT", now=now) == 0.0
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+
+
+class TestRetryBudget:
+    """Tests for the retry token bucket."""
+
+    def test_budget_is_a_ratio_of_requests(self) -> None:
+        """A 10% ratio should allow one retry per ten requests."""
+        budget = RetryBudget(ratio=0.1, min_per_second=0)
+        spent = 0
+        for _ in range(100):
+            budget.deposit()
+            spent += budget.try_spend()
+
+        assert spent == 10
+
+
+class TestRetryEngine:
+    """Tests for retry decisions."""
+
+    async def test_retries_transient_status_until_success(self) -> None:
+        """429/503 should be retried and every attempt recorded on the final response."""
+        engine = _engine()
+        attempt, calls = _attempts([httpx.Response(429), httpx.Response(503), httpx.Response(200)])
+
+        response = await engine.run(attempt, max_retries=2)
+
+        assert response.status_code == 200
+        assert len(calls) == 3
+        retry = response.extensions["cognos_retry"]
+        assert retry["retries"] == 2
+        assert [entry["status"] for entry in retry["attempts"]] == [429, 503, 200]
+        assert all("retry_in_ms" in entry for entry in retry["attempts"][:2])
+        assert engine.stats()["recovered"] == 1
+
+    async def test_non_retryable_status_returns_immediately(self) -> None:
+        """A 400 or 500 is the final outcome, without retry metadata."""
+        engine = _engine()
+        attempt, calls = _attempts([httpx.Response(400)])
+
+        response = await engine.run(attempt)
+
+        assert response.status_code == 400
+        assert len(calls) == 1
+        assert "cognos_retry" not in response.extensions
+
+    async def test_gives_up_after_max_retries(self) -> None:
+        """The last failing response should be returned with the reason recorded."""
+        engine = _engine()
+        attempt, calls = _attempts([httpx.Response(503)] * 3)
+
+        response = await engine.run(attempt, max_retries=1)
+
+        assert response.status_code == 503
+        assert len(calls) == 2
+        assert response.extensions["cognos_retry"]["attempts"][-1]["gave_up"] == "max_retries"
+
+    async def test_retry_after_is_honored(self) -> None:
+        """The wait should be at least Retry-After, and too-long waits are not retried."""
+        engine = RetryEngine(base_delay_ms=1, max_delay_ms=1000, budget=RetryBudget(ratio=1.0, min_per_second=0))
+        engine.budget.tokens = 10.0
+        attempt, _ = _attempts([httpx.Response(429, headers={"retry-after": "0.05"}), httpx.Response(200)])
+
+        response = await engine.run(attempt)
+
+        assert response.extensions["cognos_retry"]["attempts"][0]["retry_in_ms"] >= 50
+
+        attempt, calls = _attempts([httpx.Response(429, headers={"retry-after": "120"})])
+        response = await engine.run(attempt)
+
+        assert len(calls) == 1
+        assert response.extensions["cognos_retry"]["attempts"][0]["gave_up"] == "retry_after_too_long"
+
+    async def test_budget_exhaustion_stops_retries(self) -> None:
+        """Without budget tokens the failure should be returned as-is."""
+        engine = _engine(tokens=0.0, ratio=0.0)
+        attempt, calls = _attempts([httpx.Response(502), httpx.Response(200)])
+
+        response = await engine.run(attempt)
+
+        assert response.status_code == 502
+        assert len(calls) == 1
+        assert response.extensions["cognos_retry"]["attempts"][0]["gave_up"] == "budget_exhausted"
+        assert engine.stats()["budget_exhausted"] == 1
+
+    async def test_connect_errors_retry_and_reraise(self) -> None:
+        """Connect failures are retried; the last one is raised when retries run out."""
+        engine = _engine()
+        attempt, calls = _attempts([httpx.ConnectError("refused"), httpx.Response(200)])
+        assert (await engine.run(attempt)).status_code == 200
+        assert len(calls) == 2
+
+        attempt, calls = _attempts([httpx.ConnectError("refused")] * 2)
+        with pytest.raises(httpx.ConnectError):
+            await engine.run(attempt, max_retries=1)
+
+        attempt, calls = _attempts([httpx.ReadTimeout("slow")])
+        with pytest.raises(httpx.ReadTimeout):
+            await engine.run(attempt)
+        assert len(calls) == 1
+
+    async def test_deadline_bounds_attempts_and_backoff(self) -> None:
+        """A slow attempt past the deadline raises; a retry that cannot fit is not started."""
+        engine = _engine()
+
+        async def slow() -> httpx.Response:
+            await asyncio.sleep(5)
+            return httpx.Response(200)
+
+        with pytest.raises(DeadlineExceeded) as raised:
+            await engine.run(slow, deadline_seconds=0.05)
+        assert raised.value.attempts[0]["error"] == "DeadlineExceeded"
+
+        attempt, calls = _attempts([httpx.Response(429, headers={"retry-after": "0.04"}), httpx.Response(200)])
+        response = await engine.run(attempt, deadline_seconds=0.02)
+        assert len(calls) == 1
+        assert response.extensions["cognos_retry"]["attempts"][0]["gave_up"] == "deadline"
+
+
+class TestGatewayRetries:
+    """Tests for retries through the chat completions endpoint."""
+
+    def test_retried_request_passes_with_attempts_in_trace(self, tmp_db_path: str, mock_upstream_response: dict[str, Any]) -> None:
+        """A 503 followed by a 200 should yield a PASS-path response with both attempts traced."""
+        import main
+        import trace_store
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+        calls: list[int] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(1)
+            if len(calls) == 1:
+                return httpx.Response(503, headers={"retry-after": "0"}, json={"error": "busy"})
+            return httpx.Response(200, content=json.dumps(mock_upstream_response).encode("utf-8"))
+
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(main, "retry_engine", _engine()), patch.object(
+            upstream_pool, "_build_client", lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        ):
+            with TestClient(main.app) as client:
+                response = client.post(
+                    "/v1/chat/completions",
+                    json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}]},
+                    headers={"authorization": "Bearer upstream-key"},
+                )
+
+        assert response.status_code == 200
+        assert len(calls) == 2
+        trace = get_trace(response.headers["X-Cognos-Trace-Id"])
+        assert trace["status_code"] == 200
+        assert trace["decision"] != "ESCALATE"
+        assert [attempt["status"] for attempt in trace["metadata"]["retry"]["attempts"]] == [503, 200]
+
+    def test_deadline_exceeded_returns_504(self, tmp_db_path: str) -> None:
+        """An upstream slower than the request deadline should produce a 504 ESCALATE trace."""
+        import main
+        import trace_store
+        import upstream_pool
+
+        trace_store.DEFAULT_DB_PATH = tmp_db_path
+        init_db()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(5)
+            return httpx.Response(200, json={})
+
+        with patch.object(main, "MOCK_UPSTREAM", False), patch.object(
+            upstream_pool, "_build_client", lambda counters: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        ):
+            with TestClient(main.app) as client:
+                response = client.post(
+                    "/v1/chat/completions",
+                    json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "cognos": {"deadline_ms": 50}},
+                    headers={"authorization": "Bearer upstream-key"},
+                )
+
+        assert response.status_code == 504
+        trace = get_trace(response.json()["trace_id"])
+        assert trace["decision"] == "ESCALATE"
+        assert trace["metadata"]["upstream"] == "deadline"